@@ -1,16 +1,31 @@
-from django.urls import path
+from django.urls import path, re_path
 from apps.projects.views import (
     dashboard_view,
     project_detail_view,
     project_action_view,
     servers_view,
     billing_view,
+    deployment_search_view,
+    metrics_view,
+    profiling_view,
+    events_view,
+    project_events_view,
+    github_webhook_view,
+    wake_view,
 )
 
 urlpatterns = [
     path('', dashboard_view, name='dashboard'),
     path('project/<slug:slug>/', project_detail_view, name='project_detail'),
+    path('project/<slug:slug>/events/', project_events_view, name='project_events'),
     path('project/<slug:slug>/<str:action>/', project_action_view, name='project_action'),
     path('servers/', servers_view, name='servers'),
     path('billing/', billing_view, name='billing'),
+    path('search/', deployment_search_view, name='deployment_search'),
+    path('metrics', metrics_view, name='metrics'),
+    path('profiling/', profiling_view, name='profiling'),
+    path('events/', events_view, name='events'),
+    path('webhooks/github/', github_webhook_view, name='github_webhook'),
+    # Без $ в конце: nginx спящего проекта дописывает исходный путь запроса
+    re_path(r'^wake/(?P<slug>[-\w]+)/(?P<token>[0-9a-f]+)/', wake_view, name='project_wake'),
 ]
@@ -1,28 +1,165 @@
+from django import forms
 from django.contrib import admin
+from django.template.response import TemplateResponse
 from django.utils.html import format_html
 
-from .models import Deployment, Project, Server
-from .tasks import deploy_project_task, resume_project_task, suspend_project_task
+from .models import Backup, BillingEvent, Deployment, EnvVersion, Project, Server, TaskProfile
+from .services.env_store import current_env_text, diff_summary, pending_env, save_env
+from .services.fleet import (
+    FLEET_TIMEOUT,
+    group_outputs,
+    run_fleet,
+    summary,
+    targets_for_projects,
+    targets_for_servers,
+)
+from .services.log_search import search_deployments
+from .services.migrate import format_size
+from .services.placement import PLACEMENT_STRATEGY, PlacementError, collect_capacity, suggest_server
+from .tasks import (
+    PRIORITY_LOW,
+    backup_projects_task,
+    enqueue_apply_env,
+    enqueue_deploy,
+    enqueue_restore,
+    enqueue_resume,
+    enqueue_sleep,
+    enqueue_suspend,
+    enqueue_wake,
+)
+
+
+@admin.action(description="🖥 Выполнить команду", permissions=["fleet_command"])
+def run_fleet_command(modeladmin, request, queryset):
+    """
+    Промежуточная страница: ввод команды и таблица результатов по хостам.
+    Для проектов команда выполняется в каталоге проекта.
+    """
+    if queryset.model is Project:
+        targets = targets_for_projects(queryset.select_related("server"))
+    else:
+        targets = targets_for_servers(queryset)
+
+    command = request.POST.get("remote_command", "").strip()
+    try:
+        timeout = min(max(int(request.POST.get("timeout", FLEET_TIMEOUT)), 1), 600)
+    except ValueError:
+        timeout = FLEET_TIMEOUT
+
+    context = {
+        **modeladmin.admin_site.each_context(request),
+        "title": "Команда на хостах",
+        "opts": modeladmin.model._meta,
+        "queryset": queryset,
+        "targets": targets,
+        "command": command,
+        "timeout": timeout,
+    }
+    if "apply" in request.POST and command:
+        results = run_fleet(targets, command, timeout=timeout)
+        context.update({
+            "results": sorted(results, key=lambda r: (r.ok, -r.seconds)),
+            "groups": group_outputs(results),
+            "stats": summary(results),
+        })
+    return TemplateResponse(request, "admin/projects/fleet_command.html", context)
+
+
+class FleetCommandMixin:
+    """
+    Произвольная команда от SSH-пользователя на всём парке — по сути root на
+    серверах, поэтому только для суперпользователей, а не для всех, кто видит
+    список.
+    """
+
+    def has_fleet_command_permission(self, request):
+        return request.user.is_active and request.user.is_superuser
 
 
 @admin.register(Server)
-class ServerAdmin(admin.ModelAdmin):
-    list_display = ("name", "ip_address", "ssh_user", "ssh_port", "base_path", "project_count")
+class ServerAdmin(FleetCommandMixin, admin.ModelAdmin):
+    list_display = (
+        "name", "ip_address", "ssh_user", "ssh_port", "base_path",
+        "cpu_cores", "memory_mb", "reserved", "load_avg", "accepts_projects", "project_count",
+    )
+    list_filter = ("accepts_projects",)
     search_fields = ("name", "ip_address")
+    readonly_fields = (
+        "project_count", "reserved_cpus", "reserved_memory_mb",
+        "load_avg", "memory_available_mb", "disk_free_mb", "capacity_collected_at",
+    )
+    actions = ["collect_capacity", run_fleet_command]
+
+    def reserved(self, obj):
+        return f"{obj.reserved_cpus:g} CPU / {obj.reserved_memory_mb} МБ"
+    reserved.short_description = "Резерв"
+
+    @admin.action(description="📈 Собрать ресурсы")
+    def collect_capacity(self, request, queryset):
+        errors = collect_capacity(queryset)
+        for name, error in errors.items():
+            self.message_user(request, f"{name}: {error}", level="warning")
+        self.message_user(request, f"Ресурсы собраны: {queryset.count() - len(errors)} сервер(ов)")
+
+
+class ProjectAdminForm(forms.ModelForm):
+    # Не поле модели: текст шифруется и сохраняется версией EnvVersion
+    env_text = forms.CharField(
+        label="Переменные окружения (.env)", required=False,
+        widget=forms.Textarea(attrs={"rows": 8, "cols": 80, "spellcheck": "false"}),
+        help_text="Формат: KEY=VALUE. Хранятся зашифрованными, каждое изменение — новая версия",
+    )
 
-    def project_count(self, obj):
-        count = obj.projects.count()
-        return count
-    project_count.short_description = "Проектов"
+    class Meta:
+        model = Project
+        fields = "__all__"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.fields["env_text"].initial = current_env_text(self.instance)
+        elif "server" in self.fields:
+            self.fields["server"].required = False
+            self.fields["server"].help_text = f"Пусто — выберет планировщик ({PLACEMENT_STRATEGY})"
+
+    def clean(self):
+        cleaned = super().clean()
+        if not self.instance.pk and not cleaned.get("server") and not self.errors:
+            # Оценка по лимитам из формы: временный объект, в БД не пишется
+            candidate = Project(**{
+                name: cleaned.get(name)
+                for name in ("cpu_limit", "memory_limit_mb", "compose_services") if name in cleaned
+            })
+            try:
+                cleaned["server"] = suggest_server(candidate)
+            except PlacementError as e:
+                self.add_error("server", str(e))
+        return cleaned
+
+
+class EnvVersionInline(admin.TabularInline):
+    model = EnvVersion
+    fields = ("version", "summary", "author", "created_at")
+    readonly_fields = fields
+    extra = 0
+    max_num = 0
+    can_delete = False
+    ordering = ("-version",)
+    verbose_name_plural = "История env (значения не показываются)"
 
 
 @admin.register(Project)
-class ProjectAdmin(admin.ModelAdmin):
+class ProjectAdmin(FleetCommandMixin, admin.ModelAdmin):
+    form = ProjectAdminForm
+    inlines = [EnvVersionInline]
     list_display = ("name", "domain", "status_badge", "server", "internal_port", "paid_until", "last_deploy_at")
-    list_filter = ("status", "server")
+    list_filter = ("status", "server", "auto_deploy")
     search_fields = ("name", "slug", "domain")
     prepopulated_fields = {"slug": ("name",)}
-    readonly_fields = ("internal_port", "created_at", "last_deploy_at")
+    readonly_fields = (
+        "internal_port", "compose_services", "tls_expires_at", "env_status",
+        "created_at", "last_deploy_at", "sleeping_since",
+    )
 
     fieldsets = (
         ("📦 Основное", {
@@ -31,19 +168,60 @@ class ProjectAdmin(admin.ModelAdmin):
         ("⚙️ Техническое", {
             "fields": (
                 "github_repo", "github_branch", "server", "domain",
-                "remote_path", "compose_file", "internal_port", "env_vars",
+                "remote_path", "compose_file", "internal_port", "env_text", "env_status",
             ),
         }),
+        ("🌐 Nginx", {
+            "fields": (
+                ("tls", "tls_expires_at"),
+                "nginx_profile", ("client_max_body_mb", "proxy_read_timeout"),
+                ("microcache", "microcache_ttl"), "microcache_bypass_cookies",
+            ),
+            "classes": ("collapse",),
+        }),
+        ("📈 Ресурсы", {
+            "description": "Лимиты на каждый контейнер проекта; сумма проверяется по ресурсам сервера",
+            "fields": (
+                ("cpu_limit", "cpu_shares"), ("memory_limit_mb", "pids_limit"),
+                ("build_cpu_limit", "build_memory_mb"), "compose_services", "idle_timeout",
+                "backup_enabled",
+            ),
+            "classes": ("collapse",),
+        }),
+        ("🔁 Автодеплой", {
+            "fields": ("auto_deploy", "deploy_paths", "ignore_paths"),
+            "classes": ("collapse",),
+        }),
         ("💰 Биллинг", {
             "fields": ("price_per_month", "paid_until", "free_support_until", "grace_until"),
             "classes": ("collapse",),
         }),
         ("📊 Статус", {
-            "fields": ("status", "last_deploy_at", "created_at"),
+            "fields": ("status", "sleeping_since", "last_deploy_at", "created_at"),
         }),
     )
 
-    actions = ["deploy", "suspend", "resume"]
+    actions = ["deploy", "suspend", "resume", "apply_env", "sleep", "wake", "backup", run_fleet_command]
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        version = save_env(obj, form.cleaned_data.get("env_text", ""), author=request.user.get_username())
+        if version:
+            self.message_user(
+                request,
+                f"Env v{version.version}: {version.summary or 'без изменений переменных'}. "
+                f"Без пересборки — действие «Применить env»",
+            )
+
+    def env_status(self, obj):
+        if not obj.pk:
+            return "—"
+        pending = pending_env(obj)
+        if pending is None:
+            return f"v{obj.env_pushed.version} на сервере" if obj.env_pushed_id else "—"
+        version, diff = pending
+        return f"v{version.version} не применена: {diff_summary(diff) or 'без изменений переменных'}"
+    env_status.short_description = "Env"
 
     def status_badge(self, obj):
         colors = {
@@ -59,32 +237,133 @@ class ProjectAdmin(admin.ModelAdmin):
             '<span style="background:{}; color:white; padding:3px 10px; '
             'border-radius:12px; font-size:11px; font-weight:bold;">{}</span>',
             color,
-            obj.get_status_display(),
+            f"{obj.get_status_display()} 💤" if obj.sleeping_since else obj.get_status_display(),
         )
     status_badge.short_description = "Статус"
 
     @admin.action(description="🚀 Deploy")
     def deploy(self, request, queryset):
         for project in queryset:
-            deploy_project_task.delay(project.id)
+            enqueue_deploy(project.id, priority=PRIORITY_LOW)
         self.message_user(request, f"Деплой запущен для {queryset.count()} проект(ов)")
 
     @admin.action(description="⛔ Suspend")
     def suspend(self, request, queryset):
         for project in queryset:
-            suspend_project_task.delay(project.id)
+            enqueue_suspend(project.id)
         self.message_user(request, f"Suspend запущен для {queryset.count()} проект(ов)")
 
     @admin.action(description="✅ Resume")
     def resume(self, request, queryset):
         for project in queryset:
-            resume_project_task.delay(project.id)
+            enqueue_resume(project.id)
         self.message_user(request, f"Resume запущен для {queryset.count()} проект(ов)")
 
+    @admin.action(description="🔑 Применить env")
+    def apply_env(self, request, queryset):
+        for project in queryset:
+            enqueue_apply_env(project.id)
+        self.message_user(request, f"Применение env запущено для {queryset.count()} проект(ов)")
+
+    @admin.action(description="💤 Усыпить")
+    def sleep(self, request, queryset):
+        # Без idle_timeout sleep_script не знает порога простоя — такие проекты пропускаются
+        projects = queryset.filter(idle_timeout__isnull=False, sleeping_since__isnull=True).exclude(domain="")
+        for project in projects:
+            enqueue_sleep(project.id)
+        self.message_user(request, f"Усыпление запущено для {projects.count()} проект(ов)")
+
+    @admin.action(description="⏰ Разбудить")
+    def wake(self, request, queryset):
+        projects = queryset.filter(sleeping_since__isnull=False)
+        for project in projects:
+            enqueue_wake(project.id)
+        self.message_user(request, f"Пробуждение запущено для {projects.count()} проект(ов)")
+
+    @admin.action(description="💾 Резервная копия")
+    def backup(self, request, queryset):
+        ids = list(queryset.values_list("id", flat=True))
+        backup_projects_task.delay(ids)
+        self.message_user(request, f"Резервное копирование запущено для {len(ids)} проект(ов)")
+
 
 @admin.register(Deployment)
 class DeploymentAdmin(admin.ModelAdmin):
-    list_display = ("project", "action", "status", "started_at", "finished_at")
+    list_display = ("project", "action", "status", "enqueued_at", "started_at", "finished_at", "queue_wait")
     list_filter = ("status", "action", "project")
-    readonly_fields = ("log",)
+    readonly_fields = ("enqueued_at", "started_at", "finished_at", "timings", "log")
+    ordering = ("-enqueued_at",)
+    # Поиск идёт по полнотекстовому индексу (get_search_results), не по icontains
+    search_fields = ("log",)
+    search_help_text = "Поиск по логу: слова, \"точная фраза\", or, -исключить"
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return search_deployments(search_term, queryset), False
+
+    def queue_wait(self, obj):
+        seconds = obj.queue_wait_seconds
+        return f"{seconds:.1f} с" if seconds is not None else "—"
+    queue_wait.short_description = "Ожидание"
+
+
+@admin.register(Backup)
+class BackupAdmin(admin.ModelAdmin):
+    list_display = ("project", "server", "status", "started_at", "duration", "added", "processed")
+    list_filter = ("status", "project")
+    readonly_fields = (
+        "project", "server", "status", "started_at", "finished_at", "source_path",
+        "snapshots", "volumes", "data_added", "bytes_processed", "log",
+    )
     ordering = ("-started_at",)
+    actions = ["restore"]
+
+    def has_add_permission(self, request):
+        return False
+
+    def duration(self, obj):
+        if not obj.finished_at:
+            return "—"
+        return f"{(obj.finished_at - obj.started_at).total_seconds():.0f} с"
+    duration.short_description = "Длительность"
+
+    def added(self, obj):
+        return format_size(obj.data_added)
+    added.short_description = "Добавлено"
+
+    def processed(self, obj):
+        return format_size(obj.bytes_processed)
+    processed.short_description = "Обработано"
+
+    @admin.action(description="♻️ Восстановить (на текущий сервер проекта)")
+    def restore(self, request, queryset):
+        # Одна копия на проект: несколько восстановлений подряд перезаписали бы друг друга
+        backups = {}
+        for backup in queryset.filter(status="success").order_by("started_at"):
+            backups[backup.project_id] = backup
+        for backup in backups.values():
+            enqueue_restore(backup.project_id, backup.id)
+        self.message_user(request, f"Восстановление запущено для {len(backups)} проект(ов)")
+
+
+@admin.register(TaskProfile)
+class TaskProfileAdmin(admin.ModelAdmin):
+    list_display = ("task", "state", "worker", "started_at", "wall_seconds", "cpu_seconds", "rss_delta_kb", "queries")
+    list_filter = ("task", "state")
+    readonly_fields = (
+        "task", "state", "worker", "started_at", "wall_seconds", "cpu_seconds", "rss_kb",
+        "rss_delta_kb", "peak_kb", "queries", "query_seconds", "top_allocations",
+    )
+    ordering = ("-started_at",)
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(BillingEvent)
+class BillingEventAdmin(admin.ModelAdmin):
+    list_display = ("project", "kind", "due_at", "fired_at", "attempts")
+    list_filter = ("kind", ("fired_at", admin.EmptyFieldListFilter))
+    readonly_fields = ("project", "kind", "due_at", "fired_at", "attempts")
+    ordering = ("due_at",)
@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apps.projects.models import Project, Server
+from apps.projects.services.backup import backup_projects, backups_enabled, format_backup
+from apps.projects.services.migrate import format_size
+from apps.projects.tasks import enqueue_restore
+
+
+class Command(BaseCommand):
+    help = (
+        "Резервные копии проектов: запуск (run), список копий проекта (list), "
+        "восстановление на текущий или другой сервер (restore)."
+    )
+
+    def add_arguments(self, parser):
+        sub = parser.add_subparsers(dest="action", required=True)
+
+        run = sub.add_parser("run", help="Скопировать проекты сейчас (без slug — все по расписанию)")
+        run.add_argument("slugs", nargs="*")
+
+        listing = sub.add_parser("list", help="Копии проекта, новые первыми")
+        listing.add_argument("slug")
+        listing.add_argument("--limit", type=int, default=20)
+
+        restore = sub.add_parser("restore", help="Восстановить проект из копии")
+        restore.add_argument("slug")
+        restore.add_argument("--backup", type=int, help="ID копии (по умолчанию — последняя успешная)")
+        restore.add_argument("--server", help="Имя сервера, если не текущий (прежний недоступен)")
+
+    def handle(self, *args, **options):
+        getattr(self, f"_{options['action']}")(options)
+
+    @staticmethod
+    def _project(slug):
+        try:
+            return Project.objects.select_related("server").get(slug=slug)
+        except Project.DoesNotExist:
+            raise CommandError(f"Проект {slug} не найден")
+
+    def _run(self, options):
+        if not backups_enabled():
+            raise CommandError("Задайте BACKUP_REPOSITORY и BACKUP_PASSWORD")
+        projects = None
+        if options["slugs"]:
+            projects = [self._project(slug) for slug in options["slugs"]]
+        for backup in backup_projects(projects):
+            style = self.style.SUCCESS if backup.status == "success" else self.style.ERROR
+            self.stdout.write(style(format_backup(backup)))
+            if backup.status == "failed":
+                self.stdout.write(backup.log[-1000:])
+
+    def _list(self, options):
+        project = self._project(options["slug"])
+        for backup in project.backups.all()[:options["limit"]]:
+            databases = ", ".join(db["service"] for db in backup.databases) or "—"
+            self.stdout.write(
+                f"#{backup.id:<6} {timezone.localtime(backup.started_at):%d.%m.%Y %H:%M}  "
+                f"{backup.get_status_display():<12} +{format_size(backup.data_added):<10} базы: {databases}"
+            )
+
+    def _restore(self, options):
+        project = self._project(options["slug"])
+        backups = project.backups.filter(status="success")
+        if options["backup"]:
+            backups = backups.filter(id=options["backup"])
+        backup = backups.first()
+        if backup is None:
+            raise CommandError(f"Нет успешной копии {project.slug}")
+        target = None
+        if options["server"]:
+            try:
+                target = Server.objects.get(name=options["server"])
+            except Server.DoesNotExist:
+                raise CommandError(f"Сервер {options['server']} не найден")
+        dep = enqueue_restore(project.id, backup.id, target.id if target else None)
+        self.stdout.write(self.style.SUCCESS(
+            f"Восстановление {project.slug} из #{backup.id} на {(target or project.server).name} в очереди (#{dep.id})"
+        ))
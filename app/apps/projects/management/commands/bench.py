@@ -0,0 +1,383 @@
+import json
+import random
+import statistics
+import subprocess
+import time
+import tracemalloc
+from contextlib import ExitStack
+from datetime import timedelta
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+from celery import current_app
+from django.contrib.admin.sites import site as admin_site
+from django.contrib.auth.models import User
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+
+from apps.projects.models import PORT_RANGE_END, PORT_RANGE_START, BillingEvent, Deployment, Project, Server
+from apps.projects.services.billing import schedule_billing_events
+from apps.projects.services.fake_ssh import FakeSSH
+from apps.projects.services.placement import rank_servers, rebalance_plan, refresh_server_load
+
+
+class _Rollback(Exception):
+    """Откатывает транзакцию с тестовыми данными."""
+
+
+class FakeBot:
+    """Собирает обработчики бота и ответы без обращения к Telegram."""
+
+    def __init__(self):
+        self.handlers = {}
+        self.replies = []
+
+    def message_handler(self, commands):
+        def decorator(func):
+            for command in commands:
+                self.handlers[command] = func
+            return func
+        return decorator
+
+    def reply_to(self, message, text, **kwargs):
+        self.replies.append(text)
+
+    def send_message(self, chat_id, text, **kwargs):
+        self.replies.append(text)
+
+
+class Command(BaseCommand):
+    help = (
+        "Бенчмарк горячих путей ZeaControl на синтетических данных с фейковым SSH. "
+        "Данные создаются в транзакции и откатываются после прогона."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--servers", type=int, default=10)
+        parser.add_argument("--projects", type=int, default=1000)
+        parser.add_argument("--deployments", type=int, default=5, help="Деплоев на проект")
+        parser.add_argument("--log-kb", type=int, default=4, help="Размер лога деплоя (КБ)")
+        parser.add_argument("--ssh-latency", type=float, default=50, help="Задержка фейкового SSH (мс)")
+        parser.add_argument("--ssh-output-kb", type=int, default=4, help="Объём вывода фейкового SSH (КБ)")
+        parser.add_argument("--bulk", type=int, default=100, help="Проектов в массовом действии админки")
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--only", nargs="*", help="Запустить только указанные бенчмарки")
+        parser.add_argument("--output-dir", default="benchmarks", help="Куда сохранить результаты")
+        parser.add_argument("--compare", help="Файл результатов или коммит для сравнения")
+        parser.add_argument(
+            "--threshold", type=float, default=0.2,
+            help="Допустимое ухудшение времени (доля), иначе команда завершится с ошибкой",
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.fake_ssh = FakeSSH(
+            latency=options["ssh_latency"] / 1000,
+            output_bytes=options["ssh_output_kb"] * 1024,
+        )
+
+        baseline = self._load_baseline(options["compare"]) if options["compare"] else None
+
+        results = {}
+        try:
+            with transaction.atomic():
+                self._seed()
+                with ExitStack() as stack:
+                    self._patch(stack)
+                    for name, func in self._benchmarks():
+                        if options["only"] and name not in options["only"]:
+                            continue
+                        results[name] = self._measure(func)
+                        self._print_result(name, results[name])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        report = {
+            "commit": self._git_commit(),
+            "created_at": timezone.now().isoformat(),
+            "params": {
+                k: options[k] for k in (
+                    "servers", "projects", "deployments", "log_kb",
+                    "ssh_latency", "ssh_output_kb", "bulk", "repeat",
+                )
+            },
+            "results": results,
+        }
+        path = self._save(report)
+        self.stdout.write(self.style.SUCCESS(f"Результаты сохранены: {path}"))
+
+        if baseline:
+            self._compare(report, baseline)
+
+    # === Данные ===
+
+    def _seed(self):
+        o = self.options
+        t0 = time.perf_counter()
+        today = timezone.now().date()
+
+        servers = Server.objects.bulk_create([
+            Server(
+                name=f"bench-{i}", ip_address=f"10.0.{i // 250}.{i % 250 + 1}",
+                cpu_cores=random.choice([4, 8, 16]), memory_mb=random.choice([8192, 16384, 32768]),
+            )
+            for i in range(o["servers"])
+        ])
+
+        # Свободные порты кончаются на ~1000 проектов, дальше — без порта
+        used_ports = set(Project.objects.values_list("internal_port", flat=True))
+        ports = (p for p in range(PORT_RANGE_START, PORT_RANGE_END + 1) if p not in used_ports)
+        statuses = ["active"] * 6 + ["grace", "suspended", "failed", "new"]
+        projects = []
+        for i in range(o["projects"]):
+            paid_shift = random.randint(-20, 40)
+            projects.append(Project(
+                name=f"Bench {i}",
+                slug=f"bench-{i}",
+                github_repo=f"https://github.com/bench/repo-{i}",
+                server=servers[i % len(servers)],
+                domain=f"bench-{i}.example.com",
+                internal_port=next(ports, None),
+                price_per_month=random.choice([0, 500, 1000, 2500]),
+                paid_until=today + timedelta(days=paid_shift),
+                grace_until=today + timedelta(days=paid_shift + 7) if paid_shift < 0 else None,
+                status=statuses[i % len(statuses)],
+            ))
+        projects = Project.objects.bulk_create(projects, batch_size=1000)
+
+        log = "x" * (o["log_kb"] * 1024)
+        now = timezone.now()
+        batch = []
+        for project in projects:
+            for j in range(o["deployments"]):
+                started = now - timedelta(hours=j * 6 + 1)
+                status = random.choice(["success", "success", "success", "failed"])
+                batch.append(Deployment(
+                    project=project,
+                    action=random.choice(["deploy", "deploy", "suspend", "resume"]),
+                    status=status,
+                    enqueued_at=started - timedelta(seconds=random.randint(1, 60)),
+                    started_at=started,
+                    finished_at=started + timedelta(seconds=random.randint(10, 600)),
+                    log=log + "\nModuleNotFoundError: No module named 'bench'" if status == "failed" else log,
+                ))
+            if len(batch) >= 5000:
+                Deployment.objects.bulk_create(batch)
+                batch = []
+        Deployment.objects.bulk_create(batch)
+
+        # bulk_create не шлёт сигналы — события биллинга и агрегаты серверов считаем явно
+        for project in projects:
+            schedule_billing_events(project, reset=False)
+        refresh_server_load(*(s.id for s in servers))
+
+        # Данные в незакоммиченной транзакции, autovacuum их не видит: без
+        # статистики планировщик строит планы как для пустых таблиц
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                for model in (Server, Project, Deployment, BillingEvent):
+                    cursor.execute(f"ANALYZE {model._meta.db_table}")
+
+        self.user = User.objects.create_superuser("bench-admin", "bench@example.com", None)
+        self.sample_project = projects[len(projects) // 2]
+        self.bulk_ids = [p.id for p in projects[: o["bulk"]]]
+        self.stdout.write(
+            f"Данные: {len(servers)} серверов, {len(projects)} проектов, "
+            f"{len(projects) * o['deployments']} деплоев за {time.perf_counter() - t0:.1f}с"
+        )
+
+    def _patch(self, stack):
+        stack.enter_context(mock.patch("apps.projects.tasks.run_ssh", self.fake_ssh))
+        stack.enter_context(mock.patch("apps.projects.services.nginx_config.run_ssh", self.fake_ssh))
+        # Репозитории бенчмарка не существуют: серверы «тянут из GitHub» через FakeSSH
+        stack.enter_context(mock.patch("apps.projects.services.git_mirror.GIT_MIRROR", False))
+        stack.enter_context(mock.patch("apps.projects.services.notifications.notify_telegram", return_value=True))
+        stack.enter_context(mock.patch("apps.projects.tasks.notify_telegram", return_value=True))
+        # Свой кеш в памяти: синтетические данные не должны попасть в общий Redis
+        stack.enter_context(override_settings(CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "zea-bench"},
+        }))
+
+        # Задачи выполняются в процессе, без брокера
+        eager = current_app.conf.task_always_eager
+        current_app.conf.task_always_eager = True
+        stack.callback(setattr, current_app.conf, "task_always_eager", eager)
+
+    # === Бенчмарки ===
+
+    def _benchmarks(self):
+        from apps.projects import views
+        from apps.projects.management.commands.bot import register_handlers
+        from apps.projects.tasks import check_billing_task, deploy_project_task, process_billing_events_task
+
+        factory = RequestFactory()
+
+        def view(func, path, *args, **kwargs):
+            def run():
+                request = factory.get(path)
+                request.user = self.user
+                request.session = {}
+                request._messages = FallbackStorage(request)
+                response = func(request, *args, **kwargs)
+                assert response.status_code == 200, response.status_code
+            return run
+
+        def deploy_cycle():
+            Project.objects.filter(id=self.sample_project.id).update(status="active")
+            deploy_project_task.run(self.sample_project.id)
+
+        def admin_bulk(action):
+            model_admin = admin_site._registry[Project]
+
+            def run():
+                request = factory.post("/admin/projects/project/")
+                request.user = self.user
+                request.session = {}
+                request._messages = FallbackStorage(request)
+                queryset = Project.objects.filter(id__in=self.bulk_ids)
+                with mock.patch("celery.app.task.Task.apply_async"):
+                    getattr(model_admin, action)(request, queryset)
+            return run
+
+        def billing_run():
+            with transaction.atomic():
+                check_billing_task.run()
+                transaction.set_rollback(True)
+
+        def billing_poll():
+            # Горячий путь: проход поллера, события создаются сверкой заранее
+            with transaction.atomic():
+                process_billing_events_task.run()
+                transaction.set_rollback(True)
+
+        bot = FakeBot()
+        register_handlers(bot)
+        admin_chat = SimpleNamespace(id=self._admin_chat_id())
+
+        def bot_command(text):
+            command = text.split()[0].lstrip("/")
+
+            def run():
+                message = SimpleNamespace(text=text, chat=admin_chat)
+                bot.handlers[command](message)
+            return run
+
+        slug = self.sample_project.slug
+        return [
+            ("dashboard_view", view(views.dashboard_view, "/")),
+            ("billing_view", view(views.billing_view, "/billing/")),
+            ("servers_view", view(views.servers_view, "/servers/")),
+            ("project_detail_view", view(views.project_detail_view, f"/project/{slug}/", slug)),
+            ("check_billing_task", billing_run),
+            ("billing_events_poll", billing_poll),
+            ("deploy_cycle", deploy_cycle),
+            ("admin_bulk_deploy", admin_bulk("deploy")),
+            ("admin_bulk_suspend", admin_bulk("suspend")),
+            ("bot_status", bot_command("/status")),
+            ("bot_billing", bot_command("/billing")),
+            ("bot_servers", bot_command("/servers")),
+            ("bot_info", bot_command(f"/info {slug}")),
+            ("bot_logs", bot_command(f"/logs {slug}")),
+            ("bot_queue", bot_command("/queue")),
+            ("bot_search", bot_command("/search ModuleNotFoundError")),
+            # rank, а не suggest: порты бенчмарк исчерпывает намеренно
+            ("placement_rank", lambda: rank_servers(Project(memory_limit_mb=512))),
+            ("placement_rebalance", rebalance_plan),
+        ]
+
+    def _measure(self, func):
+        """Время — без tracemalloc (он замедляет код), память — отдельным прогоном."""
+        times = []
+        queries = 0
+        ssh_calls = 0
+        for _ in range(self.options["repeat"]):
+            calls_before = self.fake_ssh.calls
+            with CaptureQueriesContext(connection) as ctx:
+                t0 = time.perf_counter()
+                func()
+                times.append(time.perf_counter() - t0)
+            queries = len(ctx.captured_queries)
+            ssh_calls = self.fake_ssh.calls - calls_before
+
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return {
+            "wall_min_ms": round(min(times) * 1000, 2),
+            "wall_median_ms": round(statistics.median(times) * 1000, 2),
+            "queries": queries,
+            "peak_memory_kb": peak // 1024,
+            "ssh_calls": ssh_calls,
+        }
+
+    def _print_result(self, name, r):
+        self.stdout.write(
+            f"{name:<24} {r['wall_median_ms']:>10.1f} мс  (min {r['wall_min_ms']:.1f})  "
+            f"SQL: {r['queries']:<5} память: {r['peak_memory_kb']} КБ  SSH: {r['ssh_calls']}"
+        )
+
+    # === Хранение и сравнение ===
+
+    @staticmethod
+    def _admin_chat_id():
+        from apps.projects.management.commands import bot
+        return bot.TELEGRAM_ADMIN_CHAT_ID
+
+    @staticmethod
+    def _git_commit():
+        try:
+            return subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"],
+                capture_output=True, text=True, timeout=5,
+            ).stdout.strip() or "unknown"
+        except Exception:
+            return "unknown"
+
+    def _save(self, report):
+        out_dir = Path(self.options["output_dir"])
+        out_dir.mkdir(parents=True, exist_ok=True)
+        path = out_dir / f"{report['commit']}.json"
+        path.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+        (out_dir / "latest.json").write_text(json.dumps(report, indent=2, ensure_ascii=False))
+        return path
+
+    def _load_baseline(self, ref):
+        path = Path(ref)
+        if not path.exists():
+            path = Path(self.options["output_dir"]) / f"{ref}.json"
+        if not path.exists():
+            raise CommandError(f"Результаты для сравнения не найдены: {ref}")
+        return json.loads(path.read_text())
+
+    def _compare(self, report, baseline):
+        if baseline["params"] != report["params"]:
+            self.stdout.write(self.style.WARNING("Параметры прогонов отличаются — сравнение приблизительное"))
+
+        self.stdout.write(f"\nСравнение с {baseline['commit']}:")
+        regressions = []
+        threshold = self.options["threshold"]
+        for name, current in report["results"].items():
+            old = baseline["results"].get(name)
+            if not old:
+                continue
+            delta = (current["wall_median_ms"] - old["wall_median_ms"]) / max(old["wall_median_ms"], 0.001)
+            query_delta = current["queries"] - old["queries"]
+            mark = ""
+            if delta > threshold or query_delta > 0:
+                mark = " ⚠️"
+                regressions.append(name)
+            self.stdout.write(
+                f"{name:<24} {old['wall_median_ms']:>9.1f} → {current['wall_median_ms']:>9.1f} мс "
+                f"({delta:+.0%})  SQL {old['queries']} → {current['queries']}{mark}"
+            )
+
+        if regressions:
+            raise CommandError(f"Регрессия производительности: {', '.join(regressions)}")
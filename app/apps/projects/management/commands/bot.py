@@ -1,266 +1,416 @@
 import os
+import re
+import signal
+import sys
 import logging
+from functools import wraps
+
 import telebot
 from django.core.management.base import BaseCommand
+from django.db import InterfaceError, OperationalError, close_old_connections
+from django.utils.html import escape
 from apps.projects.models import Project, Server, Deployment
-from apps.projects.tasks import deploy_project_task, suspend_project_task, resume_project_task
+from apps.projects.services.log_search import headlines, search_deployments
+from apps.projects.services.stats import annotate_queue
+from apps.projects.services.env_store import diff_summary, pending_env
+from apps.projects.services.leader import LEADER_TTL, LeaderLease, run_while_leader
+from apps.projects.tasks import PRIORITY_HIGH, enqueue_apply_env, enqueue_deploy, enqueue_resume, enqueue_suspend
 
 logger = logging.getLogger(__name__)
 
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
 TELEGRAM_ADMIN_CHAT_ID = os.getenv("TELEGRAM_ADMIN_CHAT_ID", "")
 
+# /search: результатов на страницу и номер страницы в конце запроса («#2»)
+SEARCH_PAGE_SIZE = 5
+SEARCH_PAGE_RE = re.compile(r"\s+#(\d+)$")
+
+# Long polling не дольше аренды лидера: потеряв аренду, бот перестаёт
+# забирать обновления, пока новый лидер ещё не начал
+LONG_POLLING_TIMEOUT = int(LEADER_TTL)
+
+
+def with_db_connection(bot, handler):
+    """
+    Бот — долгоживущий процесс без request-цикла Django: сами закрываем
+    устаревшие соединения до и после обработки сообщения, а при обрыве
+    соединения отвечаем пользователю вместо тишины.
+    """
+    @wraps(handler)
+    def wrapper(message, *args, **kwargs):
+        close_old_connections()
+        try:
+            return handler(message, *args, **kwargs)
+        except (InterfaceError, OperationalError) as e:
+            logger.warning(f"Бот: ошибка БД в {handler.__name__}: {e}")
+            bot.reply_to(message, "⚠️ База данных недоступна, повторите команду позже")
+        finally:
+            close_old_connections()
+    return wrapper
+
+
+def register_handlers(bot):
+    """Регистрирует обработчики команд бота (используется и бенчмарком без Telegram)."""
+
+    def is_admin(message):
+        """Проверяет что сообщение от админа."""
+        return str(message.chat.id) == TELEGRAM_ADMIN_CHAT_ID
+
+    @bot.message_handler(commands=["start"])
+    def cmd_start(message):
+        if not is_admin(message):
+            bot.reply_to(message, "⛔ Доступ запрещён")
+            return
+        bot.reply_to(
+            message,
+            "👋 <b>ZeaControl Bot</b>\n\n"
+            "Команды:\n"
+            "/status — Все проекты\n"
+            "/deploy &lt;slug&gt; — Деплой проекта\n"
+            "/suspend &lt;slug&gt; — Остановить проект\n"
+            "/resume &lt;slug&gt; — Возобновить проект\n"
+            "/env &lt;slug&gt; — Применить env без пересборки\n"
+            "/logs &lt;slug&gt; — Последний лог деплоя\n"
+            "/search &lt;текст&gt; [#страница] — Поиск по логам\n"
+            "/queue — Очередь операций и ETA\n"
+            "/billing — Биллинг проектов\n"
+            "/servers — Список серверов\n"
+            "/info &lt;slug&gt; — Детали проекта",
+            parse_mode="HTML",
+        )
+
+    @bot.message_handler(commands=["status"])
+    def cmd_status(message):
+        if not is_admin(message):
+            return
 
-class Command(BaseCommand):
-    help = "Запуск Telegram бота ZeaControl"
+        projects = Project.objects.select_related("server").all()
+        if not projects:
+            bot.reply_to(message, "📭 Нет проектов")
+            return
 
-    def handle(self, *args, **options):
-        if not TELEGRAM_BOT_TOKEN:
-            self.stderr.write(self.style.ERROR(
-                "TELEGRAM_BOT_TOKEN не задан! Добавь его в .env"
-            ))
+        status_icons = {
+            "new": "🆕", "deploying": "🔄", "active": "🟢",
+            "grace": "🟡", "suspended": "🔴", "failed": "❌",
+        }
+
+        lines = ["📊 <b>Все проекты:</b>\n"]
+        for p in projects:
+            icon = status_icons.get(p.status, "❓")
+            domain = p.domain if p.domain else "—"
+            lines.append(f"{icon} <b>{p.name}</b> | {domain} | :{p.internal_port}")
+
+        bot.reply_to(message, "\n".join(lines), parse_mode="HTML")
+
+    @bot.message_handler(commands=["deploy"])
+    def cmd_deploy(message):
+        if not is_admin(message):
             return
 
-        bot = telebot.TeleBot(TELEGRAM_BOT_TOKEN)
-        self.stdout.write(self.style.SUCCESS("🤖 ZeaControl Bot запущен..."))
+        parts = message.text.strip().split()
+        if len(parts) < 2:
+            bot.reply_to(message, "❗ Использование: /deploy <slug>")
+            return
 
-        def is_admin(message):
-            """Проверяет что сообщение от админа."""
-            return str(message.chat.id) == TELEGRAM_ADMIN_CHAT_ID
-
-        @bot.message_handler(commands=["start"])
-        def cmd_start(message):
-            if not is_admin(message):
-                bot.reply_to(message, "⛔ Доступ запрещён")
-                return
-            bot.reply_to(
-                message,
-                "👋 <b>ZeaControl Bot</b>\n\n"
-                "Команды:\n"
-                "/status — Все проекты\n"
-                "/deploy &lt;slug&gt; — Деплой проекта\n"
-                "/suspend &lt;slug&gt; — Остановить проект\n"
-                "/resume &lt;slug&gt; — Возобновить проект\n"
-                "/logs &lt;slug&gt; — Последний лог деплоя\n"
-                "/billing — Биллинг проектов\n"
-                "/servers — Список серверов\n"
-                "/info &lt;slug&gt; — Детали проекта",
-                parse_mode="HTML",
-            )
+        slug = parts[1]
+        try:
+            project = Project.objects.get(slug=slug)
+        except Project.DoesNotExist:
+            bot.reply_to(message, f"❌ Проект <b>{slug}</b> не найден", parse_mode="HTML")
+            return
 
-        @bot.message_handler(commands=["status"])
-        def cmd_status(message):
-            if not is_admin(message):
-                return
-
-            projects = Project.objects.select_related("server").all()
-            if not projects:
-                bot.reply_to(message, "📭 Нет проектов")
-                return
-
-            status_icons = {
-                "new": "🆕", "deploying": "🔄", "active": "🟢",
-                "grace": "🟡", "suspended": "🔴", "failed": "❌",
-            }
-
-            lines = ["📊 <b>Все проекты:</b>\n"]
-            for p in projects:
-                icon = status_icons.get(p.status, "❓")
-                domain = p.domain if p.domain else "—"
-                lines.append(f"{icon} <b>{p.name}</b> | {domain} | :{p.internal_port}")
-
-            bot.reply_to(message, "\n".join(lines), parse_mode="HTML")
-
-        @bot.message_handler(commands=["deploy"])
-        def cmd_deploy(message):
-            if not is_admin(message):
-                return
-
-            parts = message.text.strip().split()
-            if len(parts) < 2:
-                bot.reply_to(message, "❗ Использование: /deploy <slug>")
-                return
-
-            slug = parts[1]
-            try:
-                project = Project.objects.get(slug=slug)
-            except Project.DoesNotExist:
-                bot.reply_to(message, f"❌ Проект <b>{slug}</b> не найден", parse_mode="HTML")
-                return
-
-            if project.status == "deploying":
-                bot.reply_to(message, f"⏳ Проект <b>{project.name}</b> уже деплоится", parse_mode="HTML")
-                return
-
-            deploy_project_task.delay(project.id)
-            bot.reply_to(
-                message,
-                f"🚀 Деплой <b>{project.name}</b> запущен!\nСервер: {project.server.name}",
-                parse_mode="HTML",
-            )
+        if project.status == "deploying":
+            bot.reply_to(message, f"⏳ Проект <b>{project.name}</b> уже деплоится", parse_mode="HTML")
+            return
 
-        @bot.message_handler(commands=["suspend"])
-        def cmd_suspend(message):
-            if not is_admin(message):
-                return
-
-            parts = message.text.strip().split()
-            if len(parts) < 2:
-                bot.reply_to(message, "❗ Использование: /suspend <slug>")
-                return
-
-            slug = parts[1]
-            try:
-                project = Project.objects.get(slug=slug)
-            except Project.DoesNotExist:
-                bot.reply_to(message, f"❌ Проект <b>{slug}</b> не найден", parse_mode="HTML")
-                return
-
-            suspend_project_task.delay(project.id)
-            bot.reply_to(
-                message,
-                f"⛔ Suspend <b>{project.name}</b> запущен!",
-                parse_mode="HTML",
-            )
+        dep = annotate_queue([enqueue_deploy(project.id, priority=PRIORITY_HIGH)])[0]
+        bot.reply_to(
+            message,
+            f"🚀 Деплой <b>{project.name}</b> запущен!\nСервер: {project.server.name}\n"
+            f"Позиция в очереди: {dep.queue_position} | ETA ~{dep.eta_display}",
+            parse_mode="HTML",
+        )
+
+    @bot.message_handler(commands=["suspend"])
+    def cmd_suspend(message):
+        if not is_admin(message):
+            return
+
+        parts = message.text.strip().split()
+        if len(parts) < 2:
+            bot.reply_to(message, "❗ Использование: /suspend <slug>")
+            return
+
+        slug = parts[1]
+        try:
+            project = Project.objects.get(slug=slug)
+        except Project.DoesNotExist:
+            bot.reply_to(message, f"❌ Проект <b>{slug}</b> не найден", parse_mode="HTML")
+            return
+
+        enqueue_suspend(project.id, priority=PRIORITY_HIGH)
+        bot.reply_to(
+            message,
+            f"⛔ Suspend <b>{project.name}</b> запущен!",
+            parse_mode="HTML",
+        )
+
+    @bot.message_handler(commands=["resume"])
+    def cmd_resume(message):
+        if not is_admin(message):
+            return
+
+        parts = message.text.strip().split()
+        if len(parts) < 2:
+            bot.reply_to(message, "❗ Использование: /resume <slug>")
+            return
+
+        slug = parts[1]
+        try:
+            project = Project.objects.get(slug=slug)
+        except Project.DoesNotExist:
+            bot.reply_to(message, f"❌ Проект <b>{slug}</b> не найден", parse_mode="HTML")
+            return
+
+        enqueue_resume(project.id)
+        bot.reply_to(
+            message,
+            f"✅ Resume <b>{project.name}</b> запущен!",
+            parse_mode="HTML",
+        )
+
+    @bot.message_handler(commands=["env"])
+    def cmd_env(message):
+        if not is_admin(message):
+            return
+
+        parts = message.text.strip().split()
+        if len(parts) < 2:
+            bot.reply_to(message, "❗ Использование: /env <slug>")
+            return
+
+        slug = parts[1]
+        try:
+            project = Project.objects.select_related("env_pushed").get(slug=slug)
+        except Project.DoesNotExist:
+            bot.reply_to(message, f"❌ Проект <b>{slug}</b> не найден", parse_mode="HTML")
+            return
+
+        pending = pending_env(project)
+        if pending is None:
+            bot.reply_to(message, f"✅ Env <b>{project.name}</b> на сервере актуален", parse_mode="HTML")
+            return
+
+        version, diff = pending
+        enqueue_apply_env(project.id)
+        bot.reply_to(
+            message,
+            f"🔑 Env v{version.version} <b>{project.name}</b> применяется\n"
+            f"{escape(diff_summary(diff)) or 'Без изменений переменных'}",
+            parse_mode="HTML",
+        )
+
+    @bot.message_handler(commands=["logs"])
+    def cmd_logs(message):
+        if not is_admin(message):
+            return
+
+        parts = message.text.strip().split()
+        if len(parts) < 2:
+            bot.reply_to(message, "❗ Использование: /logs <slug>")
+            return
+
+        slug = parts[1]
+        try:
+            project = Project.objects.get(slug=slug)
+        except Project.DoesNotExist:
+            bot.reply_to(message, f"❌ Проект <b>{slug}</b> не найден", parse_mode="HTML")
+            return
+
+        last_dep = Deployment.objects.filter(project=project).order_by("-enqueued_at").first()
+        if not last_dep:
+            bot.reply_to(message, f"📭 Нет деплоев для <b>{project.name}</b>", parse_mode="HTML")
+            return
+
+        log_text = last_dep.log[:3000] if last_dep.log else "Лог пустой"
+        bot.reply_to(
+            message,
+            f"📋 <b>{project.name}</b> — {last_dep.get_action_display()} — {last_dep.get_status_display()}\n"
+            f"🕐 {last_dep.enqueued_at.strftime('%d.%m.%Y %H:%M')}\n\n"
+            f"<pre>{log_text}</pre>",
+            parse_mode="HTML",
+        )
+
+    @bot.message_handler(commands=["search"])
+    def cmd_search(message):
+        if not is_admin(message):
+            return
+
+        parts = message.text.strip().split(maxsplit=1)
+        if len(parts) < 2:
+            bot.reply_to(message, "❗ Использование: /search <текст> [#страница]")
+            return
+
+        text, page = parts[1], 1
+        match = SEARCH_PAGE_RE.search(text)
+        if match:
+            text, page = text[:match.start()], max(int(match.group(1)), 1)
+
+        found = search_deployments(text)
+        total = found.count()
+        offset = (page - 1) * SEARCH_PAGE_SIZE
+        deployments = list(found[offset:offset + SEARCH_PAGE_SIZE])
+        if not deployments:
+            bot.reply_to(message, f"🔍 Ничего не найдено по «{escape(text)}»", parse_mode="HTML")
+            return
 
-        @bot.message_handler(commands=["resume"])
-        def cmd_resume(message):
-            if not is_admin(message):
-                return
-
-            parts = message.text.strip().split()
-            if len(parts) < 2:
-                bot.reply_to(message, "❗ Использование: /resume <slug>")
-                return
-
-            slug = parts[1]
-            try:
-                project = Project.objects.get(slug=slug)
-            except Project.DoesNotExist:
-                bot.reply_to(message, f"❌ Проект <b>{slug}</b> не найден", parse_mode="HTML")
-                return
-
-            resume_project_task.delay(project.id)
-            bot.reply_to(
-                message,
-                f"✅ Resume <b>{project.name}</b> запущен!",
-                parse_mode="HTML",
+        pages = (total + SEARCH_PAGE_SIZE - 1) // SEARCH_PAGE_SIZE
+        lines = [f"🔍 <b>{escape(text)}</b> — найдено {total}, стр. {page}/{pages}\n"]
+        fragments = headlines(deployments, text, markup="b")
+        for dep in deployments:
+            lines.append(
+                f"{dep.get_status_display()[:1]} <b>{dep.project.name}</b> — {dep.get_action_display()} "
+                f"#{dep.id} | {dep.enqueued_at.strftime('%d.%m.%Y %H:%M')}\n"
+                f"{fragments.get(dep.id, '')}\n"
             )
+        if page < pages:
+            lines.append(f"Дальше: <code>/search {escape(text)} #{page + 1}</code>")
+
+        bot.reply_to(message, "\n".join(lines), parse_mode="HTML")
+
+    @bot.message_handler(commands=["queue"])
+    def cmd_queue(message):
+        if not is_admin(message):
+            return
 
-        @bot.message_handler(commands=["logs"])
-        def cmd_logs(message):
-            if not is_admin(message):
-                return
-
-            parts = message.text.strip().split()
-            if len(parts) < 2:
-                bot.reply_to(message, "❗ Использование: /logs <slug>")
-                return
-
-            slug = parts[1]
-            try:
-                project = Project.objects.get(slug=slug)
-            except Project.DoesNotExist:
-                bot.reply_to(message, f"❌ Проект <b>{slug}</b> не найден", parse_mode="HTML")
-                return
-
-            last_dep = Deployment.objects.filter(project=project).order_by("-started_at").first()
-            if not last_dep:
-                bot.reply_to(message, f"📭 Нет деплоев для <b>{project.name}</b>", parse_mode="HTML")
-                return
-
-            log_text = last_dep.log[:3000] if last_dep.log else "Лог пустой"
-            bot.reply_to(
-                message,
-                f"📋 <b>{project.name}</b> — {last_dep.get_action_display()} — {last_dep.get_status_display()}\n"
-                f"🕐 {last_dep.started_at.strftime('%d.%m.%Y %H:%M')}\n\n"
-                f"<pre>{log_text}</pre>",
-                parse_mode="HTML",
+        deployments = annotate_queue(
+            Deployment.objects.select_related("project")
+            .filter(status__in=["pending", "running"])
+            .order_by("priority", "enqueued_at")
+        )
+        if not deployments:
+            bot.reply_to(message, "📭 Очередь пуста")
+            return
+
+        lines = ["⏳ <b>Очередь:</b>\n"]
+        for dep in deployments:
+            if dep.status == "running":
+                eta = f"выполняется, осталось ~{dep.eta_display}"
+            else:
+                eta = f"#{dep.queue_position} в «{dep.queue}», ETA ~{dep.eta_display}"
+            lines.append(
+                f"{dep.get_status_display()[:1]} <b>{dep.project.name}</b> — "
+                f"{dep.get_action_display()} | {eta}"
             )
 
-        @bot.message_handler(commands=["billing"])
-        def cmd_billing(message):
-            if not is_admin(message):
-                return
-
-            projects = Project.objects.exclude(
-                price_per_month=0
-            ).order_by("paid_until")
-
-            if not projects:
-                bot.reply_to(message, "📭 Нет проектов с биллингом")
-                return
-
-            lines = ["💰 <b>Биллинг:</b>\n"]
-            for p in projects:
-                paid = p.paid_until.strftime("%d.%m.%Y") if p.paid_until else "—"
-                status_icon = "🟢" if p.is_paid() else "🔴"
-                lines.append(
-                    f"{status_icon} <b>{p.name}</b>\n"
-                    f"   💵 {p.price_per_month} сом/мес | до: {paid}"
-                )
-
-            bot.reply_to(message, "\n".join(lines), parse_mode="HTML")
-
-        @bot.message_handler(commands=["servers"])
-        def cmd_servers(message):
-            if not is_admin(message):
-                return
-
-            servers = Server.objects.all()
-            if not servers:
-                bot.reply_to(message, "📭 Нет серверов")
-                return
-
-            lines = ["🖧 <b>Серверы:</b>\n"]
-            for s in servers:
-                count = s.projects.count()
-                lines.append(f"🖥️ <b>{s.name}</b> | {s.ip_address} | Проектов: {count}")
-
-            bot.reply_to(message, "\n".join(lines), parse_mode="HTML")
-
-        @bot.message_handler(commands=["info"])
-        def cmd_info(message):
-            if not is_admin(message):
-                return
-
-            parts = message.text.strip().split()
-            if len(parts) < 2:
-                bot.reply_to(message, "❗ Использование: /info <slug>")
-                return
-
-            slug = parts[1]
-            try:
-                project = Project.objects.select_related("server").get(slug=slug)
-            except Project.DoesNotExist:
-                bot.reply_to(message, f"❌ Проект <b>{slug}</b> не найден", parse_mode="HTML")
-                return
-
-            paid = project.paid_until.strftime("%d.%m.%Y") if project.paid_until else "—"
-            last_deploy = project.last_deploy_at.strftime("%d.%m.%Y %H:%M") if project.last_deploy_at else "—"
-
-            status_icons = {
-                "new": "🆕", "deploying": "🔄", "active": "🟢",
-                "grace": "🟡", "suspended": "🔴", "failed": "❌",
-            }
-            icon = status_icons.get(project.status, "❓")
-
-            bot.reply_to(
-                message,
-                f"📦 <b>{project.name}</b>\n\n"
-                f"Статус: {icon} {project.get_status_display()}\n"
-                f"Домен: {project.domain or '—'}\n"
-                f"Сервер: {project.server.name} ({project.server.ip_address})\n"
-                f"Порт: {project.internal_port}\n"
-                f"GitHub: {project.github_repo}\n"
-                f"Ветка: {project.github_branch}\n"
-                f"Docker: {project.compose_file}\n\n"
-                f"💰 Стоимость: {project.price_per_month} сом/мес\n"
-                f"📅 Оплачено до: {paid}\n"
-                f"🕐 Последний деплой: {last_deploy}",
-                parse_mode="HTML",
+        bot.reply_to(message, "\n".join(lines), parse_mode="HTML")
+
+    @bot.message_handler(commands=["billing"])
+    def cmd_billing(message):
+        if not is_admin(message):
+            return
+
+        projects = Project.objects.exclude(
+            price_per_month=0
+        ).order_by("paid_until")
+
+        if not projects:
+            bot.reply_to(message, "📭 Нет проектов с биллингом")
+            return
+
+        lines = ["💰 <b>Биллинг:</b>\n"]
+        for p in projects:
+            paid = p.paid_until.strftime("%d.%m.%Y") if p.paid_until else "—"
+            status_icon = "🟢" if p.is_paid() else "🔴"
+            lines.append(
+                f"{status_icon} <b>{p.name}</b>\n"
+                f"   💵 {p.price_per_month} сом/мес | до: {paid}"
             )
 
-        # Запускаем бота
-        logger.info("Telegram бот запущен, ожидаем сообщения...")
-        bot.infinity_polling(timeout=60, long_polling_timeout=60)
+        bot.reply_to(message, "\n".join(lines), parse_mode="HTML")
+
+    @bot.message_handler(commands=["servers"])
+    def cmd_servers(message):
+        if not is_admin(message):
+            return
+
+        servers = Server.objects.all()
+        if not servers:
+            bot.reply_to(message, "📭 Нет серверов")
+            return
+
+        lines = ["🖧 <b>Серверы:</b>\n"]
+        for s in servers:
+            lines.append(f"🖥️ <b>{s.name}</b> | {s.ip_address} | Проектов: {s.project_count}")
+
+        bot.reply_to(message, "\n".join(lines), parse_mode="HTML")
+
+    @bot.message_handler(commands=["info"])
+    def cmd_info(message):
+        if not is_admin(message):
+            return
+
+        parts = message.text.strip().split()
+        if len(parts) < 2:
+            bot.reply_to(message, "❗ Использование: /info <slug>")
+            return
+
+        slug = parts[1]
+        try:
+            project = Project.objects.select_related("server").get(slug=slug)
+        except Project.DoesNotExist:
+            bot.reply_to(message, f"❌ Проект <b>{slug}</b> не найден", parse_mode="HTML")
+            return
+
+        paid = project.paid_until.strftime("%d.%m.%Y") if project.paid_until else "—"
+        last_deploy = project.last_deploy_at.strftime("%d.%m.%Y %H:%M") if project.last_deploy_at else "—"
+
+        status_icons = {
+            "new": "🆕", "deploying": "🔄", "active": "🟢",
+            "grace": "🟡", "suspended": "🔴", "failed": "❌",
+        }
+        icon = status_icons.get(project.status, "❓")
+
+        bot.reply_to(
+            message,
+            f"📦 <b>{project.name}</b>\n\n"
+            f"Статус: {icon} {project.get_status_display()}\n"
+            f"Домен: {project.domain or '—'}\n"
+            f"Сервер: {project.server.name} ({project.server.ip_address})\n"
+            f"Порт: {project.internal_port}\n"
+            f"GitHub: {project.github_repo}\n"
+            f"Ветка: {project.github_branch}\n"
+            f"Docker: {project.compose_file}\n\n"
+            f"💰 Стоимость: {project.price_per_month} сом/мес\n"
+            f"📅 Оплачено до: {paid}\n"
+            f"🕐 Последний деплой: {last_deploy}",
+            parse_mode="HTML",
+        )
+
+
+class Command(BaseCommand):
+    help = "Запуск Telegram бота ZeaControl"
+
+    def handle(self, *args, **options):
+        if not TELEGRAM_BOT_TOKEN:
+            self.stderr.write(self.style.ERROR(
+                "TELEGRAM_BOT_TOKEN не задан! Добавь его в .env"
+            ))
+            return
+
+        bot = telebot.TeleBot(TELEGRAM_BOT_TOKEN)
+        register_handlers(bot)
+        for handler in bot.message_handlers:
+            handler["function"] = with_db_connection(bot, handler["function"])
+        self.stdout.write(self.style.SUCCESS("🤖 ZeaControl Bot запущен..."))
+
+        # Два getUpdates на один токен конфликтуют: опрашивает только лидер,
+        # остальные копии ждут аренду. SIGTERM освобождает её сразу.
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        lease = LeaderLease("bot")
+        logger.info(f"Telegram бот {lease.identity} ждёт аренду лидера...")
+        run_while_leader(
+            lease,
+            lambda: bot.polling(non_stop=True, timeout=60, long_polling_timeout=LONG_POLLING_TIMEOUT),
+            bot.stop_polling,
+        )
@@ -0,0 +1,258 @@
+import getpass
+import shutil
+import subprocess
+import tempfile
+import time
+from contextlib import ExitStack
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+
+from celery import current_app
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from apps.projects.models import Deployment, Project, Server
+from apps.projects.services import backup, git_mirror, idle, migrate, nginx_config, ssh_exec, tls, traffic
+from apps.projects.services.env_store import save_env
+from apps.projects.services.resources import OVERRIDE_FILE, builder_name
+from apps.projects.services.ssh_standin import SSHStandIn
+
+
+class _Rollback(Exception):
+    """Откатывает транзакцию с тестовыми данными."""
+
+
+class Command(BaseCommand):
+    help = (
+        "Прогоняет deploy → env → suspend → resume → sleep → wake → migrate → restore → traffic через настоящий ssh "
+        "против локальных SSH-стендов. Данные в БД откатываются после прогона."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=1, help="Сколько раз повторить цикл")
+        parser.add_argument("--latency", type=float, default=0, help="Задержка стенда на сессию (мс)")
+        parser.add_argument("--shim-delay", type=float, default=0, help="Длительность fetch/build (сек)")
+        parser.add_argument("--keep", action="store_true", help="Не удалять каталог стенда")
+
+    def handle(self, *args, **options):
+        root = Path(tempfile.mkdtemp(prefix="zea-e2e-"))
+        standin = SSHStandIn(
+            root,
+            latency=options["latency"] / 1000,
+            shim_delay=options["shim_delay"],
+        )
+        # Второй «сервер» — цель переезда; ключ общий: run_ssh и rsync с исходного ходят с одним
+        target = SSHStandIn(root / "target", client_key=standin.client_key)
+        try:
+            standin.start()
+            target.start()
+        except RuntimeError as e:
+            standin.stop()
+            raise CommandError(str(e))
+
+        # «GitHub» — локальный репозиторий; зеркало настоящее, git на стенде — шим
+        origin = self._make_origin(root / "origin")
+
+        failures = []
+        try:
+            with ExitStack() as stack:
+                stack.enter_context(mock.patch.object(ssh_exec, "SSH_EXTRA_OPTIONS", standin.ssh_options))
+                # ssh со стенда на стенд: known_hosts стенда, а не ~/.ssh
+                migrate_options = " ".join(["-o StrictHostKeyChecking=accept-new", *standin.ssh_options])
+                stack.enter_context(mock.patch.object(migrate, "MIGRATION_SSH_OPTIONS", migrate_options))
+                stack.enter_context(mock.patch.object(nginx_config, "NGINX_CONF_DIR", standin.nginx_conf_dir))
+                stack.enter_context(mock.patch.object(nginx_config, "NGINX_CACHE_DIR", str(root / "cache")))
+                stack.enter_context(mock.patch.object(nginx_config, "NGINX_LOG_DIR", str(root / "logs")))
+                stack.enter_context(mock.patch.object(idle, "WAKE_BASE_URL", "http://panel.local"))
+                stack.enter_context(mock.patch.object(tls, "LETSENCRYPT_DIR", str(root / "letsencrypt")))
+                stack.enter_context(mock.patch.object(git_mirror, "GIT_MIRROR_DIR", str(root / "mirrors")))
+                stack.enter_context(mock.patch.object(backup, "BACKUP_REPOSITORY", str(root / "backups")))
+                stack.enter_context(mock.patch.object(backup, "BACKUP_PASSWORD", "e2e"))
+                for module in (tls, nginx_config):
+                    stack.enter_context(mock.patch.object(module, "ACME_WEBROOT", str(root / "acme")))
+                stack.enter_context(mock.patch("apps.projects.services.notifications.notify_telegram", return_value=True))
+                stack.enter_context(mock.patch("apps.projects.tasks.notify_telegram", return_value=True))
+                eager = current_app.conf.task_always_eager
+                current_app.conf.task_always_eager = True
+                stack.callback(setattr, current_app.conf, "task_always_eager", eager)
+
+                try:
+                    with transaction.atomic():
+                        for run in range(1, options["runs"] + 1):
+                            failures += self._cycle(standin, target, run, origin)
+                        raise _Rollback
+                except _Rollback:
+                    pass
+        finally:
+            standin.stop()
+            target.stop()
+            if options["keep"]:
+                self.stdout.write(f"Каталог стенда: {root}")
+            else:
+                shutil.rmtree(root, ignore_errors=True)
+
+        self.stdout.write(f"SSH-сессий: {standin.sessions + target.sessions}")
+        if failures:
+            raise CommandError("E2E провален:\n" + "\n".join(failures))
+        self.stdout.write(self.style.SUCCESS("E2E: все проверки пройдены"))
+
+    @staticmethod
+    def _make_origin(path):
+        git = ["git", "-c", "user.name=e2e", "-c", "user.email=e2e@local", "-C", str(path)]
+        subprocess.run(["git", "init", "-q", "-b", "main", str(path)], check=True)
+        (path / "docker-compose.yml").write_text("services:\n  web:\n    build: .\n")
+        subprocess.run([*git, "add", "."], check=True)
+        subprocess.run([*git, "commit", "-q", "-m", "e2e"], check=True)
+        return str(path)
+
+    def _cycle(self, standin, target, run, origin):
+        from apps.projects.tasks import (
+            enqueue_apply_env, enqueue_deploy, enqueue_migrate, enqueue_restore, enqueue_resume,
+            enqueue_sleep, enqueue_suspend, enqueue_wake,
+        )
+
+        def change_env(project_id):
+            save_env(project, "DEBUG=False\nSECRET_KEY='e2e'\nFEATURE=on")
+            return enqueue_apply_env(project_id)
+
+        def sleep(project_id):
+            # Порог 0: access-лог есть, но любой простой уже достаточен
+            Project.objects.filter(id=project_id).update(idle_timeout=0)
+            return enqueue_sleep(project_id)
+
+        def move(project_id):
+            # Загруженный файл: должен переехать вместе с каталогом проекта
+            upload.parent.mkdir(parents=True, exist_ok=True)
+            upload.write_text("e2e")
+            return enqueue_migrate(project_id, target_server.id)
+
+        def restore(project_id):
+            # Копия, потеря файла, восстановление: файл и дамп базы возвращаются
+            backups = backup.backup_projects([Project.objects.select_related("server").get(id=project_id)])
+            (target_path / "app" / "media" / "upload.txt").unlink()
+            return enqueue_restore(project_id, backups[0].id)
+
+        server = Server.objects.create(
+            name=f"standin-{run}",
+            ip_address=standin.host,
+            ssh_port=standin.port,
+            ssh_user=getpass.getuser(),
+            base_path=str(standin.root / "srv"),
+        )
+        target_server = Server.objects.create(
+            name=f"standin-target-{run}",
+            ip_address=target.host,
+            ssh_port=target.port,
+            ssh_user=getpass.getuser(),
+            base_path=str(target.root / "srv"),
+        )
+        project = Project.objects.create(
+            name=f"E2E {run}",
+            slug=f"e2e-{run}",
+            github_repo=origin,
+            server=server,
+            domain=f"e2e-{run}.local",
+            cpu_limit=Decimal("0.5"),
+            memory_limit_mb=256,
+            build_memory_mb=1024,
+            microcache=True,
+            tls=True,
+        )
+        save_env(project, "DEBUG=False\nSECRET_KEY='e2e'")
+        enabled = Path(standin.nginx_conf_dir) / "sites-enabled" / f"{project.slug}.conf"
+        env_file = Path(project.get_remote_path()) / ".env"
+        override = Path(project.get_remote_path()) / OVERRIDE_FILE
+        calls_log = standin.root / "calls.log"
+        source_path = Path(project.get_remote_path())
+        upload = source_path / "app" / "media" / "upload.txt"
+        target_path = Path(target_server.base_path) / project.slug
+
+        failures = []
+        checks = [
+            ("deploy", enqueue_deploy, "active", lambda: (
+                enabled.exists() and env_file.exists()
+                and Path(nginx_config.microcache_dir(project)).is_dir()
+                and "mem_limit: 256m" in override.read_text()
+                and f"buildx create --name {builder_name(project)}" in calls_log.read_text()
+                and Path(tls.cert_paths(project)["fullchain"]).exists()
+                and "listen 443 ssl http2;" in enabled.read_text()
+                and f"access_log {nginx_config.access_log_path(project)} zea_log_" in enabled.read_text()
+                and project.tls_expires_at is not None
+                and "git fetch -q .git/zea.bundle refs/heads/main" in calls_log.read_text()
+                and git_mirror.mirror_path(origin).is_dir()
+            )),
+            ("env", change_env, "active", lambda: (
+                "FEATURE=on" in env_file.read_text()
+                and "up -d --no-build" in calls_log.read_text()
+                and project.env_pushed.version == 2
+            )),
+            ("suspend", enqueue_suspend, "suspended", lambda: not enabled.exists()),
+            ("resume", enqueue_resume, "active", lambda: enabled.exists()),
+            ("sleep", sleep, "active", lambda: (
+                project.sleeping_since is not None
+                and idle.wake_url(project) in enabled.read_text()
+                and f"proxy_pass http://zea_{project.slug};" not in enabled.read_text()
+                and Path(nginx_config.access_log_path(project)).exists()
+            )),
+            ("wake", enqueue_wake, "active", lambda: (
+                project.sleeping_since is None
+                and idle.wake_url(project) not in enabled.read_text()
+                and f"proxy_pass http://zea_{project.slug};" in enabled.read_text()
+            )),
+            ("migrate", move, "active", lambda: (
+                project.server_id == target_server.id
+                and (target_path / "app" / "media" / "upload.txt").read_text() == "e2e"
+                and (target_path / ".env").exists()
+                and not source_path.exists()
+                and str(target_path) in enabled.read_text()
+                and " up -d" in (target.root / "calls.log").read_text()
+                and "downtime" in Deployment.objects.filter(action="migrate").latest("enqueued_at").timings
+            )),
+            ("restore", restore, "active", lambda: (
+                (target_path / "app" / "media" / "upload.txt").read_text() == "e2e"
+                and project.backups.get().status == "success"
+                and len(project.backups.get().databases) == 1
+                and "restic dump" in (target.root / "calls.log").read_text()
+                and (target.root / "db-restore.sql").read_text().startswith("-- standin dump")
+            )),
+        ]
+        for action, enqueue, expected_status, check in checks:
+            t0 = time.perf_counter()
+            dep = enqueue(project.id)
+            wall = time.perf_counter() - t0
+
+            dep = Deployment.objects.get(id=dep.id)
+            project.refresh_from_db()
+            timings = " ".join(f"{k}={v:.2f}" for k, v in dep.timings.items())
+            self.stdout.write(f"[{run}] {action:<8} {dep.status:<8} {wall:6.2f}с  {timings}")
+
+            if dep.status != "success" or project.status != expected_status:
+                failures.append(f"[{run}] {action}: {dep.status}/{project.status}\n{dep.log}")
+            elif not check():
+                failures.append(f"[{run}] {action}: состояние на стенде не совпало")
+        return failures + self._traffic(project, run)
+
+    def _traffic(self, project, run):
+        """Сбор трафика дважды: второй раз — только новые строки, в том числе из ротированного лога."""
+        log = Path(nginx_config.access_log_path(project))
+        line = f"{time.time():.3f} 200 512 0.020\n"
+        # Переезд сбросил позицию: лог на «новом сервере» — новый файл
+        log.unlink(missing_ok=True)
+        log.write_text(line * 3)
+
+        t0 = time.perf_counter()
+        errors = traffic.collect_traffic([project.server])
+        with log.open("a") as f:
+            f.write(line * 2)
+        log.rename(log.with_name(log.name + ".1"))
+        log.write_text(line * 4)
+        errors.update(traffic.collect_traffic([project.server]))
+        errors.update(traffic.collect_traffic([project.server]))
+        wall = time.perf_counter() - t0
+
+        summary = traffic.traffic_summary(project)
+        self.stdout.write(f"[{run}] {'traffic':<8} {summary['requests']:<8} {wall:6.2f}с  p50={summary['p50']:.1f}мс")
+        if errors or summary["requests"] != 9 or summary["bytes_sent"] != 9 * 512:
+            return [f"[{run}] traffic: {summary['requests']} запросов вместо 9, ошибки: {errors}"]
+        return []
@@ -0,0 +1,86 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.projects.models import Project, Server
+from apps.projects.services.fleet import (
+    FLEET_TIMEOUT,
+    FLEET_WORKERS,
+    group_outputs,
+    run_fleet,
+    servers_lookup,
+    summary,
+    targets_for_projects,
+    targets_for_servers,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Выполняет команду параллельно на серверах или в каталогах проектов. "
+        "Вывод идёт по мере поступления с префиксом хоста, в конце — сводная таблица."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("remote_command", help="Команда, например: \"df -h /\"")
+        parser.add_argument("--servers", nargs="*", metavar="NAME",
+                            help="Серверы по имени или IP (без значений — все)")
+        parser.add_argument("--projects", nargs="*", metavar="SLUG",
+                            help="Проекты по slug (без значений — все); команда выполняется в их каталоге")
+        parser.add_argument("--status", help="Только проекты с этим статусом (active, grace…)")
+        parser.add_argument("--workers", type=int, default=FLEET_WORKERS, help="Параллельных SSH-сессий")
+        parser.add_argument("--timeout", type=int, default=FLEET_TIMEOUT, help="Таймаут на хост (сек)")
+        parser.add_argument("--quiet", action="store_true", help="Без потокового вывода, только сводка")
+        parser.add_argument("--groups", action="store_true", help="Показать вывод, сгруппированный по хостам")
+
+    def handle(self, *args, **options):
+        targets = self._targets(options)
+        if not targets:
+            raise CommandError("Не выбрано ни одного сервера или проекта")
+
+        width = max(len(t.label) for t in targets)
+
+        def on_line(label, line):
+            self.stdout.write(f"{label:<{width}} | {line.rstrip()}")
+
+        results = run_fleet(
+            targets, options["remote_command"],
+            workers=options["workers"], timeout=options["timeout"],
+            on_line=None if options["quiet"] else on_line,
+        )
+
+        self.stdout.write("")
+        self.stdout.write(f"{'Хост':<{width}}  {'Статус':<10} {'Время':>8}")
+        for r in sorted(results, key=lambda r: (r.ok, -r.seconds)):
+            line = f"{r.target.label:<{width}}  {r.status:<10} {r.seconds:7.2f}с"
+            if r.outlier:
+                line += "  ⚠ медленно"
+            if r.error:
+                line += f"  {r.error.splitlines()[0]}"
+            style = self.style.SUCCESS if r.ok and not r.outlier else self.style.WARNING if r.ok else self.style.ERROR
+            self.stdout.write(style(line))
+
+        if options["groups"]:
+            for group in group_outputs(results):
+                self.stdout.write(f"\n=== {len(group.labels)} × {', '.join(group.labels)}")
+                self.stdout.write(group.output or "(пусто)")
+
+        s = summary(results)
+        self.stdout.write(
+            f"\nХостов: {s['total']}, успешно: {s['ok']}, с ошибкой: {s['failed']}, "
+            f"медленных: {s['outliers']}, медиана {s['median']:.2f}с, максимум {s['max']:.2f}с"
+        )
+        if s["failed"]:
+            raise CommandError(f"Команда не выполнилась на {s['failed']} хост(ах)")
+
+    def _targets(self, options):
+        if options["projects"] is not None:
+            projects = Project.objects.select_related("server").order_by("slug")
+            if options["projects"]:
+                projects = projects.filter(slug__in=options["projects"])
+            if options["status"]:
+                projects = projects.filter(status=options["status"])
+            return targets_for_projects(projects)
+
+        servers = Server.objects.order_by("name")
+        if options["servers"]:
+            servers = servers.filter(servers_lookup(options["servers"]))
+        return targets_for_servers(servers)
@@ -0,0 +1,118 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.projects.models import Project, Server
+from apps.projects.services.nginx_config import remove_nginx_config
+from apps.projects.services.placement import (
+    PLACEMENT_STRATEGY,
+    REBALANCE_MAX_MOVES,
+    REBALANCE_THRESHOLD,
+    STRATEGIES,
+    collect_capacity,
+    rank_servers,
+    rebalance_plan,
+)
+from apps.projects.tasks import enqueue_migrate
+
+
+class Command(BaseCommand):
+    help = (
+        "Планировщик размещения: оценка серверов под проект (rank), план "
+        "ребалансировки парка (rebalance, apply), переезд проекта (migrate, "
+        "unforward), сбор ресурсов серверов (collect)."
+    )
+
+    def add_arguments(self, parser):
+        sub = parser.add_subparsers(dest="action", required=True)
+
+        rank = sub.add_parser("rank", help="Серверы для проекта, лучшие первыми")
+        rank.add_argument("slug")
+        rank.add_argument("--strategy", choices=STRATEGIES, default=PLACEMENT_STRATEGY)
+
+        rebalance = sub.add_parser("rebalance", help="План переездов (ничего не меняет)")
+        rebalance.add_argument("--max-moves", type=int, default=REBALANCE_MAX_MOVES)
+        rebalance.add_argument("--threshold", type=float, default=REBALANCE_THRESHOLD,
+                               help="Допустимая разница загрузки серверов (0.2 = 20%%)")
+
+        apply = sub.add_parser("apply", help="Поставить переезды из плана rebalance в очередь")
+        apply.add_argument("--max-moves", type=int, default=REBALANCE_MAX_MOVES)
+        apply.add_argument("--threshold", type=float, default=REBALANCE_THRESHOLD)
+
+        migrate = sub.add_parser("migrate", help="Перенести проект на другой сервер")
+        migrate.add_argument("slug")
+        migrate.add_argument("server", help="Имя целевого сервера")
+
+        unforward = sub.add_parser("unforward", help="Снять форвард со старого сервера после смены DNS")
+        unforward.add_argument("slug")
+        unforward.add_argument("server", help="Имя старого сервера")
+
+        sub.add_parser("collect", help="Снять ресурсы со всех серверов и пересчитать агрегаты")
+
+    def handle(self, *args, **options):
+        getattr(self, f"_{options['action']}")(options)
+
+    @staticmethod
+    def _project(slug):
+        try:
+            return Project.objects.select_related("server").get(slug=slug)
+        except Project.DoesNotExist:
+            raise CommandError(f"Проект {slug} не найден")
+
+    @staticmethod
+    def _server(name):
+        try:
+            return Server.objects.get(name=name)
+        except Server.DoesNotExist:
+            raise CommandError(f"Сервер {name} не найден")
+
+    def _rank(self, options):
+        project = self._project(options["slug"])
+        ranked = rank_servers(project, options["strategy"])
+        self.stdout.write(f"{project.slug} ({options['strategy']}), сейчас на {project.server.name}:")
+        for s in ranked:
+            utilization = "—" if s.utilization is None else f"{s.utilization:.0%}"
+            line = f"  {s.server.name:<20} {s.score:7.3f}  загрузка после {utilization:>5}"
+            if s.reasons:
+                line += f"  ({', '.join(s.reasons)})"
+            self.stdout.write((self.style.SUCCESS if s.fits else self.style.WARNING)(line))
+
+    def _rebalance(self, options):
+        plan = rebalance_plan(options["max_moves"], options["threshold"])
+        if not plan:
+            self.stdout.write(self.style.SUCCESS("Парк сбалансирован, переезды не нужны"))
+            return
+        for move in plan:
+            self.stdout.write(f"{move.project.slug:<24} {move.source.name} → {move.target.name}  {move.reason}")
+        self.stdout.write(f"Переездов: {len(plan)}")
+
+    def _apply(self, options):
+        plan = rebalance_plan(options["max_moves"], options["threshold"])
+        if not plan:
+            self.stdout.write(self.style.SUCCESS("Парк сбалансирован, переезды не нужны"))
+            return
+        # Очередь deploy: одновременно не больше CELERY_DEPLOY_CONCURRENCY переездов и деплоев
+        for move in plan:
+            enqueue_migrate(move.project.id, move.target.id)
+            self.stdout.write(f"{move.project.slug:<24} {move.source.name} → {move.target.name}  в очереди")
+
+    def _migrate(self, options):
+        project = self._project(options["slug"])
+        target = self._server(options["server"])
+        if target.id == project.server_id:
+            raise CommandError(f"Проект {project.slug} уже на {target.name}")
+        dep = enqueue_migrate(project.id, target.id)
+        self.stdout.write(self.style.SUCCESS(
+            f"Переезд {project.slug}: {project.server.name} → {target.name} в очереди (#{dep.id})"
+        ))
+
+    def _unforward(self, options):
+        project = self._project(options["slug"])
+        server = self._server(options["server"])
+        if server.id == project.server_id:
+            raise CommandError(f"{server.name} — текущий сервер проекта, конфиг не форвард")
+        self.stdout.write(remove_nginx_config(project, server=server))
+
+    def _collect(self, options):
+        errors = collect_capacity()
+        for name, error in errors.items():
+            self.stdout.write(self.style.ERROR(f"{name}: {error}"))
+        self.stdout.write(self.style.SUCCESS("Ресурсы собраны"))
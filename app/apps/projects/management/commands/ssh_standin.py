@@ -0,0 +1,43 @@
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.projects.services.ssh_standin import SSHStandIn
+
+
+class Command(BaseCommand):
+    help = "Запускает локальный SSH-стенд с шимами git/docker/nginx для ручной проверки"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--port", type=int, default=2222)
+        parser.add_argument("--root", help="Каталог стенда (по умолчанию временный)")
+        parser.add_argument("--latency", type=float, default=0, help="Задержка на сессию (мс)")
+        parser.add_argument("--shim-delay", type=float, default=0, help="Длительность fetch/build (сек)")
+
+    def handle(self, *args, **options):
+        root = options["root"] or tempfile.mkdtemp(prefix="zea-standin-")
+        standin = SSHStandIn(
+            root,
+            port=options["port"],
+            latency=options["latency"] / 1000,
+            shim_delay=options["shim_delay"],
+        )
+        try:
+            standin.start()
+        except RuntimeError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"SSH-стенд: {standin.host}:{standin.port}\n"
+            f"Каталог: {standin.root}\n"
+            f"Для run_ssh: SSH_EXTRA_OPTIONS=\"{' '.join(standin.ssh_options)}\" "
+            f"NGINX_CONF_DIR={standin.nginx_conf_dir}"
+        ))
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            standin.stop()
@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.staticfiles.finders import get_finders
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+from django.db.migrations.recorder import MigrationRecorder
+
+# Отпечатки последнего успешного старта. Лежат рядом со статикой:
+# пропала статика — пересоберётся и она, и проверка миграций
+STATE_FILE = ".startup-state.json"
+
+
+def migrations_fingerprint() -> str:
+    """Хеш содержимого файлов миграций всех приложений."""
+    digest = hashlib.sha256()
+    for app_config in sorted(apps.get_app_configs(), key=lambda a: a.label):
+        migrations_dir = Path(app_config.path) / "migrations"
+        if not migrations_dir.is_dir():
+            continue
+        for path in sorted(migrations_dir.glob("*.py")):
+            digest.update(f"{app_config.label}/{path.name}".encode())
+            digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def static_fingerprint() -> str:
+    """
+    Хеш исходников статики (пути, размеры, mtime) по тем же finders,
+    что использует collectstatic. Сами файлы не читаются.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{settings.STATIC_ROOT}|{settings.STORAGES['staticfiles']['BACKEND']}".encode())
+    entries = []
+    for finder in get_finders():
+        for path, storage in finder.list(["CVS", ".*", "*~"]):
+            stat = os.stat(storage.path(path))
+            prefix = getattr(storage, "prefix", None) or ""
+            entries.append(f"{prefix}/{path}|{stat.st_size}|{stat.st_mtime_ns}")
+    for entry in sorted(entries):
+        digest.update(entry.encode())
+    return digest.hexdigest()
+
+
+def applied_migrations(connection) -> int:
+    """Число записей в django_migrations (0 — таблицы ещё нет)."""
+    recorder = MigrationRecorder(connection)
+    if not recorder.has_table():
+        return 0
+    return recorder.migration_qs.count()
+
+
+class Command(BaseCommand):
+    help = (
+        "Подготовка контейнера к старту: ждёт БД, применяет миграции и собирает "
+        "статику только если они изменились с прошлого старта. Печатает время фаз."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--timeout", type=float, default=60, help="Сколько ждать БД (сек)")
+        parser.add_argument("--force", action="store_true", help="Выполнить migrate и collectstatic без проверок")
+        parser.add_argument("--dry-run", action="store_true", help="Только показать, что изменилось")
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        self.timings = []
+        started = time.perf_counter()
+        connection = connections[options["database"]]
+        state_path = Path(settings.STATIC_ROOT) / STATE_FILE
+        state = self._load_state(state_path)
+        force, dry_run = options["force"], options["dry_run"]
+        verbosity = max(options["verbosity"] - 1, 0)
+
+        with self._phase("db"):
+            self._wait_for_db(connection, options["timeout"])
+
+        # === Миграции ===
+        with self._phase("migrations:check"):
+            files = migrations_fingerprint()
+            applied = applied_migrations(connection)
+            saved = state.get("migrations", {})
+            migrate = force or saved.get("files") != files or saved.get("applied") != applied
+
+        if migrate and not dry_run:
+            with self._phase("migrate"):
+                call_command("migrate", interactive=False, database=options["database"], verbosity=verbosity)
+            applied = applied_migrations(connection)
+        state["migrations"] = {"files": files, "applied": applied}
+
+        # === Статика ===
+        with self._phase("static:check"):
+            static = static_fingerprint()
+            collect = force or state.get("static") != static
+
+        if collect and not dry_run:
+            with self._phase("collectstatic"):
+                call_command("collectstatic", interactive=False, verbosity=verbosity)
+        state["static"] = static
+
+        if not dry_run:
+            self._save_state(state_path, state)
+
+        self.timings.append(("total", time.perf_counter() - started))
+        self.stdout.write(f"migrate: {'да' if migrate else 'нет изменений'}, "
+                          f"collectstatic: {'да' if collect else 'нет изменений'}"
+                          f"{' (dry-run)' if dry_run else ''}")
+        for name, seconds in self.timings:
+            self.stdout.write(f"  {name:<18} {seconds:7.3f}с")
+
+    @contextmanager
+    def _phase(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings.append((name, time.perf_counter() - t0))
+
+    def _wait_for_db(self, connection, timeout):
+        """Пробует подключиться с нарастающей паузой, пока не истечёт timeout."""
+        deadline = time.monotonic() + timeout
+        delay = 0.1
+        while True:
+            try:
+                connection.ensure_connection()
+                return
+            except OperationalError as e:
+                if time.monotonic() + delay > deadline:
+                    raise CommandError(f"БД недоступна за {timeout:.0f}с: {e}")
+                self.stdout.write(f"Ожидание БД: {str(e).strip().splitlines()[0]}")
+                connection.close()
+                time.sleep(delay)
+                delay = min(delay * 2, 2)
+
+    def _load_state(self, path: Path) -> dict:
+        try:
+            return json.loads(path.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self, path: Path, state: dict):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(state, indent=2))
+        tmp.replace(path)
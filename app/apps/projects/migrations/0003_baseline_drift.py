@@ -0,0 +1,200 @@
+# Generated by Django 5.2 on 2026-10-19 18:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Расхождение моделей с 0001–0002, накопленное до того, как миграции стали
+# коммититься: старый entrypoint выполнял makemigrations при старте, поэтому в
+# базах существующих установок эти колонки уже есть (через неотслеживаемую
+# автомиграцию). Состояние описывается обычными операциями, а в БД колонки
+# добавляются только если их нет — миграция применяется и на чистой базе, и
+# поверх автомиграции без --fake.
+
+DATABASE_OPERATIONS = [
+    migrations.RunSQL(
+        [
+            """ALTER TABLE "projects_deployment" ADD COLUMN IF NOT EXISTS "action" varchar(20) DEFAULT 'deploy' NOT NULL""",
+            """ALTER TABLE "projects_deployment" ALTER COLUMN "action" DROP DEFAULT""",
+            """ALTER TABLE "projects_project" ADD COLUMN IF NOT EXISTS "env_vars" text DEFAULT '' NOT NULL""",
+            """ALTER TABLE "projects_project" ALTER COLUMN "env_vars" DROP DEFAULT""",
+            """ALTER TABLE "projects_project" ADD COLUMN IF NOT EXISTS "internal_port" integer NULL UNIQUE CHECK ("internal_port" >= 0)""",
+        ],
+        [
+            'ALTER TABLE "projects_project" DROP COLUMN IF EXISTS "internal_port"',
+            'ALTER TABLE "projects_project" DROP COLUMN IF EXISTS "env_vars"',
+            'ALTER TABLE "projects_deployment" DROP COLUMN IF EXISTS "action"',
+        ],
+    ),
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0002_project_grace_until'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=DATABASE_OPERATIONS,
+            state_operations=[
+                migrations.AlterModelOptions(
+                    name='deployment',
+                    options={'ordering': ['-started_at'], 'verbose_name': 'Деплой', 'verbose_name_plural': 'Деплои'},
+                ),
+                migrations.AlterModelOptions(
+                    name='project',
+                    options={'ordering': ['-created_at'], 'verbose_name': 'Проект', 'verbose_name_plural': 'Проекты'},
+                ),
+                migrations.AlterModelOptions(
+                    name='server',
+                    options={'verbose_name': 'Сервер', 'verbose_name_plural': 'Серверы'},
+                ),
+                migrations.AddField(
+                    model_name='deployment',
+                    name='action',
+                    field=models.CharField(choices=[('deploy', 'Deploy'), ('suspend', 'Suspend'), ('resume', 'Resume')], default='deploy', max_length=20, verbose_name='Действие'),
+                ),
+                migrations.AddField(
+                    model_name='project',
+                    name='env_vars',
+                    field=models.TextField(blank=True, help_text='Будут записаны в файл .env при деплое. Формат: KEY=VALUE', verbose_name='Переменные окружения (.env)'),
+                ),
+                migrations.AddField(
+                    model_name='project',
+                    name='internal_port',
+                    field=models.PositiveIntegerField(blank=True, help_text='Назначается автоматически из диапазона 9001–9999', null=True, unique=True, verbose_name='Внутренний порт'),
+                ),
+                migrations.AlterField(
+                    model_name='deployment',
+                    name='finished_at',
+                    field=models.DateTimeField(blank=True, null=True, verbose_name='Завершён'),
+                ),
+                migrations.AlterField(
+                    model_name='deployment',
+                    name='log',
+                    field=models.TextField(blank=True, verbose_name='Лог'),
+                ),
+                migrations.AlterField(
+                    model_name='deployment',
+                    name='project',
+                    field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deployments', to='projects.project', verbose_name='Проект'),
+                ),
+                migrations.AlterField(
+                    model_name='deployment',
+                    name='started_at',
+                    field=models.DateTimeField(auto_now_add=True, verbose_name='Начат'),
+                ),
+                migrations.AlterField(
+                    model_name='deployment',
+                    name='status',
+                    field=models.CharField(choices=[('pending', '⏳ В очереди'), ('running', '🔄 Выполняется'), ('success', '✅ Успешно'), ('failed', '❌ Ошибка')], default='pending', max_length=20, verbose_name='Статус'),
+                ),
+                migrations.AlterField(
+                    model_name='project',
+                    name='compose_file',
+                    field=models.CharField(default='docker-compose.prod.yml', max_length=255, verbose_name='Docker-compose файл'),
+                ),
+                migrations.AlterField(
+                    model_name='project',
+                    name='created_at',
+                    field=models.DateTimeField(auto_now_add=True, verbose_name='Создан'),
+                ),
+                migrations.AlterField(
+                    model_name='project',
+                    name='description',
+                    field=models.TextField(blank=True, verbose_name='Описание'),
+                ),
+                migrations.AlterField(
+                    model_name='project',
+                    name='domain',
+                    field=models.CharField(blank=True, max_length=255, verbose_name='Домен'),
+                ),
+                migrations.AlterField(
+                    model_name='project',
+                    name='free_support_until',
+                    field=models.DateField(blank=True, null=True, verbose_name='Бесплатная поддержка до'),
+                ),
+                migrations.AlterField(
+                    model_name='project',
+                    name='github_branch',
+                    field=models.CharField(default='main', max_length=50, verbose_name='Ветка'),
+                ),
+                migrations.AlterField(
+                    model_name='project',
+                    name='github_repo',
+                    field=models.URLField(verbose_name='GitHub репозиторий'),
+                ),
+                migrations.AlterField(
+                    model_name='project',
+                    name='grace_until',
+                    field=models.DateField(blank=True, help_text='Дата окончания grace-периода', null=True, verbose_name='Grace до'),
+                ),
+                migrations.AlterField(
+                    model_name='project',
+                    name='last_deploy_at',
+                    field=models.DateTimeField(blank=True, null=True, verbose_name='Последний деплой'),
+                ),
+                migrations.AlterField(
+                    model_name='project',
+                    name='name',
+                    field=models.CharField(max_length=150, verbose_name='Название проекта'),
+                ),
+                migrations.AlterField(
+                    model_name='project',
+                    name='paid_until',
+                    field=models.DateField(blank=True, null=True, verbose_name='Оплачено до'),
+                ),
+                migrations.AlterField(
+                    model_name='project',
+                    name='price_per_month',
+                    field=models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Стоимость/мес'),
+                ),
+                migrations.AlterField(
+                    model_name='project',
+                    name='remote_path',
+                    field=models.CharField(blank=True, help_text='Если пусто — используется base_path/slug', max_length=255, verbose_name='Путь на сервере'),
+                ),
+                migrations.AlterField(
+                    model_name='project',
+                    name='server',
+                    field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='projects', to='projects.server', verbose_name='Сервер'),
+                ),
+                migrations.AlterField(
+                    model_name='project',
+                    name='slug',
+                    field=models.SlugField(unique=True, verbose_name='Slug'),
+                ),
+                migrations.AlterField(
+                    model_name='project',
+                    name='status',
+                    field=models.CharField(choices=[('new', '🆕 Новый'), ('deploying', '🔄 Деплоится'), ('active', '🟢 Активный'), ('grace', '🟡 Grace-период'), ('suspended', '🔴 Приостановлен'), ('failed', '❌ Ошибка')], default='new', max_length=20, verbose_name='Статус'),
+                ),
+                migrations.AlterField(
+                    model_name='server',
+                    name='base_path',
+                    field=models.CharField(default='/srv/projects', help_text='Базовая папка проектов на удалённом сервере', max_length=255, verbose_name='Базовый путь'),
+                ),
+                migrations.AlterField(
+                    model_name='server',
+                    name='ip_address',
+                    field=models.GenericIPAddressField(verbose_name='IP адрес'),
+                ),
+                migrations.AlterField(
+                    model_name='server',
+                    name='name',
+                    field=models.CharField(max_length=100, verbose_name='Название'),
+                ),
+                migrations.AlterField(
+                    model_name='server',
+                    name='ssh_port',
+                    field=models.PositiveIntegerField(default=22, verbose_name='SSH порт'),
+                ),
+                migrations.AlterField(
+                    model_name='server',
+                    name='ssh_user',
+                    field=models.CharField(default='root', max_length=50, verbose_name='SSH пользователь'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2 on 2026-10-19 16:24
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_started_at(apps, schema_editor):
+    """Для старых записей время постановки в очередь = время старта."""
+    Deployment = apps.get_model("projects", "Deployment")
+    Deployment.objects.filter(started_at__isnull=False).update(enqueued_at=F("started_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0003_baseline_drift'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='deployment',
+            options={'ordering': ['-enqueued_at'], 'verbose_name': 'Деплой', 'verbose_name_plural': 'Деплои'},
+        ),
+        migrations.AddField(
+            model_name='deployment',
+            name='enqueued_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Поставлен в очередь'),
+        ),
+        migrations.AddField(
+            model_name='deployment',
+            name='priority',
+            field=models.PositiveSmallIntegerField(default=5, verbose_name='Приоритет'),
+        ),
+        migrations.AddField(
+            model_name='deployment',
+            name='timings',
+            field=models.JSONField(blank=True, default=dict, help_text='queue, git, build, up, nginx, notify', verbose_name='Тайминги фаз (сек)'),
+        ),
+        migrations.AlterField(
+            model_name='deployment',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Начат'),
+        ),
+        migrations.AlterField(
+            model_name='deployment',
+            name='status',
+            field=models.CharField(choices=[('pending', '⏳ В очереди'), ('running', '🔄 Выполняется'), ('success', '✅ Успешно'), ('failed', '❌ Ошибка'), ('skipped', '⏭ Пропущен')], default='pending', max_length=20, verbose_name='Статус'),
+        ),
+        migrations.AddIndex(
+            model_name='deployment',
+            index=models.Index(fields=['status', 'action'], name='deployment_status_action_idx'),
+        ),
+        migrations.RunPython(copy_started_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-19 16:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0004_deployment_timings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='auto_deploy',
+            field=models.BooleanField(default=False, help_text='Деплоить при push в ветку проекта (GitHub webhook)', verbose_name='Автодеплой по push'),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='deploy_paths',
+            field=models.TextField(blank=True, help_text='Glob-шаблоны по одному в строке (app/*, Dockerfile). Пусто — любые файлы', verbose_name='Пути для автодеплоя'),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='ignore_paths',
+            field=models.TextField(blank=True, default='docs/*\n*.md', help_text='Push, затрагивающий только эти файлы, не вызывает деплой', verbose_name='Игнорируемые пути'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2 on 2026-10-19 16:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0005_project_auto_deploy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BillingEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('warning', 'Предупреждение об оплате'), ('grace', 'Переход в Grace'), ('suspend', 'Приостановка')], max_length=20, verbose_name='Событие')),
+                ('due_at', models.DateTimeField(verbose_name='Срок')),
+                ('fired_at', models.DateTimeField(blank=True, null=True, verbose_name='Выполнено')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='billing_events', to='projects.project', verbose_name='Проект')),
+            ],
+            options={
+                'verbose_name': 'Событие биллинга',
+                'verbose_name_plural': 'События биллинга',
+                'ordering': ['due_at'],
+                'indexes': [models.Index(condition=models.Q(('fired_at__isnull', True)), fields=['due_at'], name='billing_event_due_idx')],
+                'constraints': [models.UniqueConstraint(fields=('project', 'kind'), name='billing_event_project_kind_uniq')],
+            },
+        ),
+    ]
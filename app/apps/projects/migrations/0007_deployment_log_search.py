@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-19 16:45
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import django.db.models.functions.text
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # Индекс по логам строится долго — CONCURRENTLY не блокирует запись деплоев
+    atomic = False
+
+    dependencies = [
+        ('projects', '0006_billing_event'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='deployment',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.SearchVector(django.db.models.functions.text.Right('log', 100000), config='simple'), name='deployment_log_search_idx'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2 on 2026-10-19 16:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0007_deployment_log_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='build_cpu_limit',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True, verbose_name='CPU сборки (ядер)'),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='build_memory_mb',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Память сборки (МБ)'),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='compose_services',
+            field=models.PositiveSmallIntegerField(default=1, editable=False, help_text='Обновляется при деплое; лимиты проекта умножаются на это число', verbose_name='Сервисов в compose'),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='cpu_limit',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='cpus в compose, например 1.5. Пусто — без лимита', max_digits=5, null=True, verbose_name='Лимит CPU (ядер)'),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='cpu_shares',
+            field=models.PositiveIntegerField(default=1024, help_text='Доля CPU при конкуренции с соседями (1024 — обычная, 512 — вдвое меньше)', verbose_name='Вес CPU'),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='memory_limit_mb',
+            field=models.PositiveIntegerField(blank=True, help_text='mem_limit без swap. Пусто — без лимита', null=True, verbose_name='Лимит памяти (МБ)'),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='pids_limit',
+            field=models.PositiveIntegerField(blank=True, help_text='Защита от fork-бомб и утечек потоков', null=True, verbose_name='Лимит процессов'),
+        ),
+        migrations.AddField(
+            model_name='server',
+            name='cpu_cores',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Для проверки лимитов проектов. Пусто — не проверять', null=True, verbose_name='Ядер CPU'),
+        ),
+        migrations.AddField(
+            model_name='server',
+            name='memory_mb',
+            field=models.PositiveIntegerField(blank=True, help_text='Для проверки лимитов проектов. Пусто — не проверять', null=True, verbose_name='Память (МБ)'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-19 16:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0008_resource_limits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='client_max_body_mb',
+            field=models.PositiveIntegerField(blank=True, help_text='Пусто — по профилю', null=True, verbose_name='Макс. размер запроса (МБ)'),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='nginx_profile',
+            field=models.CharField(choices=[('default', 'Обычный сайт'), ('static', 'Много статики'), ('api', 'API')], default='default', max_length=20, verbose_name='Профиль Nginx'),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='proxy_read_timeout',
+            field=models.PositiveIntegerField(blank=True, help_text='Пусто — по профилю', null=True, verbose_name='Таймаут ответа приложения (сек)'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-19 16:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0009_nginx_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='microcache',
+            field=models.BooleanField(default=False, help_text='Nginx кеширует ответы анонимным посетителям на несколько секунд; сбрасывается при деплое', verbose_name='Микрокеш'),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='microcache_bypass_cookies',
+            field=models.CharField(default='sessionid csrftoken', help_text='С этими cookie (или с Authorization) запрос идёт мимо кеша. Через пробел', max_length=255, verbose_name='Cookie без кеша'),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='microcache_ttl',
+            field=models.PositiveSmallIntegerField(default=5, verbose_name='TTL микрокеша (сек)'),
+        ),
+    ]
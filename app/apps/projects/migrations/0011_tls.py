@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-19 17:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0010_microcache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='tls',
+            field=models.BooleanField(default=False, help_text='Сертификат ACME (certbot), HTTP/2, редирект с http. Нужен домен', verbose_name='HTTPS'),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='tls_expires_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Сертификат до'),
+        ),
+    ]
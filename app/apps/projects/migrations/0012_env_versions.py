@@ -0,0 +1,114 @@
+# Generated by Django 5.2 on 2026-10-19 17:06
+
+import base64
+import hashlib
+import re
+
+import django.db.models.deletion
+from cryptography.fernet import Fernet, MultiFernet
+from django.conf import settings
+from django.db import migrations, models
+from django.utils.crypto import salted_hmac
+
+# Копия шифрования и контрольной суммы из services/env_store.py на момент
+# миграции: сервисный модуль может меняться, а история миграций — нет.
+# Ключи и формат должны совпадать с тем, чем env_store расшифровывает версии.
+ENV_LINE_RE = re.compile(r"^\s*(?:export\s+)?([A-Za-z_][A-Za-z0-9_]*)\s*=(.*)$")
+
+
+def _fernet():
+    keys = settings.ENV_ENCRYPTION_KEYS or [
+        base64.urlsafe_b64encode(hashlib.sha256(f"zea.env:{settings.SECRET_KEY}".encode()).digest())
+    ]
+    return MultiFernet([Fernet(key) for key in keys])
+
+
+def _normalize(text):
+    lines = [line.rstrip() for line in (text or "").replace("\r\n", "\n").split("\n")]
+    text = "\n".join(lines).strip("\n")
+    return text + "\n" if text else ""
+
+
+def _checksum(text):
+    return salted_hmac("zea.env", _normalize(text), algorithm="sha256").hexdigest()
+
+
+def _encrypt(text):
+    return _fernet().encrypt(_normalize(text).encode()).decode()
+
+
+def _decrypt(ciphertext):
+    return _fernet().decrypt(ciphertext.encode()).decode()
+
+
+def _summary(text):
+    """Первая версия: все переменные добавлены (+KEY), как diff_summary от пустого env."""
+    names = {m[1] for m in map(ENV_LINE_RE.match, (text or "").splitlines()) if m}
+    return " ".join(f"+{name}" for name in sorted(names))
+
+
+def encrypt_env_vars(apps, schema_editor):
+    """env_vars → первая зашифрованная версия. На сервер её запишет следующий деплой."""
+    Project = apps.get_model("projects", "Project")
+    EnvVersion = apps.get_model("projects", "EnvVersion")
+    for project in Project.objects.exclude(env_vars="").only("id", "env_vars"):
+        EnvVersion.objects.create(
+            project=project, version=1,
+            ciphertext=_encrypt(project.env_vars),
+            checksum=_checksum(project.env_vars),
+            summary=_summary(project.env_vars)[:500],
+        )
+
+
+def decrypt_env_vars(apps, schema_editor):
+    Project = apps.get_model("projects", "Project")
+    EnvVersion = apps.get_model("projects", "EnvVersion")
+    for version in EnvVersion.objects.order_by("project_id", "-version").distinct("project_id"):
+        Project.objects.filter(id=version.project_id).update(env_vars=_decrypt(version.ciphertext))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0011_tls'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='deployment',
+            name='action',
+            field=models.CharField(choices=[('deploy', 'Deploy'), ('suspend', 'Suspend'), ('resume', 'Resume'), ('env', 'Env')], default='deploy', max_length=20, verbose_name='Действие'),
+        ),
+        migrations.CreateModel(
+            name='EnvVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(verbose_name='Версия')),
+                ('ciphertext', models.TextField(verbose_name='Зашифрованный .env')),
+                ('checksum', models.CharField(max_length=64, verbose_name='Контрольная сумма')),
+                ('summary', models.CharField(blank=True, help_text='Только имена переменных', max_length=500, verbose_name='Изменения')),
+                ('author', models.CharField(blank=True, max_length=150, verbose_name='Автор')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создана')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='env_versions', to='projects.project', verbose_name='Проект')),
+            ],
+            options={
+                'verbose_name': 'Версия env',
+                'verbose_name_plural': 'Версии env',
+                'ordering': ['-version'],
+            },
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='env_pushed',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='projects.envversion', verbose_name='Env на сервере'),
+        ),
+        migrations.AddConstraint(
+            model_name='envversion',
+            constraint=models.UniqueConstraint(fields=('project', 'version'), name='env_version_unique'),
+        ),
+        migrations.RunPython(encrypt_env_vars, decrypt_env_vars),
+        migrations.RemoveField(
+            model_name='project',
+            name='env_vars',
+        ),
+    ]
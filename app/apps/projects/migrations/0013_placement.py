@@ -0,0 +1,81 @@
+# Generated by Django 5.2 on 2026-10-19 17:10
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+# Копия services/placement.estimate на момент миграции: сервисный модуль
+# может меняться, а история миграций — нет
+DEFAULT_PROJECT_CPUS = Decimal("0.5")
+DEFAULT_PROJECT_MEMORY_MB = 512
+
+
+def _estimate(project):
+    containers = max(project.compose_services, 1)
+    cpus = Decimal(project.cpu_limit or DEFAULT_PROJECT_CPUS) * containers
+    memory = (project.memory_limit_mb or DEFAULT_PROJECT_MEMORY_MB) * containers
+    return cpus, memory
+
+
+def fill_server_load(apps, schema_editor):
+    """Начальные агрегаты серверов; дальше их обновляют сигналы проектов."""
+    Server = apps.get_model("projects", "Server")
+    Project = apps.get_model("projects", "Project")
+    for server in Server.objects.all():
+        projects = list(Project.objects.filter(server=server))
+        footprints = [_estimate(p) for p in projects]
+        server.project_count = len(projects)
+        server.reserved_cpus = sum((cpus for cpus, _ in footprints), 0)
+        server.reserved_memory_mb = sum(memory for _, memory in footprints)
+        server.save(update_fields=["project_count", "reserved_cpus", "reserved_memory_mb"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0012_env_versions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='server',
+            name='accepts_projects',
+            field=models.BooleanField(default=True, help_text='Выключено — планировщик не размещает сюда проекты и предлагает увести текущие', verbose_name='Принимает проекты'),
+        ),
+        migrations.AddField(
+            model_name='server',
+            name='capacity_collected_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Ресурсы собраны'),
+        ),
+        migrations.AddField(
+            model_name='server',
+            name='disk_free_mb',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Свободно на диске (МБ)'),
+        ),
+        migrations.AddField(
+            model_name='server',
+            name='load_avg',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Load average (5 мин)'),
+        ),
+        migrations.AddField(
+            model_name='server',
+            name='memory_available_mb',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Свободно памяти (МБ)'),
+        ),
+        migrations.AddField(
+            model_name='server',
+            name='project_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Проектов'),
+        ),
+        migrations.AddField(
+            model_name='server',
+            name='reserved_cpus',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=7, verbose_name='Зарезервировано CPU'),
+        ),
+        migrations.AddField(
+            model_name='server',
+            name='reserved_memory_mb',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Зарезервировано памяти (МБ)'),
+        ),
+        migrations.RunPython(fill_server_load, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-19 17:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0013_placement'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='deployment',
+            name='action',
+            field=models.CharField(choices=[('deploy', 'Deploy'), ('suspend', 'Suspend'), ('resume', 'Resume'), ('env', 'Env'), ('migrate', 'Migrate')], default='deploy', max_length=20, verbose_name='Действие'),
+        ),
+        migrations.AlterField(
+            model_name='deployment',
+            name='timings',
+            field=models.JSONField(blank=True, default=dict, help_text='queue, git, build, up, nginx, notify; переезд: preflight, presync, stop, sync, cleanup, downtime', verbose_name='Тайминги фаз (сек)'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-19 17:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0014_migrate_action'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='idle_timeout',
+            field=models.PositiveIntegerField(blank=True, help_text='Контейнеры останавливаются, если к сайту не было запросов; первый запрос будит проект. Пусто — работает всегда', null=True, verbose_name='Засыпать после простоя (мин)'),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='sleeping_since',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Спит с'),
+        ),
+        migrations.AlterField(
+            model_name='deployment',
+            name='action',
+            field=models.CharField(choices=[('deploy', 'Deploy'), ('suspend', 'Suspend'), ('resume', 'Resume'), ('env', 'Env'), ('migrate', 'Migrate'), ('sleep', 'Sleep'), ('wake', 'Wake')], default='deploy', max_length=20, verbose_name='Действие'),
+        ),
+    ]
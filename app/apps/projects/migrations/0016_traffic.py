@@ -0,0 +1,46 @@
+# Generated by Django 5.2 on 2026-10-19 17:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0015_idle_sleep'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='traffic_log_inode',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='traffic_log_offset',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='TrafficBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField(verbose_name='Начало часа')),
+                ('requests', models.PositiveBigIntegerField(default=0, verbose_name='Запросов')),
+                ('bytes_sent', models.PositiveBigIntegerField(default=0, verbose_name='Отдано байт')),
+                ('status_2xx', models.PositiveBigIntegerField(default=0, verbose_name='2xx')),
+                ('status_3xx', models.PositiveBigIntegerField(default=0, verbose_name='3xx')),
+                ('status_4xx', models.PositiveBigIntegerField(default=0, verbose_name='4xx')),
+                ('status_5xx', models.PositiveBigIntegerField(default=0, verbose_name='5xx')),
+                ('latency', models.JSONField(blank=True, default=dict, verbose_name='Время ответа приложения')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='traffic_buckets', to='projects.project', verbose_name='Проект')),
+            ],
+            options={
+                'verbose_name': 'Трафик за час',
+                'verbose_name_plural': 'Трафик',
+                'ordering': ['-start'],
+                'indexes': [models.Index(fields=['start'], name='traffic_bucket_start_idx')],
+                'constraints': [models.UniqueConstraint(fields=('project', 'start'), name='traffic_bucket_unique')],
+            },
+        ),
+    ]
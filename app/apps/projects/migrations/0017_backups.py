@@ -0,0 +1,48 @@
+# Generated by Django 5.2 on 2026-10-19 17:32
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0016_traffic'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='backup_enabled',
+            field=models.BooleanField(default=True, help_text='Ночная копия каталога проекта, томов и дампов баз (restic)', verbose_name='Резервные копии'),
+        ),
+        migrations.AlterField(
+            model_name='deployment',
+            name='action',
+            field=models.CharField(choices=[('deploy', 'Deploy'), ('suspend', 'Suspend'), ('resume', 'Resume'), ('env', 'Env'), ('migrate', 'Migrate'), ('sleep', 'Sleep'), ('wake', 'Wake'), ('restore', 'Restore')], default='deploy', max_length=20, verbose_name='Действие'),
+        ),
+        migrations.CreateModel(
+            name='Backup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('running', 'Выполняется'), ('success', 'Успешно'), ('failed', 'Ошибка')], default='running', max_length=20, verbose_name='Статус')),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Начат')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершён')),
+                ('source_path', models.CharField(max_length=500, verbose_name='Каталог проекта')),
+                ('snapshots', models.JSONField(blank=True, default=list, verbose_name='Снимки')),
+                ('volumes', models.JSONField(blank=True, default=list, verbose_name='Тома')),
+                ('data_added', models.PositiveBigIntegerField(default=0, verbose_name='Добавлено в репозиторий (байт)')),
+                ('bytes_processed', models.PositiveBigIntegerField(default=0, verbose_name='Обработано (байт)')),
+                ('log', models.TextField(blank=True, verbose_name='Лог')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='backups', to='projects.project', verbose_name='Проект')),
+                ('server', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='projects.server', verbose_name='Сервер')),
+            ],
+            options={
+                'verbose_name': 'Резервная копия',
+                'verbose_name_plural': 'Резервные копии',
+                'ordering': ['-started_at'],
+                'indexes': [models.Index(fields=['project', '-started_at'], name='backup_project_started_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-19 17:44
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0017_backups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task', models.CharField(max_length=200, verbose_name='Задача')),
+                ('state', models.CharField(blank=True, max_length=20, verbose_name='Итог')),
+                ('worker', models.CharField(blank=True, max_length=100, verbose_name='Процесс')),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Начало')),
+                ('wall_seconds', models.FloatField(verbose_name='Длительность (с)')),
+                ('cpu_seconds', models.FloatField(verbose_name='CPU (с)')),
+                ('rss_kb', models.PositiveBigIntegerField(verbose_name='RSS после (КБ)')),
+                ('rss_delta_kb', models.BigIntegerField(verbose_name='Прирост RSS (КБ)')),
+                ('peak_kb', models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Пик tracemalloc (КБ)')),
+                ('queries', models.PositiveIntegerField(default=0, verbose_name='Запросов к БД')),
+                ('query_seconds', models.FloatField(default=0, verbose_name='Время в БД (с)')),
+                ('top_allocations', models.JSONField(blank=True, default=list, verbose_name='Крупнейшие аллокации')),
+            ],
+            options={
+                'verbose_name': 'Профиль задачи',
+                'verbose_name_plural': 'Профили задач',
+                'ordering': ['-started_at'],
+                'indexes': [models.Index(fields=['started_at'], name='task_profile_started_idx')],
+            },
+        ),
+    ]
@@ -1,10 +1,31 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models.functions import Right
 from django.utils import timezone
 
 
 PORT_RANGE_START = 9001
 PORT_RANGE_END = 9999
 
+# Вес CPU Docker по умолчанию: override с cpu_shares нужен только при другом значении
+DEFAULT_CPU_SHARES = 1024
+
+# Полнотекстовый индекс строится по хвосту лога: ошибки сборки — в конце,
+# а tsvector ограничен 1 МБ. Конфигурация simple — без стемминга, логи
+# смешанные (русский/английский, пути, имена модулей).
+LOG_SEARCH_CONFIG = "simple"
+LOG_SEARCH_CHARS = 100_000
+
+
+def log_search_vector():
+    """
+    Выражение индекса deployment_log_search_idx. Запросы должны использовать
+    ровно его же, иначе Postgres не применит индекс и прочитает все логи.
+    """
+    return SearchVector(Right("log", LOG_SEARCH_CHARS), config=LOG_SEARCH_CONFIG)
+
 
 class Server(models.Model):
     name = models.CharField("Название", max_length=100)
@@ -17,16 +38,54 @@ class Server(models.Model):
         default="/srv/projects",
         help_text="Базовая папка проектов на удалённом сервере",
     )
+    cpu_cores = models.PositiveSmallIntegerField(
+        "Ядер CPU", null=True, blank=True,
+        help_text="Для проверки лимитов проектов. Пусто — не проверять",
+    )
+    memory_mb = models.PositiveIntegerField(
+        "Память (МБ)", null=True, blank=True,
+        help_text="Для проверки лимитов проектов. Пусто — не проверять",
+    )
+    accepts_projects = models.BooleanField(
+        "Принимает проекты", default=True,
+        help_text="Выключено — планировщик не размещает сюда проекты и предлагает увести текущие",
+    )
+
+    # === Снимок с сервера (collect_capacity_task, services/placement.py) ===
+    load_avg = models.FloatField("Load average (5 мин)", null=True, blank=True, editable=False)
+    memory_available_mb = models.PositiveIntegerField("Свободно памяти (МБ)", null=True, blank=True, editable=False)
+    disk_free_mb = models.PositiveIntegerField("Свободно на диске (МБ)", null=True, blank=True, editable=False)
+    capacity_collected_at = models.DateTimeField("Ресурсы собраны", null=True, blank=True, editable=False)
+
+    # === Агрегаты по проектам сервера: пересчитываются при изменении проектов ===
+    project_count = models.PositiveIntegerField("Проектов", default=0, editable=False)
+    reserved_cpus = models.DecimalField(
+        "Зарезервировано CPU", max_digits=7, decimal_places=2, default=0, editable=False,
+    )
+    reserved_memory_mb = models.PositiveIntegerField("Зарезервировано памяти (МБ)", default=0, editable=False)
 
     class Meta:
         verbose_name = "Сервер"
         verbose_name_plural = "Серверы"
 
+    def clean(self):
+        from .services.resources import capacity_errors
+
+        if self.pk:
+            errors = capacity_errors(self, self.projects.all())
+            if errors:
+                raise ValidationError(errors)
+
     def __str__(self):
         return f"{self.name} ({self.ip_address})"
 
 
 class Project(models.Model):
+    NGINX_PROFILE_CHOICES = [
+        ("default", "Обычный сайт"),
+        ("static", "Много статики"),
+        ("api", "API"),
+    ]
     STATUS_CHOICES = [
         ("new", "🆕 Новый"),
         ("deploying", "🔄 Деплоится"),
@@ -67,10 +126,94 @@ class Project(models.Model):
         null=True,
         help_text="Назначается автоматически из диапазона 9001–9999",
     )
-    env_vars = models.TextField(
-        "Переменные окружения (.env)",
+    # Сам .env — в EnvVersion (зашифрован); здесь — версия, записанная на сервер
+    env_pushed = models.ForeignKey(
+        "EnvVersion", on_delete=models.SET_NULL, null=True, blank=True, editable=False,
+        related_name="+", verbose_name="Env на сервере",
+    )
+
+    # === Nginx (см. NGINX_PROFILES в services/nginx_config.py) ===
+    nginx_profile = models.CharField(
+        "Профиль Nginx", max_length=20, choices=NGINX_PROFILE_CHOICES, default="default",
+    )
+    client_max_body_mb = models.PositiveIntegerField(
+        "Макс. размер запроса (МБ)", null=True, blank=True,
+        help_text="Пусто — по профилю",
+    )
+    proxy_read_timeout = models.PositiveIntegerField(
+        "Таймаут ответа приложения (сек)", null=True, blank=True,
+        help_text="Пусто — по профилю",
+    )
+    microcache = models.BooleanField(
+        "Микрокеш", default=False,
+        help_text="Nginx кеширует ответы анонимным посетителям на несколько секунд; сбрасывается при деплое",
+    )
+    microcache_ttl = models.PositiveSmallIntegerField("TTL микрокеша (сек)", default=5)
+    microcache_bypass_cookies = models.CharField(
+        "Cookie без кеша", max_length=255, default="sessionid csrftoken",
+        help_text="С этими cookie (или с Authorization) запрос идёт мимо кеша. Через пробел",
+    )
+    tls = models.BooleanField(
+        "HTTPS", default=False,
+        help_text="Сертификат ACME (certbot), HTTP/2, редирект с http. Нужен домен",
+    )
+    tls_expires_at = models.DateTimeField("Сертификат до", null=True, blank=True)
+
+    # === Ресурсы (лимиты на контейнер, см. services/resources.py) ===
+    cpu_limit = models.DecimalField(
+        "Лимит CPU (ядер)", max_digits=5, decimal_places=2, null=True, blank=True,
+        help_text="cpus в compose, например 1.5. Пусто — без лимита",
+    )
+    cpu_shares = models.PositiveIntegerField(
+        "Вес CPU", default=DEFAULT_CPU_SHARES,
+        help_text="Доля CPU при конкуренции с соседями (1024 — обычная, 512 — вдвое меньше)",
+    )
+    memory_limit_mb = models.PositiveIntegerField(
+        "Лимит памяти (МБ)", null=True, blank=True,
+        help_text="mem_limit без swap. Пусто — без лимита",
+    )
+    pids_limit = models.PositiveIntegerField(
+        "Лимит процессов", null=True, blank=True,
+        help_text="Защита от fork-бомб и утечек потоков",
+    )
+    build_cpu_limit = models.DecimalField(
+        "CPU сборки (ядер)", max_digits=5, decimal_places=2, null=True, blank=True,
+    )
+    build_memory_mb = models.PositiveIntegerField("Память сборки (МБ)", null=True, blank=True)
+    idle_timeout = models.PositiveIntegerField(
+        "Засыпать после простоя (мин)", null=True, blank=True,
+        help_text="Контейнеры останавливаются, если к сайту не было запросов; первый запрос будит проект. "
+                  "Пусто — работает всегда",
+    )
+    sleeping_since = models.DateTimeField("Спит с", null=True, blank=True, editable=False)
+    # Докуда прочитан access-лог (services/traffic.py): смена inode — лог ротирован
+    traffic_log_inode = models.PositiveBigIntegerField(null=True, blank=True, editable=False)
+    traffic_log_offset = models.PositiveBigIntegerField(default=0, editable=False)
+    backup_enabled = models.BooleanField(
+        "Резервные копии", default=True,
+        help_text="Ночная копия каталога проекта, томов и дампов баз (restic)",
+    )
+    compose_services = models.PositiveSmallIntegerField(
+        "Сервисов в compose", default=1, editable=False,
+        help_text="Обновляется при деплое; лимиты проекта умножаются на это число",
+    )
+
+    # === Автодеплой (GitHub webhook) ===
+    auto_deploy = models.BooleanField(
+        "Автодеплой по push",
+        default=False,
+        help_text="Деплоить при push в ветку проекта (GitHub webhook)",
+    )
+    deploy_paths = models.TextField(
+        "Пути для автодеплоя",
         blank=True,
-        help_text="Будут записаны в файл .env при деплое. Формат: KEY=VALUE",
+        help_text="Glob-шаблоны по одному в строке (app/*, Dockerfile). Пусто — любые файлы",
+    )
+    ignore_paths = models.TextField(
+        "Игнорируемые пути",
+        blank=True,
+        default="docs/*\n*.md",
+        help_text="Push, затрагивающий только эти файлы, не вызывает деплой",
     )
 
     # === Биллинг ===
@@ -100,6 +243,44 @@ class Project(models.Model):
         verbose_name_plural = "Проекты"
         ordering = ["-created_at"]
 
+    # Поля, от которых зависят события биллинга (см. services/billing.py)
+    BILLING_FIELDS = ("status", "paid_until", "grace_until")
+    # Поля, от которых зависят агрегаты сервера (см. services/placement.py)
+    PLACEMENT_FIELDS = ("server_id", "cpu_limit", "memory_limit_mb", "compose_services")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._billing_snapshot = instance.billing_state()
+        instance._placement_snapshot = instance.placement_state()
+        return instance
+
+    def placement_state(self) -> tuple:
+        return tuple(self.__dict__.get(field) for field in self.PLACEMENT_FIELDS)
+
+    def billing_state(self) -> tuple:
+        # Только загруженные поля: отложенные не тянем из БД ради сравнения.
+        # deploying — тот же active для биллинга, деплой не пересчитывает события.
+        state = {field: self.__dict__.get(field) for field in self.BILLING_FIELDS}
+        if state["status"] == "deploying":
+            state["status"] = "active"
+        return tuple(state.values())
+
+    def billing_changed(self) -> bool:
+        return getattr(self, "_billing_snapshot", None) != self.billing_state()
+
+    def clean(self):
+        from .services.resources import capacity_errors
+
+        if self.tls and not self.domain:
+            raise ValidationError({"tls": "Для HTTPS нужен домен"})
+        if self.server_id is None:
+            return
+        neighbours = Project.objects.filter(server_id=self.server_id).exclude(pk=self.pk)
+        errors = capacity_errors(self.server, [*neighbours, self])
+        if errors:
+            raise ValidationError(errors)
+
     def save(self, *args, **kwargs):
         if not self.internal_port:
             self.internal_port = self._next_free_port()
@@ -134,7 +315,29 @@ class Deployment(models.Model):
         ("running", "🔄 Выполняется"),
         ("success", "✅ Успешно"),
         ("failed", "❌ Ошибка"),
+        ("skipped", "⏭ Пропущен"),
     ]
+    ACTION_CHOICES = [
+        ("deploy", "Deploy"),
+        ("suspend", "Suspend"),
+        ("resume", "Resume"),
+        ("env", "Env"),
+        ("migrate", "Migrate"),
+        ("sleep", "Sleep"),
+        ("wake", "Wake"),
+        ("restore", "Restore"),
+    ]
+    # Очередь Celery, в которой выполняется действие (см. CELERY_TASK_ROUTES)
+    QUEUE_BY_ACTION = {
+        "deploy": "deploy",
+        "suspend": "lifecycle",
+        "resume": "lifecycle",
+        "env": "lifecycle",
+        "migrate": "deploy",
+        "sleep": "lifecycle",
+        "wake": "lifecycle",
+        "restore": "deploy",
+    }
 
     project = models.ForeignKey(
         Project, on_delete=models.CASCADE, verbose_name="Проект",
@@ -144,21 +347,231 @@ class Deployment(models.Model):
         "Статус", max_length=20, choices=STATUS_CHOICES, default="pending"
     )
     action = models.CharField(
-        "Действие", max_length=20, default="deploy",
-        choices=[
-            ("deploy", "Deploy"),
-            ("suspend", "Suspend"),
-            ("resume", "Resume"),
-        ],
-    )
-    started_at = models.DateTimeField("Начат", auto_now_add=True)
+        "Действие", max_length=20, default="deploy", choices=ACTION_CHOICES,
+    )
+    priority = models.PositiveSmallIntegerField("Приоритет", default=5)
+    enqueued_at = models.DateTimeField("Поставлен в очередь", default=timezone.now)
+    started_at = models.DateTimeField("Начат", null=True, blank=True)
     finished_at = models.DateTimeField("Завершён", null=True, blank=True)
+    timings = models.JSONField(
+        "Тайминги фаз (сек)", default=dict, blank=True,
+        help_text="queue, git, build, up, nginx, notify; переезд: preflight, presync, stop, sync, cleanup, downtime",
+    )
     log = models.TextField("Лог", blank=True)
 
     class Meta:
         verbose_name = "Деплой"
         verbose_name_plural = "Деплои"
-        ordering = ["-started_at"]
+        ordering = ["-enqueued_at"]
+        indexes = [
+            models.Index(fields=["status", "action"], name="deployment_status_action_idx"),
+            # Индекс по выражению: Postgres обновляет его при каждой записи лога
+            # (в том числе через QuerySet.update()), а строки не хранят tsvector
+            GinIndex(log_search_vector(), name="deployment_log_search_idx"),
+        ]
+
+    @property
+    def queue(self):
+        return self.QUEUE_BY_ACTION.get(self.action, "maintenance")
+
+    @property
+    def queue_wait_seconds(self):
+        if not self.started_at:
+            return None
+        return (self.started_at - self.enqueued_at).total_seconds()
+
+    @property
+    def duration_seconds(self):
+        if not self.started_at or not self.finished_at:
+            return None
+        return (self.finished_at - self.started_at).total_seconds()
 
     def __str__(self):
         return f"{self.project.slug} — {self.get_action_display()} — {self.get_status_display()}"
+
+
+class EnvVersion(models.Model):
+    """
+    Версия переменных окружения проекта. Текст зашифрован (Fernet, см.
+    services/env_store.py); версии не меняются — каждое изменение даёт новую.
+    """
+    project = models.ForeignKey(
+        Project, on_delete=models.CASCADE, verbose_name="Проект",
+        related_name="env_versions",
+    )
+    version = models.PositiveIntegerField("Версия")
+    ciphertext = models.TextField("Зашифрованный .env")
+    # HMAC текста: сравнение версий без расшифровки
+    checksum = models.CharField("Контрольная сумма", max_length=64)
+    summary = models.CharField("Изменения", max_length=500, blank=True, help_text="Только имена переменных")
+    author = models.CharField("Автор", max_length=150, blank=True)
+    created_at = models.DateTimeField("Создана", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Версия env"
+        verbose_name_plural = "Версии env"
+        ordering = ["-version"]
+        constraints = [
+            models.UniqueConstraint(fields=["project", "version"], name="env_version_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.project.slug} env v{self.version}"
+
+
+class BillingEvent(models.Model):
+    """
+    Запланированный переход биллинга проекта. Строки пересчитываются при
+    изменении paid_until/grace_until/status, поллер забирает только наступившие.
+    """
+    KIND_CHOICES = [
+        ("warning", "Предупреждение об оплате"),
+        ("grace", "Переход в Grace"),
+        ("suspend", "Приостановка"),
+    ]
+
+    project = models.ForeignKey(
+        Project, on_delete=models.CASCADE, verbose_name="Проект",
+        related_name="billing_events",
+    )
+    kind = models.CharField("Событие", max_length=20, choices=KIND_CHOICES)
+    due_at = models.DateTimeField("Срок")
+    fired_at = models.DateTimeField("Выполнено", null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField("Попыток", default=0)
+
+    class Meta:
+        verbose_name = "Событие биллинга"
+        verbose_name_plural = "События биллинга"
+        ordering = ["due_at"]
+        constraints = [
+            models.UniqueConstraint(fields=["project", "kind"], name="billing_event_project_kind_uniq"),
+        ]
+        indexes = [
+            # Поллер читает только невыполненные события — индекс только по ним
+            models.Index(
+                fields=["due_at"], name="billing_event_due_idx",
+                condition=models.Q(fired_at__isnull=True),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.project.slug} — {self.get_kind_display()} — {self.due_at:%d.%m.%Y %H:%M}"
+
+
+class TrafficBucket(models.Model):
+    """
+    Трафик проекта за час по access-логу nginx (services/traffic.py). Строки
+    лога не хранятся: счётчики и гистограмма времени ответа приложения.
+    """
+    project = models.ForeignKey(
+        Project, on_delete=models.CASCADE, verbose_name="Проект",
+        related_name="traffic_buckets",
+    )
+    start = models.DateTimeField("Начало часа")
+    requests = models.PositiveBigIntegerField("Запросов", default=0)
+    bytes_sent = models.PositiveBigIntegerField("Отдано байт", default=0)
+    status_2xx = models.PositiveBigIntegerField("2xx", default=0)
+    status_3xx = models.PositiveBigIntegerField("3xx", default=0)
+    status_4xx = models.PositiveBigIntegerField("4xx", default=0)
+    status_5xx = models.PositiveBigIntegerField("5xx", default=0)
+    # {индекс логарифмической корзины: запросов} — сливается сложением
+    latency = models.JSONField("Время ответа приложения", default=dict, blank=True)
+
+    class Meta:
+        verbose_name = "Трафик за час"
+        verbose_name_plural = "Трафик"
+        ordering = ["-start"]
+        constraints = [
+            models.UniqueConstraint(fields=["project", "start"], name="traffic_bucket_unique"),
+        ]
+        indexes = [
+            # Удаление старых корзин по всем проектам
+            models.Index(fields=["start"], name="traffic_bucket_start_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.project.slug} — {self.start:%d.%m.%Y %H:00}"
+
+
+class Backup(models.Model):
+    """
+    Запуск резервного копирования проекта (services/backup.py). Данные — в
+    restic-репозитории проекта; здесь снимки, тома и каталог на момент копии,
+    нужные для восстановления на любой сервер.
+    """
+    STATUS_CHOICES = [
+        ("running", "Выполняется"),
+        ("success", "Успешно"),
+        ("failed", "Ошибка"),
+    ]
+
+    project = models.ForeignKey(
+        Project, on_delete=models.CASCADE, verbose_name="Проект",
+        related_name="backups",
+    )
+    server = models.ForeignKey(
+        Server, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Сервер",
+        related_name="+",
+    )
+    status = models.CharField("Статус", max_length=20, choices=STATUS_CHOICES, default="running")
+    started_at = models.DateTimeField("Начат", default=timezone.now)
+    finished_at = models.DateTimeField("Завершён", null=True, blank=True)
+    source_path = models.CharField("Каталог проекта", max_length=500)
+    # [{"kind": "files"|"db", "id": снимок restic, "service", "engine"}]
+    snapshots = models.JSONField("Снимки", default=list, blank=True)
+    # [{"name", "key", "path"}] — именованные тома compose
+    volumes = models.JSONField("Тома", default=list, blank=True)
+    data_added = models.PositiveBigIntegerField("Добавлено в репозиторий (байт)", default=0)
+    bytes_processed = models.PositiveBigIntegerField("Обработано (байт)", default=0)
+    log = models.TextField("Лог", blank=True)
+
+    class Meta:
+        verbose_name = "Резервная копия"
+        verbose_name_plural = "Резервные копии"
+        ordering = ["-started_at"]
+        indexes = [
+            models.Index(fields=["project", "-started_at"], name="backup_project_started_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.project.slug} — {self.started_at:%d.%m.%Y %H:%M}"
+
+    def snapshot(self, kind: str = "files"):
+        return next((s for s in self.snapshots if s["kind"] == kind), None)
+
+    @property
+    def databases(self) -> list:
+        return [s for s in self.snapshots if s["kind"] == "db"]
+
+
+class TaskProfile(models.Model):
+    """
+    Замер одного запуска задачи Celery (services/profiling.py): время, CPU,
+    прирост RSS процесса воркера, запросы к БД и — для части запусков —
+    пик и места аллокаций по tracemalloc.
+    """
+    task = models.CharField("Задача", max_length=200)
+    state = models.CharField("Итог", max_length=20, blank=True)
+    worker = models.CharField("Процесс", max_length=100, blank=True)
+    started_at = models.DateTimeField("Начало", default=timezone.now)
+    wall_seconds = models.FloatField("Длительность (с)")
+    cpu_seconds = models.FloatField("CPU (с)")
+    rss_kb = models.PositiveBigIntegerField("RSS после (КБ)")
+    rss_delta_kb = models.BigIntegerField("Прирост RSS (КБ)")
+    peak_kb = models.PositiveBigIntegerField("Пик tracemalloc (КБ)", null=True, blank=True)
+    queries = models.PositiveIntegerField("Запросов к БД", default=0)
+    query_seconds = models.FloatField("Время в БД (с)", default=0)
+    # [["файл:строка", КБ]] — память, ещё занятая к концу задачи (tracemalloc)
+    top_allocations = models.JSONField("Крупнейшие аллокации", default=list, blank=True)
+
+    class Meta:
+        verbose_name = "Профиль задачи"
+        verbose_name_plural = "Профили задач"
+        ordering = ["-started_at"]
+        indexes = [
+            # Рейтинг за окно и удаление старых замеров
+            models.Index(fields=["started_at"], name="task_profile_started_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.task} — {self.started_at:%d.%m.%Y %H:%M:%S}"
@@ -0,0 +1,278 @@
+import json
+import logging
+import os
+import re
+import shlex
+
+from django.utils import timezone
+
+from ..models import Backup, Project
+from .fleet import run_fleet, targets_for_servers
+from .migrate import format_size, prepare_script
+from .resources import compose_files
+
+logger = logging.getLogger(__name__)
+
+# Резервные копии — restic на серверах проектов: разбиение на блоки по
+# содержимому, дедупликация и сжатие. Каждый запуск инкрементальный: в
+# репозиторий уходят только новые блоки. Репозиторий у каждого проекта свой
+# (BACKUP_REPOSITORY/<slug>), копию можно восстановить на любой сервер.
+#
+# Нужен restic ≥ 0.17 (--stdin-from-command). Без BACKUP_REPOSITORY и
+# BACKUP_PASSWORD копии не делаются.
+BACKUP_REPOSITORY = os.getenv("BACKUP_REPOSITORY", "").rstrip("/")
+BACKUP_PASSWORD = os.getenv("BACKUP_PASSWORD", "")
+# BACKUP_ENV_<ИМЯ> передаётся restic как <ИМЯ> (ключи S3, B2 и т. п.)
+BACKUP_ENV_PREFIX = "BACKUP_ENV_"
+# Ограничение отдачи с сервера, КиБ/с (0 — без ограничения)
+BACKUP_LIMIT_UPLOAD = int(os.getenv("BACKUP_LIMIT_UPLOAD", 0))
+# Серверов одновременно; проекты одного сервера копируются по очереди
+BACKUP_WORKERS = int(os.getenv("BACKUP_WORKERS", 4))
+BACKUP_TIMEOUT = int(os.getenv("BACKUP_TIMEOUT", 6 * 60 * 60))
+BACKUP_KEEP_DAILY = int(os.getenv("BACKUP_KEEP_DAILY", 7))
+BACKUP_KEEP_WEEKLY = int(os.getenv("BACKUP_KEEP_WEEKLY", 4))
+BACKUP_KEEP_MONTHLY = int(os.getenv("BACKUP_KEEP_MONTHLY", 6))
+# prune (перепаковка репозитория) дорогой — только в этот день недели (6 — воскресенье)
+BACKUP_PRUNE_WEEKDAY = 6
+BACKUP_STATUSES = ("active", "grace", "suspended")
+
+RESTIC = "nice -n 19 ionice -c 3 restic"
+# Секреты приходят в stdin строками ИМЯ=значение, а не в тексте команды
+READ_SECRETS = 'while IFS= read -r line; do [ -n "$line" ] && export "$line"; done'
+
+# Логические дампы баз из запущенных контейнеров: выгрузка, загрузка, готовность.
+# Выполняются в контейнере (sh -c), переменные — из его окружения.
+_MYSQL_AUTH = '-uroot -p"${MYSQL_ROOT_PASSWORD:-$MARIADB_ROOT_PASSWORD}"'
+DATABASES = {
+    "postgres": {
+        "dump": 'pg_dumpall --clean --if-exists -U "${POSTGRES_USER:-postgres}"',
+        "load": 'psql -q -U "${POSTGRES_USER:-postgres}" -d postgres',
+        "ready": 'pg_isready -q -U "${POSTGRES_USER:-postgres}"',
+    },
+    "mysql": {
+        "dump": f"mysqldump --all-databases --single-transaction --routines --events {_MYSQL_AUTH}",
+        "load": f"mysql {_MYSQL_AUTH}",
+        "ready": f"mysqladmin ping -s {_MYSQL_AUTH}",
+    },
+}
+# Шаблон образа → движок
+IMAGE_ENGINES = (("*postgres*", "postgres"), ("*postgis*", "postgres"), ("*mysql*", "mysql"), ("*mariadb*", "mysql"))
+# Сколько ждать запуска базы при восстановлении (по 2 с)
+DB_READY_ATTEMPTS = 30
+
+SECTION_RE = re.compile(r"^ZEA_BACKUP_BEGIN (\S+)\n(.*?)^ZEA_BACKUP_END \1 (\d+)$", re.MULTILINE | re.DOTALL)
+MAX_LOG_CHARS = 20000
+
+
+class BackupError(RuntimeError):
+    """Восстановление невозможно: копия неполная."""
+
+
+def backups_enabled() -> bool:
+    return bool(BACKUP_REPOSITORY and BACKUP_PASSWORD)
+
+
+def repository(project) -> str:
+    return f"{BACKUP_REPOSITORY}/{project.slug}"
+
+
+def secrets() -> bytes:
+    """stdin для скриптов: пароль репозитория и BACKUP_ENV_* без префикса."""
+    env = {"RESTIC_PASSWORD": BACKUP_PASSWORD}
+    env.update({
+        key[len(BACKUP_ENV_PREFIX):]: value for key, value in os.environ.items()
+        if key.startswith(BACKUP_ENV_PREFIX)
+    })
+    return "".join(f"{key}={value}\n" for key, value in env.items()).encode()
+
+
+def backup_candidates():
+    return (
+        Project.objects.select_related("server")
+        .filter(backup_enabled=True, status__in=BACKUP_STATUSES)
+        .order_by("server_id", "id")
+    )
+
+
+def backup_script(project, prune: bool = False) -> str:
+    """
+    Shell: снимок каталога проекта и именованных томов compose, затем дамп
+    каждой базы из запущенных контейнеров (потоком в restic, без временных
+    файлов) и чистка по политике хранения. Выполняется в подоболочке:
+    ошибка одного проекта не прерывает копирование остальных на сервере.
+    """
+    path = project.get_remote_path()
+    files = compose_files(project)
+    slug = project.slug
+    restic = RESTIC + (f" --limit-upload {BACKUP_LIMIT_UPLOAD}" if BACKUP_LIMIT_UPLOAD else "")
+    cases = "\n".join(
+        f"    {pattern}) engine={engine}; dump={shlex.quote(DATABASES[engine]['dump'])} ;;"
+        for pattern, engine in IMAGE_ENGINES
+    )
+    keep = f"--keep-daily {BACKUP_KEEP_DAILY} --keep-weekly {BACKUP_KEEP_WEEKLY} --keep-monthly {BACKUP_KEEP_MONTHLY}"
+    return f"""echo "ZEA_BACKUP_BEGIN {slug}"
+(
+set -e
+export RESTIC_REPOSITORY={shlex.quote(repository(project))}
+cd {path}
+{RESTIC} cat config >/dev/null 2>&1 || {RESTIC} init
+name=$(docker compose {files} config 2>/dev/null | sed -n 's/^name: //p')
+[ -n "$name" ] || name=$(basename {path})
+paths={path}
+for volume in $(docker volume ls -q --filter "label=com.docker.compose.project=$name"); do
+  key=$(docker volume inspect -f '{{{{ index .Labels "com.docker.compose.volume" }}}}' "$volume")
+  dir=$(docker volume inspect -f '{{{{ .Mountpoint }}}}' "$volume")
+  echo "ZEA_VOLUME $volume ${{key:-$volume}} $dir"
+  paths="$paths $dir"
+done
+echo "ZEA_SNAPSHOT files"
+{restic} backup --json --quiet --host {slug} --tag files --exclude-caches $paths
+for line in $(docker compose {files} ps --format '{{{{.Service}}}}={{{{.Image}}}}'); do
+  service=${{line%%=*}}
+  case "${{line#*=}}" in
+{cases}
+    *) continue ;;
+  esac
+  echo "ZEA_SNAPSHOT db $service $engine"
+  {restic} backup --json --quiet --host {slug} --tag "db-$service" --stdin-filename "$service.sql" \\
+    --stdin-from-command -- docker compose {files} exec -T "$service" sh -c "$dump"
+done
+{RESTIC} forget --host {slug} --group-by host,tags {keep}{" --prune" if prune else ""}
+)
+echo "ZEA_BACKUP_END {slug} $?"
+"""
+
+
+def parse_backup(section: str) -> dict:
+    """Снимки (по сводкам restic --json), тома и объёмы из вывода backup_script."""
+    result = {"snapshots": [], "volumes": [], "data_added": 0, "bytes_processed": 0}
+    current = None
+    for line in section.splitlines():
+        if line.startswith("ZEA_VOLUME "):
+            _, name, key, path = line.split(" ", 3)
+            result["volumes"].append({"name": name, "key": key, "path": path})
+        elif line.startswith("ZEA_SNAPSHOT "):
+            parts = line.split()
+            current = {"kind": parts[1]}
+            if parts[1] == "db":
+                current.update(service=parts[2], engine=parts[3])
+        elif line.startswith("{") and current is not None:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            if message.get("message_type") != "summary":
+                continue
+            current["id"] = message.get("snapshot_id", "")
+            result["snapshots"].append(current)
+            result["data_added"] += message.get("data_added", 0)
+            result["bytes_processed"] += message.get("total_bytes_processed", 0)
+            current = None
+    return result
+
+
+def _finish(backup, status: str, log: str, parsed: dict = None):
+    backup.status = status
+    backup.finished_at = timezone.now()
+    backup.log = log[-MAX_LOG_CHARS:]
+    for key, value in (parsed or {}).items():
+        setattr(backup, key, value)
+    backup.save()
+
+
+def backup_projects(projects=None) -> list:
+    """
+    Копирует проекты: серверы параллельно (не больше BACKUP_WORKERS), одна
+    SSH-сессия на сервер. Возвращает записи Backup.
+    """
+    if not backups_enabled():
+        logger.info("BACKUP_REPOSITORY или BACKUP_PASSWORD не заданы — резервные копии выключены")
+        return []
+    projects = list(backup_candidates() if projects is None else projects)
+    by_server = {}
+    for project in projects:
+        by_server.setdefault(project.server, []).append(project)
+    if not by_server:
+        return []
+
+    prune = timezone.localdate().weekday() == BACKUP_PRUNE_WEEKDAY
+    backups = {
+        p.id: Backup.objects.create(project=p, server=p.server, source_path=p.get_remote_path())
+        for p in projects
+    }
+    servers = list(by_server)
+    targets = targets_for_servers(servers)
+    stdin = secrets()
+    for target, server in zip(targets, servers):
+        target.command = READ_SECRETS + "\n" + "".join(backup_script(p, prune) for p in by_server[server])
+        target.stdin = stdin
+    results = run_fleet(targets, "restic backup", workers=BACKUP_WORKERS, timeout=BACKUP_TIMEOUT)
+
+    for server, result in zip(servers, results):
+        sections = {slug: (body, int(code)) for slug, body, code in SECTION_RE.findall(result.output)}
+        for project in by_server[server]:
+            backup = backups[project.id]
+            if project.slug not in sections:
+                # Сессия оборвалась раньше (таймаут, сервер недоступен)
+                _finish(backup, "failed", f"{result.error or result.status}\n{result.output[-2000:]}")
+                continue
+            body, code = sections[project.slug]
+            parsed = parse_backup(body)
+            ok = code == 0 and any(s["kind"] == "files" for s in parsed["snapshots"])
+            _finish(backup, "success" if ok else "failed", body, parsed)
+        logger.info(f"Резервные копии {server.name}: {result.status} за {result.seconds:.0f} с")
+    return list(backups.values())
+
+
+def restore_script(backup, project) -> str:
+    """
+    Shell (на сервере проекта): снимок во временный каталог, оттуда rsync
+    каталога проекта и томов на их места на этом сервере, сборка и запуск,
+    затем загрузка дампов баз. Каталог проекта на сервере может отличаться
+    от каталога на момент копии (другой сервер, другой base_path).
+    """
+    if backup.status != "success" or backup.snapshot() is None:
+        raise BackupError(f"Копия #{backup.id} ({backup.get_status_display()}) без снимка файлов")
+    path = project.get_remote_path()
+    files = compose_files(project)
+    volumes = "\n".join(
+        f"""docker volume create --label com.docker.compose.project="$name" \\
+  --label com.docker.compose.volume={shlex.quote(v["key"])} {shlex.quote(v["name"])} >/dev/null
+dir=$(docker volume inspect -f '{{{{ .Mountpoint }}}}' {shlex.quote(v["name"])})
+echo "--- том {v["name"]}"
+rsync -a --delete "$tmp"{shlex.quote(v["path"])}/ "$dir/\""""
+        for v in backup.volumes
+    )
+    databases = "\n".join(
+        f"""echo "--- база {db["service"]}"
+i=0
+until docker compose {files} exec -T {db["service"]} sh -c {shlex.quote(DATABASES[db["engine"]]["ready"])}; do
+  i=$((i + 1)); [ $i -lt {DB_READY_ATTEMPTS} ] || {{ echo "База {db["service"]} не запустилась"; exit 1; }}
+  sleep 2
+done
+{RESTIC} dump {db["id"]} /{db["service"]}.sql | docker compose {files} exec -T {db["service"]} sh -c {shlex.quote(DATABASES[db["engine"]]["load"])}"""
+        for db in backup.databases
+    )
+    return f"""{READ_SECRETS}
+set -e
+export RESTIC_REPOSITORY={shlex.quote(repository(project))}
+tmp=$(mktemp -d /var/tmp/zea-restore.XXXXXX)
+trap 'rm -rf "$tmp"' EXIT
+echo "--- restic restore {backup.snapshot()["id"]}"
+{RESTIC} restore {backup.snapshot()["id"]} --target "$tmp"
+mkdir -p {path}
+cd {path}
+docker compose {files} stop 2>/dev/null || true
+rsync -a --delete "$tmp"{shlex.quote(backup.source_path)}/ {path}/
+name=$(docker compose {files} config 2>/dev/null | sed -n 's/^name: //p')
+[ -n "$name" ] || name=$(basename {path})
+{volumes}
+{prepare_script(project, path)}
+docker compose {files} up -d
+{databases}
+echo "Восстановлено из копии от {timezone.localtime(backup.started_at):%d.%m.%Y %H:%M}"
+"""
+
+
+def format_backup(backup) -> str:
+    return f"{backup} ({backup.get_status_display()}, +{format_size(backup.data_added)})"
@@ -0,0 +1,165 @@
+import logging
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import BillingEvent, Deployment, Project
+
+logger = logging.getLogger(__name__)
+
+GRACE_DAYS = 7
+WARNING_DAYS = 3
+# Предупреждение приходит в рабочее время, переходы статусов — ровно в полночь
+WARNING_HOUR = 10
+
+# Сколько событий поллер забирает за один проход и через сколько повторить упавшее
+POLL_BATCH = 100
+RETRY_DELAY = timedelta(minutes=5)
+
+
+def _local_datetime(day, hour: int = 0) -> datetime:
+    return timezone.make_aware(datetime.combine(day, time(hour)))
+
+
+def planned_events(project: Project) -> dict:
+    """
+    Когда должно сработать каждое событие при текущем состоянии проекта.
+    None — событие неприменимо (нет даты оплаты, не тот статус).
+    """
+    today = timezone.localdate()
+    events = {"warning": None, "grace": None, "suspend": None}
+
+    if project.paid_until and project.status in ("active", "deploying"):
+        warning_day = project.paid_until - timedelta(days=WARNING_DAYS)
+        if warning_day >= today:
+            events["warning"] = _local_datetime(warning_day, WARNING_HOUR)
+        elif project.paid_until >= today:
+            # Оплачено меньше чем на WARNING_DAYS вперёд: день предупреждения прошёл, предупреждаем сразу
+            events["warning"] = timezone.now()
+        # Оплачено «до» включительно: grace с полуночи следующего дня
+        events["grace"] = _local_datetime(project.paid_until + timedelta(days=1))
+
+    if project.grace_until and project.status == "grace":
+        events["suspend"] = _local_datetime(project.grace_until + timedelta(days=1))
+
+    return events
+
+
+def schedule_billing_events(project: Project, reset: bool = True):
+    """
+    Приводит события проекта к planned_events.
+    reset=True — состояние биллинга изменилось: все события планируются заново.
+    reset=False — сверка: создаём недостающие и правим сроки, уже выполненные
+    с тем же сроком не трогаем.
+    """
+    existing = {event.kind: event for event in BillingEvent.objects.filter(project=project)}
+    for kind, due_at in planned_events(project).items():
+        event = existing.get(kind)
+        if due_at is None:
+            if event:
+                event.delete()
+            continue
+        if event and not reset and kind == "warning" and due_at <= timezone.now():
+            # Срочное предупреждение планируется на «сейчас» и при сверке сдвигается — уже поставленное не трогаем
+            continue
+        if event and event.due_at == due_at and (event.fired_at is None or not reset):
+            if not (kind == "suspend" and event.fired_at and _suspend_failed(project)):
+                continue
+            # Suspend поставлен, но проект всё ещё в grace: задача упала — повторяем
+            logger.warning(f"Проект {project.slug}: suspend не выполнен, повторяем")
+        BillingEvent.objects.update_or_create(
+            project=project, kind=kind,
+            defaults={"due_at": due_at, "fired_at": None, "attempts": 0},
+        )
+
+
+def _suspend_pending(project: Project) -> bool:
+    return Deployment.objects.filter(project=project, action="suspend", status__in=["pending", "running"]).exists()
+
+
+def _suspend_failed(project: Project) -> bool:
+    """Grace истёк, а suspend не идёт: поставленная задача упала или не дошла до очереди."""
+    return (
+        project.status == "grace"
+        and project.grace_until is not None
+        and project.grace_until < timezone.localdate()
+        and not _suspend_pending(project)
+    )
+
+
+# === Обработчики ===
+# Срабатывают по сроку, но проверяют актуальное состояние проекта: повторный
+# или запоздавший запуск ничего не ломает. Постановка задач и уведомления —
+# после коммита: воркер должен видеть запись Deployment, а откаченный
+# обработчик ничего не отправляет.
+
+def _fire_warning(project: Project):
+    from .notifications import notify_billing_warning
+
+    if project.status != "active" or not project.paid_until:
+        return
+    days_left = (project.paid_until - timezone.localdate()).days
+    if 0 <= days_left <= WARNING_DAYS:
+        transaction.on_commit(lambda: notify_billing_warning(project, days_left), robust=True)
+
+
+def _fire_grace(project: Project):
+    from .notifications import notify_status_change
+
+    today = timezone.localdate()
+    if project.status not in ("active", "deploying") or not project.paid_until or project.paid_until >= today:
+        return
+    old_status = project.status
+    project.status = "grace"
+    project.grace_until = today + timedelta(days=GRACE_DAYS)
+    project.save(update_fields=["status", "grace_until"])
+    transaction.on_commit(lambda: notify_status_change(project, old_status, "grace"), robust=True)
+    logger.info(f"Проект {project.slug} → GRACE до {project.grace_until}")
+
+
+def _fire_suspend(project: Project):
+    from ..tasks import PRIORITY_LOW, enqueue_suspend
+
+    if project.status != "grace" or not project.grace_until or project.grace_until >= timezone.localdate():
+        return
+    if _suspend_pending(project):
+        return
+    # Не поставилась (брокер недоступен) — событие уже выполнено, повторит ежедневная сверка
+    transaction.on_commit(lambda: enqueue_suspend(project.id, priority=PRIORITY_LOW), robust=True)
+    logger.info(f"Проект {project.slug} → SUSPEND (grace истёк)")
+
+
+HANDLERS = {
+    "warning": _fire_warning,
+    "grace": _fire_grace,
+    "suspend": _fire_suspend,
+}
+
+
+def pop_due_events(limit: int = POLL_BATCH) -> int:
+    """
+    Выполняет наступившие события. Несколько поллеров не мешают друг другу:
+    строки блокируются с SKIP LOCKED. Возвращает число обработанных событий.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        events = list(
+            BillingEvent.objects.select_for_update(skip_locked=True, of=("self",))
+            .select_related("project")
+            .filter(fired_at__isnull=True, due_at__lte=now)
+            .order_by("due_at")[:limit]
+        )
+        for event in events:
+            try:
+                with transaction.atomic():
+                    HANDLERS[event.kind](event.project)
+            except Exception as e:
+                BillingEvent.objects.filter(id=event.id).update(
+                    attempts=event.attempts + 1, due_at=now + RETRY_DELAY,
+                )
+                logger.error(f"Событие биллинга {event} упало (попытка {event.attempts + 1}): {e}")
+                continue
+            # Через update: обработчик мог пересчитать (и удалить) события проекта
+            BillingEvent.objects.filter(id=event.id).update(fired_at=now)
+    return len(events)
@@ -0,0 +1,139 @@
+import base64
+import hashlib
+import re
+import shlex
+
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from django.conf import settings
+from django.db import transaction
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+from ..models import EnvVersion
+
+# Строка KEY=VALUE (допускается префикс export); комментарии и пустые строки — не переменные
+ENV_LINE_RE = re.compile(r"^\s*(?:export\s+)?([A-Za-z_][A-Za-z0-9_]*)\s*=(.*)$")
+
+
+class EnvDecryptError(RuntimeError):
+    """Версию env не удалось расшифровать: ключ удалён из ENV_ENCRYPTION_KEYS."""
+
+
+def _fernet() -> MultiFernet:
+    """
+    Первый ключ ENV_ENCRYPTION_KEYS шифрует, остальные только расшифровывают
+    (ротация). Без ключей — ключ из SECRET_KEY: смена SECRET_KEY сделает
+    сохранённые версии нечитаемыми.
+    """
+    keys = settings.ENV_ENCRYPTION_KEYS or [
+        base64.urlsafe_b64encode(hashlib.sha256(f"zea.env:{settings.SECRET_KEY}".encode()).digest())
+    ]
+    return MultiFernet([Fernet(key) for key in keys])
+
+
+def normalize(text: str) -> str:
+    """Единый вид .env: \\n вместо \\r\\n, без хвостовых пробелов, перевод строки в конце."""
+    lines = [line.rstrip() for line in (text or "").replace("\r\n", "\n").split("\n")]
+    text = "\n".join(lines).strip("\n")
+    return text + "\n" if text else ""
+
+
+def checksum(text: str) -> str:
+    """HMAC текста: сравнение версий без расшифровки и без утечки значений."""
+    return salted_hmac("zea.env", normalize(text), algorithm="sha256").hexdigest()
+
+
+def encrypt(text: str) -> str:
+    return _fernet().encrypt(normalize(text).encode()).decode()
+
+
+def decrypt(version: EnvVersion) -> str:
+    try:
+        return _fernet().decrypt(version.ciphertext.encode()).decode()
+    except InvalidToken:
+        raise EnvDecryptError(f"{version}: нет ключа для расшифровки")
+
+
+def parse_env(text: str) -> dict:
+    return {m[1]: m[2].strip() for m in map(ENV_LINE_RE.match, (text or "").splitlines()) if m}
+
+
+def diff_env(old_text: str, new_text: str) -> dict:
+    """Какие переменные добавлены, удалены и изменены (только имена)."""
+    old, new = parse_env(old_text), parse_env(new_text)
+    return {
+        "added": sorted(new.keys() - old.keys()),
+        "removed": sorted(old.keys() - new.keys()),
+        "changed": sorted(key for key in old.keys() & new.keys() if old[key] != new[key]),
+    }
+
+
+def diff_summary(diff: dict) -> str:
+    parts = [f"+{key}" for key in diff["added"]]
+    parts += [f"~{key}" for key in diff["changed"]]
+    parts += [f"−{key}" for key in diff["removed"]]
+    return " ".join(parts)
+
+
+def current_env(project):
+    return project.env_versions.order_by("-version").first()
+
+
+def current_env_text(project) -> str:
+    version = current_env(project)
+    return decrypt(version) if version else ""
+
+
+def save_env(project, text: str, author: str = ""):
+    """
+    Сохраняет новую версию, если текст изменился. Возвращает EnvVersion
+    или None, если менять нечего.
+    """
+    with transaction.atomic():
+        # Блокировка проекта: версии одного проекта нумеруются без гонок
+        type(project).objects.select_for_update().only("id").get(pk=project.pk)
+        current = current_env(project)
+        if current is None and not normalize(text):
+            return None
+        if current and constant_time_compare(current.checksum, checksum(text)):
+            return None
+        previous = decrypt(current) if current else ""
+        return EnvVersion.objects.create(
+            project=project,
+            version=(current.version + 1) if current else 1,
+            ciphertext=encrypt(text),
+            checksum=checksum(text),
+            summary=diff_summary(diff_env(previous, text))[:500],
+            author=author,
+        )
+
+
+def pending_env(project):
+    """
+    (версия, diff) — если текущая версия ещё не записана на сервер, иначе None.
+    diff считается от версии, которая на сервере.
+    """
+    current = current_env(project)
+    if current is None or current.id == project.env_pushed_id:
+        return None
+    pushed = decrypt(project.env_pushed) if project.env_pushed_id else ""
+    return current, diff_env(pushed, decrypt(current))
+
+
+def mark_env_pushed(project, version):
+    project.env_pushed = version
+    type(project).objects.filter(pk=project.pk).update(env_pushed=version)
+
+
+def env_write_command(text: str) -> str:
+    """
+    Shell: записать .env (права 600), только если содержимое на сервере
+    отличается. Печатает, был ли файл обновлён.
+    """
+    text = normalize(text)
+    digest = hashlib.sha256(text.encode()).hexdigest()
+    return f"""if [ "$(sha256sum .env 2>/dev/null | cut -d' ' -f1)" = "{digest}" ]; then
+  echo ".env не изменился"
+else
+  (umask 077 && printf '%s' {shlex.quote(text)} > .env.zea) && mv .env.zea .env
+  echo ".env обновлён"
+fi"""
@@ -0,0 +1,30 @@
+import time
+import threading
+
+
+class FakeSSH:
+    """
+    Подмена run_ssh для бенчмарков: не ходит в сеть, а имитирует
+    задержку и объём вывода удалённой команды.
+    """
+
+    def __init__(self, latency: float = 0.05, output_bytes: int = 4096):
+        self.latency = latency
+        self.output_bytes = output_bytes
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, host: str, user: str, port: int, command: str, timeout: int = 600,
+                 on_output=None, stdin=None, forward_agent: bool = False) -> str:
+        # forward_agent принимается ради совместимости с run_ssh: агента здесь нет
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        line = f"[{user}@{host}:{port}] ok\n"
+        repeat = max(self.output_bytes // len(line), 1)
+        output = line * repeat
+        if on_output:
+            on_output(output)
+        return output
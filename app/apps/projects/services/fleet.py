@@ -0,0 +1,186 @@
+import hashlib
+import ipaddress
+import logging
+import shlex
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from django.db.models import Q
+
+from .ssh_exec import SSHCommandError, run_ssh
+
+logger = logging.getLogger(__name__)
+
+# Одновременных SSH-сессий: ssh-процессы лёгкие, упираемся в сеть и sshd
+FLEET_WORKERS = 16
+FLEET_TIMEOUT = 120
+
+# Хост — выброс по времени, если дольше медианы в OUTLIER_FACTOR раз и хотя бы на OUTLIER_MIN_SECONDS
+OUTLIER_FACTOR = 3
+OUTLIER_MIN_SECONDS = 1.0
+
+
+@dataclass
+class FleetTarget:
+    label: str
+    host: str
+    user: str
+    port: int
+    cwd: str = ""
+    # Своя команда для цели (например, со списком проектов сервера) вместо общей
+    command: str = ""
+    # stdin команды (секреты — не в тексте команды)
+    stdin: bytes = None
+
+
+@dataclass
+class HostResult:
+    target: FleetTarget
+    returncode: int = None
+    seconds: float = 0.0
+    output: str = ""
+    error: str = ""
+    outlier: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0
+
+    @property
+    def status(self) -> str:
+        if self.ok:
+            return "ok"
+        if self.error.startswith("ssh:"):
+            return "error"
+        if self.returncode is None:
+            return "timeout"
+        return f"exit {self.returncode}"
+
+
+@dataclass
+class OutputGroup:
+    """Хосты с одинаковым выводом — чтобы не читать 30 одинаковых «Docker version …»."""
+    output: str
+    labels: list = field(default_factory=list)
+
+
+def servers_lookup(values) -> Q:
+    """
+    Фильтр серверов по именам или IP. В ip_address (inet) уходят только
+    настоящие адреса: psycopg не адаптирует «prod-1» к inet.
+    """
+    ips, names = [], []
+    for value in values:
+        try:
+            ips.append(str(ipaddress.ip_address(value)))
+        except ValueError:
+            names.append(value)
+    lookup = Q(name__in=names)
+    if ips:
+        lookup |= Q(ip_address__in=ips)
+    return lookup
+
+
+def targets_for_servers(servers) -> list:
+    return [
+        FleetTarget(label=s.name, host=s.ip_address, user=s.ssh_user, port=s.ssh_port)
+        for s in servers
+    ]
+
+
+def targets_for_projects(projects) -> list:
+    """Команда выполняется в каталоге проекта (cd <remote_path>)."""
+    return [
+        FleetTarget(
+            label=p.slug, host=p.server.ip_address, user=p.server.ssh_user,
+            port=p.server.ssh_port, cwd=p.get_remote_path(),
+        )
+        for p in projects
+    ]
+
+
+def _run_one(target: FleetTarget, command: str, timeout: int, on_line) -> HostResult:
+    result = HostResult(target=target)
+    command = target.command or command
+    remote = f"cd {shlex.quote(target.cwd)} && {command}" if target.cwd else command
+    callback = (lambda chunk: on_line(target.label, chunk)) if on_line else None
+
+    t0 = time.monotonic()
+    try:
+        result.output = run_ssh(target.host, target.user, target.port, remote,
+                                timeout=timeout, on_output=callback, stdin=target.stdin)
+        result.returncode = 0
+    except SSHCommandError as e:
+        result.returncode = e.returncode
+        result.output = e.output
+        result.error = "" if e.returncode is not None else str(e)
+        # ssh сам возвращает 255, если не смог подключиться
+        if e.returncode == 255:
+            result.error = "ssh: не удалось подключиться"
+    except Exception as e:
+        result.error = f"ssh: {e}"
+    result.seconds = time.monotonic() - t0
+    return result
+
+
+def run_fleet(targets, command: str, workers: int = FLEET_WORKERS,
+              timeout: int = FLEET_TIMEOUT, on_line=None) -> list:
+    """
+    Выполняет команду на всех целях параллельно (не больше workers сессий).
+    on_line(label, line) вызывается по мере поступления вывода; вызовы
+    сериализованы, строки разных хостов не перемешиваются посередине.
+    Результаты возвращаются в порядке targets.
+    """
+    lock = threading.Lock()
+
+    def emit(label, line):
+        with lock:
+            on_line(label, line)
+
+    workers = max(1, min(workers, len(targets) or 1))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fleet") as pool:
+        futures = [
+            pool.submit(_run_one, target, command, timeout, emit if on_line else None)
+            for target in targets
+        ]
+        results = [future.result() for future in futures]
+
+    mark_outliers(results)
+    failed = sum(1 for r in results if not r.ok)
+    logger.info(f"Fleet: «{command[:80]}» на {len(results)} хостах, ошибок: {failed}")
+    return results
+
+
+def mark_outliers(results):
+    """Помечает хосты, которые заметно медленнее остальных."""
+    durations = [r.seconds for r in results if r.ok]
+    if len(durations) < 3:
+        return
+    median = statistics.median(durations)
+    for r in results:
+        r.outlier = r.seconds > median * OUTLIER_FACTOR and r.seconds - median >= OUTLIER_MIN_SECONDS
+
+
+def group_outputs(results) -> list:
+    """Группирует хосты по одинаковому выводу, самые частые группы — первыми."""
+    groups = {}
+    for r in results:
+        text = (r.output or r.error).strip()
+        key = hashlib.sha1(text.encode()).hexdigest()
+        groups.setdefault(key, OutputGroup(output=text)).labels.append(r.target.label)
+    return sorted(groups.values(), key=lambda g: -len(g.labels))
+
+
+def summary(results) -> dict:
+    durations = [r.seconds for r in results]
+    return {
+        "total": len(results),
+        "ok": sum(1 for r in results if r.ok),
+        "failed": sum(1 for r in results if not r.ok),
+        "outliers": sum(1 for r in results if r.outlier),
+        "median": statistics.median(durations) if durations else 0,
+        "max": max(durations) if durations else 0,
+    }
@@ -0,0 +1,183 @@
+import fcntl
+import hashlib
+import logging
+import os
+import re
+import shlex
+import subprocess
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+from .ssh_exec import run_ssh
+
+logger = logging.getLogger(__name__)
+
+# Код на серверы идёт из локального bare-зеркала репозитория: из GitHub
+# зеркало докачивает только новые объекты, а серверу уходит thin bundle —
+# коммиты, которых у него ещё нет. GIT_MIRROR=0 — серверы тянут из GitHub сами.
+GIT_MIRROR = os.getenv("GIT_MIRROR", "1") == "1"
+GIT_MIRROR_DIR = os.getenv("GIT_MIRROR_DIR", "/var/lib/zea/git-mirrors")
+GIT_MIRROR_TIMEOUT = 300
+
+# Временный файл bundle на сервере
+REMOTE_BUNDLE = ".git/zea.bundle"
+
+SHA_RE = re.compile(r"^[0-9a-f]{40}$", re.MULTILINE)
+
+
+class GitMirrorError(RuntimeError):
+    """Локальная git-команда зеркала завершилась с ошибкой или по таймауту."""
+
+
+def mirror_path(repo_url: str) -> Path:
+    """Каталог зеркала: имя репозитория + хеш URL (одинаковые имена у разных владельцев)."""
+    digest = hashlib.sha1(repo_url.encode()).hexdigest()[:10]
+    name = repo_url.rstrip("/").rsplit("/", 1)[-1].removesuffix(".git")
+    name = re.sub(r"[^A-Za-z0-9_.-]+", "-", name).strip("-") or "repo"
+    return Path(GIT_MIRROR_DIR) / f"{name}-{digest}.git"
+
+
+def _git(mirror: Path, *args, input: str = None) -> str:
+    try:
+        result = subprocess.run(
+            ["git", f"--git-dir={mirror}", *args],
+            input=input, capture_output=True, text=True, timeout=GIT_MIRROR_TIMEOUT,
+        )
+    except subprocess.TimeoutExpired:
+        raise GitMirrorError(f"git {args[0]}: таймаут ({GIT_MIRROR_TIMEOUT}с)")
+    except OSError as e:
+        raise GitMirrorError(f"git не запускается: {e}")
+    if result.returncode != 0:
+        raise GitMirrorError(f"git {args[0]}: {result.stderr.strip()}")
+    return result.stdout
+
+
+@contextmanager
+def _locked(mirror: Path):
+    """Эксклюзивная блокировка зеркала: деплои одного репозитория из разных воркеров."""
+    mirror.parent.mkdir(parents=True, exist_ok=True)
+    with open(f"{mirror}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def update_mirror(repo_url: str, branch: str) -> str:
+    """
+    Докачивает ветку в зеркало и возвращает её коммит. Вызывается под
+    _locked: только ветка и без тегов — pull request'ы GitHub не тянутся.
+    """
+    mirror = mirror_path(repo_url)
+    if not (mirror / "HEAD").exists():
+        _git(mirror, "init", "--bare", "-q")
+        _git(mirror, "remote", "add", "origin", repo_url)
+    _git(mirror, "fetch", "-q", "--no-tags", "origin", f"+refs/heads/{branch}:refs/heads/{branch}")
+    return _git(mirror, "rev-parse", f"refs/heads/{branch}").strip()
+
+
+def remote_haves(project) -> list:
+    """Коммиты, которые уже есть в репозитории на сервере (HEAD и ветки)."""
+    s = project.server
+    cmd = f"""
+cd {project.get_remote_path()} 2>/dev/null || exit 0
+git rev-parse -q --verify HEAD
+git for-each-ref --format='%(objectname)' refs/heads refs/remotes
+exit 0
+"""
+    return sorted(set(SHA_RE.findall(run_ssh(s.ip_address, s.ssh_user, s.ssh_port, cmd))))
+
+
+def known_commits(mirror: Path, shas: list) -> list:
+    """Оставляет коммиты, известные зеркалу: только их можно указать как базу bundle."""
+    if not shas:
+        return []
+    output = _git(mirror, "cat-file", "--batch-check", input="\n".join(shas) + "\n")
+    # Формат: «<sha> commit <size>» или «<sha> missing»
+    return [parts[0] for parts in map(str.split, output.splitlines()) if parts[1:2] == ["commit"]]
+
+
+def create_bundle(mirror: Path, branch: str, sha: str, haves: list, path: str) -> bool:
+    """
+    Пишет в path thin bundle ветки без объектов, достижимых из haves.
+    False — у сервера уже есть всё нужное, bundle не создан.
+    """
+    exclude = [f"^{have}" for have in haves]
+    if not _git(mirror, "rev-list", "-n", "1", sha, *exclude).strip():
+        return False
+    _git(mirror, "bundle", "create", path, f"refs/heads/{branch}", *exclude)
+    return True
+
+
+def direct_script(project) -> str:
+    """Shell: сервер сам клонирует и обновляет репозиторий из GitHub."""
+    branch = project.github_branch
+    return f"""if [ ! -d ".git" ]; then
+  git clone {project.github_repo} .
+fi
+
+git fetch --all
+git checkout {branch}
+git reset --hard origin/{branch}
+"""
+
+
+def bundle_script(project, sha: str, size: int = None) -> str:
+    """Shell: принять bundle из stdin (если size задан) и переключиться на sha."""
+    branch = project.github_branch
+    lines = [
+        'if [ ! -d ".git" ]; then',
+        "  git init -q",
+        f"  git remote add origin {shlex.quote(project.github_repo)}",
+        "fi",
+    ]
+    if size is None:
+        lines.append(f'echo "Зеркало: {sha[:12]} уже на сервере"')
+    else:
+        lines += [
+            f'echo "Зеркало: {sha[:12]}, bundle {max(size // 1024, 1)} КБ"',
+            f"cat > {REMOTE_BUNDLE}",
+            f"git fetch -q {REMOTE_BUNDLE} refs/heads/{branch}",
+            f"rm -f {REMOTE_BUNDLE}",
+        ]
+    lines += [
+        f"git update-ref refs/remotes/origin/{branch} {sha}",
+        f"git checkout -q -f -B {branch} {sha}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+@contextmanager
+def repository_source(project):
+    """
+    Готовит доставку кода на сервер проекта: выдаёт (shell-скрипт, stdin).
+    Скрипт выполняется в каталоге проекта, stdin (bundle или None) — передать
+    в run_ssh. Если зеркало недоступно (нет доступа к GitHub с управляющего
+    хоста, нет git), скрипт тянет код из GitHub напрямую, как раньше.
+    """
+    if not GIT_MIRROR:
+        yield direct_script(project), None
+        return
+
+    mirror = mirror_path(project.github_repo)
+    with tempfile.TemporaryDirectory(prefix="zea-bundle-") as tmp:
+        bundle = os.path.join(tmp, "repo.bundle")
+        # Опрос сервера — до блокировки: медленный сервер не держит зеркало
+        haves = remote_haves(project)
+        try:
+            with _locked(mirror):
+                sha = update_mirror(project.github_repo, project.github_branch)
+                haves = known_commits(mirror, haves)
+                created = create_bundle(mirror, project.github_branch, sha, haves, bundle)
+        except GitMirrorError as e:
+            logger.warning(f"Зеркало {project.github_repo} недоступно, fetch из GitHub: {e}")
+            error = f"echo {shlex.quote(f'Зеркало недоступно: {e}')}\n"
+        else:
+            error = None
+
+        if error:
+            yield error + direct_script(project), None
+        elif not created:
+            yield bundle_script(project, sha), None
+        else:
+            with open(bundle, "rb") as stdin:
+                yield bundle_script(project, sha, os.path.getsize(bundle)), stdin
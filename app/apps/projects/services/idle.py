@@ -0,0 +1,117 @@
+import logging
+import os
+import re
+
+from django.urls import reverse
+from django.utils.crypto import salted_hmac
+
+from ..models import Project
+from . import nginx_config
+from .fleet import run_fleet, targets_for_servers
+from .resources import compose_files
+
+logger = logging.getLogger(__name__)
+
+# Засыпание: простаивающий проект останавливается, nginx отправляет запросы
+# к приложению в панель (wake_view), она будит проект. Простой — время с
+# последней записи в access-логе проекта: лог не разбирается.
+#
+# Адрес панели, доступный с серверов проектов. Без него проекты не засыпают.
+WAKE_BASE_URL = os.getenv("WAKE_BASE_URL", "").rstrip("/")
+# Сколько ждать ответа приложения после запуска, прежде чем вернуть ему трафик
+WAKE_READY_TIMEOUT = int(os.getenv("WAKE_READY_TIMEOUT", 60))
+# Через сколько секунд посетитель повторяет запрос (Retry-After и автообновление)
+WAKE_RETRY_AFTER = 3
+# Повторные запросы к спящему проекту не ставят пробуждение в очередь заново
+WAKE_LOCK_TTL = 60
+
+IDLE_LINE_RE = re.compile(r"^ZEA_IDLE (\S+) (\d+)$", re.MULTILINE)
+
+
+def wake_token(slug: str) -> str:
+    """Подпись в адресе пробуждения: без неё панель не будит проекты по перебору slug."""
+    return salted_hmac("zea.wake", slug, algorithm="sha256").hexdigest()[:32]
+
+
+def wake_url(project) -> str:
+    return WAKE_BASE_URL + reverse("project_wake", args=[project.slug, wake_token(project.slug)])
+
+
+def idle_command() -> str:
+    """Shell: «ZEA_IDLE <slug> <секунд без запросов>» по access-логам сервера."""
+    return f"""now=$(date +%s)
+for f in {nginx_config.NGINX_LOG_DIR}/*.access.log; do
+  [ -f "$f" ] && echo "ZEA_IDLE $(basename "$f" .access.log) $((now - $(stat -c %Y "$f")))"
+done
+true"""
+
+
+def parse_idle(output: str) -> dict:
+    return {slug: int(seconds) for slug, seconds in IDLE_LINE_RE.findall(output)}
+
+
+def sleep_candidates():
+    """Работающие проекты с порогом простоя и доменом (без nginx будить некому)."""
+    return (
+        Project.objects.select_related("server")
+        .filter(idle_timeout__isnull=False, sleeping_since__isnull=True, status__in=["active", "grace"])
+        .exclude(domain="")
+    )
+
+
+def find_idle_projects() -> tuple:
+    """
+    Проекты, простаивающие дольше своего idle_timeout. Опрос серверов —
+    параллельно, одна команда на сервер. Возвращает (проекты, {сервер: ошибка}).
+    """
+    by_server = {}
+    for project in sleep_candidates():
+        by_server.setdefault(project.server, []).append(project)
+    if not by_server:
+        return [], {}
+
+    servers = list(by_server)
+    results = run_fleet(targets_for_servers(servers), idle_command())
+    idle, errors = [], {}
+    for server, result in zip(servers, results):
+        if not result.ok:
+            errors[server.name] = result.error or result.status
+            continue
+        seconds = parse_idle(result.output)
+        for project in by_server[server]:
+            # Нет лога — конфиг ещё не ставился с access_log: ждём следующего деплоя
+            if seconds.get(project.slug, 0) >= project.idle_timeout * 60:
+                idle.append(project)
+    return idle, errors
+
+
+def sleep_script(project) -> str:
+    """
+    Shell: ещё раз проверить простой, остановить контейнеры и поставить
+    nginx-конфиг пробуждения. Запросы, пришедшие после проверки, получат
+    502 на время stop — затем их примет панель.
+    """
+    log = nginx_config.access_log_path(project)
+    return f"""set -e
+cd {project.get_remote_path()}
+if [ -f {log} ] && [ $(( $(date +%s) - $(stat -c %Y {log}) )) -lt {project.idle_timeout * 60} ]; then
+  echo "ZEA_AWAKE: были запросы, проект не усыплён"
+  exit 0
+fi
+docker compose {compose_files(project)} stop
+{nginx_config.nginx_install_command(project, sleeping=True)}"""
+
+
+def wake_script(project) -> str:
+    """
+    Shell (быстрый путь resume): запустить контейнеры без сборки, дождаться
+    ответа приложения и вернуть обычный nginx-конфиг — одна SSH-сессия.
+    """
+    return f"""set -e
+cd {project.get_remote_path()}
+docker compose {compose_files(project)} up -d --no-build
+for i in $(seq 1 {WAKE_READY_TIMEOUT * 2}); do
+  curl -s -o /dev/null --max-time 1 http://127.0.0.1:{project.internal_port}/ && break
+  sleep 0.5
+done
+{nginx_config.nginx_install_command(project)}"""
@@ -0,0 +1,251 @@
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime
+from functools import wraps
+
+from celery import current_task
+from celery.beat import Scheduler
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Выборы лидера через аренду в Redis. beat и Telegram-бот запускаются в
+# нескольких копиях (на разных узлах), работает только держатель аренды
+# своей роли. Лидер продлевает аренду каждые LEADER_TTL/3; если он пропал,
+# резервная копия забирает аренду не позже чем через LEADER_TTL + LEADER_RETRY.
+#
+# Каждый срок лидерства получает fencing-токен — растущий номер. beat
+# передаёт его задачам в заголовке: задача от лидера прошлого срока, пришедшая
+# после задачи нового, не выполняется (fenced).
+LEADER_TTL = float(os.getenv("LEADER_TTL", 15))
+LEADER_RETRY = float(os.getenv("LEADER_RETRY", 2))
+ROLES = ("beat", "bot")
+KEY_PREFIX = "zea:leader:"
+TOKEN_HEADER = "zea_leader_token"
+
+# Взять или продлить аренду. KEYS: аренда, счётчик сроков; ARGV: кто, ttl (мс).
+# Значение аренды — «кто|токен». Возвращает токен срока или 0, если лидер другой.
+_ACQUIRE = """
+local current = redis.call('GET', KEYS[1])
+if current then
+  local holder, token = string.match(current, '^(.*)|(%d+)$')
+  if holder ~= ARGV[1] then return 0 end
+  redis.call('PEXPIRE', KEYS[1], ARGV[2])
+  return tonumber(token)
+end
+local token = redis.call('INCR', KEYS[2])
+redis.call('SET', KEYS[1], ARGV[1] .. '|' .. token, 'PX', ARGV[2])
+return token
+"""
+_RELEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
+# Наибольший выполненный токен задачи: меньший — задача устаревшего лидера
+_FENCE = """
+local seen = tonumber(redis.call('GET', KEYS[1]) or '0')
+if tonumber(ARGV[1]) < seen then return 0 end
+redis.call('SET', KEYS[1], ARGV[1])
+return 1
+"""
+
+_redis = None
+_redis_lock = threading.Lock()
+
+
+def _get_redis():
+    global _redis
+    if _redis is None:
+        with _redis_lock:
+            if _redis is None:
+                import redis
+
+                _redis = redis.Redis.from_url(
+                    settings.LEADER_REDIS_URL,
+                    socket_timeout=2,
+                    socket_connect_timeout=2,
+                )
+    return _redis
+
+
+class LeaderLease:
+    """
+    Аренда роли. hold() берёт или продлевает её и возвращает, лидер ли этот
+    процесс; token — fencing-токен текущего срока (None — не лидер).
+    Недоступный Redis — не лидер: лучше ни одного лидера, чем два.
+    """
+
+    def __init__(self, role: str, ttl: float = LEADER_TTL):
+        self.role = role
+        self.ttl = ttl
+        self.key = KEY_PREFIX + role
+        self.identity = f"{socket.gethostname()}:{os.getpid()}"
+        self.token = None
+
+    @property
+    def renew_interval(self) -> float:
+        return self.ttl / 3
+
+    def hold(self) -> bool:
+        try:
+            token = int(_get_redis().eval(
+                _ACQUIRE, 2, self.key, self.key + ":term", self.identity, int(self.ttl * 1000),
+            )) or None
+        except Exception as e:
+            if self.token:
+                logger.warning(f"Лидер {self.role}: Redis недоступен, работа приостановлена: {e}")
+            token = None
+        if token != self.token:
+            if token:
+                logger.info(f"Лидер {self.role}: {self.identity}, срок {token}")
+            elif self.token:
+                logger.warning(f"Лидер {self.role}: аренда потеряна ({self.identity})")
+        self.token = token
+        return token is not None
+
+    def release(self):
+        """Освобождает аренду при штатной остановке: резервная копия не ждёт LEADER_TTL."""
+        if self.token:
+            try:
+                _get_redis().eval(_RELEASE, 1, self.key, f"{self.identity}|{self.token}")
+            except Exception as e:
+                logger.warning(f"Лидер {self.role}: аренда не освобождена: {e}")
+            self.token = None
+
+
+def leaders() -> dict:
+    """{роль: (кто, токен)} для текущих лидеров; пусто, если Redis недоступен."""
+    try:
+        values = _get_redis().mget([KEY_PREFIX + role for role in ROLES])
+    except Exception as e:
+        logger.warning(f"Лидеры не получены: {e}")
+        return {}
+    result = {}
+    for role, value in zip(ROLES, values):
+        if value:
+            holder, _, token = value.decode().rpartition("|")
+            result[role] = (holder, int(token))
+    return result
+
+
+def run_while_leader(lease: LeaderLease, target, stop):
+    """
+    Цикл копии процесса: ждёт аренду, запускает target в потоке и продлевает
+    аренду, пока он работает. Потеря аренды — stop() до завершения потока и
+    снова ожидание. При выходе аренда освобождается.
+    """
+    try:
+        while True:
+            if not lease.hold():
+                time.sleep(LEADER_RETRY)
+                continue
+            thread = threading.Thread(target=target, name=f"leader-{lease.role}", daemon=True)
+            thread.start()
+            while thread.is_alive() and lease.hold():
+                thread.join(lease.renew_interval)
+            while thread.is_alive():
+                # stop() до старта цикла в потоке может потеряться — повторяем
+                stop()
+                thread.join(1)
+    finally:
+        lease.release()
+
+
+def _request_token(request):
+    # Воркер раскладывает заголовки сообщения в атрибуты request, eager — в request.headers
+    token = getattr(request, TOKEN_HEADER, None) or (getattr(request, "headers", None) or {}).get(TOKEN_HEADER)
+    return int(token) if token else None
+
+
+def fenced(func):
+    """
+    Для задач beat: задача, отправленная лидером прошлого срока, пропускается,
+    если задача с тем же именем от более нового лидера уже выполнялась.
+    Задачи без токена (вызванные вручную) выполняются всегда.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        request = current_task.request if current_task else None
+        token = _request_token(request) if request else None
+        if token is not None:
+            try:
+                allowed = _get_redis().eval(_FENCE, 1, f"{KEY_PREFIX}fence:{request.task}", token)
+            except Exception as e:
+                logger.warning(f"Fencing {request.task} не проверен: {e}")
+                allowed = 1
+            if not allowed:
+                logger.warning(f"{request.task}: токен {token} устарел, задача прежнего лидера пропущена")
+                return None
+        return func(*args, **kwargs)
+    return wrapper
+
+
+class LeaderScheduler(Scheduler):
+    """
+    beat, который отправляет задачи, только пока держит аренду "beat".
+    Время последнего запуска записей хранится в Redis, а не в локальном
+    файле: новый лидер продолжает расписание прежнего. Иначе после
+    переключения ночные crontab-задачи сработали бы сразу.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.lease = LeaderLease("beat")
+        super().__init__(*args, **kwargs)
+
+    @property
+    def last_run_key(self) -> str:
+        return self.lease.key + ":last_run"
+
+    def tick(self, *args, **kwargs):
+        previous = self.lease.token
+        if not self.lease.hold():
+            return min(LEADER_RETRY, self.max_interval)
+        if self.lease.token != previous:
+            self._load_last_run()
+        return min(super().tick(*args, **kwargs), self.lease.renew_interval)
+
+    def _load_last_run(self):
+        try:
+            stored = _get_redis().hgetall(self.last_run_key)
+        except Exception as e:
+            logger.warning(f"Расписание прежнего лидера не получено: {e}")
+            return
+        # Записи, которые ещё не запускались, отсчитываются от начала срока
+        now = self.app.now()
+        missing = {}
+        for name, entry in self.schedule.items():
+            timestamp = stored.get(name.encode())
+            if timestamp:
+                entry.last_run_at = datetime.fromtimestamp(float(timestamp), tz=self.app.timezone)
+            else:
+                entry.last_run_at = now
+                missing[name] = now.timestamp()
+        if missing:
+            try:
+                _get_redis().hset(self.last_run_key, mapping=missing)
+            except Exception as e:
+                logger.warning(f"Время запуска записей не сохранено: {e}")
+        # Очередь записей пересобирается с новыми временами
+        self._heap = None
+
+    def reserve(self, entry):
+        new_entry = super().reserve(entry)
+        try:
+            _get_redis().hset(self.last_run_key, entry.name, new_entry.last_run_at.timestamp())
+        except Exception as e:
+            logger.warning(f"Время запуска {entry.name} не сохранено: {e}")
+        return new_entry
+
+    def apply_async(self, entry, producer=None, advance=True, **kwargs):
+        headers = {**(entry.options.get("headers") or {}), TOKEN_HEADER: self.lease.token}
+        entry.options = {**entry.options, "headers": headers}
+        return super().apply_async(entry, producer, advance, **kwargs)
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self.lease.release()
@@ -0,0 +1,173 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = "zea:live:"
+
+# Буферизация логов: публикуем не чаще раза в LOG_FLUSH_INTERVAL или по LOG_FLUSH_BYTES
+LOG_FLUSH_INTERVAL = 0.5
+LOG_FLUSH_BYTES = 8 * 1024
+
+# Очередь событий одного клиента; если клиент не успевает — события отбрасываются
+CLIENT_QUEUE_SIZE = 200
+
+# Если Redis недоступен, не пытаемся публиковать какое-то время,
+# чтобы деплой не ждал таймаут подключения на каждой строке лога
+RETRY_AFTER = 30
+
+_redis = None
+_redis_lock = threading.Lock()
+_disabled_until = 0.0
+
+
+def _get_redis():
+    global _redis
+    if _redis is None:
+        with _redis_lock:
+            if _redis is None:
+                import redis
+
+                _redis = redis.Redis.from_url(
+                    settings.LIVE_EVENTS_REDIS_URL,
+                    socket_timeout=2,
+                    socket_connect_timeout=2,
+                )
+    return _redis
+
+
+def publish(project_id: int, event: str, data: dict):
+    """Публикует событие проекта в Redis. Ошибки не должны ломать деплой."""
+    global _disabled_until
+    if time.monotonic() < _disabled_until:
+        return
+
+    payload = json.dumps({"event": event, "project_id": project_id, **data}, default=str)
+    try:
+        _get_redis().publish(f"{CHANNEL_PREFIX}{project_id}", payload)
+    except Exception as e:
+        _disabled_until = time.monotonic() + RETRY_AFTER
+        logger.warning(f"Live-события отключены на {RETRY_AFTER}с: {e}")
+
+
+def publish_deployment(dep):
+    """Переход статуса деплоя (pending → running → success/failed)."""
+    publish(dep.project_id, "deployment", {
+        "deployment_id": dep.id,
+        "action": dep.action,
+        "status": dep.status,
+        "status_display": dep.get_status_display(),
+        "timings": dep.timings,
+    })
+
+
+def publish_project_status(project):
+    publish(project.id, "status", {
+        "slug": project.slug,
+        "status": project.status,
+        "status_display": project.get_status_display(),
+    })
+
+
+class LogStreamer:
+    """
+    Callback для run_ssh(on_output=...): копит строки и публикует их
+    пачками, чтобы не дёргать Redis на каждую строку сборки.
+    """
+
+    def __init__(self, dep):
+        self.dep = dep
+        self.buffer = []
+        self.size = 0
+        self.last_flush = time.monotonic()
+
+    def __call__(self, chunk: str):
+        self.buffer.append(chunk)
+        self.size += len(chunk)
+        if self.size >= LOG_FLUSH_BYTES or time.monotonic() - self.last_flush >= LOG_FLUSH_INTERVAL:
+            self.flush()
+
+    def write(self, text: str):
+        """Служебные строки (заголовки фаз) — сразу в поток."""
+        self.buffer.append(text)
+        self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        publish(self.dep.project_id, "log", {
+            "deployment_id": self.dep.id,
+            "chunk": "".join(self.buffer),
+        })
+        self.buffer = []
+        self.size = 0
+        self.last_flush = time.monotonic()
+
+
+class Broadcaster:
+    """
+    Одна подписка Redis (PSUBSCRIBE zea:live:*) на процесс ASGI, события
+    раздаются клиентам через asyncio.Queue. Клиенты не ходят в БД.
+    """
+
+    def __init__(self):
+        self.clients = {}  # queue → project_id (None — все проекты)
+        self._task = None
+
+    def subscribe(self, project_id=None) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        self.clients[queue] = project_id
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._listen())
+        return queue
+
+    def unsubscribe(self, queue):
+        self.clients.pop(queue, None)
+
+    def _dispatch(self, payload: dict):
+        for queue, project_id in list(self.clients.items()):
+            if project_id is None:
+                # Общий поток (Dashboard) — только смены статусов, без логов
+                if payload.get("event") == "log":
+                    continue
+            elif payload.get("project_id") != project_id:
+                continue
+            try:
+                queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                pass
+
+    async def _listen(self):
+        import redis.asyncio as aioredis
+
+        while self.clients:
+            client = aioredis.Redis.from_url(settings.LIVE_EVENTS_REDIS_URL)
+            pubsub = client.pubsub()
+            try:
+                await pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+                while self.clients:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=5)
+                    if not message:
+                        continue
+                    try:
+                        payload = json.loads(message["data"])
+                    except (TypeError, ValueError):
+                        continue
+                    self._dispatch(payload)
+            except Exception as e:
+                logger.warning(f"Live-подписка Redis прервалась: {e}")
+                await asyncio.sleep(1)
+            finally:
+                try:
+                    await pubsub.aclose()
+                    await client.aclose()
+                except Exception:
+                    pass
+
+
+broadcaster = Broadcaster()
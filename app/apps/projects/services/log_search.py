@@ -0,0 +1,66 @@
+from django.contrib.postgres.search import SearchHeadline, SearchQuery
+from django.db.models.functions import Right
+from django.utils.html import escape
+
+from ..models import LOG_SEARCH_CHARS, LOG_SEARCH_CONFIG, Deployment, log_search_vector
+
+# Маркеры подсветки от ts_headline: управляющие символы в логах не встречаются,
+# поэтому их можно безопасно заменить на теги после экранирования текста
+_START, _STOP = "\x02", "\x03"
+HEADLINE_OPTIONS = {
+    "start_sel": _START,
+    "stop_sel": _STOP,
+    "max_fragments": 3,
+    "max_words": 20,
+    "min_words": 8,
+    "fragment_delimiter": " … ",
+}
+
+
+def search_query(text: str) -> SearchQuery:
+    """
+    Синтаксис как у поисковиков: слова через пробел — все сразу,
+    "точная фраза", or — любое из, -слово — исключить.
+    """
+    return SearchQuery(text, search_type="websearch", config=LOG_SEARCH_CONFIG)
+
+
+def search_deployments(text: str, queryset=None):
+    """
+    Деплои, в логе которых встречается text, новые первыми.
+    Фильтр идёт по GIN-индексу deployment_log_search_idx; сам лог
+    не читается (defer) — подсветка считается только для страницы.
+    """
+    queryset = Deployment.objects.all() if queryset is None else queryset
+    return (
+        queryset.alias(log_search=log_search_vector())
+        .filter(log_search=search_query(text))
+        .select_related("project")
+        .defer("log")
+        .order_by("-enqueued_at")
+    )
+
+
+def headlines(deployments, text: str, markup: str = "mark") -> dict:
+    """
+    Фрагменты логов с подсветкой совпадений: {deployment_id: html}.
+    markup — тег подсветки ("mark" для страниц, "b" для Telegram).
+    Текст лога экранируется, безопасен для вывода как HTML.
+    """
+    ids = [dep.id for dep in deployments]
+    if not ids:
+        return {}
+    rows = (
+        Deployment.objects.filter(id__in=ids)
+        .annotate(headline=SearchHeadline(
+            Right("log", LOG_SEARCH_CHARS), search_query(text),
+            config=LOG_SEARCH_CONFIG, **HEADLINE_OPTIONS,
+        ))
+        .values_list("id", "headline")
+    )
+    return {
+        dep_id: escape(headline or "")
+        .replace(_START, f"<{markup}>")
+        .replace(_STOP, f"</{markup}>")
+        for dep_id, headline in rows
+    }
@@ -0,0 +1,145 @@
+from datetime import timedelta
+
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum
+from django.utils import timezone
+
+from ..models import Deployment
+from .leader import leaders
+from .profiling import task_ranking
+from .stats import average_durations
+
+# Границы бакетов гистограмм (сек)
+DURATION_BUCKETS = (5, 15, 30, 60, 120, 300, 600, 1200)
+QUEUE_WAIT_BUCKETS = (1, 5, 15, 30, 60, 300, 900, 1800)
+
+# Сколько последних запусков брать для средних по фазам
+PHASE_SAMPLE_SIZE = 200
+
+
+def _labels(**labels) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(f'{k}="{v}"' for k, v in labels.items())
+    return "{" + inner + "}"
+
+
+def _histogram(lines, name, help_text, start_field, end_field, buckets):
+    """Гистограмма по всем завершённым запускам — один запрос с разбивкой по действиям."""
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+
+    duration = ExpressionWrapper(F(end_field) - F(start_field), output_field=DurationField())
+    aggregates = {
+        f"le_{b}": Count("id", filter=Q(_d__lte=timedelta(seconds=b))) for b in buckets
+    }
+    rows = (
+        Deployment.objects.filter(**{f"{start_field}__isnull": False, f"{end_field}__isnull": False})
+        .annotate(_d=duration)
+        .values("action")
+        .annotate(_count=Count("id"), _sum=Sum("_d"), **aggregates)
+        .order_by("action")
+    )
+    for row in rows:
+        action = row["action"]
+        for b in buckets:
+            lines.append(f"{name}_bucket{_labels(action=action, le=b)} {row[f'le_{b}']}")
+        lines.append(f"{name}_bucket{_labels(action=action, le='+Inf')} {row['_count']}")
+        total = row["_sum"].total_seconds() if row["_sum"] else 0.0
+        lines.append(f"{name}_sum{_labels(action=action)} {total:.3f}")
+        lines.append(f"{name}_count{_labels(action=action)} {row['_count']}")
+
+
+def render_metrics() -> str:
+    """Отдаёт метрики деплоев в текстовом формате Prometheus."""
+    lines = []
+
+    _histogram(
+        lines,
+        "zea_deployment_duration_seconds",
+        "Длительность выполнения операции",
+        "started_at", "finished_at", DURATION_BUCKETS,
+    )
+    _histogram(
+        lines,
+        "zea_deployment_queue_wait_seconds",
+        "Время ожидания в очереди Celery",
+        "enqueued_at", "started_at", QUEUE_WAIT_BUCKETS,
+    )
+
+    # Счётчики по статусам
+    lines.append("# HELP zea_deployments_total Количество операций по статусу")
+    lines.append("# TYPE zea_deployments_total counter")
+    for row in Deployment.objects.values("action", "status").annotate(n=Count("id")).order_by("action", "status"):
+        lines.append(f"zea_deployments_total{_labels(action=row['action'], status=row['status'])} {row['n']}")
+
+    # Доля ошибок за последние 24 часа
+    since = timezone.now() - timedelta(hours=24)
+    lines.append("# HELP zea_deployment_failure_ratio Доля ошибок за последние 24 часа")
+    lines.append("# TYPE zea_deployment_failure_ratio gauge")
+    rows = (
+        Deployment.objects.filter(finished_at__gte=since, status__in=["success", "failed"])
+        .values("action")
+        .annotate(total=Count("id"), failed=Count("id", filter=Q(status="failed")))
+        .order_by("action")
+    )
+    for row in rows:
+        ratio = row["failed"] / row["total"] if row["total"] else 0
+        lines.append(f"zea_deployment_failure_ratio{_labels(action=row['action'])} {ratio:.4f}")
+
+    # Глубина очередей
+    depth = {queue: {"pending": 0, "running": 0} for queue in set(Deployment.QUEUE_BY_ACTION.values())}
+    for row in (
+        Deployment.objects.filter(status__in=["pending", "running"])
+        .values("action", "status")
+        .annotate(n=Count("id"))
+    ):
+        queue = Deployment.QUEUE_BY_ACTION.get(row["action"], "maintenance")
+        depth.setdefault(queue, {"pending": 0, "running": 0})[row["status"]] += row["n"]
+    lines.append("# HELP zea_queue_depth Операции в очереди и в работе")
+    lines.append("# TYPE zea_queue_depth gauge")
+    for queue in sorted(depth):
+        for state, n in sorted(depth[queue].items()):
+            lines.append(f"zea_queue_depth{_labels(queue=queue, state=state)} {n}")
+
+    # Средняя длительность фаз
+    phase_totals = {}
+    for timings in (
+        Deployment.objects.filter(finished_at__isnull=False)
+        .exclude(timings={})
+        .order_by("-finished_at")
+        .values_list("timings", flat=True)[:PHASE_SAMPLE_SIZE]
+    ):
+        for phase, seconds in (timings or {}).items():
+            total, count = phase_totals.get(phase, (0.0, 0))
+            phase_totals[phase] = (total + float(seconds), count + 1)
+    lines.append("# HELP zea_deployment_phase_avg_seconds Средняя длительность фазы")
+    lines.append("# TYPE zea_deployment_phase_avg_seconds gauge")
+    for phase in sorted(phase_totals):
+        total, count = phase_totals[phase]
+        lines.append(f"zea_deployment_phase_avg_seconds{_labels(phase=phase)} {total / count:.3f}")
+
+    # Оценка длительности для ETA
+    lines.append("# HELP zea_deployment_expected_seconds Ожидаемая длительность (для ETA)")
+    lines.append("# TYPE zea_deployment_expected_seconds gauge")
+    for action, seconds in sorted(average_durations().items()):
+        lines.append(f"zea_deployment_expected_seconds{_labels(action=action)} {seconds:.3f}")
+
+    # Лидеры beat и бота: смена токена — переключение на резервную копию
+    lines.append("# HELP zea_leader_term Срок (fencing-токен) текущего лидера роли")
+    lines.append("# TYPE zea_leader_term gauge")
+    for role, (holder, token) in sorted(leaders().items()):
+        lines.append(f"zea_leader_term{_labels(role=role, instance=holder)} {token}")
+
+    # Профили задач Celery за сутки (services/profiling.py): средние на запуск
+    ranking = list(task_ranking(hours=24))
+    for name, field, help_text, fmt in (
+        ("zea_task_cpu_seconds_avg", "avg_cpu", "Среднее CPU-время задачи за 24 часа", ".4f"),
+        ("zea_task_rss_delta_kb_avg", "avg_rss_delta", "Средний прирост RSS воркера за задачу, КБ", ".0f"),
+        ("zea_task_queries_avg", "avg_queries", "Среднее число запросов к БД за задачу", ".1f"),
+    ):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for row in sorted(ranking, key=lambda r: r["task"]):
+            lines.append(f"{name}{_labels(task=row['task'])} {row[field]:{fmt}}")
+
+    return "\n".join(lines) + "\n"
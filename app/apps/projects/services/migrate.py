@@ -0,0 +1,161 @@
+import os
+import re
+import shlex
+import socket
+
+from . import tls
+from .resources import build_command, compose_files
+
+# Переезд проекта на другой сервер. Данные (каталог проекта и именованные
+# тома compose) копирует rsync с исходного сервера на целевой напрямую:
+# первый проход — пока проект работает, второй — только разница, при
+# остановленных контейнерах. Простой ограничен вторым проходом и запуском.
+#
+# Исходный сервер ходит на целевой по SSH с ключом управляющего хоста
+# (agent forwarding): отдельные ключи между серверами не нужны.
+MIGRATION_SSH_OPTIONS = os.getenv(
+    "MIGRATION_SSH_OPTIONS", "-o StrictHostKeyChecking=accept-new -o BatchMode=yes",
+)
+RSYNC_OPTIONS = "-aH --numeric-ids --delete --stats"
+# Первый проход копирует все данные: таймаут больше обычного SSH_TIMEOUT
+PRESYNC_TIMEOUT = int(os.getenv("MIGRATION_PRESYNC_TIMEOUT", 3 * 60 * 60))
+
+RSYNC_FILES_RE = re.compile(r"^Number of regular files transferred: ([\d,.]+)", re.MULTILINE)
+RSYNC_BYTES_RE = re.compile(r"^Total transferred file size: ([\d,.]+) bytes", re.MULTILINE)
+
+
+class MigrationError(RuntimeError):
+    """Переезд невозможен: проверки перед переездом не пройдены."""
+
+
+def _remote(target) -> tuple:
+    """(команда ssh, user@host) для подключения с исходного сервера к целевому."""
+    return f"ssh -p {target.ssh_port} {MIGRATION_SSH_OPTIONS}", f"{target.ssh_user}@{target.ip_address}"
+
+
+def check_paths(source, source_path: str, target, target_path: str):
+    """Защита от копирования каталога в самого себя и rm -rf не того пути при очистке."""
+    if not source_path.startswith("/") or source_path.rstrip("/").count("/") < 2:
+        raise MigrationError(f"Путь {source_path} слишком короткий для переезда")
+    if source.ip_address == target.ip_address and source_path == target_path:
+        raise MigrationError(f"{source.name} и {target.name} — один хост и один каталог {source_path}")
+
+
+def preflight_script(project, target) -> str:
+    """Shell (на исходном сервере): rsync на обоих серверах, SSH до целевого, свободный порт."""
+    rsh, dest = _remote(target)
+    port = project.internal_port
+    remote = (
+        f"command -v rsync >/dev/null || {{ echo 'rsync не установлен на {target.name}'; exit 1; }}\n"
+        f"if ss -ltnH 'sport = :{port}' | grep -q .; then echo 'Порт {port} занят на {target.name}'; exit 1; fi\n"
+        "echo ok"
+    )
+    return f"""set -e
+command -v rsync >/dev/null || {{ echo "rsync не установлен на исходном сервере"; exit 1; }}
+{rsh} {dest} {shlex.quote(remote)}
+"""
+
+
+def sync_script(project, source_path: str, target, target_path: str) -> str:
+    """
+    Shell (на исходном сервере): rsync каталога проекта и именованных томов
+    compose на целевой сервер. Тома на целевом создаются с метками compose —
+    docker compose up подхватит их, а не создаст пустые.
+    """
+    rsh, dest = _remote(target)
+    return f"""set -e
+export RSYNC_RSH={shlex.quote(rsh)}
+$RSYNC_RSH {dest} "mkdir -p {target_path}"
+echo "--- {source_path}"
+rsync {RSYNC_OPTIONS} {source_path}/ {dest}:{target_path}/
+cd {source_path}
+name=$(docker compose {compose_files(project)} config 2>/dev/null | sed -n 's/^name: //p')
+[ -n "$name" ] || name=$(basename {source_path})
+for volume in $(docker volume ls -q --filter "label=com.docker.compose.project=$name"); do
+  key=$(docker volume inspect -f '{{{{ index .Labels "com.docker.compose.volume" }}}}' "$volume")
+  source_dir=$(docker volume inspect -f '{{{{ .Mountpoint }}}}' "$volume")
+  target_dir=$($RSYNC_RSH {dest} "docker volume create --label com.docker.compose.project=$name --label com.docker.compose.volume=$key $volume >/dev/null && docker volume inspect -f '{{{{ .Mountpoint }}}}' $volume")
+  echo "--- том $volume"
+  rsync {RSYNC_OPTIONS} "$source_dir/" "{dest}:$target_dir/"
+done
+"""
+
+
+def certificates_script(project, target) -> str:
+    """
+    Shell (на исходном сервере): копирует сертификат проекта на целевой
+    сервер — nginx там сразу поднимается с HTTPS, без нового выпуска.
+    """
+    rsh, dest = _remote(target)
+    slug = project.slug
+    letsencrypt = tls.LETSENCRYPT_DIR
+    return f"""set -e
+[ -d {letsencrypt}/live/{slug} ] || {{ echo "Сертификата {slug} нет, будет выпущен на новом сервере"; exit 0; }}
+cd {letsencrypt}
+paths=$(for p in live/{slug} archive/{slug} renewal/{slug}.conf; do if [ -e "$p" ]; then echo "$p"; fi; done)
+tar -cf - $paths | {rsh} {dest} "mkdir -p {letsencrypt} && tar -C {letsencrypt} -xf -"
+echo "Сертификат {slug} скопирован"
+"""
+
+
+def prepare_script(project, path: str) -> str:
+    """
+    Shell (на целевом сервере): образы из скопированного каталога — тот же
+    релиз, что работает сейчас. Сборка идёт до остановки и в простой не входит.
+    """
+    return f"""set -e
+cd {path}
+docker compose {compose_files(project)} pull --ignore-buildable --quiet 2>/dev/null || true
+export DOCKER_BUILDKIT=1
+{build_command(project)}
+"""
+
+
+def stop_script(project, path: str) -> str:
+    return f"""set -e
+cd {path}
+docker compose {compose_files(project)} stop
+"""
+
+
+def start_script(project, path: str) -> str:
+    """Запуск на целевом сервере, а при откате — снова на исходном."""
+    return f"""set -e
+cd {path}
+docker compose {compose_files(project)} up -d
+"""
+
+
+def cleanup_script(project, path: str, cache_dir: str = "") -> str:
+    """Shell: удаляет контейнеры, тома и каталог проекта на исходном сервере."""
+    cache = f"rm -rf {cache_dir}\n" if cache_dir else ""
+    return f"""set -e
+cd {path}
+docker compose {compose_files(project)} down --volumes --remove-orphans
+cd /
+rm -rf {path}
+{cache}echo "Каталог {path} удалён"
+"""
+
+
+def parse_rsync_stats(output: str) -> tuple:
+    """(файлов, байт), переданных всеми rsync в выводе (--stats)."""
+    def total(regex):
+        return sum(int(re.sub(r"[,.]", "", value)) for value in regex.findall(output))
+    return total(RSYNC_FILES_RE), total(RSYNC_BYTES_RE)
+
+
+def format_size(size: int) -> str:
+    for unit in ("Б", "КБ", "МБ"):
+        if size < 1024:
+            return f"{size} {unit}"
+        size //= 1024
+    return f"{size} ГБ"
+
+
+def dns_points_to(domain: str, address: str) -> bool:
+    """Указывает ли A-запись домена (с управляющего хоста) на address."""
+    try:
+        return address in socket.gethostbyname_ex(domain)[2]
+    except OSError:
+        return False
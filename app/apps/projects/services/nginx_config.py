@@ -1,49 +1,392 @@
+import os
+import re
 import logging
+import time
+from dataclasses import dataclass
+
 from .ssh_exec import run_ssh
+from .tls import ACME_WEBROOT, cert_paths, certbot_command, enddate_command, save_cert_dates
 
 logger = logging.getLogger(__name__)
 
-NGINX_TEMPLATE = """
+# Каталог конфигов Nginx на удалённом сервере (переопределяется в тестовом стенде)
+NGINX_CONF_DIR = os.getenv("NGINX_CONF_DIR", "/etc/nginx")
+
+# Микрокеш: по зоне на проект (proxy_cache_path — контекст http, куда
+# подключаются sites-enabled). Записи вытесняются по inactive/max_size.
+NGINX_CACHE_DIR = os.getenv("NGINX_CACHE_DIR", "/var/cache/nginx/zea")
+MICROCACHE_MAX_SIZE = os.getenv("NGINX_MICROCACHE_MAX_SIZE", "256m")
+COOKIE_NAME_RE = re.compile(r"^[A-Za-z0-9_]+$")
+
+# Access-лог проекта: по времени последней записи определяется простой
+# (services/idle.py), по содержимому — трафик (services/traffic.py)
+NGINX_LOG_DIR = os.getenv("NGINX_LOG_DIR", "/var/log/nginx/zea")
+# Компактная строка лога: время, код, байты, время ответа приложения последним
+# (через запятую, если upstream было несколько). Поля разбирает traffic.py.
+ACCESS_LOG_FORMAT = "$msec $status $bytes_sent $upstream_response_time"
+
+# DNS для OCSP stapling
+NGINX_RESOLVER = os.getenv("NGINX_RESOLVER", "1.1.1.1 8.8.8.8")
+
+# Сжатие brotli требует модуля ngx_brotli, в стандартном nginx его нет
+NGINX_BROTLI = os.getenv("NGINX_BROTLI", "0") == "1"
+
+COMPRESSIBLE_TYPES = (
+    "text/plain text/css text/xml application/javascript application/json "
+    "application/xml application/rss+xml image/svg+xml font/ttf font/otf"
+)
+
+
+@dataclass(frozen=True)
+class NginxProfile:
+    """Пресет конфига; client_max_body_mb и proxy_read_timeout переопределяются в проекте."""
+    keepalive: int                 # простаивающих соединений к приложению на воркер nginx
+    client_max_body_mb: int
+    proxy_read_timeout: int        # сек
+    proxy_connect_timeout: int     # сек
+    static_max_age: int            # сек, 0 — без кеширования
+    media_max_age: int
+    static_immutable: bool = False  # только для статики с хешем в имени (ManifestStaticFilesStorage)
+    gzip_static: bool = False       # отдавать готовые .gz рядом с файлами
+    open_file_cache: int = 1000     # дескрипторов в кеше, 0 — выключен
+    compress_types: str = COMPRESSIBLE_TYPES
+
+
+DAY = 24 * 60 * 60
+
+NGINX_PROFILES = {
+    # Обычный Django-сайт
+    "default": NginxProfile(
+        keepalive=16, client_max_body_mb=50, proxy_read_timeout=300, proxy_connect_timeout=10,
+        static_max_age=7 * DAY, media_max_age=DAY,
+    ),
+    # Много статики: долгий кеш, immutable, готовые .gz, большой кеш дескрипторов
+    "static": NginxProfile(
+        keepalive=16, client_max_body_mb=20, proxy_read_timeout=60, proxy_connect_timeout=10,
+        static_max_age=365 * DAY, media_max_age=30 * DAY, static_immutable=True,
+        gzip_static=True, open_file_cache=10000,
+    ),
+    # API: много коротких запросов — больше keepalive, короткие таймауты, сжатие JSON
+    "api": NginxProfile(
+        keepalive=64, client_max_body_mb=10, proxy_read_timeout=30, proxy_connect_timeout=5,
+        static_max_age=DAY, media_max_age=DAY, open_file_cache=0,
+        compress_types="application/json application/problem+json application/xml text/plain text/csv",
+    ),
+}
+
+MICROCACHE_ZONE = """
+proxy_cache_path {cache_dir} levels=1:2 keys_zone={zone}:10m max_size={max_size} inactive=10m use_temp_path=off;
+"""
+
+# Поколение в ключе кеша меняется при каждой установке конфига (деплой,
+# resume): после reload старые записи не находятся и вытесняются по inactive.
+# Ответы с Set-Cookie и с Cache-Control: private/no-cache nginx не кеширует.
+MICROCACHE_LOCATION = """
+        proxy_cache {zone};
+        proxy_cache_key "{generation}|$scheme$request_method$host$request_uri";
+        proxy_cache_valid 200 301 302 {ttl}s;
+        proxy_cache_valid 404 1s;
+        proxy_cache_bypass {bypass};
+        proxy_no_cache {bypass};
+        proxy_cache_use_stale error timeout updating http_500 http_502 http_503 http_504;
+        proxy_cache_background_update on;
+        proxy_cache_lock on;
+        proxy_cache_lock_timeout 5s;
+        add_header X-Cache-Status $upstream_cache_status;"""
+
+NGINX_TEMPLATE = """{microcache_zone}
+log_format {log_format} '{access_log_format}';
+
+upstream {upstream} {{
+    server 127.0.0.1:{port};
+    keepalive {keepalive};
+}}
+
 server {{
     listen 80;
     server_name {domain};
 
-    client_max_body_size 50M;
+    # HTTP-01: выпуск и продление сертификатов
+    location /.well-known/acme-challenge/ {{
+        root {acme_webroot};
+    }}
+{http_body}}}
+{tls_server}"""
+
+SITE_BODY = """
+    client_max_body_size {client_max_body_mb}M;
+    access_log {access_log} {log_format};
+
+{compression}{open_file_cache}{root_location}
+    location /static/ {{
+        alias {remote_path}/app/static/;
+{static_files}
+    }}
+
+    location /media/ {{
+        alias {remote_path}/app/media/;
+{media_files}
+    }}
+"""
 
+APP_LOCATION = """
     location / {{
-        proxy_pass http://127.0.0.1:{port};
+        proxy_pass http://{upstream};
+        # keepalive к upstream: HTTP/1.1 без «Connection: close»
+        proxy_http_version 1.1;
+        proxy_set_header Connection "";
         proxy_set_header Host $host;
         proxy_set_header X-Real-IP $remote_addr;
         proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
         proxy_set_header X-Forwarded-Proto $scheme;
-        proxy_read_timeout 300s;
-        proxy_connect_timeout 75s;
+        proxy_read_timeout {proxy_read_timeout}s;
+        proxy_connect_timeout {proxy_connect_timeout}s;{microcache}
     }}
+"""
 
-    location /static/ {{
-        alias {remote_path}/app/static/;
+# Проект спит: запросы к приложению идут в панель, она будит проект и
+# отвечает 503 с автообновлением. Статика отдаётся как обычно.
+WAKE_LOCATION = """
+    location / {{
+        proxy_pass {wake_url};
+        proxy_set_header X-Original-URI $request_uri;
+        proxy_ssl_server_name on;
+        proxy_connect_timeout 5s;
+        proxy_read_timeout 10s;
     }}
+"""
 
-    location /media/ {{
-        alias {remote_path}/app/media/;
+HTTPS_REDIRECT = """
+    location / {
+        return 301 https://$host$request_uri;
+    }
+"""
+
+# Кеш сессий общий для всех сайтов сервера (имя и размер должны совпадать
+# во всех конфигах): повторное подключение — без полного handshake.
+# http2 в listen, а не «http2 on», — для nginx < 1.25.1 (Debian 12).
+TLS_SERVER = """
+server {{
+    listen 443 ssl http2;
+    server_name {domain};
+
+    ssl_certificate {fullchain};
+    ssl_certificate_key {privkey};
+    ssl_trusted_certificate {chain};
+    ssl_protocols TLSv1.2 TLSv1.3;
+    ssl_session_cache shared:zea_ssl:20m;
+    ssl_session_timeout 1d;
+    ssl_session_tickets off;
+    ssl_stapling on;
+    ssl_stapling_verify on;
+    resolver {resolver} valid=300s;
+    resolver_timeout 5s;
+{site_body}}}
+"""
+
+
+# Форвард на исходном сервере после переезда: запросы, пришедшие по старой
+# A-записи, уходят на новый сервер (Host сохраняется) до смены DNS
+FORWARD_TEMPLATE = """server {{
+    listen 80;
+    server_name {domain};
+{http_body}}}
+{tls_server}"""
+
+FORWARD_LOCATION = """
+    location / {{
+        proxy_pass {scheme}://{address};
+        proxy_set_header Host $host;
+        proxy_set_header X-Real-IP $remote_addr;
+        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
+        proxy_set_header X-Forwarded-Proto $scheme;{ssl}
     }}
-}}
 """
 
 
-def generate_nginx_config(project) -> str:
-    """Генерирует Nginx конфиг для проекта."""
+def get_profile(project) -> NginxProfile:
+    return NGINX_PROFILES.get(project.nginx_profile, NGINX_PROFILES["default"])
+
+
+def _compression(profile: NginxProfile) -> str:
+    lines = [
+        "gzip on;",
+        "gzip_vary on;",
+        "gzip_proxied any;",
+        "gzip_comp_level 5;",
+        "gzip_min_length 1024;",
+        f"gzip_types {profile.compress_types};",
+    ]
+    if NGINX_BROTLI:
+        lines += ["brotli on;", "brotli_comp_level 5;", f"brotli_types {profile.compress_types};"]
+    return "".join(f"    {line}\n" for line in lines)
+
+
+def _open_file_cache(profile: NginxProfile) -> str:
+    if not profile.open_file_cache:
+        return ""
+    return (
+        f"    open_file_cache max={profile.open_file_cache} inactive=60s;\n"
+        "    open_file_cache_valid 60s;\n"
+        "    open_file_cache_min_uses 2;\n"
+    )
+
+
+def _file_location(max_age: int, immutable: bool = False, gzip_static: bool = False) -> str:
+    lines = ["sendfile on;", "tcp_nopush on;", "access_log off;"]
+    if gzip_static:
+        lines.append("gzip_static on;")
+    if max_age:
+        cache_control = f"public, max-age={max_age}" + (", immutable" if immutable else "")
+        lines.append(f'add_header Cache-Control "{cache_control}";')
+    return "\n".join(f"        {line}" for line in lines)
+
+
+def microcache_dir(project) -> str:
+    return f"{NGINX_CACHE_DIR}/{project.slug}"
+
+
+def _bypass_variables(project) -> str:
+    """Запросы с авторизацией или с cookie сессии идут мимо кеша."""
+    # В имени переменной nginx допустимы только буквы, цифры и _
+    cookies = [name for name in project.microcache_bypass_cookies.replace(",", " ").split()
+               if COOKIE_NAME_RE.match(name)]
+    return " ".join(["$http_authorization", *(f"$cookie_{name}" for name in cookies)])
+
+
+def access_log_path(project) -> str:
+    return f"{NGINX_LOG_DIR}/{project.slug}.access.log"
+
+
+def log_format_name(project) -> str:
+    # Формат на проект, как и зона микрокеша: имя log_format уникально в http
+    return f"zea_log_{project.slug}"
+
+
+def generate_nginx_config(project, cache_generation: str = "", tls: bool = None,
+                          sleeping: bool = False) -> str:
+    """
+    Генерирует Nginx конфиг для проекта по его профилю.
+    tls=False — только HTTP (пока сертификата ещё нет), по умолчанию — project.tls.
+    sleeping — контейнеры остановлены, запросы к приложению будят проект.
+    """
     if not project.domain:
         return ""
 
+    tls = project.tls if tls is None else tls
+    profile = get_profile(project)
+    upstream = f"zea_{project.slug}"
+    zone = f"zea_cache_{project.slug}"
+    microcache_zone = microcache = ""
+    if project.microcache:
+        microcache_zone = MICROCACHE_ZONE.format(
+            cache_dir=microcache_dir(project), zone=zone, max_size=MICROCACHE_MAX_SIZE,
+        )
+        microcache = MICROCACHE_LOCATION.format(
+            zone=zone, generation=cache_generation, ttl=project.microcache_ttl,
+            bypass=_bypass_variables(project),
+        )
+
+    if sleeping:
+        from .idle import wake_url
+
+        root_location = WAKE_LOCATION.format(wake_url=wake_url(project))
+    else:
+        root_location = APP_LOCATION.format(
+            upstream=upstream,
+            proxy_read_timeout=project.proxy_read_timeout or profile.proxy_read_timeout,
+            proxy_connect_timeout=profile.proxy_connect_timeout,
+            microcache=microcache,
+        )
+    site_body = SITE_BODY.format(
+        remote_path=project.get_remote_path(),
+        client_max_body_mb=project.client_max_body_mb or profile.client_max_body_mb,
+        access_log=access_log_path(project),
+        log_format=log_format_name(project),
+        compression=_compression(profile),
+        open_file_cache=_open_file_cache(profile),
+        root_location=root_location,
+        static_files=_file_location(profile.static_max_age, profile.static_immutable, profile.gzip_static),
+        media_files=_file_location(profile.media_max_age),
+    )
+    tls_server = ""
+    if tls:
+        tls_server = TLS_SERVER.format(
+            domain=project.domain, resolver=NGINX_RESOLVER, site_body=site_body, **cert_paths(project),
+        )
+
     return NGINX_TEMPLATE.format(
+        microcache_zone=microcache_zone,
+        log_format=log_format_name(project),
+        access_log_format=ACCESS_LOG_FORMAT,
+        upstream=upstream,
         domain=project.domain,
         port=project.internal_port,
-        remote_path=project.get_remote_path(),
+        keepalive=profile.keepalive,
+        acme_webroot=ACME_WEBROOT,
+        http_body=HTTPS_REDIRECT if tls else site_body,
+        tls_server=tls_server,
     ).strip()
 
 
-def deploy_nginx_config(project) -> str:
+def generate_forward_config(project, target) -> str:
+    """Конфиг-форвард на target: HTTP как есть, HTTPS — с сертификатом исходного сервера."""
+    if not project.domain:
+        return ""
+
+    http_body = FORWARD_LOCATION.format(scheme="http", address=target.ip_address, ssl="")
+    tls_server = ""
+    if project.tls:
+        location = FORWARD_LOCATION.format(
+            scheme="https", address=target.ip_address,
+            ssl=f"\n        proxy_ssl_server_name on;\n        proxy_ssl_name {project.domain};",
+        )
+        tls_server = TLS_SERVER.format(
+            domain=project.domain, resolver=NGINX_RESOLVER, site_body=location, **cert_paths(project),
+        )
+    return FORWARD_TEMPLATE.format(domain=project.domain, http_body=http_body, tls_server=tls_server).strip()
+
+
+def _install_command(project, text: str) -> str:
+    available = f"{NGINX_CONF_DIR}/sites-available/{project.slug}.conf"
+    enabled = f"{NGINX_CONF_DIR}/sites-enabled/{project.slug}.conf"
+    # Экранируем конфиг для передачи через SSH
+    escaped = text.replace("'", "'\\''")
+    return f"echo '{escaped}' > {available}\nln -sf {available} {enabled}\nnginx -t\nsystemctl reload nginx"
+
+
+def nginx_install_command(project, sleeping: bool = False) -> str:
+    """Shell: установить конфиг проекта (при первом HTTPS — выпустить сертификат) и перезагрузить Nginx."""
+    # Новое поколение ключа — сброс микрокеша после деплоя
+    generation = str(int(time.time()))
+    config = generate_nginx_config(project, cache_generation=generation, sleeping=sleeping)
+
+    # Пустой access-лог с текущим временем: простой считается от установки конфига
+    prepare = f"mkdir -p {NGINX_LOG_DIR}\ntouch {access_log_path(project)}\n"
+    if project.microcache:
+        prepare += f"mkdir -p {microcache_dir(project)}\n"
+    certificate = ""
+    if project.tls:
+        # Первый выпуск: сертификата ещё нет, а 443-блок без него не пройдёт
+        # nginx -t. Сначала HTTP-конфиг для HTTP-01, затем certbot.
+        prepare += f"mkdir -p {ACME_WEBROOT}\n"
+        bootstrap = generate_nginx_config(project, cache_generation=generation, tls=False, sleeping=sleeping)
+        certificate = f"""if [ ! -f {cert_paths(project)["fullchain"]} ]; then
+{_install_command(project, bootstrap)}
+{certbot_command(project)}
+fi
+"""
+
+    upstream = "пробуждение через панель" if sleeping else f"порт {project.internal_port}"
+    cmd = f"""{prepare}{certificate}{_install_command(project, config)}
+echo "Nginx конфиг для {project.domain} → {upstream} установлен"
+"""
+    if project.tls:
+        cmd += enddate_command(project) + "\n"
+    return cmd
+
+
+def deploy_nginx_config(project, sleeping: bool = False) -> str:
     """
     Отправляет Nginx конфиг на сервер проекта и перезагружает Nginx.
     Возвращает лог выполнения.
@@ -52,38 +395,36 @@ def deploy_nginx_config(project) -> str:
         logger.info(f"Проект {project.slug}: домен не указан, Nginx пропущен")
         return "Домен не указан — Nginx конфиг не создан\n"
 
-    config = generate_nginx_config(project)
     s = project.server
-    config_filename = f"{project.slug}.conf"
+    logger.info(f"Устанавливаем Nginx конфиг для {project.domain}")
+    log = run_ssh(s.ip_address, s.ssh_user, s.ssh_port, f"\nset -e\n{nginx_install_command(project, sleeping)}")
+    if project.tls:
+        save_cert_dates(log)
+    return log
 
-    # Экранируем конфиг для передачи через SSH
-    escaped_config = config.replace("'", "'\\''")
 
+def deploy_forward_config(project, source, target) -> str:
+    """Заменяет конфиг проекта на source форвардом на target (после переезда)."""
     cmd = f"""
 set -e
-echo '{escaped_config}' > /etc/nginx/sites-available/{config_filename}
-ln -sf /etc/nginx/sites-available/{config_filename} /etc/nginx/sites-enabled/{config_filename}
-nginx -t
-systemctl reload nginx
-echo "Nginx конфиг для {project.domain} → порт {project.internal_port} установлен"
+{_install_command(project, generate_forward_config(project, target))}
+echo "Nginx {source.name}: {project.domain} → {target.ip_address}"
 """
-
-    logger.info(f"Устанавливаем Nginx конфиг для {project.domain}")
-    log = run_ssh(s.ip_address, s.ssh_user, s.ssh_port, cmd)
-    return log
+    logger.info(f"Форвард {project.domain}: {source.name} → {target.name}")
+    return run_ssh(source.ip_address, source.ssh_user, source.ssh_port, cmd)
 
 
-def remove_nginx_config(project) -> str:
-    """Удаляет Nginx конфиг с сервера при suspend."""
+def remove_nginx_config(project, server=None) -> str:
+    """Удаляет Nginx конфиг с сервера проекта (suspend) или с server (форвард после переезда)."""
     if not project.domain:
         return ""
 
-    s = project.server
+    s = server or project.server
     config_filename = f"{project.slug}.conf"
 
     cmd = f"""
 set -e
-rm -f /etc/nginx/sites-enabled/{config_filename}
+rm -f {NGINX_CONF_DIR}/sites-enabled/{config_filename}
 nginx -t && systemctl reload nginx
 echo "Nginx конфиг для {project.domain} удалён"
 """
@@ -1,6 +1,7 @@
 import os
 import logging
 import requests
+from django.utils import timezone
 
 logger = logging.getLogger(__name__)
 
@@ -34,6 +35,20 @@ def notify_telegram(message: str) -> bool:
         return False
 
 
+def notify_telegram_async(message: str):
+    """
+    Ставит уведомление в очередь notifications, чтобы медленный Telegram API
+    не задерживал деплой. Если брокер недоступен — отправляет синхронно.
+    """
+    from ..tasks import send_telegram_task
+
+    try:
+        send_telegram_task.delay(message)
+    except Exception as e:
+        logger.warning(f"Очередь уведомлений недоступна, отправляем напрямую: {e}")
+        notify_telegram(message)
+
+
 def notify_deploy_success(project):
     msg = (
         f"✅ <b>Deploy SUCCESS</b>\n"
@@ -41,7 +56,7 @@ def notify_deploy_success(project):
         f"Домен: {project.domain or '—'}\n"
         f"Сервер: {project.server.name}"
     )
-    notify_telegram(msg)
+    notify_telegram_async(msg)
 
 
 def notify_deploy_failed(project, error: str = ""):
@@ -51,7 +66,50 @@ def notify_deploy_failed(project, error: str = ""):
         f"Сервер: {project.server.name}\n"
         f"Ошибка: <code>{error[:200]}</code>"
     )
-    notify_telegram(msg)
+    notify_telegram_async(msg)
+
+
+def notify_migrated(project, source, downtime: float):
+    msg = (
+        f"🚚 <b>Переезд завершён</b>\n"
+        f"Проект: <b>{project.name}</b>\n"
+        f"{source.name} → {project.server.name}\n"
+        f"Простой: {downtime:.1f} с"
+    )
+    notify_telegram_async(msg)
+
+
+def notify_migration_failed(project, target, error: str = "", source=None):
+    msg = (
+        f"🔴 <b>Переезд FAILED</b>\n"
+        f"Проект: <b>{project.name}</b>\n"
+        f"{(source or project.server).name} → {target.name}\n"
+        f"Ошибка: <code>{error[:200]}</code>"
+    )
+    notify_telegram_async(msg)
+
+
+def notify_backups_failed(backups):
+    names = ", ".join(b.project.name for b in backups)
+    notify_telegram_async(f"💾 <b>Резервные копии FAILED</b>\nПроекты: <b>{names}</b>\nЛоги — в админке, раздел Backups")
+
+
+def notify_restored(project, backup):
+    msg = (
+        f"♻️ <b>Проект восстановлен</b>\n"
+        f"Проект: <b>{project.name}</b>\n"
+        f"Копия от {timezone.localtime(backup.started_at):%d.%m.%Y %H:%M} → {project.server.name}"
+    )
+    notify_telegram_async(msg)
+
+
+def notify_restore_failed(project, error: str = ""):
+    msg = (
+        f"🔴 <b>Восстановление FAILED</b>\n"
+        f"Проект: <b>{project.name}</b>\n"
+        f"Ошибка: <code>{error[:200]}</code>"
+    )
+    notify_telegram_async(msg)
 
 
 def notify_status_change(project, old_status: str, new_status: str):
@@ -69,7 +127,7 @@ def notify_status_change(project, old_status: str, new_status: str):
         f"Проект: <b>{project.name}</b>\n"
         f"{old_status.upper()} → {new_status.upper()}"
     )
-    notify_telegram(msg)
+    notify_telegram_async(msg)
 
 
 def notify_billing_warning(project, days_left: int):
@@ -79,4 +137,4 @@ def notify_billing_warning(project, days_left: int):
         f"Осталось дней: <b>{days_left}</b>\n"
         f"Оплачено до: {project.paid_until}"
     )
-    notify_telegram(msg)
+    notify_telegram_async(msg)
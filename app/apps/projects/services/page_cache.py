@@ -0,0 +1,114 @@
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Версии групп данных. Ключи фрагментов и ETag включают версии, поэтому
+# при изменении модели достаточно увеличить версию — старые записи просто
+# перестают читаться и вытесняются по TTL.
+VERSION_PREFIX = "zea:version:"
+GROUPS = ("projects", "servers", "deployments")
+
+# TTL закешированных фрагментов; актуальность обеспечивают версии
+FRAGMENT_TIMEOUT = 60 * 60
+
+# Кеш фрагментов для {% cache ... using=fragments %}: без Redis — заглушка
+# из CACHES, страница рендерится целиком
+FRAGMENT_CACHE = "default"
+FRAGMENT_CACHE_OFF = "off"
+
+
+def _initial_version() -> int:
+    # Если ключ версии вытеснен (allkeys-lru), новая версия не должна
+    # совпасть со старой, иначе всплывут устаревшие фрагменты
+    return time.time_ns()
+
+
+def get_versions(*groups):
+    """
+    Текущие версии групп одним запросом к Redis. None — Redis недоступен:
+    страница отдаётся без ETag и без кеша фрагментов.
+    """
+    groups = groups or GROUPS
+    keys = {f"{VERSION_PREFIX}{group}": group for group in groups}
+    try:
+        found = cache.get_many(keys)
+        versions = {}
+        for key, group in keys.items():
+            if key not in found:
+                cache.add(key, _initial_version(), timeout=None)
+                found[key] = cache.get(key)
+            versions[group] = found[key]
+    except Exception as e:
+        logger.warning(f"Версии кеша страниц недоступны: {e}")
+        return None
+    return versions
+
+
+def fragment_cache(versions) -> str:
+    """Алиас кеша для {% cache %}: без версий фрагменты не кешируются."""
+    return FRAGMENT_CACHE if versions else FRAGMENT_CACHE_OFF
+
+
+def bump(*groups):
+    """Инвалидирует фрагменты и ETag, зависящие от групп."""
+    for group in groups:
+        key = f"{VERSION_PREFIX}{group}"
+        try:
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.add(key, _initial_version(), timeout=None)
+        except Exception as e:
+            # Вызывается из on_commit после save(): сбой Redis не должен ронять задачу или админку.
+            # Версия не выросла — фрагменты устареют не дольше чем на FRAGMENT_TIMEOUT
+            logger.warning(f"Версия {group} не увеличена: {e}")
+
+
+def cached(name: str, versions, compute, *extra):
+    """
+    get_or_set для вычисляемых сводок; ключ зависит от версий и extra (например, даты).
+    Без версий или без Redis — просто compute().
+    """
+    if not versions:
+        return compute()
+    parts = [name, *(f"{group}={versions[group]}" for group in sorted(versions)), *map(str, extra)]
+    try:
+        return cache.get_or_set(":".join(parts), compute, FRAGMENT_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"Кеш сводки {name} недоступен: {e}")
+        return compute()
+
+
+def page_etag(*groups, bucket: int = None):
+    """
+    etag_func для django.views.decorators.http.condition.
+
+    ETag зависит от версий групп, пользователя и CSRF-cookie (в странице
+    рендерится токен), а для страниц с датами/ETA — от текущего дня или
+    временного окна bucket (сек). Если в сессии ждут flash-сообщения или
+    Redis недоступен, ETag не считается: страница рендерится полностью.
+    """
+    def etag_func(request, *args, **kwargs):
+        if len(get_messages(request)):
+            return None
+        parts = [
+            request.path,
+            str(request.user.pk),
+            request.COOKIES.get(settings.CSRF_COOKIE_NAME, ""),
+            timezone.now().date().isoformat(),
+        ]
+        versions = get_versions(*groups)
+        if versions is None:
+            return None
+        parts += [f"{group}={version}" for group, version in sorted(versions.items())]
+        if bucket:
+            parts.append(str(int(time.time()) // bucket))
+        return hashlib.sha1("|".join(parts).encode()).hexdigest()
+    return etag_func
@@ -0,0 +1,281 @@
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.db.models import Count
+from django.utils import timezone
+
+from ..models import PORT_RANGE_END, PORT_RANGE_START, Project, Server
+from .fleet import run_fleet, targets_for_servers
+from .page_cache import bump
+from .resources import CPU_OVERCOMMIT, MEMORY_RESERVED_MB
+
+logger = logging.getLogger(__name__)
+
+# spread — равномерно по серверам, binpack — плотно, оставляя серверы свободными
+STRATEGIES = ("spread", "binpack")
+PLACEMENT_STRATEGY = os.getenv("PLACEMENT_STRATEGY", "spread")
+
+# Оценка для проектов без лимитов (на контейнер): иначе они «бесплатны» для планировщика
+DEFAULT_PROJECT_CPUS = Decimal("0.5")
+DEFAULT_PROJECT_MEMORY_MB = 512
+# Меньше свободного места — сервер не принимает проекты (образы, сборка)
+MIN_DISK_FREE_MB = 5 * 1024
+# Вес загрузки CPU (load average на ядро) в оценке сервера
+LOAD_WEIGHT = 0.25
+# Ребалансировка идёт, пока разница загрузки серверов больше порога
+REBALANCE_THRESHOLD = 0.2
+REBALANCE_MAX_MOVES = 10
+
+# Строки «key=value» из вывода CAPACITY_COMMAND
+CAPACITY_COMMAND = r"""echo "cores=$(nproc)"
+free -m | awk '/^Mem:/ {print "memory=" $2; print "available=" $7}'
+echo "load=$(cut -d' ' -f2 /proc/loadavg)"
+df -Pm / | awk 'NR==2 {print "disk_free=" $4}'"""
+CAPACITY_LINE_RE = re.compile(r"^(cores|memory|available|load|disk_free)=([0-9.]+)$", re.MULTILINE)
+
+
+class PlacementError(RuntimeError):
+    """Проект некуда разместить."""
+
+
+def estimate(project) -> tuple:
+    """(cpus, memory_mb), которые планировщик резервирует под проект."""
+    containers = max(project.compose_services, 1)
+    cpus = Decimal(project.cpu_limit or DEFAULT_PROJECT_CPUS) * containers
+    memory = (project.memory_limit_mb or DEFAULT_PROJECT_MEMORY_MB) * containers
+    return cpus, memory
+
+
+def refresh_server_load(*server_ids):
+    """Пересчитывает агрегаты серверов (project_count, reserved_*) одним запросом к проектам."""
+    server_ids = {sid for sid in server_ids if sid}
+    if not server_ids:
+        return
+    totals = {sid: [0, Decimal(0), 0] for sid in server_ids}
+    rows = Project.objects.filter(server_id__in=server_ids).only(
+        "server_id", "cpu_limit", "memory_limit_mb", "compose_services",
+    )
+    for project in rows:
+        cpus, memory = estimate(project)
+        total = totals[project.server_id]
+        total[0] += 1
+        total[1] += cpus
+        total[2] += memory
+    for sid, (count, cpus, memory) in totals.items():
+        Server.objects.filter(id=sid).update(
+            project_count=count, reserved_cpus=cpus, reserved_memory_mb=memory,
+        )
+    bump("servers")
+
+
+def parse_capacity(output: str) -> dict:
+    return {key: float(value) for key, value in CAPACITY_LINE_RE.findall(output)}
+
+
+def collect_capacity(servers=None) -> dict:
+    """
+    Снимает ресурсы со всех серверов параллельно (fleet). cpu_cores и
+    memory_mb заполняются, только если пусты: значения, заданные вручную,
+    важнее. Возвращает {имя сервера: ошибка} для недоступных.
+    """
+    servers = list(Server.objects.all() if servers is None else servers)
+    results = run_fleet(targets_for_servers(servers), CAPACITY_COMMAND)
+    errors = {}
+    now = timezone.now()
+    for server, result in zip(servers, results):
+        data = parse_capacity(result.output) if result.ok else {}
+        if not data:
+            errors[server.name] = result.error or result.status
+            continue
+        update = {
+            "load_avg": data.get("load"),
+            "memory_available_mb": int(data["available"]) if "available" in data else None,
+            "disk_free_mb": int(data["disk_free"]) if "disk_free" in data else None,
+            "capacity_collected_at": now,
+        }
+        if not server.cpu_cores and "cores" in data:
+            update["cpu_cores"] = int(data["cores"])
+        if not server.memory_mb and "memory" in data:
+            update["memory_mb"] = int(data["memory"])
+        Server.objects.filter(id=server.id).update(**update)
+    # Страховка: агрегаты могли разойтись после QuerySet.update() по проектам
+    refresh_server_load(*(s.id for s in servers))
+    return errors
+
+
+def free_ports() -> int:
+    """Порты выделяются из общего диапазона для всего парка."""
+    used = Project.objects.filter(
+        internal_port__gte=PORT_RANGE_START, internal_port__lte=PORT_RANGE_END,
+    ).aggregate(n=Count("id"))["n"]
+    return PORT_RANGE_END - PORT_RANGE_START + 1 - used
+
+
+@dataclass
+class ServerScore:
+    server: Server
+    score: float
+    fits: bool
+    # Загрузка по доминирующему ресурсу после размещения (None — ресурсы неизвестны)
+    utilization: float = None
+    reasons: list = field(default_factory=list)
+
+
+def _utilization(server, cpus, memory) -> tuple:
+    """(cpu, память) — доли ёмкости сервера; None, если ёмкость неизвестна."""
+    if not server.cpu_cores or not server.memory_mb:
+        return None, None
+    cpu_capacity = server.cpu_cores * CPU_OVERCOMMIT
+    memory_capacity = max(server.memory_mb - MEMORY_RESERVED_MB, 1)
+    return float(cpus) / cpu_capacity, memory / memory_capacity
+
+
+def score_server(server, cpus, memory, strategy: str) -> ServerScore:
+    """
+    Оценка сервера под проект с резервом (cpus, memory). Считается по
+    агрегатам сервера, без запросов к проектам. Больше — лучше.
+    """
+    reasons = []
+    fits = server.accepts_projects
+    if not fits:
+        reasons.append("не принимает проекты")
+
+    cpu_u, memory_u = _utilization(
+        server, server.reserved_cpus + cpus, server.reserved_memory_mb + memory,
+    )
+    if cpu_u is None:
+        # Ёмкость неизвестна: проверить нечего, такие серверы — после известных
+        reasons.append("ресурсы неизвестны")
+        return ServerScore(server, -1 - server.project_count / 1000, fits, None, reasons)
+
+    utilization = max(cpu_u, memory_u)
+    if cpu_u > 1:
+        fits = False
+        reasons.append(f"CPU {cpu_u:.0%}")
+    if memory_u > 1:
+        fits = False
+        reasons.append(f"память {memory_u:.0%}")
+    if server.memory_available_mb is not None and server.memory_available_mb < memory:
+        fits = False
+        reasons.append(f"сейчас свободно {server.memory_available_mb} МБ")
+    if server.disk_free_mb is not None and server.disk_free_mb < MIN_DISK_FREE_MB:
+        fits = False
+        reasons.append(f"диск {server.disk_free_mb} МБ")
+
+    load = min((server.load_avg or 0) / server.cpu_cores, 1)
+    if strategy == "binpack":
+        score = utilization - LOAD_WEIGHT * load
+    else:
+        score = 1 - utilization - LOAD_WEIGHT * load - server.project_count / 1000
+    return ServerScore(server, score, fits, utilization, reasons)
+
+
+def rank_servers(project, strategy: str = None, servers=None) -> list:
+    """Все серверы с оценкой под проект: подходящие первыми, лучшие выше."""
+    strategy = strategy or PLACEMENT_STRATEGY
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Неизвестная стратегия {strategy}, доступны: {', '.join(STRATEGIES)}")
+    cpus, memory = estimate(project)
+    servers = Server.objects.all() if servers is None else servers
+    scores = [
+        score_server(server, cpus, memory, strategy)
+        for server in servers if server.id != project.server_id
+    ]
+    return sorted(scores, key=lambda s: (not s.fits, -s.score))
+
+
+def suggest_server(project, strategy: str = None) -> Server:
+    """Лучший сервер для проекта; PlacementError, если не подходит ни один."""
+    if not project.internal_port and free_ports() <= 0:
+        raise PlacementError(f"Нет свободных портов в диапазоне {PORT_RANGE_START}–{PORT_RANGE_END}")
+    ranked = rank_servers(project, strategy)
+    if not ranked or not ranked[0].fits:
+        details = "; ".join(f"{s.server.name}: {', '.join(s.reasons)}" for s in ranked[:5])
+        raise PlacementError(f"Нет сервера с достаточными ресурсами ({details or 'серверов нет'})")
+    return ranked[0].server
+
+
+@dataclass
+class Move:
+    project: Project
+    source: Server
+    target: Server
+    reason: str
+
+
+def rebalance_plan(max_moves: int = REBALANCE_MAX_MOVES, threshold: float = REBALANCE_THRESHOLD) -> list:
+    """
+    План переездов (жадно, по одному проекту): сначала уводит проекты с
+    серверов, не принимающих проекты, затем выравнивает загрузку — пока
+    разница между самым загруженным и самым свободным сервером больше
+    threshold. Считается в памяти по агрегатам; ничего не меняет.
+    """
+    servers = {s.id: s for s in Server.objects.all()}
+    load = {sid: [s.reserved_cpus, s.reserved_memory_mb] for sid, s in servers.items()}
+    projects = {}
+    for project in Project.objects.filter(server_id__in=servers).only(
+        "id", "name", "slug", "server_id", "cpu_limit", "memory_limit_mb", "compose_services",
+    ):
+        projects.setdefault(project.server_id, []).append(project)
+
+    def utilization(sid, cpus=0, memory=0):
+        cpu_u, memory_u = _utilization(servers[sid], load[sid][0] + cpus, load[sid][1] + memory)
+        return None if cpu_u is None else max(cpu_u, memory_u)
+
+    def move(project, target, reason):
+        cpus, memory = estimate(project)
+        load[project.server_id][0] -= cpus
+        load[project.server_id][1] -= memory
+        load[target][0] += cpus
+        load[target][1] += memory
+        plan.append(Move(project, servers[project.server_id], servers[target], reason))
+        projects[project.server_id].remove(project)
+        projects.setdefault(target, []).append(project)
+        project.server_id = target
+
+    plan = []
+    # Приёмники — только серверы с известной ёмкостью, принимающие проекты
+    targets = [sid for sid, s in servers.items() if s.accepts_projects and utilization(sid) is not None]
+
+    def best_target(project, exclude):
+        cpus, memory = estimate(project)
+        options = [
+            (utilization(sid, cpus, memory), sid) for sid in targets
+            if sid != exclude and utilization(sid, cpus, memory) <= 1
+        ]
+        return min(options)[1] if options else None
+
+    for sid, server in servers.items():
+        if server.accepts_projects:
+            continue
+        for project in sorted(projects.get(sid, []), key=lambda p: estimate(p), reverse=True):
+            if len(plan) >= max_moves:
+                return plan
+            target = best_target(project, sid)
+            if target is not None:
+                move(project, target, f"{server.name} не принимает проекты")
+
+    while len(plan) < max_moves and len(targets) > 1:
+        busiest = max(targets, key=utilization)
+        idlest = min(targets, key=utilization)
+        gap = utilization(busiest) - utilization(idlest)
+        if gap <= threshold:
+            break
+        # Проект, после переезда которого разница станет минимальной
+        best = None
+        for project in projects.get(busiest, []):
+            cpus, memory = estimate(project)
+            after_target = utilization(idlest, cpus, memory)
+            if after_target > 1:
+                continue
+            after_source = utilization(busiest, -cpus, -memory)
+            new_gap = abs(after_source - after_target)
+            if new_gap < gap and (best is None or new_gap < best[0]):
+                best = (new_gap, project)
+        if best is None:
+            break
+        move(best[1], idlest, f"загрузка {utilization(busiest):.0%} → {utilization(idlest):.0%}")
+    return plan
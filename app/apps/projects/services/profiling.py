@@ -0,0 +1,189 @@
+import logging
+import os
+import random
+import resource
+import socket
+import time
+import tracemalloc
+from datetime import timedelta
+
+from django.db import connection
+from django.db.models import Avg, Count, F, Max, Min, Q, Sum
+from django.utils import timezone
+
+from ..models import TaskProfile
+
+logger = logging.getLogger(__name__)
+
+# Профилирование задач Celery: сигналы task_prerun/task_postrun (core/celery.py)
+# замеряют длительность, CPU, прирост RSS процесса воркера и запросы к БД.
+# Выключено по умолчанию. TASK_PROFILE_RATE — доля профилируемых запусков (0..1).
+# tracemalloc замедляет задачу в разы, поэтому пик и места аллокаций снимаются
+# у доли TASK_PROFILE_TRACEMALLOC_RATE от профилируемых запусков.
+TASK_PROFILE_RATE = float(os.getenv("TASK_PROFILE_RATE", 0))
+TASK_PROFILE_TRACEMALLOC_RATE = float(os.getenv("TASK_PROFILE_TRACEMALLOC_RATE", 0))
+TASK_PROFILE_RETENTION_DAYS = int(os.getenv("TASK_PROFILE_RETENTION_DAYS", 14))
+TOP_ALLOCATIONS = 5
+
+# Сортировки рейтинга: параметр страницы → агрегат
+RANKINGS = {
+    "rss": "avg_rss_delta",
+    "cpu": "cpu_total",
+    "wall": "avg_wall",
+    "queries": "avg_queries",
+    "peak": "max_peak",
+}
+
+_PAGE_KB = os.sysconf("SC_PAGE_SIZE") // 1024
+
+# Замеры идущих задач процесса: task_id → _Probe. Вложенные eager-задачи —
+# отдельные записи.
+_probes = {}
+
+
+def rss_kb() -> int:
+    """Текущий RSS процесса (/proc/self/statm); без /proc — пиковый из getrusage."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_KB
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class _QueryCounter:
+    """execute_wrapper соединения: число и время запросов без DEBUG."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        t0 = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - t0
+
+
+class _Probe:
+    def __init__(self, trace: bool):
+        # tracemalloc один на процесс: внешняя задача уже трассирует — вложенная нет
+        self.trace = trace and not tracemalloc.is_tracing()
+        self.queries = _QueryCounter()
+        # Запросы из потоков задачи (run_fleet) идут через свои соединения и не считаются
+        connection.execute_wrappers.append(self.queries)
+        if self.trace:
+            tracemalloc.start()
+        self.started_at = timezone.now()
+        self.rss = rss_kb()
+        self.cpu = time.process_time()
+        self.wall = time.perf_counter()
+
+
+def _where(frame) -> str:
+    path = frame.filename
+    for marker in ("site-packages/", "/app/"):
+        if marker in path:
+            path = path.rsplit(marker, 1)[1]
+            break
+    return f"{path}:{frame.lineno}"
+
+
+def start(task_id: str, task_name: str):
+    if not TASK_PROFILE_RATE or random.random() >= TASK_PROFILE_RATE:
+        return
+    _probes[task_id] = _Probe(trace=random.random() < TASK_PROFILE_TRACEMALLOC_RATE)
+
+
+def finish(task_id: str, task_name: str, state: str = ""):
+    probe = _probes.pop(task_id, None)
+    if probe is None:
+        return
+    wall = time.perf_counter() - probe.wall
+    cpu = time.process_time() - probe.cpu
+    rss = rss_kb()
+    try:
+        connection.execute_wrappers.remove(probe.queries)
+    except ValueError:
+        pass
+
+    peak_kb, top = None, []
+    if probe.trace:
+        peak_kb = tracemalloc.get_traced_memory()[1] // 1024
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__),)
+        )
+        tracemalloc.stop()
+        top = [
+            [_where(stat.traceback[0]), stat.size // 1024]
+            for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]
+        ]
+
+    try:
+        TaskProfile.objects.create(
+            task=task_name,
+            state=state or "",
+            # pid на момент замера: модуль импортируется ещё в родителе prefork
+            worker=f"{socket.gethostname()}:{os.getpid()}",
+            started_at=probe.started_at,
+            wall_seconds=round(wall, 4),
+            cpu_seconds=round(cpu, 4),
+            rss_kb=rss,
+            rss_delta_kb=rss - probe.rss,
+            peak_kb=peak_kb,
+            queries=probe.queries.count,
+            query_seconds=round(probe.queries.seconds, 4),
+            top_allocations=top,
+        )
+    except Exception as e:
+        # Профилирование не должно ломать воркер: БД может быть недоступна
+        logger.warning(f"Профиль {task_name} не сохранён: {e}")
+
+
+def prune_profiles() -> int:
+    cutoff = timezone.now() - timedelta(days=TASK_PROFILE_RETENTION_DAYS)
+    deleted, _ = TaskProfile.objects.filter(started_at__lt=cutoff).delete()
+    return deleted
+
+
+def task_ranking(hours: int = 24, sort: str = "rss"):
+    """Задачи за последние hours часов, худшие по выбранному показателю первыми."""
+    since = timezone.now() - timedelta(hours=hours)
+    return (
+        TaskProfile.objects.filter(started_at__gte=since)
+        .values("task")
+        .annotate(
+            runs=Count("id"),
+            avg_wall=Avg("wall_seconds"),
+            max_wall=Max("wall_seconds"),
+            avg_cpu=Avg("cpu_seconds"),
+            cpu_total=Sum("cpu_seconds"),
+            avg_rss_delta=Avg("rss_delta_kb"),
+            rss_growth=Sum("rss_delta_kb", filter=Q(rss_delta_kb__gt=0)),
+            avg_queries=Avg("queries"),
+            max_queries=Max("queries"),
+            max_peak=Max("peak_kb"),
+        )
+        .order_by(F(RANKINGS.get(sort, RANKINGS["rss"])).desc(nulls_last=True), "task")
+    )
+
+
+def worst_runs(hours: int = 24, limit: int = 10):
+    """Запуски с наибольшим приростом RSS — с местами аллокаций, если снимались."""
+    since = timezone.now() - timedelta(hours=hours)
+    return TaskProfile.objects.filter(started_at__gte=since, rss_delta_kb__gt=0).order_by("-rss_delta_kb")[:limit]
+
+
+def worker_growth(hours: int = 24, limit: int = 10):
+    """
+    Рост RSS процессов воркеров за окно: от минимального к максимальному
+    замеру. По нему подбирается --max-tasks-per-child.
+    """
+    since = timezone.now() - timedelta(hours=hours)
+    return (
+        TaskProfile.objects.filter(started_at__gte=since)
+        .values("worker")
+        .annotate(runs=Count("id"), min_rss=Min("rss_kb"), max_rss=Max("rss_kb"), growth=F("max_rss") - F("min_rss"))
+        .order_by("-growth")[:limit]
+    )
@@ -0,0 +1,157 @@
+import re
+import shlex
+
+from ..models import DEFAULT_CPU_SHARES
+
+# Генерируемый override лежит рядом с compose-файлом проекта. Имя не
+# docker-compose.override.yml: тот подхватывается только без -f, а мы
+# всегда передаём -f явно.
+OVERRIDE_FILE = "docker-compose.zea.yml"
+
+# Лимиты CPU — потолки, а не резерв: сумма по проектам может превышать
+# число ядер. Память так не переподписываем — это OOM у соседей.
+CPU_OVERCOMMIT = 2.0
+# Память под систему, dockerd и nginx
+MEMORY_RESERVED_MB = 512
+
+# Период CFS для builder'а (мкс): квота = cpus × период
+CPU_PERIOD = 100_000
+
+# Имена сервисов из вывода `docker compose config --services`
+SERVICE_RE = re.compile(r"^[a-zA-Z0-9][a-zA-Z0-9_.-]*$")
+
+
+def has_limits(project) -> bool:
+    return any((project.cpu_limit, project.memory_limit_mb, project.pids_limit,
+                project.cpu_shares != DEFAULT_CPU_SHARES))
+
+
+def has_build_limits(project) -> bool:
+    return bool(project.build_cpu_limit or project.build_memory_mb)
+
+
+def compose_files(project) -> str:
+    """
+    Аргументы -f для docker compose: compose-файл проекта и override с
+    лимитами. Override пишет только деплой, поэтому он подключается, если
+    уже лежит на сервере: лимиты, заданные в админке до следующего деплоя,
+    не ломают resume, sleep/wake, apply-env и migrate.
+    """
+    files = f"-f {shlex.quote(project.compose_file)}"
+    if has_limits(project):
+        files += f' $([ ! -f {OVERRIDE_FILE} ] || echo "-f {OVERRIDE_FILE}")'
+    return files
+
+
+def render_compose_override(project, services) -> str:
+    """
+    Override с лимитами для каждого сервиса compose-файла. Лимиты — на
+    контейнер: проект из N сервисов может занять до N × лимит.
+    """
+    limits = []
+    if project.cpu_limit:
+        limits.append(f"cpus: {project.cpu_limit}")
+    if project.cpu_shares != DEFAULT_CPU_SHARES:
+        limits.append(f"cpu_shares: {project.cpu_shares}")
+    if project.memory_limit_mb:
+        # memswap = mem: контейнер упирается в лимит, а не уходит в swap всего сервера
+        limits.append(f"mem_limit: {project.memory_limit_mb}m")
+        limits.append(f"memswap_limit: {project.memory_limit_mb}m")
+    if project.pids_limit:
+        limits.append(f"pids_limit: {project.pids_limit}")
+
+    header = f"# Сгенерировано ZeaControl для {project.slug}, не редактировать вручную"
+    if not services:
+        return f"{header}\nservices: {{}}\n"
+    lines = [header, "services:"]
+    for service in services:
+        lines.append(f"  {service}:")
+        lines.extend(f"    {limit}" for limit in limits)
+    return "\n".join(lines) + "\n"
+
+
+def parse_services(output: str) -> list:
+    return [line.strip() for line in output.splitlines() if SERVICE_RE.match(line.strip())]
+
+
+def override_command(project, services) -> str:
+    """Shell: записать override (или удалить устаревший, если лимитов больше нет)."""
+    if not has_limits(project):
+        return f"rm -f {OVERRIDE_FILE}"
+    return f"cat > {OVERRIDE_FILE} <<'ZEA_OVERRIDE'\n{render_compose_override(project, services)}ZEA_OVERRIDE"
+
+
+def builder_name(project) -> str:
+    return f"zea-{project.slug}"
+
+
+def build_command(project) -> str:
+    """
+    Shell: сборка с низким приоритетом. Лимиты сборки применяются через
+    отдельный buildx builder (docker-container) проекта: RUN-шаги BuildKit
+    выполняются в его контейнере, а не в процессе docker compose.
+    Builder пересоздаётся, когда меняются лимиты.
+    """
+    build = f"nice -n 19 ionice -c 3 docker compose {compose_files(project)} build"
+    if not has_build_limits(project):
+        return build
+
+    opts = ["default-load=true"]
+    if project.build_memory_mb:
+        opts += [f"memory={project.build_memory_mb}m", f"memory-swap={project.build_memory_mb}m"]
+    if project.build_cpu_limit:
+        opts += [f"cpu-period={CPU_PERIOD}", f"cpu-quota={int(project.build_cpu_limit * CPU_PERIOD)}"]
+    opts = ",".join(opts)
+    name = builder_name(project)
+    return f"""BUILDER_OPTS='{opts}'
+if [ "$(cat .zea-builder 2>/dev/null)" != "$BUILDER_OPTS" ] || ! docker buildx inspect {name} >/dev/null 2>&1; then
+  docker buildx rm {name} >/dev/null 2>&1 || true
+  docker buildx create --name {name} --driver docker-container --driver-opt "$BUILDER_OPTS"
+  echo "$BUILDER_OPTS" > .zea-builder
+fi
+{build} --builder {name}"""
+
+
+def project_footprint(project) -> tuple:
+    """(cpus, memory_mb), которые проект может занять целиком: лимит × число сервисов."""
+    containers = max(project.compose_services, 1)
+    cpus = float(project.cpu_limit or 0) * containers
+    memory = (project.memory_limit_mb or 0) * containers
+    return cpus, memory
+
+
+def capacity_errors(server, projects) -> list:
+    """
+    Проверка лимитов проектов сервера против его ресурсов. Проекты без
+    лимита не учитываются: их потребление ограничено только сервером.
+    Пустые cpu_cores/memory_mb — ресурсы неизвестны, проверка пропускается.
+    """
+    errors = []
+    projects = list(projects)
+
+    if server.cpu_cores:
+        for project in projects:
+            for value, label in ((project.cpu_limit, "CPU"), (project.build_cpu_limit, "CPU сборки")):
+                if value and value > server.cpu_cores:
+                    errors.append(f"{project.slug}: {label} {value} больше, чем ядер на сервере ({server.cpu_cores})")
+        total_cpus = sum(project_footprint(p)[0] for p in projects)
+        allowed = server.cpu_cores * CPU_OVERCOMMIT
+        if total_cpus > allowed:
+            errors.append(
+                f"Сумма лимитов CPU {total_cpus:g} больше допустимой {allowed:g} "
+                f"({server.cpu_cores} ядер × {CPU_OVERCOMMIT:g})"
+            )
+
+    if server.memory_mb:
+        available = server.memory_mb - MEMORY_RESERVED_MB
+        for project in projects:
+            if project.build_memory_mb and project.build_memory_mb > available:
+                errors.append(f"{project.slug}: память сборки {project.build_memory_mb} МБ больше доступной ({available} МБ)")
+        total_memory = sum(project_footprint(p)[1] for p in projects)
+        if total_memory > available:
+            errors.append(
+                f"Сумма лимитов памяти {total_memory} МБ больше доступной {available} МБ "
+                f"({server.memory_mb} МБ − {MEMORY_RESERVED_MB} МБ на систему)"
+            )
+
+    return errors
@@ -1,45 +1,93 @@
+import os
 import subprocess
+import threading
 import logging
 
 logger = logging.getLogger(__name__)
 
 SSH_TIMEOUT = 600  # 10 минут максимум на выполнение SSH-команды
 
+# Дополнительные опции ssh, например "-o UserKnownHostsFile=/tmp/known_hosts"
+SSH_EXTRA_OPTIONS = os.getenv("SSH_EXTRA_OPTIONS", "").split()
 
-def run_ssh(host: str, user: str, port: int, command: str, timeout: int = SSH_TIMEOUT) -> str:
+
+class SSHCommandError(RuntimeError):
+    """Команда завершилась с ошибкой или по таймауту (returncode=None)."""
+
+    def __init__(self, message: str, returncode: int = None, output: str = ""):
+        super().__init__(message)
+        self.returncode = returncode
+        self.output = output
+
+
+def run_ssh(host: str, user: str, port: int, command: str, timeout: int = SSH_TIMEOUT,
+            on_output=None, stdin=None, forward_agent: bool = False) -> str:
     """
     Выполняет команду на удалённом сервере через SSH.
-    Возвращает stdout+stderr.
-    Бросает RuntimeError если команда завершилась с ошибкой или по таймауту.
+    Возвращает stdout+stderr (в порядке поступления).
+    on_output(chunk) вызывается на каждую строку вывода — для живых логов.
+    stdin — открытый бинарный файл, который получит команда (например, git bundle),
+    или bytes — немного данных (секреты: в отличие от команды, не видны в списке процессов).
+    forward_agent — ssh -A: команда сама ходит по SSH на другой сервер (переезд).
+    Бросает SSHCommandError (RuntimeError) если команда завершилась с ошибкой или по таймауту.
     """
     target = f"{user}@{host}"
     logger.info(f"SSH → {target}:{port} | Команда: {command[:100]}...")
 
+    proc = subprocess.Popen(
+        [
+            "ssh",
+            "-p", str(port),
+            "-o", "StrictHostKeyChecking=accept-new",
+            "-o", "ConnectTimeout=10",
+            *(["-A"] if forward_agent else []),
+            *SSH_EXTRA_OPTIONS,
+            target,
+            command,
+        ],
+        stdin=subprocess.PIPE if isinstance(stdin, bytes) else stdin if stdin is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+    )
+    if isinstance(stdin, bytes):
+        # Меньше буфера канала: запись не блокируется, даже если команда не читает stdin
+        proc.stdin.write(stdin)
+        proc.stdin.close()
+
+    timed_out = threading.Event()
+
+    def _kill():
+        timed_out.set()
+        proc.kill()
+
+    timer = threading.Timer(timeout, _kill)
+    timer.start()
+    chunks = []
     try:
-        proc = subprocess.run(
-            [
-                "ssh",
-                "-p", str(port),
-                "-o", "StrictHostKeyChecking=accept-new",
-                "-o", "ConnectTimeout=10",
-                target,
-                command,
-            ],
-            capture_output=True,
-            text=True,
-            timeout=timeout,
-        )
-    except subprocess.TimeoutExpired:
+        for raw in proc.stdout:
+            line = raw.decode("utf-8", errors="replace")
+            chunks.append(line)
+            if on_output:
+                try:
+                    on_output(line)
+                except Exception as e:
+                    logger.warning(f"Ошибка обработчика вывода SSH: {e}")
+        proc.wait()
+    finally:
+        timer.cancel()
+        proc.stdout.close()
+
+    output = "".join(chunks)
+
+    if timed_out.is_set():
         msg = f"SSH таймаут ({timeout}с) при выполнении команды на {target}"
         logger.error(msg)
-        raise RuntimeError(msg)
-
-    output = (proc.stdout or "") + "\n" + (proc.stderr or "")
+        raise SSHCommandError(msg, output=output)
 
     if proc.returncode != 0:
         msg = f"SSH команда завершилась с ошибкой (code={proc.returncode}):\n{output}"
         logger.error(msg)
-        raise RuntimeError(msg)
+        raise SSHCommandError(msg, returncode=proc.returncode, output=output)
 
     logger.info(f"SSH ← {target} | OK")
     return output
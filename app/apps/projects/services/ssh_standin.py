@@ -0,0 +1,309 @@
+import asyncio
+import ipaddress
+import logging
+import os
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Шимы вместо настоящих git/docker/nginx/certbot: пишут вызов в calls.log и имитируют
+# вывод. SHIM_DELAY (сек) задаёт «время работы» тяжёлых команд.
+SHIMS = {
+    "git": """#!/bin/sh
+echo "git $*" >> "$STANDIN_ROOT/calls.log"
+case "$1" in
+  clone) mkdir -p .git && echo "Cloning into '.'..." ;;
+  init) mkdir -p .git ;;
+  fetch) sleep "${SHIM_DELAY:-0}"; echo "From standin" ;;
+  checkout) echo "Already on '$2'" ;;
+  reset) echo "HEAD is now at 0000000 standin" ;;
+  *) echo "git $*" ;;
+esac
+""",
+    "docker": """#!/bin/sh
+echo "docker $*" >> "$STANDIN_ROOT/calls.log"
+case "$*" in
+  "volume "*) ;;
+  *" ps --format"*) echo "web=standin-web"; echo "db=postgres:16" ;;
+  *" exec "*pg_dumpall*) echo "-- standin dump" ;;
+  *" exec "*psql*) cat > "$STANDIN_ROOT/db-restore.sql" ;;
+  *" build"*) sleep "${SHIM_DELAY:-0}"; echo "#1 [internal] load build definition"; echo "#9 DONE 0.0s" ;;
+  *" up"*) echo " Container standin-web-1  Started" ;;
+  *" stop"*) echo " Container standin-web-1  Stopped" ;;
+  *" start"*) echo " Container standin-web-1  Started" ;;
+  *" down"*) echo " Container standin-web-1  Removed" ;;
+  *"config --services"*) echo "web" ;;
+  "system prune"*) echo "Total reclaimed space: 0B" ;;
+  *) echo "docker $*" ;;
+esac
+""",
+    "nginx": """#!/bin/sh
+echo "nginx $*" >> "$STANDIN_ROOT/calls.log"
+echo "nginx: configuration file $NGINX_CONF_DIR/nginx.conf test is successful" >&2
+""",
+    "systemctl": """#!/bin/sh
+echo "systemctl $*" >> "$STANDIN_ROOT/calls.log"
+""",
+    "certbot": """#!/bin/sh
+echo "certbot $*" >> "$STANDIN_ROOT/calls.log"
+while [ $# -gt 0 ]; do
+  case "$1" in
+    --cert-name) name="$2"; shift ;;
+    --config-dir) dir="$2"; shift ;;
+  esac
+  shift
+done
+live="$dir/live/$name"
+[ -f "$live/fullchain.pem" ] && { echo "Certificate not yet due for renewal"; exit 0; }
+mkdir -p "$live"
+echo "notAfter=$(date -u -d '+90 days' '+%b %e %H:%M:%S %Y GMT')" > "$live/fullchain.pem"
+touch "$live/privkey.pem" "$live/chain.pem"
+echo "Successfully received certificate."
+""",
+    "openssl": """#!/bin/sh
+while [ $# -gt 0 ]; do
+  [ "$1" = "-in" ] && { cat "$2"; exit 0; }
+  shift
+done
+""",
+    # rsync user@host:path — оба «сервера» на одной машине, копируем локально
+    "rsync": """#!/bin/sh
+echo "rsync $*" >> "$STANDIN_ROOT/calls.log"
+for arg; do src="$dst"; dst="$arg"; done
+dst="${dst#*:}"
+mkdir -p "$dst"
+cp -a "${src%/}/." "$dst/"
+echo "Number of regular files transferred: $(find "$src" -type f | wc -l)"
+echo "Total transferred file size: $(du -sb "$src" | cut -f1) bytes"
+""",
+    # Проверка готовности приложения после пробуждения: «приложение» отвечает сразу
+    "curl": """#!/bin/sh
+echo "curl $*" >> "$STANDIN_ROOT/calls.log"
+""",
+    # Репозиторий — каталог: снимок = копия путей (или вывода команды) в snapshots/<id>
+    "restic": """#!/bin/sh
+echo "restic $*" >> "$STANDIN_ROOT/calls.log"
+[ -n "$RESTIC_PASSWORD" ] || { echo "Fatal: Please specify repository password" >&2; exit 1; }
+repo="$RESTIC_REPOSITORY"
+cmd="$1"; shift
+case "$cmd" in
+  cat) [ -f "$repo/config" ] ;;
+  init) mkdir -p "$repo/snapshots" && touch "$repo/config" && echo "created restic repository" ;;
+  backup)
+    id=$(od -An -N4 -tx1 /dev/urandom | tr -d ' \\n'); snap="$repo/snapshots/$id"; mkdir -p "$snap"
+    while [ $# -gt 0 ]; do
+      case "$1" in
+        --host|--tag|--limit-upload) shift ;;
+        --stdin-filename) name="$2"; shift ;;
+        --) shift; "$@" > "$snap/$name" || exit 1; set -- ;;
+        -*) ;;
+        *) mkdir -p "$snap$1"; cp -a "$1/." "$snap$1/" ;;
+      esac
+      [ $# -gt 0 ] && shift
+    done
+    size=$(du -sb "$snap" | cut -f1)
+    printf '{"message_type":"summary","data_added":%s,"total_bytes_processed":%s,"snapshot_id":"%s"}\\n' "$size" "$size" "$id" ;;
+  restore) mkdir -p "$3" && cp -a "$repo/snapshots/$1/." "$3/" ;;
+  dump) cat "$repo/snapshots/$1$2" ;;
+  forget) echo "Applying Policy" ;;
+esac
+""",
+    "ionice": """#!/bin/sh
+shift 2
+exec "$@"
+""",
+}
+
+
+def _prepare_root(root: Path) -> Path:
+    """Создаёт каталог стенда: bin/ с шимами, etc/nginx, srv/."""
+    bin_dir = root / "bin"
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    for name, script in SHIMS.items():
+        path = bin_dir / name
+        path.write_text(script)
+        path.chmod(0o755)
+
+    for sub in ("etc/nginx/sites-available", "etc/nginx/sites-enabled", "srv"):
+        (root / sub).mkdir(parents=True, exist_ok=True)
+    (root / "calls.log").touch()
+    return root
+
+
+class SSHStandIn:
+    """
+    Локальный SSH-сервер для тестов (asyncssh). Слушает только loopback и
+    пускает любого пользователя с ключом стенда (client_key, его передают
+    ssh_options); команды выполняет через sh внутри каталога стенда, где git,
+    docker, nginx и systemctl подменены шимами. Несколько стендов одного
+    теста могут делить ключ: client_key=другой.client_key.
+
+    Сервер работает в отдельном потоке со своим event loop:
+
+        with SSHStandIn(root) as standin:
+            run_ssh("127.0.0.1", "root", standin.port, "docker ps")
+    """
+
+    def __init__(self, root, host: str = "127.0.0.1", port: int = 0,
+                 latency: float = 0.0, shim_delay: float = 0.0, client_key: str = None):
+        # Стенд выполняет любые команды: наружу его открывать нельзя
+        try:
+            loopback = ipaddress.ip_address(host).is_loopback
+        except ValueError:
+            loopback = host == "localhost"
+        if not loopback:
+            raise ValueError(f"SSH-стенд слушает только loopback, не {host}")
+        self.root = _prepare_root(Path(root))
+        self.client_key = client_key or str(self.root / "client_key")
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.shim_delay = shim_delay
+        self.nginx_conf_dir = str(self.root / "etc" / "nginx")
+        self.known_hosts = str(self.root / "known_hosts")
+        self.sessions = 0
+
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._error = None
+
+    # === Жизненный цикл ===
+
+    def start(self):
+        try:
+            import asyncssh  # noqa: F401
+        except ImportError:
+            raise RuntimeError("Для SSH-стенда нужен пакет asyncssh: pip install asyncssh")
+
+        self._ensure_client_key()
+        self._thread = threading.Thread(target=self._run, name="ssh-standin", daemon=True)
+        self._thread.start()
+        self._ready.wait(timeout=15)
+        if self._error:
+            raise RuntimeError(f"SSH-стенд не запустился: {self._error}")
+        logger.info(f"SSH-стенд слушает {self.host}:{self.port}, каталог {self.root}")
+        return self
+
+    def stop(self):
+        if self._loop and self._server:
+            self._loop.call_soon_threadsafe(self._server.close)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def ssh_options(self) -> list:
+        """Опции для ssh-клиента (SSH_EXTRA_OPTIONS): ключ стенда, свой known_hosts вместо ~/.ssh."""
+        return [
+            "-i", self.client_key,
+            "-o", "IdentitiesOnly=yes",
+            "-o", f"UserKnownHostsFile={self.known_hosts}",
+            "-o", "BatchMode=yes",
+            "-o", "LogLevel=ERROR",
+        ]
+
+    def calls(self) -> list:
+        """Вызовы шимов в порядке выполнения."""
+        return (self.root / "calls.log").read_text().splitlines()
+
+    # === asyncssh ===
+
+    def _ensure_client_key(self):
+        import asyncssh
+
+        path = Path(self.client_key)
+        if not path.exists():
+            key = asyncssh.generate_private_key("ssh-ed25519")
+            key.write_private_key(str(path))
+            # ssh отказывается от ключа, доступного другим пользователям
+            path.chmod(0o600)
+            key.write_public_key(f"{path}.pub")
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._listen())
+        except Exception as e:
+            self._error = e
+            self._ready.set()
+            return
+        self._ready.set()
+        self._loop.run_forever()
+        self._loop.close()
+
+    async def _listen(self):
+        import asyncssh
+
+        standin = self
+
+        self._server = await asyncssh.create_server(
+            asyncssh.SSHServer,
+            self.host,
+            self.port,
+            server_host_keys=[asyncssh.generate_private_key("ssh-ed25519")],
+            # Только ключ стенда, без пароля и keyboard-interactive
+            authorized_client_keys=f"{self.client_key}.pub",
+            password_auth=False,
+            kbdint_auth=False,
+            process_factory=lambda process: standin._handle(process),
+            encoding=None,
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def _handle(self, process):
+        self.sessions += 1
+        command = process.command or ""
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        env = dict(os.environ)
+        env.update({
+            "PATH": f"{self.root / 'bin'}:{env.get('PATH', '/usr/bin:/bin')}",
+            "STANDIN_ROOT": str(self.root),
+            "NGINX_CONF_DIR": self.nginx_conf_dir,
+            "SHIM_DELAY": str(self.shim_delay),
+        })
+        proc = await asyncio.create_subprocess_exec(
+            "sh", "-c", command,
+            cwd=str(self.root),
+            env=env,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+
+        async def pump(reader, writer):
+            while True:
+                chunk = await reader.read(4096)
+                if not chunk:
+                    break
+                writer.write(chunk)
+
+        async def feed_stdin():
+            try:
+                async for chunk in process.stdin:
+                    proc.stdin.write(chunk)
+                    await proc.stdin.drain()
+            except Exception:
+                pass
+            finally:
+                proc.stdin.close()
+
+        stdin_task = asyncio.ensure_future(feed_stdin())
+        await asyncio.gather(
+            pump(proc.stdout, process.stdout),
+            pump(proc.stderr, process.stderr),
+        )
+        code = await proc.wait()
+        stdin_task.cancel()
+        process.exit(code)
@@ -0,0 +1,133 @@
+import os
+import time
+import logging
+from contextlib import contextmanager
+
+from django.utils import timezone
+
+from ..models import Deployment
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних успешных запусков учитывать при расчёте ETA
+HISTORY_SIZE = 20
+
+# Оценка длительности, пока нет истории (сек)
+DEFAULT_DURATIONS = {
+    "deploy": 300,
+    "suspend": 15,
+    "resume": 30,
+    "migrate": 900,
+    "sleep": 15,
+    "wake": 20,
+    "restore": 900,
+}
+
+# Параллелизм воркеров по очередям (см. docker-compose.prod.yml)
+QUEUE_CONCURRENCY = {
+    "deploy": int(os.getenv("CELERY_DEPLOY_CONCURRENCY", 1)),
+    "lifecycle": int(os.getenv("CELERY_OPS_CONCURRENCY", 2)),
+    "maintenance": int(os.getenv("CELERY_MAINTENANCE_CONCURRENCY", 1)),
+}
+
+
+@contextmanager
+def track_phase(dep, phase: str):
+    """Записывает длительность фазы в dep.timings (сек), даже если фаза упала."""
+    t0 = time.monotonic()
+    try:
+        yield
+    finally:
+        dep.timings[phase] = round(time.monotonic() - t0, 3)
+
+
+def format_duration(seconds) -> str:
+    """120.5 → '2 мин 0 с'"""
+    if seconds is None:
+        return "—"
+    seconds = int(max(seconds, 0))
+    if seconds < 60:
+        return f"{seconds} с"
+    minutes, seconds = divmod(seconds, 60)
+    if minutes < 60:
+        return f"{minutes} мин {seconds} с"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours} ч {minutes} мин"
+
+
+def average_durations() -> dict:
+    """Средняя длительность успешных запусков по действиям (сек)."""
+    result = {}
+    for action, _ in Deployment.ACTION_CHOICES:
+        rows = (
+            Deployment.objects.filter(
+                action=action,
+                status="success",
+                started_at__isnull=False,
+                finished_at__isnull=False,
+            )
+            .order_by("-finished_at")
+            .values_list("started_at", "finished_at")[:HISTORY_SIZE]
+        )
+        durations = [(finished - started).total_seconds() for started, finished in rows]
+        if durations:
+            result[action] = sum(durations) / len(durations)
+        else:
+            result[action] = DEFAULT_DURATIONS.get(action, 60)
+    return result
+
+
+def annotate_queue(deployments, averages: dict = None):
+    """
+    Проставляет у деплоев queue_wait_display и duration_display, а у незавершённых —
+    ещё queue_position, eta_seconds и eta_display.
+
+    Позиция считается среди pending-задач той же очереди с учётом приоритета,
+    ETA — по средней длительности из истории и параллелизму воркера.
+    """
+    deployments = list(deployments)
+    for dep in deployments:
+        dep.queue_wait_display = format_duration(dep.queue_wait_seconds)
+        dep.duration_display = format_duration(dep.duration_seconds)
+
+    active = [d for d in deployments if d.status in ("pending", "running")]
+    if not active:
+        return deployments
+
+    averages = averages or average_durations()
+    now = timezone.now()
+
+    queued = list(
+        Deployment.objects.filter(status__in=["pending", "running"])
+        .only("id", "action", "status", "priority", "enqueued_at", "started_at")
+    )
+
+    for dep in active:
+        own = averages.get(dep.action, 60)
+        concurrency = max(QUEUE_CONCURRENCY.get(dep.queue, 1), 1)
+
+        if dep.status == "running":
+            elapsed = (now - dep.started_at).total_seconds() if dep.started_at else 0
+            dep.queue_position = 0
+            dep.eta_seconds = max(own - elapsed, 0)
+            dep.eta_display = format_duration(dep.eta_seconds)
+            continue
+
+        same_queue = [q for q in queued if q.queue == dep.queue and q.id != dep.id]
+        ahead = [
+            q for q in same_queue
+            if q.status == "pending"
+            and (q.priority, q.enqueued_at) < (dep.priority, dep.enqueued_at)
+        ]
+        running_left = sum(
+            max(averages.get(q.action, 60) - (now - q.started_at).total_seconds(), 0)
+            for q in same_queue
+            if q.status == "running" and q.started_at
+        )
+        ahead_work = sum(averages.get(q.action, 60) for q in ahead)
+
+        dep.queue_position = len(ahead) + 1
+        dep.eta_seconds = (running_left + ahead_work) / concurrency + own
+        dep.eta_display = format_duration(dep.eta_seconds)
+
+    return deployments
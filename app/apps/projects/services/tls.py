@@ -0,0 +1,128 @@
+import os
+import logging
+import re
+import shlex
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import Q
+from django.utils import timezone
+
+from ..models import Project
+from .ssh_exec import SSHCommandError, run_ssh
+
+logger = logging.getLogger(__name__)
+
+# ACME-сервер. Для проверки без Let's Encrypt — локальный Pebble:
+# ACME_DIRECTORY=https://127.0.0.1:14000/dir ACME_INSECURE=1
+ACME_DIRECTORY = os.getenv("ACME_DIRECTORY", "https://acme-v02.api.letsencrypt.org/directory")
+ACME_EMAIL = os.getenv("ACME_EMAIL", "")
+ACME_INSECURE = os.getenv("ACME_INSECURE", "0") == "1"
+# HTTP-01: nginx отдаёт /.well-known/acme-challenge/ из этого каталога
+ACME_WEBROOT = os.getenv("ACME_WEBROOT", "/var/www/acme")
+# Каталог certbot на удалённом сервере (переопределяется в тестовом стенде)
+LETSENCRYPT_DIR = os.getenv("LETSENCRYPT_DIR", "/etc/letsencrypt")
+
+# certbot --keep-until-expiring перевыпускает сертификат за 30 дней до истечения;
+# задача продления берёт проекты с запасом
+RENEW_BEFORE = timedelta(days=30)
+
+# Строка с датой истечения в выводе команд: «ZEA_CERT <slug> <notAfter>»
+CERT_LINE_RE = re.compile(r"^ZEA_CERT (\S+) (.+)$", re.MULTILINE)
+
+
+def cert_paths(project) -> dict:
+    live = f"{LETSENCRYPT_DIR}/live/{project.slug}"
+    return {
+        "fullchain": f"{live}/fullchain.pem",
+        "privkey": f"{live}/privkey.pem",
+        "chain": f"{live}/chain.pem",
+    }
+
+
+def certbot_command(project) -> str:
+    """Выпуск/продление сертификата через webroot; действующий сертификат не трогается."""
+    args = [
+        "certbot", "certonly", "--webroot", "-w", ACME_WEBROOT,
+        "-d", project.domain, "--cert-name", project.slug,
+        "--config-dir", LETSENCRYPT_DIR,
+        "--server", ACME_DIRECTORY,
+        "--non-interactive", "--agree-tos", "--keep-until-expiring",
+    ]
+    args += ["-m", ACME_EMAIL] if ACME_EMAIL else ["--register-unsafely-without-email"]
+    if ACME_INSECURE:
+        args.append("--no-verify-ssl")
+    return " ".join(shlex.quote(arg) for arg in args)
+
+
+def enddate_command(project) -> str:
+    """Shell: печатает ZEA_CERT <slug> <notAfter> для разбора parse_cert_dates."""
+    fullchain = cert_paths(project)["fullchain"]
+    return (
+        f'echo "ZEA_CERT {project.slug} '
+        f'$(openssl x509 -enddate -noout -in {fullchain} | cut -d= -f2)"'
+    )
+
+
+def parse_cert_dates(output: str) -> dict:
+    """{slug: datetime истечения} из строк ZEA_CERT."""
+    dates = {}
+    for slug, value in CERT_LINE_RE.findall(output):
+        try:
+            # Формат openssl: «Jan  9 12:00:00 2027 GMT»
+            expires = datetime.strptime(" ".join(value.split()), "%b %d %H:%M:%S %Y %Z")
+        except ValueError:
+            continue
+        dates[slug] = expires.replace(tzinfo=dt_timezone.utc)
+    return dates
+
+
+def save_cert_dates(output: str) -> dict:
+    dates = parse_cert_dates(output)
+    for slug, expires in dates.items():
+        Project.objects.filter(slug=slug).update(tls_expires_at=expires)
+    return dates
+
+
+def projects_to_renew():
+    """Проекты с HTTPS, чей сертификат истекает в пределах RENEW_BEFORE (или дата неизвестна)."""
+    deadline = timezone.now() + RENEW_BEFORE
+    return (
+        Project.objects.select_related("server")
+        .filter(tls=True, status__in=["active", "grace", "deploying"])
+        .exclude(domain="")
+        .filter(Q(tls_expires_at__isnull=True) | Q(tls_expires_at__lt=deadline))
+        .order_by("server_id", "slug")
+    )
+
+
+def renew_server_certificates(server, projects) -> dict:
+    """
+    Продлевает сертификаты проектов одного сервера за одну SSH-сессию.
+    nginx перезагружается один раз и только если хотя бы один сертификат
+    действительно обновился. Ошибка одного проекта не прерывает остальные.
+    """
+    lines = ["renewed=0"]
+    for project in projects:
+        fullchain = cert_paths(project)["fullchain"]
+        lines += [
+            f"before=$(openssl x509 -enddate -noout -in {fullchain} 2>/dev/null || true)",
+            f"{certbot_command(project)} || echo 'ZEA_CERT_FAILED {project.slug}'",
+            f"after=$(openssl x509 -enddate -noout -in {fullchain} 2>/dev/null || true)",
+            '[ "$before" != "$after" ] && renewed=1',
+            f"[ -n \"$after\" ] && {enddate_command(project)}",
+        ]
+    lines.append('if [ "$renewed" = 1 ]; then nginx -t && systemctl reload nginx && echo ZEA_RELOADED; fi')
+
+    try:
+        output = run_ssh(server.ip_address, server.ssh_user, server.ssh_port, "\n".join(lines), timeout=900)
+    except SSHCommandError as e:
+        # Сертификаты могли обновиться, а nginx -t упасть: даты всё равно сохраняем
+        save_cert_dates(e.output)
+        raise
+    dates = save_cert_dates(output)
+    failed = re.findall(r"^ZEA_CERT_FAILED (\S+)$", output, re.MULTILINE)
+    logger.info(
+        f"TLS {server.name}: проверено {len(projects)}, ошибок {len(failed)}, "
+        f"reload: {'да' if 'ZEA_RELOADED' in output else 'нет'}"
+    )
+    return {"dates": dates, "failed": failed, "reloaded": "ZEA_RELOADED" in output}
@@ -0,0 +1,279 @@
+import logging
+import os
+import re
+import shlex
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from ..models import Project, TrafficBucket
+from . import nginx_config
+from .fleet import run_fleet, targets_for_servers
+
+logger = logging.getLogger(__name__)
+
+# Трафик проектов по access-логам nginx. Лог читается с места, где
+# остановился прошлый сбор (inode и смещение хранятся в проекте), и
+# сворачивается awk на сервере: по SSH идут только часовые счётчики.
+BUCKET_SECONDS = 60 * 60
+# Больше за один сбор с файла не читается: многогигабайтный лог (первый
+# сбор, долгий перерыв) догоняется за несколько запусков
+TRAFFIC_MAX_BYTES = int(os.getenv("TRAFFIC_MAX_BYTES", 256 * 1024 * 1024))
+TRAFFIC_RETENTION_DAYS = int(os.getenv("TRAFFIC_RETENTION_DAYS", 90))
+# Шаг логарифмических корзин времени ответа: погрешность перцентилей (γ−1)/(γ+1) ≈ 5%
+SKETCH_GAMMA = 1.1
+
+COUNTERS = ("requests", "bytes_sent", "status_2xx", "status_3xx", "status_4xx", "status_5xx")
+
+TRAFFIC_LINE_RE = re.compile(r"^ZEA_T (\S+) (\d+) (\d+) (\d+) (\d+) (\d+) (\d+) (\d+) (\S+)$", re.MULTILINE)
+POSITION_LINE_RE = re.compile(r"^ZEA_POS (\S+) (\d+) (\d+)$", re.MULTILINE)
+
+# Строки в формате ACCESS_LOG_FORMAT → «ZEA_T slug час запросы байты 2xx 3xx 4xx 5xx
+# корзина:запросов,...» и «ZEA_POS slug inode смещение». При capped=1 кусок обрезан
+# по размеру: последняя строка может быть недописанной — она не учитывается,
+# смещение считается по целым строкам.
+TRAFFIC_AWK = r"""
+BEGIN { lg = log(gamma) }
+function add(line,   n, f, b, t, x, i) {
+    n = split(line, f, " ")
+    if (n < 4 || f[2] !~ /^[1-5][0-9][0-9]$/) return
+    b = int(f[1] / bucket) * bucket
+    req[b]++
+    bytes[b] += f[3]
+    st[b, substr(f[2], 1, 1)]++
+    t = f[n]
+    if (t !~ /^[0-9.]+$/) return
+    x = t * 1000
+    if (x < 1) x = 1
+    x = log(x) / lg
+    i = int(x)
+    if (i < x) i++
+    hist[b, i]++
+}
+NR > 1 { add(prev); used += length(prev) + 1 }
+{ prev = $0 }
+END {
+    if (NR && !capped) add(prev)
+    for (b in req) {
+        h = ""
+        for (k in hist) {
+            split(k, p, SUBSEP)
+            if (p[1] == b) h = h "," p[2] ":" hist[k]
+        }
+        printf "ZEA_T %s %.0f %.0f %.0f %.0f %.0f %.0f %.0f %s\n", slug, b, req[b], bytes[b],
+            st[b, 2], st[b, 3], st[b, 4], st[b, 5], (h == "" ? "-" : substr(h, 2))
+    }
+    printf "ZEA_POS %s %s %.0f\n", slug, inode, capped ? start + used : size
+}
+"""
+
+
+def collect_command(projects) -> str:
+    """
+    Shell: новые строки access-логов проектов сервера, свёрнутые в часовые
+    счётчики. Читается только хвост после сохранённого смещения (tail -c
+    с seek); после ротации сначала дочитывается остаток прежнего файла.
+    """
+    calls = "\n".join(
+        f"zea_traffic {p.slug} {p.traffic_log_inode or 0} {p.traffic_log_offset}" for p in projects
+    )
+    return f"""awk_prog={shlex.quote(TRAFFIC_AWK)}
+zea_chunk() {{
+  # slug файл inode с до; код 1 — кусок обрезан TRAFFIC_MAX_BYTES
+  len=$(($5 - $4)); capped=0
+  if [ "$len" -le 0 ]; then echo "ZEA_POS $1 $3 $5"; return 0; fi
+  if [ "$len" -gt {TRAFFIC_MAX_BYTES} ]; then len={TRAFFIC_MAX_BYTES}; capped=1; fi
+  tail -c +$(($4 + 1)) "$2" | head -c "$len" | LC_ALL=C nice -n 19 awk -v slug="$1" -v inode="$3" \\
+    -v start="$4" -v size="$5" -v capped="$capped" -v bucket={BUCKET_SECONDS} -v gamma={SKETCH_GAMMA} "$awk_prog"
+  [ "$capped" = 0 ]
+}}
+zea_traffic() {{
+  f={nginx_config.NGINX_LOG_DIR}/$1.access.log
+  [ -f "$f" ] || return 0
+  set -- "$1" "$2" "$3" $(stat -c '%i %s' "$f")
+  from=$3
+  if [ "$2" != "$4" ]; then
+    # Ротация (create): прежний файл — .1, пока logrotate его не сжал (delaycompress)
+    if [ "$2" != 0 ] && [ -f "$f.1" ] && [ "$(stat -c %i "$f.1")" = "$2" ]; then
+      zea_chunk "$1" "$f.1" "$2" "$3" "$(stat -c %s "$f.1")" || return 0
+    fi
+    from=0
+  elif [ "$5" -lt "$3" ]; then
+    # Ротация copytruncate: тот же файл стал короче
+    from=0
+  fi
+  zea_chunk "$1" "$f" "$4" "$from" "$5" || true
+}}
+{calls}
+true"""
+
+
+def empty_counts() -> dict:
+    return {**dict.fromkeys(COUNTERS, 0), "latency": {}}
+
+
+def merge_counts(total: dict, counts: dict):
+    """Складывает счётчики и гистограммы; гистограммы сливаются без потери точности."""
+    for key in COUNTERS:
+        total[key] += counts[key]
+    latency = total["latency"]
+    for index, n in counts["latency"].items():
+        latency[index] = latency.get(index, 0) + n
+
+
+def parse_traffic(output: str) -> tuple:
+    """({(slug, начало часа): счётчики}, {slug: (inode, смещение)})."""
+    buckets = {}
+    for slug, start, *counters, histogram in TRAFFIC_LINE_RE.findall(output):
+        counts = dict(zip(COUNTERS, map(int, counters)))
+        counts["latency"] = {}
+        if histogram != "-":
+            for item in histogram.split(","):
+                index, n = item.split(":")
+                counts["latency"][index] = int(n)
+        key = (slug, datetime.fromtimestamp(int(start), tz=dt_timezone.utc))
+        merge_counts(buckets.setdefault(key, empty_counts()), counts)
+    # Последняя позиция файла: после остатка ротированного идёт текущий
+    positions = {slug: (int(inode), int(offset)) for slug, inode, offset in POSITION_LINE_RE.findall(output)}
+    return buckets, positions
+
+
+def store_traffic(server, projects, output: str) -> int:
+    """
+    Добавляет счётчики к часовым корзинам и сдвигает позиции логов — в одной
+    транзакции. Если позиция проекта изменилась после запуска команды
+    (параллельный сбор, переезд), его результат отбрасывается: строки не
+    учитываются дважды. Возвращает число запросов.
+    """
+    buckets, positions = parse_traffic(output)
+    sent = {p.id: (p.traffic_log_inode, p.traffic_log_offset) for p in projects}
+    slugs = {p.slug: p.id for p in projects}
+    requests = 0
+    with transaction.atomic():
+        current = {
+            pid: (inode, offset) for pid, inode, offset in Project.objects.select_for_update()
+            .filter(id__in=sent, server_id=server.id)
+            .values_list("id", "traffic_log_inode", "traffic_log_offset")
+        }
+        valid = {pid for pid, position in current.items() if position == sent[pid]}
+
+        for slug, (inode, offset) in positions.items():
+            pid = slugs.get(slug)
+            if pid in valid and (inode, offset) != sent[pid]:
+                Project.objects.filter(id=pid).update(traffic_log_inode=inode, traffic_log_offset=offset)
+
+        counts = {(slugs[slug], start): c for (slug, start), c in buckets.items() if slugs.get(slug) in valid}
+        if counts:
+            existing = {
+                (b.project_id, b.start): b for b in TrafficBucket.objects.select_for_update().filter(
+                    project_id__in={pid for pid, _ in counts}, start__in={start for _, start in counts},
+                )
+            }
+            created, updated = [], []
+            for (pid, start), c in counts.items():
+                requests += c["requests"]
+                bucket = existing.get((pid, start))
+                if bucket is None:
+                    created.append(TrafficBucket(project_id=pid, start=start, **c))
+                    continue
+                total = {key: getattr(bucket, key) for key in COUNTERS}
+                total["latency"] = bucket.latency
+                merge_counts(total, c)
+                for key, value in total.items():
+                    setattr(bucket, key, value)
+                updated.append(bucket)
+            TrafficBucket.objects.bulk_create(created)
+            TrafficBucket.objects.bulk_update(updated, [*COUNTERS, "latency"])
+    return requests
+
+
+def collect_traffic(servers=None) -> dict:
+    """
+    Собирает трафик со всех серверов параллельно (fleet), одна команда на
+    сервер. Возвращает {имя сервера: ошибка} для недоступных.
+    """
+    projects = Project.objects.select_related("server").exclude(domain="").only(
+        "id", "slug", "server", "traffic_log_inode", "traffic_log_offset",
+    )
+    if servers is not None:
+        projects = projects.filter(server__in=servers)
+    by_server = {}
+    for project in projects:
+        by_server.setdefault(project.server, []).append(project)
+    if not by_server:
+        return {}
+
+    servers = list(by_server)
+    targets = targets_for_servers(servers)
+    for target, server in zip(targets, servers):
+        target.command = collect_command(by_server[server])
+    results = run_fleet(targets, "zea_traffic")
+    errors = {}
+    for server, result in zip(servers, results):
+        if not result.ok:
+            errors[server.name] = result.error or result.status
+            continue
+        requests = store_traffic(server, by_server[server], result.output)
+        logger.info(f"Трафик {server.name}: {requests} запросов")
+    return errors
+
+
+def prune_traffic() -> int:
+    cutoff = timezone.now() - timedelta(days=TRAFFIC_RETENTION_DAYS)
+    deleted, _ = TrafficBucket.objects.filter(start__lt=cutoff).delete()
+    return deleted
+
+
+def quantile(latency: dict, q: float):
+    """Время ответа (мс) для перцентиля q по гистограмме; None без данных."""
+    total = sum(latency.values())
+    if not total:
+        return None
+    seen = 0
+    for index in sorted(latency, key=int):
+        seen += latency[index]
+        if seen >= q * total:
+            # Середина корзины (γ^(i−1), γ^i] с относительной погрешностью
+            return 2 * SKETCH_GAMMA ** int(index) / (1 + SKETCH_GAMMA)
+
+
+def bucket_start(moment) -> datetime:
+    return datetime.fromtimestamp(
+        int(moment.timestamp()) // BUCKET_SECONDS * BUCKET_SECONDS, tz=dt_timezone.utc,
+    )
+
+
+def traffic_summary(project, hours: int = 24) -> dict:
+    """Итоги за последние hours часов, почасовые столбики и сумма за 30 дней."""
+    now = timezone.now()
+    since = bucket_start(now) - timedelta(hours=hours - 1)
+    rows = {b.start: b for b in project.traffic_buckets.filter(start__gte=since)}
+
+    total = empty_counts()
+    for bucket in rows.values():
+        merge_counts(total, {**{key: getattr(bucket, key) for key in COUNTERS}, "latency": bucket.latency})
+
+    hourly = [since + timedelta(hours=h) for h in range(hours)]
+    peak = max((rows[start].requests for start in rows), default=0) or 1
+    bars = [
+        {
+            "start": start,
+            "requests": rows[start].requests if start in rows else 0,
+            "height": round(100 * rows[start].requests / peak) if start in rows else 0,
+        }
+        for start in hourly
+    ]
+    month = project.traffic_buckets.filter(start__gte=now - timedelta(days=30)).aggregate(
+        requests=Sum("requests"), bytes_sent=Sum("bytes_sent"),
+    )
+    return {
+        **total,
+        "errors": round(100 * total["status_5xx"] / total["requests"], 2) if total["requests"] else 0,
+        "p50": quantile(total["latency"], 0.5),
+        "p95": quantile(total["latency"], 0.95),
+        "p99": quantile(total["latency"], 0.99),
+        "bars": bars,
+        "month": month,
+    }
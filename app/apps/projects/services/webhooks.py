@@ -0,0 +1,126 @@
+import hashlib
+import hmac
+import logging
+import os
+import re
+from fnmatch import fnmatch
+
+from django.db import transaction
+
+from ..models import Deployment, Project
+
+logger = logging.getLogger(__name__)
+
+GITHUB_WEBHOOK_SECRET = os.getenv("GITHUB_WEBHOOK_SECRET", "")
+
+# Окно склейки push'ей: деплой стартует через WEBHOOK_DEBOUNCE секунд,
+# все push'и за это время попадают в один и тот же pending-деплой
+WEBHOOK_DEBOUNCE = int(os.getenv("WEBHOOK_DEBOUNCE", "5"))
+
+# GitHub кладёт в payload не больше 20 коммитов — при обрезке список файлов неполный
+GITHUB_MAX_COMMITS = 20
+
+_REPO_RE = re.compile(r"github\.com[:/]+([^/\s]+/[^/\s]+?)(?:\.git)?/?$", re.IGNORECASE)
+
+
+def verify_signature(body: bytes, signature: str, secret: str = None) -> bool:
+    """Проверяет заголовок X-Hub-Signature-256 (HMAC SHA-256 от тела запроса)."""
+    secret = GITHUB_WEBHOOK_SECRET if secret is None else secret
+    if not secret or not signature or not signature.startswith("sha256="):
+        return False
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(signature[len("sha256="):], expected)
+
+
+def repo_full_name(url: str) -> str:
+    """owner/name из https- или ssh-адреса репозитория GitHub (в нижнем регистре)."""
+    match = _REPO_RE.search((url or "").strip())
+    return match.group(1).lower() if match else ""
+
+
+def changed_paths(payload: dict):
+    """
+    Файлы, затронутые push'ем. None — список неизвестен (обрезан GitHub
+    или force-push без коммитов), в этом случае деплоим.
+    """
+    commits = payload.get("commits") or []
+    if not commits or len(commits) >= GITHUB_MAX_COMMITS:
+        return None
+    paths = set()
+    for commit in commits:
+        for key in ("added", "modified", "removed"):
+            paths.update(commit.get(key) or [])
+    return paths
+
+
+def _patterns(text: str) -> list:
+    return [line.strip().lstrip("/") for line in (text or "").splitlines() if line.strip()]
+
+
+def paths_match(paths, include: str = "", exclude: str = "") -> bool:
+    """
+    Есть ли среди путей хоть один, ради которого стоит деплоить.
+    Шаблоны — fnmatch, где * совпадает и с «/» (docs/* — вся папка docs).
+    """
+    if paths is None:
+        return True
+    include, exclude = _patterns(include), _patterns(exclude)
+    for path in paths:
+        if any(fnmatch(path, pattern) for pattern in exclude):
+            continue
+        if include and not any(fnmatch(path, pattern) for pattern in include):
+            continue
+        return True
+    return False
+
+
+def _queue_deploy(project: Project) -> str:
+    """
+    Ставит не больше одного деплоя на серию push'ей: если pending-деплой уже
+    есть, он и так заберёт свежий коммит (git reset --hard origin/<branch>).
+    """
+    from ..tasks import enqueue_deploy
+
+    with transaction.atomic():
+        # Блокировка строки проекта сериализует параллельные вебхуки
+        Project.objects.select_for_update().filter(id=project.id).first()
+        pending = Deployment.objects.filter(
+            project=project, action="deploy", status="pending",
+        ).first()
+        if pending:
+            return f"coalesced:{pending.id}"
+        # Запись создаётся под блокировкой (её увидит следующий вебхук), задача — после коммита
+        dep = enqueue_deploy(project.id, countdown=WEBHOOK_DEBOUNCE, wait_running=True, defer=True)
+    return f"queued:{dep.id}"
+
+
+def handle_push(payload: dict) -> dict:
+    """Обрабатывает push-событие GitHub. Возвращает решение по каждому проекту."""
+    if payload.get("deleted"):
+        return {}
+
+    ref = payload.get("ref", "")
+    if not ref.startswith("refs/heads/"):
+        return {}
+    branch = ref[len("refs/heads/"):]
+
+    repository = payload.get("repository") or {}
+    full_name = (repository.get("full_name") or "").lower()
+    if not full_name:
+        return {}
+
+    paths = changed_paths(payload)
+    results = {}
+    candidates = Project.objects.filter(
+        auto_deploy=True, github_branch=branch, github_repo__icontains=full_name,
+    )
+    for project in candidates:
+        if repo_full_name(project.github_repo) != full_name:
+            continue
+        if not paths_match(paths, project.deploy_paths, project.ignore_paths):
+            results[project.slug] = "ignored:paths"
+            continue
+        results[project.slug] = _queue_deploy(project)
+
+    logger.info(f"Webhook push {full_name}@{branch}: {results or 'нет проектов'}")
+    return results
@@ -0,0 +1,54 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Deployment, Project, Server
+from .services.billing import schedule_billing_events
+from .services.page_cache import bump
+from .services.placement import refresh_server_load
+
+
+def _bump_on_commit(group: str):
+    # До коммита другой процесс может закешировать старые данные под новой версией
+    transaction.on_commit(lambda: bump(group))
+
+
+@receiver([post_save, post_delete], sender=Project)
+def project_changed(sender, **kwargs):
+    _bump_on_commit("projects")
+
+
+@receiver(post_save, sender=Project)
+def reschedule_billing(sender, instance, **kwargs):
+    """Пересчитывает события биллинга, если изменились статус или даты оплаты."""
+    if not instance.billing_changed():
+        return
+    instance._billing_snapshot = instance.billing_state()
+    transaction.on_commit(lambda: schedule_billing_events(instance))
+
+
+@receiver(post_save, sender=Project)
+def refresh_placement_on_save(sender, instance, **kwargs):
+    """Агрегаты серверов — только если изменились сервер проекта или его лимиты."""
+    previous = getattr(instance, "_placement_snapshot", None)
+    current = instance.placement_state()
+    if previous == current:
+        return
+    instance._placement_snapshot = current
+    old_server = previous[0] if previous else None
+    transaction.on_commit(lambda: refresh_server_load(old_server, instance.server_id))
+
+
+@receiver(post_delete, sender=Project)
+def refresh_placement_on_delete(sender, instance, **kwargs):
+    transaction.on_commit(lambda: refresh_server_load(instance.server_id))
+
+
+@receiver([post_save, post_delete], sender=Server)
+def server_changed(sender, **kwargs):
+    _bump_on_commit("servers")
+
+
+@receiver([post_save, post_delete], sender=Deployment)
+def deployment_changed(sender, **kwargs):
+    _bump_on_commit("deployments")
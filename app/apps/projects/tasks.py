@@ -1,113 +1,321 @@
 import logging
 from celery import shared_task
+from django.db import connection, transaction
+from django.db.models import Q
 from django.utils import timezone
 
-from .models import Deployment, Project
-from .services.ssh_exec import run_ssh
-from .services.nginx_config import deploy_nginx_config, remove_nginx_config
+from .models import Backup, Deployment, Project, Server
+from .services.ssh_exec import SSH_TIMEOUT, run_ssh
+from .services.nginx_config import (
+    deploy_forward_config,
+    deploy_nginx_config,
+    microcache_dir,
+    remove_nginx_config,
+)
+from .services.env_store import current_env, decrypt, diff_summary, env_write_command, mark_env_pushed, pending_env
+from .services.git_mirror import repository_source
+from .services.billing import pop_due_events, schedule_billing_events
+from .services.leader import fenced
+from .services.page_cache import bump
+from .services.resources import build_command, compose_files, has_limits, override_command, parse_services
+from .services.stats import track_phase
+from .services.placement import collect_capacity
+from .services.migrate import (
+    PRESYNC_TIMEOUT,
+    MigrationError,
+    certificates_script,
+    check_paths,
+    cleanup_script,
+    dns_points_to,
+    format_size,
+    parse_rsync_stats,
+    preflight_script,
+    prepare_script,
+    start_script,
+    stop_script,
+    sync_script,
+)
+from .services.tls import projects_to_renew, renew_server_certificates, save_cert_dates
+from .services.traffic import collect_traffic, prune_traffic
+from .services.profiling import prune_profiles
+from .services.backup import BACKUP_TIMEOUT, BackupError, backup_projects, restore_script, secrets
+from .services.idle import WAKE_BASE_URL, find_idle_projects, sleep_script, wake_script
+from .services.live import LogStreamer, publish_deployment, publish_project_status
 from .services.notifications import (
+    notify_telegram,
+    notify_telegram_async,
+    notify_backups_failed,
     notify_deploy_success,
     notify_deploy_failed,
+    notify_migrated,
+    notify_migration_failed,
+    notify_restore_failed,
+    notify_restored,
     notify_status_change,
-    notify_billing_warning,
 )
 
 logger = logging.getLogger(__name__)
 
-GRACE_DAYS = 7
+# Приоритеты задач внутри очереди (Redis: меньше — важнее)
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 5
+PRIORITY_LOW = 9
 
 
-@shared_task
-def deploy_project_task(project_id: int):
+def _enqueue(task, project_id: int, action: str, priority: int,
+             countdown: int = None, defer: bool = False, **kwargs) -> Deployment:
+    """
+    Создаёт запись Deployment в статусе pending и ставит задачу в очередь.
+    Время постановки в очередь нужно для расчёта ожидания и ETA.
+    defer — вызов внутри транзакции: запись создаётся сразу (видна под
+    блокировками вызывающего), а задача уходит в брокер после коммита,
+    иначе воркер может стартовать раньше и не найти запись.
+    """
+    dep = Deployment.objects.create(
+        project_id=project_id, action=action, status="pending", priority=priority,
+    )
+
+    def send():
+        try:
+            task.apply_async(
+                args=[project_id], kwargs={"deployment_id": dep.id, **kwargs},
+                priority=priority, countdown=countdown,
+            )
+        except Exception as e:
+            dep.status = "failed"
+            dep.finished_at = timezone.now()
+            dep.log = f"Не удалось поставить задачу в очередь: {e}"
+            dep.save(update_fields=["status", "finished_at", "log"])
+            raise
+        publish_deployment(dep)
+
+    if defer:
+        # robust: транзакция уже закоммичена, ошибка брокера только помечает запись failed
+        transaction.on_commit(send, robust=True)
+    else:
+        send()
+    return dep
+
+
+def enqueue_deploy(project_id: int, priority: int = PRIORITY_NORMAL,
+                   countdown: int = None, wait_running: bool = False, defer: bool = False) -> Deployment:
+    """
+    Ставит деплой в очередь deploy с заданным приоритетом.
+    wait_running — если проект уже деплоится, дождаться окончания и задеплоить
+    снова, а не пропускать (нужно для push: текущий деплой мог взять старый коммит).
+    """
+    return _enqueue(
+        deploy_project_task, project_id, "deploy", priority,
+        countdown=countdown, defer=defer, wait_running=wait_running,
+    )
+
+
+def enqueue_suspend(project_id: int, priority: int = PRIORITY_NORMAL) -> Deployment:
+    """Ставит suspend в очередь lifecycle."""
+    return _enqueue(suspend_project_task, project_id, "suspend", priority)
+
+
+def enqueue_resume(project_id: int, priority: int = PRIORITY_HIGH) -> Deployment:
+    """Ставит resume в очередь lifecycle. По умолчанию — вне очереди."""
+    return _enqueue(resume_project_task, project_id, "resume", priority)
+
+
+def enqueue_apply_env(project_id: int, priority: int = PRIORITY_HIGH) -> Deployment:
+    """Ставит применение env (без сборки) в очередь lifecycle."""
+    return _enqueue(apply_env_task, project_id, "env", priority)
+
+
+def enqueue_sleep(project_id: int, priority: int = PRIORITY_LOW) -> Deployment:
+    """Ставит усыпление простаивающего проекта в очередь lifecycle."""
+    return _enqueue(sleep_project_task, project_id, "sleep", priority)
+
+
+def enqueue_wake(project_id: int, priority: int = PRIORITY_HIGH) -> Deployment:
+    """Ставит пробуждение в очередь lifecycle вне очереди: посетитель ждёт."""
+    return _enqueue(wake_project_task, project_id, "wake", priority)
+
+
+def enqueue_migrate(project_id: int, target_id: int, priority: int = PRIORITY_NORMAL) -> Deployment:
+    """Ставит переезд на другой сервер в очередь deploy: на целевом сервере идёт сборка."""
+    return _enqueue(migrate_project_task, project_id, "migrate", priority, target_id=target_id)
+
+
+def enqueue_restore(project_id: int, backup_id: int, target_id: int = None,
+                    priority: int = PRIORITY_NORMAL) -> Deployment:
+    """Восстановление из копии — в очереди deploy: на сервере идёт сборка."""
+    return _enqueue(restore_project_task, project_id, "restore", priority,
+                    backup_id=backup_id, target_id=target_id)
+
+
+def _start_deployment(project, action: str, deployment_id: int = None) -> Deployment:
+    """Переводит запись из очереди в running и фиксирует время ожидания."""
+    dep = None
+    if deployment_id:
+        dep = Deployment.objects.filter(id=deployment_id).first()
+    if dep is None:
+        dep = Deployment(project=project, action=action)
+
+    dep.status = "running"
+    dep.started_at = timezone.now()
+    dep.timings = {"queue": round(dep.queue_wait_seconds, 3)}
+    dep.save()
+    publish_deployment(dep)
+    publish_project_status(project)
+    return dep
+
+
+def _ensure_db_alive():
+    """
+    Пока идут SSH-фазы (сборка — до 10 минут), соединение с БД простаивает
+    и может быть закрыто сервером. Проверяем его перед записью результата.
+    """
+    if connection.in_atomic_block or connection.connection is None:
+        return
+    if not connection.is_usable():
+        logger.warning("Соединение с БД потеряно во время деплоя, переподключаемся")
+        connection.close()
+
+
+def _finish_deployment(dep: Deployment, log: str, stream: LogStreamer = None):
+    _ensure_db_alive()
+    if stream:
+        stream.flush()
+    dep.log = log
+    dep.finished_at = timezone.now()
+    dep.save()
+    publish_deployment(dep)
+
+
+# Деплой с wait_running ждёт окончания текущего: повтор каждые 15с, не дольше ~10 минут
+WAIT_RUNNING_RETRY = 15
+WAIT_RUNNING_MAX_RETRIES = 40
+
+
+@shared_task(max_retries=WAIT_RUNNING_MAX_RETRIES)
+def deploy_project_task(project_id: int, deployment_id: int = None, wait_running: bool = False):
     """Деплоит проект на удалённый сервер через SSH."""
     project = Project.objects.select_related("server").get(id=project_id)
 
     # Проверяем, не деплоится ли уже
+    retries = deploy_project_task.request.retries or 0
+    if (project.status == "deploying" and wait_running and deployment_id
+            and retries < WAIT_RUNNING_MAX_RETRIES):
+        logger.info(f"Проект {project.slug} деплоится, повтор через {WAIT_RUNNING_RETRY}с")
+        raise deploy_project_task.retry(countdown=WAIT_RUNNING_RETRY)
     if project.status == "deploying":
         logger.warning(f"Проект {project.slug} уже деплоится, пропускаем")
+        if deployment_id:
+            Deployment.objects.filter(id=deployment_id, status="pending").update(
+                status="skipped",
+                finished_at=timezone.now(),
+                log="Пропущено: проект уже деплоится",
+            )
+            bump("deployments")
         return f"Проект {project.slug} уже деплоится"
 
     old_status = project.status
     project.status = "deploying"
     project.save(update_fields=["status"])
 
-    dep = Deployment.objects.create(
-        project=project, status="running", action="deploy"
-    )
+    dep = _start_deployment(project, "deploy", deployment_id)
 
     s = project.server
     path = project.get_remote_path()
-    port = project.internal_port
 
-    cmd = f"""
+    git_cmd = f"""
 set -e
 mkdir -p {path}
 cd {path}
+"""
 
-if [ ! -d ".git" ]; then
-  git clone {project.github_repo} .
-fi
+    env_version = current_env(project)
 
-git fetch --all
-git checkout {project.github_branch}
-git reset --hard origin/{project.github_branch}
-"""
-    
-    # Добавляем создание .env если есть переменные
-    if project.env_vars:
-        escaped_env = project.env_vars.replace("'", "'\\''")
-        cmd += f"\necho '{escaped_env}' > .env\n"
-
-    # Очищаем неиспользуемые Docker-ресурсы и запускаем сборку с низким приоритетом
-    cmd += f"""
-docker system prune -f 2>/dev/null || true
-export DOCKER_BUILDKIT=1
-nice -n 19 ionice -c 3 docker compose -f {project.compose_file} up -d --build --remove-orphans
+    services_cmd = f"cd {path} && docker compose -f {project.compose_file} config --services"
+
+    up_cmd = f"""
+set -e
+cd {path}
+docker compose {compose_files(project)} up -d --remove-orphans
 """
 
     log = ""
+    stream = LogStreamer(dep)
     try:
-        log = run_ssh(s.ip_address, s.ssh_user, s.ssh_port, cmd)
+        with track_phase(dep, "git"):
+            # .env перезаписывается, только если отличается от файла на сервере
+            env_cmd = f"\n{env_write_command(decrypt(env_version))}\n" if env_version else ""
+            # Код — bundle из локального зеркала (или fetch из GitHub, если зеркало недоступно)
+            with repository_source(project) as (source_cmd, bundle):
+                log += run_ssh(s.ip_address, s.ssh_user, s.ssh_port, git_cmd + source_cmd + env_cmd,
+                               on_output=stream, stdin=bundle)
+            # Список сервисов нужен только для override с лимитами
+            services = []
+            if has_limits(project):
+                services = parse_services(run_ssh(s.ip_address, s.ssh_user, s.ssh_port, services_cmd))
+            if services and len(services) != project.compose_services:
+                project.compose_services = len(services)
+                project.save(update_fields=["compose_services"])
+
+        # Лимиты ресурсов — override к compose-файлу; очищаем неиспользуемые
+        # Docker-ресурсы и собираем с низким приоритетом и лимитами сборки
+        build_cmd = f"""
+set -e
+cd {path}
+{override_command(project, services)}
+docker system prune -f 2>/dev/null || true
+export DOCKER_BUILDKIT=1
+{build_command(project)}
+"""
+        with track_phase(dep, "build"):
+            log += run_ssh(s.ip_address, s.ssh_user, s.ssh_port, build_cmd, on_output=stream)
+        with track_phase(dep, "up"):
+            log += run_ssh(s.ip_address, s.ssh_user, s.ssh_port, up_cmd, on_output=stream)
 
         # Настраиваем Nginx если указан домен
         try:
-            nginx_log = deploy_nginx_config(project)
+            with track_phase(dep, "nginx"):
+                nginx_log = deploy_nginx_config(project)
             log += "\n--- NGINX ---\n" + nginx_log
+            stream.write("\n--- NGINX ---\n" + nginx_log)
         except Exception as e:
             log += f"\n--- NGINX ERROR ---\n{e}"
+            stream.write(f"\n--- NGINX ERROR ---\n{e}")
             logger.warning(f"Nginx конфиг не установлен: {e}")
 
         dep.status = "success"
         project.status = "active"
+        project.sleeping_since = None
         project.last_deploy_at = timezone.now()
+        if env_version:
+            mark_env_pushed(project, env_version)
 
-        notify_deploy_success(project)
+        with track_phase(dep, "notify"):
+            notify_deploy_success(project)
 
     except Exception as e:
         log += f"\nDEPLOY ERROR: {e}"
+        stream.write(f"\nDEPLOY ERROR: {e}")
         dep.status = "failed"
         project.status = "failed"
         project.last_deploy_at = timezone.now()
 
-        notify_deploy_failed(project, str(e))
+        with track_phase(dep, "notify"):
+            notify_deploy_failed(project, str(e))
 
-    dep.log = log
-    dep.finished_at = timezone.now()
-    dep.save()
-    project.save(update_fields=["status", "last_deploy_at"])
+    _finish_deployment(dep, log, stream)
+    project.save(update_fields=["status", "last_deploy_at", "sleeping_since"])
+    publish_project_status(project)
 
     if project.status != old_status:
         notify_status_change(project, old_status, project.status)
 
 
 @shared_task
-def suspend_project_task(project_id: int):
+def suspend_project_task(project_id: int, deployment_id: int = None):
     """Останавливает контейнеры проекта на удалённом сервере."""
     project = Project.objects.select_related("server").get(id=project_id)
     old_status = project.status
-    dep = Deployment.objects.create(
-        project=project, status="running", action="suspend"
-    )
+    dep = _start_deployment(project, "suspend", deployment_id)
 
     s = project.server
     path = project.get_remote_path()
@@ -119,41 +327,42 @@ docker compose -f {project.compose_file} stop
 """
 
     log = ""
+    stream = LogStreamer(dep)
     try:
-        log = run_ssh(s.ip_address, s.ssh_user, s.ssh_port, cmd)
+        with track_phase(dep, "stop"):
+            log = run_ssh(s.ip_address, s.ssh_user, s.ssh_port, cmd, on_output=stream)
 
         # Удаляем Nginx конфиг
         try:
-            nginx_log = remove_nginx_config(project)
+            with track_phase(dep, "nginx"):
+                nginx_log = remove_nginx_config(project)
             log += "\n--- NGINX ---\n" + nginx_log
         except Exception as e:
             log += f"\n--- NGINX REMOVE ERROR ---\n{e}"
 
         dep.status = "success"
         project.status = "suspended"
+        project.sleeping_since = None
 
     except Exception as e:
         log += f"\nSUSPEND ERROR: {e}"
         dep.status = "failed"
         logger.error(f"Ошибка suspend {project.slug}: {e}")
 
-    dep.log = log
-    dep.finished_at = timezone.now()
-    dep.save()
-    project.save(update_fields=["status"])
+    _finish_deployment(dep, log, stream)
+    project.save(update_fields=["status", "sleeping_since"])
+    publish_project_status(project)
 
     if project.status != old_status:
         notify_status_change(project, old_status, project.status)
 
 
 @shared_task
-def resume_project_task(project_id: int):
+def resume_project_task(project_id: int, deployment_id: int = None):
     """Возобновляет контейнеры проекта на удалённом сервере."""
     project = Project.objects.select_related("server").get(id=project_id)
     old_status = project.status
-    dep = Deployment.objects.create(
-        project=project, status="running", action="resume"
-    )
+    dep = _start_deployment(project, "resume", deployment_id)
 
     s = project.server
     path = project.get_remote_path()
@@ -161,22 +370,26 @@ def resume_project_task(project_id: int):
     cmd = f"""
 set -e
 cd {path}
-docker compose -f {project.compose_file} up -d
+docker compose {compose_files(project)} up -d
 """
 
     log = ""
+    stream = LogStreamer(dep)
     try:
-        log = run_ssh(s.ip_address, s.ssh_user, s.ssh_port, cmd)
+        with track_phase(dep, "up"):
+            log = run_ssh(s.ip_address, s.ssh_user, s.ssh_port, cmd, on_output=stream)
 
         # Восстанавливаем Nginx конфиг
         try:
-            nginx_log = deploy_nginx_config(project)
+            with track_phase(dep, "nginx"):
+                nginx_log = deploy_nginx_config(project)
             log += "\n--- NGINX ---\n" + nginx_log
         except Exception as e:
             log += f"\n--- NGINX ERROR ---\n{e}"
 
         dep.status = "success"
         project.status = "active"
+        project.sleeping_since = None
         project.last_deploy_at = timezone.now()
 
     except Exception as e:
@@ -184,57 +397,535 @@ docker compose -f {project.compose_file} up -d
         dep.status = "failed"
         logger.error(f"Ошибка resume {project.slug}: {e}")
 
-    dep.log = log
-    dep.finished_at = timezone.now()
-    dep.save()
-    project.save(update_fields=["status", "last_deploy_at"])
+    _finish_deployment(dep, log, stream)
+    project.save(update_fields=["status", "last_deploy_at", "sleeping_since"])
+    publish_project_status(project)
 
     if project.status != old_status:
         notify_status_change(project, old_status, project.status)
 
 
 @shared_task
-def check_billing_task():
+def apply_env_task(project_id: int, deployment_id: int = None):
     """
-    Ежедневная проверка биллинга:
-    1. Активные проекты с истёкшей оплатой → Grace (7 дней)
-    2. Grace проекты с истёкшим grace-периодом → Suspend
-    3. Предупреждение за 3 дня до окончания оплаты
+    Применяет изменённые переменные без сборки: записывает .env и вызывает
+    up --no-build — compose пересоздаёт только контейнеры, чья конфигурация
+    изменилась. Остановленный проект только получает новый .env.
     """
-    from datetime import timedelta
+    project = Project.objects.select_related("server", "env_pushed").get(id=project_id)
+    dep = _start_deployment(project, "env", deployment_id)
 
-    today = timezone.now().date()
+    s = project.server
+    path = project.get_remote_path()
+    pending = pending_env(project)
 
-    # 1. Предупреждения за 3 дня
-    warning_date = today + timedelta(days=3)
-    projects_warning = Project.objects.filter(
-        status="active",
-        paid_until=warning_date,
-    )
-    for project in projects_warning:
-        days_left = (project.paid_until - today).days
-        notify_billing_warning(project, days_left)
-
-    # 2. Active → Grace
-    projects_expired = Project.objects.filter(
-        status__in=["active", "deploying"],
-        paid_until__lt=today,
-    ).exclude(paid_until__isnull=True)
-
-    for project in projects_expired:
-        old_status = project.status
-        project.status = "grace"
-        project.grace_until = today + timedelta(days=GRACE_DAYS)
-        project.save(update_fields=["status", "grace_until"])
-        notify_status_change(project, old_status, "grace")
-        logger.info(f"Проект {project.slug} → GRACE до {project.grace_until}")
-
-    # 3. Grace → Suspend
-    projects_grace_expired = Project.objects.filter(
-        status="grace",
-        grace_until__lt=today,
+    log = ""
+    stream = LogStreamer(dep)
+    try:
+        if pending is None:
+            log = "Env на сервере актуален, применять нечего\n"
+            stream.write(log)
+        else:
+            version, diff = pending
+            log = f"Env v{version.version}: {diff_summary(diff) or 'без изменений переменных'}\n"
+            stream.write(log)
+            cmd = f"""
+set -e
+cd {path}
+{env_write_command(decrypt(version))}
+"""
+            if project.status != "suspended" and not project.sleeping_since:
+                cmd += f"docker compose {compose_files(project)} up -d --no-build --remove-orphans\n"
+            with track_phase(dep, "up"):
+                log += run_ssh(s.ip_address, s.ssh_user, s.ssh_port, cmd, on_output=stream)
+            mark_env_pushed(project, version)
+        dep.status = "success"
+    except Exception as e:
+        log += f"\nENV ERROR: {e}"
+        stream.write(f"\nENV ERROR: {e}")
+        dep.status = "failed"
+        logger.error(f"Ошибка применения env {project.slug}: {e}")
+
+    _finish_deployment(dep, log, stream)
+
+
+# Статусы, при которых контейнеры проекта запущены и переезд идёт с остановкой
+MIGRATE_RUNNING_STATUSES = ("active", "grace", "failed")
+
+
+@shared_task
+def migrate_project_task(project_id: int, deployment_id: int = None, target_id: int = None):
+    """
+    Переносит проект на другой сервер:
+    preflight → presync (rsync, проект работает) → build на целевом →
+    stop → sync (только изменения) → up на целевом → nginx → cleanup.
+    Простой — stop + sync + up. Ошибка до up откатывает проект на исходный
+    сервер; после up переезд уже состоялся. Ошибка nginx — переезд failed,
+    а каталог на исходном не удаляется: домен без рабочего vhost, копия нужна
+    для отката. Ошибка очистки только записывается в лог.
+    """
+    project = Project.objects.select_related("server").get(id=project_id)
+    if project.status == "deploying":
+        logger.warning(f"Проект {project.slug} деплоится, переезд пропущен")
+        if deployment_id:
+            Deployment.objects.filter(id=deployment_id, status="pending").update(
+                status="skipped",
+                finished_at=timezone.now(),
+                log="Пропущено: проект деплоится",
+            )
+            bump("deployments")
+        return f"Проект {project.slug} деплоится"
+
+    target = Server.objects.get(id=target_id)
+    source = project.server
+    source_path = project.get_remote_path()
+    old_status = project.status
+    running = old_status in MIGRATE_RUNNING_STATUSES
+    project.status = "deploying"
+    project.save(update_fields=["status"])
+
+    dep = _start_deployment(project, "migrate", deployment_id)
+
+    log = []
+    stream = LogStreamer(dep)
+
+    def say(text: str):
+        log.append(text)
+        stream.write(text)
+
+    def on_source(cmd: str, **kwargs) -> str:
+        # rsync и tar с исходного сервера ходят на целевой с ключом управляющего хоста
+        output = run_ssh(source.ip_address, source.ssh_user, source.ssh_port, cmd,
+                         on_output=stream, forward_agent=True, **kwargs)
+        log.append(output)
+        return output
+
+    def on_target(cmd: str) -> str:
+        output = run_ssh(target.ip_address, target.ssh_user, target.ssh_port, cmd, on_output=stream)
+        log.append(output)
+        return output
+
+    stopped = False
+    try:
+        if target.id == source.id:
+            raise MigrationError(f"Проект уже на сервере {target.name}")
+        # Дальше project.server — целевой: пути, nginx и compose считаются для него
+        project.server = target
+        target_path = project.get_remote_path()
+        check_paths(source, source_path, target, target_path)
+        say(f"Переезд {project.slug}: {source.name}:{source_path} → {target.name}:{target_path}\n")
+
+        if old_status != "new":
+            with track_phase(dep, "preflight"):
+                on_source(preflight_script(project, target))
+            if running:
+                with track_phase(dep, "presync"):
+                    presync = on_source(sync_script(project, source_path, target, target_path),
+                                        timeout=PRESYNC_TIMEOUT)
+                    if project.tls:
+                        on_source(certificates_script(project, target))
+                with track_phase(dep, "build"):
+                    on_target(prepare_script(project, target_path))
+                with track_phase(dep, "stop"):
+                    say(f"\n--- STOP {source.name} ---\n")
+                    stopped = True
+                    on_source(stop_script(project, source_path))
+            else:
+                # Контейнеры не запущены: данные не меняются, хватит одного прохода
+                presync = ""
+            with track_phase(dep, "sync"):
+                sync = on_source(sync_script(project, source_path, target, target_path),
+                                 timeout=SSH_TIMEOUT if running else PRESYNC_TIMEOUT)
+            if running:
+                with track_phase(dep, "up"):
+                    on_target(start_script(project, target_path))
+
+            files, size = parse_rsync_stats(presync)
+            delta_files, delta_size = parse_rsync_stats(sync)
+            say(
+                f"\nrsync: первый проход — {format_size(size)} (файлов: {files}), "
+                f"финальный — {format_size(delta_size)} (файлов: {delta_files})\n"
+            )
+
+        # Лог на целевом сервере — другой файл: трафик читается с начала
+        project.traffic_log_inode, project.traffic_log_offset = None, 0
+        project.save(update_fields=["server", "traffic_log_inode", "traffic_log_offset"])
+    except Exception as e:
+        say(f"\nMIGRATE ERROR: {e}\n")
+        dep.status = "failed"
+        project.server = source
+        project.status = old_status
+        if stopped:
+            try:
+                on_source(start_script(project, source_path))
+                say(f"Проект снова запущен на {source.name}\n")
+            except Exception as restart_error:
+                say(f"Не удалось запустить проект на {source.name}: {restart_error}\n")
+                project.status = "failed"
+        logger.error(f"Ошибка переезда {project.slug} на {target.name}: {e}")
+        with track_phase(dep, "notify"):
+            notify_migration_failed(project, target, str(e))
+    else:
+        nginx_error = None
+        if running and project.domain:
+            try:
+                with track_phase(dep, "nginx"):
+                    say("\n--- NGINX ---\n" + deploy_nginx_config(project))
+                    # Один адрес — один nginx: конфиг целевого уже заменил исходный
+                    if source.ip_address == target.ip_address:
+                        pass
+                    elif dns_points_to(project.domain, target.ip_address):
+                        say(remove_nginx_config(project, server=source))
+                    else:
+                        # Старая A-запись ещё в кешах резолверов: источник проксирует на целевой
+                        say(deploy_forward_config(project, source, target))
+                        say(
+                            f"DNS {project.domain} не указывает на {target.ip_address}: обновите A-запись, "
+                            f"затем снимите форвард — placement unforward {project.slug} {source.name}\n"
+                        )
+            except Exception as e:
+                nginx_error = e
+                say(
+                    f"\n--- NGINX ERROR ---\n{e}\n"
+                    f"Проект запущен на {target.name}, но домен не настроен. Каталог на {source.name} "
+                    f"сохранён: повторите деплой или переезд обратно на {source.name}, "
+                    f"лишнюю копию затем удалите вручную ({source_path})\n"
+                )
+                logger.error(f"Nginx после переезда {project.slug} не настроен, очистка {source.name} пропущена: {e}")
+
+        if old_status != "new" and nginx_error is None:
+            try:
+                with track_phase(dep, "cleanup"):
+                    cache = microcache_dir(project) if project.microcache else ""
+                    on_source(cleanup_script(project, source_path, cache))
+            except Exception as e:
+                say(f"\n--- CLEANUP ERROR ---\n{e}\n")
+                logger.warning(f"{source.name}: каталог {project.slug} не очищен: {e}")
+
+        dep.status = "success" if nginx_error is None else "failed"
+        project.status = "active" if old_status == "failed" else old_status
+        if running:
+            project.sleeping_since = None
+        downtime = sum(dep.timings.get(phase, 0) for phase in ("stop", "sync", "up")) if running else 0
+        dep.timings["downtime"] = round(downtime, 3)
+        with track_phase(dep, "notify"):
+            if nginx_error is None:
+                say(f"\nПереезд завершён, простой {downtime:.1f} с\n")
+                notify_migrated(project, source, downtime)
+            else:
+                notify_migration_failed(project, target, f"nginx не настроен: {nginx_error}", source=source)
+
+    _finish_deployment(dep, "".join(log), stream)
+    project.save(update_fields=["status", "sleeping_since"])
+    publish_project_status(project)
+
+    if project.status != old_status:
+        notify_status_change(project, old_status, project.status)
+
+
+@shared_task
+def restore_project_task(project_id: int, deployment_id: int = None, backup_id: int = None,
+                         target_id: int = None):
+    """
+    Восстанавливает проект из резервной копии на его сервер или на target
+    (сервер вышел из строя). Данные на сервере заменяются содержимым копии.
+    Копия и сервер проверяются до начала: негодная копия не трогает ни
+    сервер, ни статус проекта. suspended и grace после восстановления
+    сохраняются — восстановление не обходит биллинг.
+    """
+    project = Project.objects.select_related("server").get(id=project_id)
+    if project.status == "deploying":
+        logger.warning(f"Проект {project.slug} деплоится, восстановление пропущено")
+        if deployment_id:
+            Deployment.objects.filter(id=deployment_id, status="pending").update(
+                status="skipped",
+                finished_at=timezone.now(),
+                log="Пропущено: проект деплоится",
+            )
+            bump("deployments")
+        return f"Проект {project.slug} деплоится"
+
+    source = project.server
+    try:
+        backup = Backup.objects.get(id=backup_id, project=project)
+        if target_id and target_id != source.id:
+            project.server = Server.objects.get(id=target_id)
+        # Путь проекта — на том сервере, куда восстанавливаем
+        script = restore_script(backup, project)
+    except (Backup.DoesNotExist, Server.DoesNotExist, BackupError) as e:
+        project.server = source
+        error = str(e)
+        logger.error(f"Восстановление {project.slug} не начато: {error}")
+        if deployment_id:
+            Deployment.objects.filter(id=deployment_id, status="pending").update(
+                status="failed",
+                finished_at=timezone.now(),
+                log=f"RESTORE ERROR: {error}\nСервер и статус проекта не менялись\n",
+            )
+            bump("deployments")
+        notify_restore_failed(project, error)
+        return error
+
+    old_status = project.status
+    project.status = "deploying"
+    project.save(update_fields=["status"])
+
+    dep = _start_deployment(project, "restore", deployment_id)
+
+    log = []
+    stream = LogStreamer(dep)
+
+    def say(text: str):
+        log.append(text)
+        stream.write(text)
+
+    s = project.server
+    try:
+        say(f"Восстановление {project.slug} на {s.name} из копии #{backup.id}\n")
+        with track_phase(dep, "restore"):
+            log.append(run_ssh(s.ip_address, s.ssh_user, s.ssh_port, script,
+                               timeout=BACKUP_TIMEOUT, on_output=stream, stdin=secrets()))
+        if old_status == "suspended":
+            # Копия поднимает контейнеры (дампы грузятся в запущенные базы); приостановленный остаётся остановленным
+            with track_phase(dep, "stop"):
+                log.append(run_ssh(s.ip_address, s.ssh_user, s.ssh_port,
+                                   f"set -e\ncd {project.get_remote_path()}\n"
+                                   f"docker compose {compose_files(project)} stop\n",
+                                   on_output=stream))
+        if project.server_id != source.id:
+            # Лог на новом сервере — другой файл: трафик читается с начала
+            project.traffic_log_inode, project.traffic_log_offset = None, 0
+            project.save(update_fields=["server", "traffic_log_inode", "traffic_log_offset"])
+    except Exception as e:
+        say(f"\nRESTORE ERROR: {e}\n")
+        dep.status = "failed"
+        project.server = source
+        # Данные на сервере уже могли быть заменены частично
+        project.status = "failed"
+        logger.error(f"Ошибка восстановления {project.slug}: {e}")
+        with track_phase(dep, "notify"):
+            notify_restore_failed(project, str(e))
+    else:
+        if project.domain and old_status != "suspended":
+            try:
+                with track_phase(dep, "nginx"):
+                    say("\n--- NGINX ---\n" + deploy_nginx_config(project))
+            except Exception as e:
+                say(f"\n--- NGINX ERROR ---\n{e}\n")
+                logger.warning(f"Nginx после восстановления {project.slug} не настроен: {e}")
+        dep.status = "success"
+        project.status = old_status if old_status in ("suspended", "grace") else "active"
+        project.sleeping_since = None
+        with track_phase(dep, "notify"):
+            notify_restored(project, backup)
+
+    _finish_deployment(dep, "".join(log), stream)
+    project.save(update_fields=["status", "sleeping_since"])
+    publish_project_status(project)
+
+    if project.status != old_status:
+        notify_status_change(project, old_status, project.status)
+
+
+@shared_task
+def sleep_project_task(project_id: int, deployment_id: int = None):
+    """
+    Останавливает простаивающий проект и ставит nginx-конфиг пробуждения.
+    Простой перепроверяется на сервере: запрос после find_idle_projects
+    отменяет усыпление.
+    """
+    project = Project.objects.select_related("server").get(id=project_id)
+    dep = _start_deployment(project, "sleep", deployment_id)
+    s = project.server
+
+    log = ""
+    stream = LogStreamer(dep)
+    try:
+        if project.sleeping_since or project.status not in ("active", "grace"):
+            reason = "уже спит" if project.sleeping_since else project.get_status_display()
+            log = f"Не усыпляем: {reason}\n"
+            stream.write(log)
+        else:
+            with track_phase(dep, "stop"):
+                log = run_ssh(s.ip_address, s.ssh_user, s.ssh_port, sleep_script(project), on_output=stream)
+            if "ZEA_AWAKE" not in log:
+                project.sleeping_since = timezone.now()
+                project.save(update_fields=["sleeping_since"])
+                logger.info(f"Проект {project.slug} уснул")
+        dep.status = "success"
+    except Exception as e:
+        log += f"\nSLEEP ERROR: {e}"
+        stream.write(f"\nSLEEP ERROR: {e}")
+        dep.status = "failed"
+        logger.error(f"Ошибка усыпления {project.slug}: {e}")
+
+    _finish_deployment(dep, log, stream)
+    publish_project_status(project)
+
+
+@shared_task
+def wake_project_task(project_id: int, deployment_id: int = None):
+    """
+    Быстрый resume спящего проекта: up без сборки, ожидание ответа
+    приложения и обычный nginx-конфиг — за одну SSH-сессию.
+    """
+    project = Project.objects.select_related("server").get(id=project_id)
+    dep = _start_deployment(project, "wake", deployment_id)
+    s = project.server
+
+    log = ""
+    stream = LogStreamer(dep)
+    try:
+        if not project.sleeping_since or project.status == "deploying":
+            log = f"Проект не спит ({project.get_status_display()}), будить нечего\n"
+            stream.write(log)
+        else:
+            with track_phase(dep, "up"):
+                log = run_ssh(s.ip_address, s.ssh_user, s.ssh_port, wake_script(project), on_output=stream)
+            if project.tls:
+                save_cert_dates(log)
+            slept = (timezone.now() - project.sleeping_since).total_seconds()
+            project.sleeping_since = None
+            project.save(update_fields=["sleeping_since"])
+            logger.info(f"Проект {project.slug} проснулся за {dep.timings['up']:.1f}с (спал {slept / 60:.0f} мин)")
+        dep.status = "success"
+    except Exception as e:
+        log += f"\nWAKE ERROR: {e}"
+        stream.write(f"\nWAKE ERROR: {e}")
+        dep.status = "failed"
+        logger.error(f"Ошибка пробуждения {project.slug}: {e}")
+
+    _finish_deployment(dep, log, stream)
+    publish_project_status(project)
+
+
+@shared_task
+@fenced
+def sleep_idle_projects_task():
+    """Усыпляет проекты без запросов дольше их idle_timeout (beat, раз в 5 минут)."""
+    if not WAKE_BASE_URL:
+        return {"sleeping": [], "errors": {}}
+    idle, errors = find_idle_projects()
+    for name, error in errors.items():
+        logger.warning(f"Простой проектов {name} не проверен: {error}")
+    busy = set(
+        Deployment.objects.filter(project__in=idle, status__in=["pending", "running"])
+        .values_list("project_id", flat=True)
     )
+    queued = []
+    for project in idle:
+        if project.id not in busy:
+            enqueue_sleep(project.id)
+            queued.append(project.slug)
+    return {"sleeping": queued, "errors": errors}
+
+
+@shared_task(ignore_result=True)
+@fenced
+def process_billing_events_task():
+    """Выполняет наступившие события биллинга (запускается beat раз в минуту)."""
+    processed = pop_due_events()
+    if processed:
+        logger.info(f"Событий биллинга выполнено: {processed}")
+    return processed
+
 
-    for project in projects_grace_expired:
-        suspend_project_task.delay(project.id)
-        logger.info(f"Проект {project.slug} → SUSPEND (grace истёк)")
+@shared_task
+@fenced
+def check_billing_task():
+    """
+    Ежедневная сверка биллинга: создаёт недостающие события (проекты,
+    изменённые в обход save(), или до появления событий) и сразу выполняет
+    наступившие. Сами переходы делает process_billing_events_task.
+    """
+    projects = Project.objects.filter(
+        Q(paid_until__isnull=False) | Q(status="grace")
+    ).only("id", "slug", "status", "paid_until", "grace_until")
+    for project in projects.iterator():
+        schedule_billing_events(project, reset=False)
+    return pop_due_events()
+
+
+@shared_task
+@fenced
+def collect_capacity_task():
+    """Снимает ресурсы серверов для планировщика (beat, раз в 15 минут)."""
+    errors = collect_capacity()
+    for name, error in errors.items():
+        logger.warning(f"Ресурсы {name} не собраны: {error}")
+    return errors
+
+
+@shared_task
+@fenced
+def collect_traffic_task():
+    """Дочитывает access-логи проектов в часовые корзины трафика (beat, раз в 5 минут)."""
+    errors = collect_traffic()
+    for name, error in errors.items():
+        logger.warning(f"Трафик {name} не собран: {error}")
+    deleted = prune_traffic()
+    if deleted:
+        logger.info(f"Удалено старых корзин трафика: {deleted}")
+    return errors
+
+
+# acks_late=False: копирование может идти дольше visibility_timeout брокера,
+# иначе Redis выдал бы ту же задачу второму воркеру посреди работы
+@shared_task(acks_late=False)
+@fenced
+def backup_projects_task(project_ids: list = None):
+    """
+    Резервные копии проектов (beat, раз в сутки). Отдельная очередь backups:
+    копирование идёт часами и не должно задерживать сбор метрик и продление
+    сертификатов в maintenance.
+    """
+    projects = None
+    if project_ids is not None:
+        projects = Project.objects.select_related("server").filter(id__in=project_ids)
+    backups = backup_projects(projects)
+    failed = [b for b in backups if b.status == "failed"]
+    if failed:
+        notify_backups_failed(failed)
+    return {"total": len(backups), "failed": [b.project.slug for b in failed]}
+
+
+@shared_task
+@fenced
+def renew_certificates_task():
+    """
+    Ежедневное продление сертификатов. Проекты группируются по серверу:
+    одна SSH-сессия и не больше одного reload nginx на сервер.
+    """
+    by_server = {}
+    for project in projects_to_renew():
+        by_server.setdefault(project.server, []).append(project)
+
+    failed = []
+    for server, projects in by_server.items():
+        try:
+            result = renew_server_certificates(server, projects)
+        except Exception as e:
+            logger.error(f"TLS {server.name}: продление не выполнено: {e}")
+            failed += [p.slug for p in projects]
+            continue
+        failed += result["failed"]
+
+    if failed:
+        notify_telegram_async(f"🔒 Не удалось продлить сертификаты: {', '.join(failed)}")
+    return {"servers": len(by_server), "failed": failed}
+
+
+@shared_task
+@fenced
+def prune_task_profiles_task():
+    """Удаляет профили задач старше TASK_PROFILE_RETENTION_DAYS (beat, раз в сутки)."""
+    deleted = prune_profiles()
+    if deleted:
+        logger.info(f"Удалено старых профилей задач: {deleted}")
+    return deleted
+
+
+@shared_task(ignore_result=True)
+def send_telegram_task(message: str):
+    """Отправляет Telegram уведомление из очереди notifications."""
+    notify_telegram(message)
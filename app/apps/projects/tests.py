@@ -1,3 +1,1338 @@
-from django.test import TestCase
+import asyncio
+import importlib
+import os
+import subprocess
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from cryptography.fernet import Fernet
+from django.conf import settings
+from django.contrib import admin as django_admin
+from django.core.management import CommandError, call_command
+from django.db.models import Q
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from .models import Backup, Deployment, EnvVersion, Project, Server, log_search_vector
+from . import views
+from .management.commands import startup
+from .services.env_store import (
+    EnvDecryptError,
+    checksum,
+    decrypt,
+    diff_env,
+    diff_summary,
+    encrypt,
+    env_write_command,
+    normalize,
+)
+from .services import (
+    backup,
+    billing,
+    fleet,
+    git_mirror,
+    idle,
+    leader,
+    live,
+    log_search,
+    metrics,
+    nginx_config,
+    page_cache,
+    profiling,
+    resources,
+    stats,
+    traffic,
+    webhooks,
+)
+from .services.idle import parse_idle, wake_token
+from .services.ssh_exec import SSHCommandError
+from .services.migrate import MigrationError, check_paths, parse_rsync_stats
+from .services.placement import estimate, parse_capacity, score_server
+from .services.nginx_config import (
+    NGINX_CACHE_DIR,
+    NGINX_LOG_DIR,
+    NGINX_PROFILES,
+    generate_forward_config,
+    generate_nginx_config,
+)
+from .services.tls import ACME_WEBROOT, LETSENCRYPT_DIR, parse_cert_dates
+
+
+def make_project(**kwargs):
+    server = Server(name="test", ip_address="10.0.0.1", base_path="/srv/projects")
+    fields = {"slug": "shop", "domain": "shop.example.com", "internal_port": 9005}
+    fields.update(kwargs)
+    return Project(server=server, **fields)
+
+
+NOW = datetime(2026, 10, 19, 12, 0, tzinfo=dt_timezone.utc)
+
+
+def ago(seconds):
+    return NOW - timedelta(seconds=seconds)
+
+
+class QueueRoutingTests(SimpleTestCase):
+    def route(self, name):
+        from core.celery import app
+
+        return app.amqp.router.route({}, name)["queue"].name
+
+    def test_every_task_has_a_queue(self):
+        from celery import Task
+
+        from . import tasks
+
+        queues = {queue.name for queue in settings.CELERY_TASK_QUEUES}
+        names = [obj.name for obj in vars(tasks).values() if isinstance(obj, Task)]
+        self.assertIn("apps.projects.tasks.deploy_project_task", names)
+        for name in names:
+            # Без явного маршрута задача молча уйдёт в очередь по умолчанию
+            self.assertIn(name, settings.CELERY_TASK_ROUTES)
+            self.assertIn(self.route(name), queues)
+
+    def test_enqueue_queue_and_priority(self):
+        from . import tasks
+
+        cases = [
+            (tasks.enqueue_deploy, tasks.deploy_project_task, "deploy", tasks.PRIORITY_NORMAL),
+            (tasks.enqueue_suspend, tasks.suspend_project_task, "suspend", tasks.PRIORITY_NORMAL),
+            (tasks.enqueue_resume, tasks.resume_project_task, "resume", tasks.PRIORITY_HIGH),
+            (tasks.enqueue_apply_env, tasks.apply_env_task, "env", tasks.PRIORITY_HIGH),
+            (tasks.enqueue_sleep, tasks.sleep_project_task, "sleep", tasks.PRIORITY_LOW),
+            (tasks.enqueue_wake, tasks.wake_project_task, "wake", tasks.PRIORITY_HIGH),
+        ]
+        for enqueue, task, action, priority in cases:
+            with self.subTest(action=action), \
+                    mock.patch.object(tasks.Deployment.objects, "create",
+                                      side_effect=lambda **fields: Deployment(id=1, **fields)) as create, \
+                    mock.patch.object(task, "apply_async") as send, \
+                    mock.patch.object(tasks, "publish_deployment"):
+                dep = enqueue(3)
+                create.assert_called_once_with(project_id=3, action=action, status="pending", priority=priority)
+                self.assertEqual(send.call_args.kwargs["priority"], priority)
+                # Очередь в ETA (Deployment.queue) совпадает с маршрутом Celery
+                self.assertEqual(self.route(task.name), dep.queue)
+
+
+class QueueStatsTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch("django.utils.timezone.now", return_value=NOW)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def annotate(self, deployments, queued):
+        with mock.patch.object(stats.Deployment.objects, "filter") as filter_:
+            filter_.return_value.only.return_value = queued
+            return stats.annotate_queue(deployments, averages={"deploy": 300, "suspend": 15})
+
+    def test_track_phase_records_failed_phase(self):
+        dep = Deployment()
+        with self.assertRaises(RuntimeError), stats.track_phase(dep, "build"):
+            raise RuntimeError("docker")
+
+        self.assertIn("build", dep.timings)
+
+    def test_format_duration(self):
+        self.assertEqual([stats.format_duration(s) for s in (None, -5, 42.9, 120.5, 7300)],
+                         ["—", "0 с", "42 с", "2 мин 0 с", "2 ч 1 мин"])
+
+    def test_queue_position_and_eta(self):
+        running = Deployment(id=1, action="deploy", status="running", priority=5,
+                             enqueued_at=ago(160), started_at=ago(100))
+        normal = Deployment(id=2, action="deploy", status="pending", priority=5, enqueued_at=ago(50))
+        urgent = Deployment(id=3, action="deploy", status="pending", priority=1, enqueued_at=ago(10))
+        other_queue = Deployment(id=4, action="suspend", status="pending", priority=0, enqueued_at=ago(90))
+        done = Deployment(id=5, action="deploy", status="success", enqueued_at=ago(900),
+                          started_at=ago(870), finished_at=ago(600))
+        queued = [running, normal, urgent, other_queue]
+
+        self.annotate([running, normal, urgent, done], queued)
+
+        self.assertEqual((running.queue_position, running.eta_seconds), (0, 200))
+        self.assertEqual(running.queue_wait_display, "1 мин 0 с")
+        # Срочный деплой обгоняет обычный; suspend в другой очереди не мешает
+        self.assertEqual((urgent.queue_position, urgent.eta_seconds), (1, 200 + 300))
+        self.assertEqual((normal.queue_position, normal.eta_seconds), (2, 200 + 300 + 300))
+        self.assertEqual(normal.eta_display, "13 мин 20 с")
+        self.assertEqual(normal.queue_wait_display, "—")
+        self.assertEqual(done.duration_display, "4 мин 30 с")
+        self.assertFalse(hasattr(done, "queue_position"))
+
+        with mock.patch.dict(stats.QUEUE_CONCURRENCY, {"deploy": 2}):
+            self.annotate([normal], queued)
+        self.assertEqual(normal.eta_seconds, (200 + 300) / 2 + 300)
+
+    def test_finished_only_skips_queue_query(self):
+        done = Deployment(id=5, action="deploy", status="failed", enqueued_at=ago(60), started_at=ago(50))
+        with mock.patch.object(stats.Deployment.objects, "filter") as filter_:
+            stats.annotate_queue([done])
+
+        filter_.assert_not_called()
+        self.assertEqual(done.queue_wait_display, "10 с")
+
+
+class MetricsTests(SimpleTestCase):
+    def test_render(self):
+        objects = mock.MagicMock()
+        histogram = objects.filter.return_value.annotate.return_value.values.return_value.annotate.return_value
+        buckets = {f"le_{b}": 1 for b in metrics.DURATION_BUCKETS}
+        histogram.order_by.side_effect = [
+            [{"action": "deploy", "_count": 2, "_sum": timedelta(seconds=90.5), **buckets}],
+            [],
+        ]
+        objects.values.return_value.annotate.return_value.order_by.return_value = [
+            {"action": "deploy", "status": "failed", "n": 1},
+        ]
+        recent = objects.filter.return_value.values.return_value.annotate.return_value
+        recent.order_by.return_value = [{"action": "deploy", "total": 4, "failed": 1}]
+        recent.__iter__.return_value = iter([{"action": "wake", "status": "pending", "n": 3}])
+        objects.filter.return_value.exclude.return_value.order_by.return_value.values_list.return_value \
+            .__getitem__.return_value = [{"git": 2, "build": 60}, {"git": 4}]
+
+        with mock.patch.object(metrics.Deployment, "objects", objects), \
+                mock.patch.object(metrics, "average_durations", return_value={"deploy": 120.0}), \
+                mock.patch.object(metrics, "leaders", return_value={}), \
+                mock.patch.object(metrics, "task_ranking", return_value=[]):
+            lines = metrics.render_metrics().splitlines()
+
+        for line in (
+            "# TYPE zea_deployment_duration_seconds histogram",
+            'zea_deployment_duration_seconds_bucket{action="deploy",le="5"} 1',
+            'zea_deployment_duration_seconds_bucket{action="deploy",le="+Inf"} 2',
+            'zea_deployment_duration_seconds_sum{action="deploy"} 90.500',
+            'zea_deployment_duration_seconds_count{action="deploy"} 2',
+            "# TYPE zea_deployment_queue_wait_seconds histogram",
+            'zea_deployments_total{action="deploy",status="failed"} 1',
+            'zea_deployment_failure_ratio{action="deploy"} 0.2500',
+            'zea_queue_depth{queue="lifecycle",state="pending"} 3',
+            'zea_queue_depth{queue="deploy",state="running"} 0',
+            'zea_deployment_phase_avg_seconds{phase="build"} 60.000',
+            'zea_deployment_phase_avg_seconds{phase="git"} 3.000',
+            'zea_deployment_expected_seconds{action="deploy"} 120.000',
+        ):
+            self.assertIn(line, lines)
+        self.assertFalse([line for line in lines if line.startswith("zea_deployment_queue_wait_seconds_")])
+
+
+class LiveEventsTests(SimpleTestCase):
+    def test_dispatch(self):
+        broadcaster = live.Broadcaster()
+        dashboard, shop, full = asyncio.Queue(), asyncio.Queue(), asyncio.Queue(maxsize=1)
+        broadcaster.clients = {dashboard: None, shop: 7, full: 7}
+        full.put_nowait({})
+
+        for payload in (
+            {"event": "status", "project_id": 7},
+            {"event": "log", "project_id": 7, "chunk": "ok"},
+            {"event": "deployment", "project_id": 8},
+        ):
+            broadcaster._dispatch(payload)
+
+        # Dashboard не получает логи, страница проекта — чужие события; переполненная очередь не мешает
+        self.assertEqual([dashboard.get_nowait()["event"] for _ in range(dashboard.qsize())], ["status", "deployment"])
+        self.assertEqual([shop.get_nowait()["event"] for _ in range(shop.qsize())], ["status", "log"])
+        self.assertEqual(full.qsize(), 1)
+
+    def test_sse_stream(self):
+        broadcaster = live.Broadcaster()
+
+        async def listen():
+            pass
+
+        async def consume():
+            stream = views._sse_stream(7)
+            chunks = [await anext(stream)]
+            broadcaster._dispatch({"event": "log", "project_id": 7, "chunk": "сборка"})
+            chunks.append(await anext(stream))
+            chunks.append(await anext(stream))
+            self.assertEqual(len(broadcaster.clients), 1)
+            await stream.aclose()
+            return chunks
+
+        with mock.patch.object(views, "broadcaster", broadcaster), \
+                mock.patch.object(views, "SSE_KEEPALIVE", 0.01), \
+                mock.patch.object(broadcaster, "_listen", listen):
+            chunks = asyncio.run(consume())
+
+        self.assertEqual(chunks, [
+            "retry: 3000\n\n",
+            'event: log\ndata: {"event": "log", "project_id": 7, "chunk": "сборка"}\n\n',
+            ": keepalive\n\n",
+        ])
+        self.assertEqual(broadcaster.clients, {})
+
+    def test_wsgi_gets_no_stream(self):
+        response = asyncio.run(views._sse_response(RequestFactory().get("/events/"), None))
+        self.assertEqual(response.status_code, 204)
+
+    def test_log_streamer_batches(self):
+        streamer = live.LogStreamer(Deployment(id=3, project_id=7))
+        with mock.patch.object(live, "publish") as publish:
+            streamer("step 1\n")
+            publish.assert_not_called()
+            streamer.write("== build ==\n")
+        publish.assert_called_once_with(7, "log", {"deployment_id": 3, "chunk": "step 1\n== build ==\n"})
+
+    def test_publish_backs_off_without_redis(self):
+        with mock.patch.object(live, "_disabled_until", 0.0), \
+                mock.patch.object(live, "_get_redis", side_effect=ConnectionError("redis down")) as get_redis:
+            with self.assertLogs(live.logger, "WARNING"):
+                live.publish(7, "status", {})
+            live.publish(7, "status", {})
+        get_redis.assert_called_once()
+
+
+class StartupTests(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.static_root = root.name
+        self.fingerprints = {"migrations": "m1", "applied": 20, "static": "s1"}
+
+    def startup(self, *args):
+        out = StringIO()
+        with override_settings(STATIC_ROOT=self.static_root), \
+                mock.patch.object(startup.Command, "_wait_for_db"), \
+                mock.patch.object(startup, "migrations_fingerprint", return_value=self.fingerprints["migrations"]), \
+                mock.patch.object(startup, "applied_migrations", return_value=self.fingerprints["applied"]), \
+                mock.patch.object(startup, "static_fingerprint", return_value=self.fingerprints["static"]), \
+                mock.patch.object(startup, "call_command") as call:
+            call_command("startup", *args, stdout=out)
+        return [c.args[0] for c in call.call_args_list], out.getvalue()
+
+    def test_skips_unchanged(self):
+        self.assertEqual(self.startup()[0], ["migrate", "collectstatic"])
+        ran, out = self.startup()
+        self.assertEqual(ran, [])
+        self.assertIn("migrate: нет изменений, collectstatic: нет изменений", out)
+        self.assertEqual(self.startup("--force")[0], ["migrate", "collectstatic"])
+
+    def test_reruns_changed_phase(self):
+        self.startup()
+        self.fingerprints["static"] = "s2"
+        self.assertEqual(self.startup()[0], ["collectstatic"])
+        # Другое число применённых миграций — БД восстановлена из копии или откатана
+        self.fingerprints["applied"] = 18
+        self.assertEqual(self.startup()[0], ["migrate"])
+
+    def test_dry_run(self):
+        self.startup()
+        self.fingerprints["migrations"] = "m2"
+        for _ in range(2):
+            ran, out = self.startup("--dry-run")
+            self.assertEqual(ran, [])
+            self.assertIn("migrate: да, collectstatic: нет изменений (dry-run)", out)
+
+    def test_migrations_fingerprint_stable(self):
+        self.assertEqual(startup.migrations_fingerprint(), startup.migrations_fingerprint())
+
+    def test_wait_for_db(self):
+        from django.db import OperationalError
+
+        command = startup.Command(stdout=StringIO())
+        connection = mock.Mock()
+        connection.ensure_connection.side_effect = [OperationalError("starting up"), None]
+        with mock.patch.object(startup.time, "sleep") as sleep:
+            command._wait_for_db(connection, timeout=5)
+        sleep.assert_called_once_with(0.1)
+
+        connection.ensure_connection.side_effect = OperationalError("refused")
+        with self.assertRaises(CommandError):
+            command._wait_for_db(connection, timeout=0)
+
+
+class DatabaseSettingsTests(SimpleTestCase):
+    def default_db(self, **env):
+        from core.project_settings import database
+
+        self.addCleanup(importlib.reload, database)
+        with mock.patch.dict(os.environ, env):
+            return importlib.reload(database).DATABASES["default"]
+
+    def test_web_uses_pool(self):
+        db = self.default_db(ZEA_PROCESS_TYPE="web", DB_POOL_MAX_SIZE="8")
+        self.assertEqual(db["OPTIONS"]["pool"]["max_size"], 8)
+        # Пул и постоянные соединения Django вместе не допускает
+        self.assertNotIn("CONN_MAX_AGE", db)
+        self.assertTrue(db["CONN_HEALTH_CHECKS"])
+
+    def test_long_running_processes_keep_connection(self):
+        for process_type in ("worker", "beat", "bot"):
+            with self.subTest(process_type=process_type):
+                db = self.default_db(ZEA_PROCESS_TYPE=process_type, DB_CONN_MAX_AGE="120")
+                self.assertEqual(db["CONN_MAX_AGE"], 120)
+                self.assertNotIn("pool", db["OPTIONS"])
+
+    def test_sse_returns_connection_before_streaming(self):
+        from django.core.handlers.wsgi import WSGIRequest
+
+        # Поток SSE бесконечный: соединение из пула отдаётся до начала стрима, а не по request_finished
+        with mock.patch.object(views, "ASGIRequest", WSGIRequest), \
+                mock.patch.object(views, "close_old_connections") as close:
+            response = asyncio.run(views._sse_response(RequestFactory().get("/events/"), iter(["retry: 3000\n\n"])))
+        close.assert_called_once_with()
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+
+
+class LogSearchTests(SimpleTestCase):
+    def test_search_uses_index_expression(self):
+        query = log_search.search_deployments('"connection refused" -timeout').query
+
+        # Иначе Postgres не возьмёт GIN-индекс deployment_log_search_idx
+        self.assertEqual(query.annotations["log_search"], log_search_vector())
+        self.assertEqual(query.where.children[0].rhs, log_search.search_query('"connection refused" -timeout'))
+        self.assertEqual(query.deferred_loading, (frozenset({"log"}), True))
+        self.assertEqual(query.order_by, ("-enqueued_at",))
+
+    def test_headlines_escape_log(self):
+        rows = [(1, "<script>alert(1)</script> \x02error\x03: a & 'b'"), (2, None)]
+        with mock.patch.object(log_search.Deployment.objects, "filter") as filter_:
+            filter_.return_value.annotate.return_value.values_list.return_value = rows
+            deployments = [Deployment(id=1), Deployment(id=2)]
+
+            self.assertEqual(log_search.headlines(deployments, "error"), {
+                1: "&lt;script&gt;alert(1)&lt;/script&gt; <mark>error</mark>: a &amp; &#x27;b&#x27;",
+                2: "",
+            })
+            self.assertEqual(log_search.headlines(deployments, "error", markup="b")[1],
+                             "&lt;script&gt;alert(1)&lt;/script&gt; <b>error</b>: a &amp; &#x27;b&#x27;")
+        self.assertEqual(log_search.headlines([], "error"), {})
+
+
+class ResourceLimitsTests(SimpleTestCase):
+    def test_override(self):
+        project = make_project(cpu_limit=Decimal("1.50"), memory_limit_mb=256, pids_limit=100, cpu_shares=512)
+
+        self.assertEqual(resources.render_compose_override(project, ["web", "worker"]), (
+            "# Сгенерировано ZeaControl для shop, не редактировать вручную\n"
+            "services:\n"
+            "  web:\n"
+            "    cpus: 1.50\n    cpu_shares: 512\n    mem_limit: 256m\n    memswap_limit: 256m\n    pids_limit: 100\n"
+            "  worker:\n"
+            "    cpus: 1.50\n    cpu_shares: 512\n    mem_limit: 256m\n    memswap_limit: 256m\n    pids_limit: 100\n"
+        ))
+        self.assertTrue(resources.render_compose_override(project, []).endswith("services: {}\n"))
+        self.assertEqual(resources.parse_services("web\nworker\nWARN[0000] x y\n"), ["web", "worker"])
+
+    def test_override_command(self):
+        limited = make_project(memory_limit_mb=256)
+        with tempfile.TemporaryDirectory() as tmp:
+            run = lambda command: subprocess.run(
+                ["sh", "-e", "-c", command], cwd=tmp, capture_output=True, text=True, check=True,
+            ).stdout.strip()
+            files = lambda project: run(f"echo {resources.compose_files(project)}")
+            path = os.path.join(tmp, resources.OVERRIDE_FILE)
+
+            # Лимиты заданы, но деплоя ещё не было: override нет, compose работает без него
+            self.assertEqual(files(limited), "-f docker-compose.prod.yml")
+
+            run(resources.override_command(limited, ["web"]))
+            with open(path) as f:
+                self.assertEqual(f.read(), resources.render_compose_override(limited, ["web"]))
+            self.assertEqual(files(limited), f"-f docker-compose.prod.yml -f {resources.OVERRIDE_FILE}")
+
+            # Лимиты сняли — устаревший override удаляется и больше не передаётся compose
+            self.assertEqual(files(make_project()), "-f docker-compose.prod.yml")
+            run(resources.override_command(make_project(), ["web"]))
+            self.assertFalse(os.path.exists(path))
+
+    def test_build_command(self):
+        plain = resources.build_command(make_project())
+        self.assertEqual(plain, "nice -n 19 ionice -c 3 docker compose -f docker-compose.prod.yml build")
+
+        command = resources.build_command(make_project(build_cpu_limit=Decimal("1.5"), build_memory_mb=2048))
+        self.assertIn("BUILDER_OPTS='default-load=true,memory=2048m,memory-swap=2048m,"
+                      "cpu-period=100000,cpu-quota=150000'", command)
+        self.assertTrue(command.endswith(f"{plain} --builder zea-shop"))
+        self.assertIn("docker compose -f docker-compose.prod.yml $([ ! -f docker-compose.zea.yml ]",
+                      resources.build_command(make_project(cpu_limit=Decimal(1))))
+        subprocess.run(["sh", "-n", "-c", command], check=True)
+
+    def test_capacity_errors(self):
+        server = Server(name="s", cpu_cores=2, memory_mb=2560)
+        fits = make_project(cpu_limit=Decimal(1), memory_limit_mb=512, compose_services=2)
+        self.assertEqual(resources.capacity_errors(server, [fits, make_project(slug="blog")]), [])
+        self.assertEqual(resources.capacity_errors(Server(name="unknown"), [make_project(cpu_limit=Decimal(64))]), [])
+
+        errors = resources.capacity_errors(server, [
+            fits,
+            make_project(slug="big", cpu_limit=Decimal(3), memory_limit_mb=1536, build_memory_mb=4096),
+        ])
+        self.assertEqual(errors, [
+            "big: CPU 3 больше, чем ядер на сервере (2)",
+            "Сумма лимитов CPU 5 больше допустимой 4 (2 ядер × 2)",
+            "big: память сборки 4096 МБ больше доступной (2048 МБ)",
+            "Сумма лимитов памяти 2560 МБ больше доступной 2048 МБ (2560 МБ − 512 МБ на систему)",
+        ])
+
+
+class NginxConfigTests(SimpleTestCase):
+    def test_no_domain(self):
+        self.assertEqual(generate_nginx_config(make_project(domain="")), "")
+
+    def test_unknown_profile_falls_back_to_default(self):
+        self.assertEqual(
+            generate_nginx_config(make_project(nginx_profile="missing")),
+            generate_nginx_config(make_project(nginx_profile="default")),
+        )
+
+    def test_default_profile(self):
+        config = generate_nginx_config(make_project(nginx_profile="default"))
+
+        self.assertIn("upstream zea_shop {\n    server 127.0.0.1:9005;\n    keepalive 16;\n}", config)
+        self.assertIn("proxy_pass http://zea_shop;", config)
+        self.assertIn("proxy_http_version 1.1;", config)
+        self.assertIn('proxy_set_header Connection "";', config)
+        self.assertIn("client_max_body_size 50M;", config)
+        self.assertIn("proxy_read_timeout 300s;", config)
+        self.assertIn("gzip on;", config)
+        self.assertIn("open_file_cache max=1000 inactive=60s;", config)
+        self.assertIn('add_header Cache-Control "public, max-age=604800";', config)
+        self.assertIn('add_header Cache-Control "public, max-age=86400";', config)
+        self.assertNotIn("immutable", config)
+        self.assertNotIn("gzip_static", config)
+        self.assertIn("alias /srv/projects/shop/app/static/;", config)
+
+    def test_static_profile(self):
+        config = generate_nginx_config(make_project(nginx_profile="static"))
+
+        self.assertIn('add_header Cache-Control "public, max-age=31536000, immutable";', config)
+        self.assertIn('add_header Cache-Control "public, max-age=2592000";', config)
+        self.assertIn("gzip_static on;", config)
+        self.assertIn("open_file_cache max=10000 inactive=60s;", config)
+        self.assertIn("client_max_body_size 20M;", config)
+        self.assertIn("sendfile on;", config)
+
+    def test_api_profile(self):
+        config = generate_nginx_config(make_project(nginx_profile="api"))
+
+        self.assertIn("keepalive 64;", config)
+        self.assertIn("client_max_body_size 10M;", config)
+        self.assertIn("proxy_read_timeout 30s;", config)
+        self.assertIn("proxy_connect_timeout 5s;", config)
+        self.assertIn("gzip_types application/json", config)
+        self.assertNotIn("open_file_cache", config)
+
+    def test_project_overrides(self):
+        config = generate_nginx_config(
+            make_project(nginx_profile="api", client_max_body_mb=200, proxy_read_timeout=900)
+        )
+
+        self.assertIn("client_max_body_size 200M;", config)
+        self.assertIn("proxy_read_timeout 900s;", config)
+
+    def test_microcache_disabled_by_default(self):
+        config = generate_nginx_config(make_project())
+
+        self.assertNotIn("proxy_cache", config)
+
+    def test_microcache(self):
+        config = generate_nginx_config(
+            make_project(microcache=True, microcache_ttl=3, microcache_bypass_cookies="sessionid, bad-name jwt"),
+            cache_generation="42",
+        )
+
+        self.assertTrue(config.startswith(
+            f"proxy_cache_path {NGINX_CACHE_DIR}/shop levels=1:2 keys_zone=zea_cache_shop:10m"
+        ))
+        self.assertIn("proxy_cache zea_cache_shop;", config)
+        self.assertIn('proxy_cache_key "42|$scheme$request_method$host$request_uri";', config)
+        self.assertIn("proxy_cache_valid 200 301 302 3s;", config)
+        self.assertIn("proxy_cache_bypass $http_authorization $cookie_sessionid $cookie_jwt;", config)
+        self.assertIn("proxy_no_cache $http_authorization $cookie_sessionid $cookie_jwt;", config)
+        self.assertIn("proxy_cache_use_stale error timeout updating", config)
+        self.assertIn("proxy_cache_background_update on;", config)
+        self.assertNotIn("bad-name", config)
+
+    def test_microcache_generation_rotates_key(self):
+        project = make_project(microcache=True)
+
+        self.assertNotEqual(
+            generate_nginx_config(project, cache_generation="1"),
+            generate_nginx_config(project, cache_generation="2"),
+        )
+
+    def test_profiles_match_model_choices(self):
+        self.assertEqual(set(NGINX_PROFILES), {key for key, _ in Project.NGINX_PROFILE_CHOICES})
+
+    def test_braces_balanced(self):
+        for profile in NGINX_PROFILES:
+            for tls in (False, True):
+                config = generate_nginx_config(make_project(nginx_profile=profile, microcache=True, tls=tls))
+                self.assertEqual(config.count("{"), config.count("}"), (profile, tls))
+
+    def test_http_only(self):
+        config = generate_nginx_config(make_project())
+
+        self.assertIn(f"location /.well-known/acme-challenge/ {{\n        root {ACME_WEBROOT};", config)
+        self.assertNotIn("listen 443", config)
+        self.assertNotIn("return 301", config)
+
+    def test_tls(self):
+        config = generate_nginx_config(make_project(tls=True))
+        http, https = config.split("listen 443 ssl http2;")
+
+        self.assertIn("location /.well-known/acme-challenge/", http)
+        self.assertIn("return 301 https://$host$request_uri;", http)
+        self.assertNotIn("proxy_pass", http)
+        self.assertIn(f"ssl_certificate {LETSENCRYPT_DIR}/live/shop/fullchain.pem;", https)
+        self.assertIn(f"ssl_certificate_key {LETSENCRYPT_DIR}/live/shop/privkey.pem;", https)
+        self.assertIn("ssl_session_cache shared:zea_ssl:20m;", https)
+        self.assertIn("ssl_session_tickets off;", https)
+        self.assertIn("ssl_stapling on;", https)
+        self.assertIn("proxy_pass http://zea_shop;", https)
+
+    def test_tls_bootstrap(self):
+        project = make_project(tls=True)
+
+        self.assertEqual(generate_nginx_config(project, tls=False), generate_nginx_config(make_project()))
+
+
+class WebhookTests(SimpleTestCase):
+    BODY = b'{"ref": "refs/heads/main"}'
+
+    def _sign(self, secret="s3cret", body=BODY):
+        import hashlib
+        import hmac
+
+        return "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+    def test_verify_signature(self):
+        self.assertTrue(webhooks.verify_signature(self.BODY, self._sign(), "s3cret"))
+        self.assertFalse(webhooks.verify_signature(self.BODY + b" ", self._sign(), "s3cret"))
+        self.assertFalse(webhooks.verify_signature(self.BODY, self._sign("other"), "s3cret"))
+        self.assertFalse(webhooks.verify_signature(self.BODY, self._sign()[len("sha256="):], "s3cret"))
+        self.assertFalse(webhooks.verify_signature(self.BODY, "", "s3cret"))
+        # Без секрета вебхук не принимается, даже с «подписью» пустым ключом
+        self.assertFalse(webhooks.verify_signature(self.BODY, self._sign(""), ""))
+
+    def test_changed_paths(self):
+        payload = {"commits": [
+            {"added": ["app/a.py"], "modified": ["README.md"], "removed": []},
+            {"added": [], "modified": ["app/a.py"], "removed": ["old.txt"]},
+        ]}
+        self.assertEqual(webhooks.changed_paths(payload), {"app/a.py", "README.md", "old.txt"})
+        self.assertIsNone(webhooks.changed_paths({"commits": []}))
+        self.assertIsNone(webhooks.changed_paths({"commits": [{"added": ["x"]}] * webhooks.GITHUB_MAX_COMMITS}))
+
+    def test_paths_match(self):
+        self.assertTrue(webhooks.paths_match(None, "app/*", "*"))
+        self.assertFalse(webhooks.paths_match(set()))
+        self.assertTrue(webhooks.paths_match({"app/a.py"}))
+        self.assertFalse(webhooks.paths_match({"docs/guide/index.md", "README.md"}, exclude="docs/*\n*.md"))
+        self.assertTrue(webhooks.paths_match({"docs/x.md", "app/a.py"}, exclude="docs/*"))
+        self.assertTrue(webhooks.paths_match({"app/a.py"}, include="/app/*"))
+        self.assertFalse(webhooks.paths_match({"app/a.py"}, include="app/*", exclude="*.py"))
+        self.assertFalse(webhooks.paths_match({"web/a.py"}, include="app/*"))
+
+    def test_repo_full_name(self):
+        for url in ("https://github.com/Owner/Repo.git", "git@github.com:owner/repo.git", "https://github.com/owner/repo/"):
+            self.assertEqual(webhooks.repo_full_name(url), "owner/repo")
+        self.assertEqual(webhooks.repo_full_name("https://gitlab.com/owner/repo"), "")
+
+    def test_deploy_sent_after_commit(self):
+        from . import tasks
+
+        with mock.patch.object(tasks.Deployment.objects, "create", return_value=mock.Mock(id=1)), \
+                mock.patch.object(tasks.deploy_project_task, "apply_async") as send, \
+                mock.patch.object(tasks.transaction, "on_commit") as on_commit:
+            tasks.enqueue_deploy(3, countdown=5, wait_running=True, defer=True)
+            send.assert_not_called()
+            with mock.patch.object(tasks, "publish_deployment"):
+                on_commit.call_args.args[0]()
+        send.assert_called_once()
+        self.assertEqual(send.call_args.kwargs["kwargs"], {"deployment_id": 1, "wait_running": True})
+
+
+class CertDatesTests(SimpleTestCase):
+    def test_parse(self):
+        dates = parse_cert_dates(
+            "Nginx конфиг установлен\n"
+            "ZEA_CERT shop Jan  9 12:00:00 2027 GMT\n"
+            "ZEA_CERT blog \n"
+            "ZEA_CERT api garbage\n"
+        )
+
+        self.assertEqual(list(dates), ["shop"])
+        self.assertEqual(dates["shop"].isoformat(), "2027-01-09T12:00:00+00:00")
+
+
+class RenewCertificatesTaskTests(SimpleTestCase):
+    def test_failures_are_reported(self):
+        from . import tasks
+
+        ok, broken = make_project(slug="shop"), make_project(slug="blog")
+        # Проекты группируются по серверу: у сохранённых серверов есть id
+        ok.server = Server(id=1, name="a", ip_address="10.0.0.1")
+        broken.server = Server(id=2, name="b", ip_address="10.0.0.2")
+        with mock.patch.object(tasks, "projects_to_renew", return_value=[ok, broken]), \
+                mock.patch.object(tasks, "renew_server_certificates", side_effect=[
+                    {"renewed": ["shop"], "failed": []},
+                    RuntimeError("ssh: connection refused"),
+                ]), \
+                mock.patch.object(tasks, "notify_telegram_async") as notify, \
+                self.assertLogs(tasks.logger, "ERROR"):
+            result = tasks.renew_certificates_task.run()
+        self.assertEqual(result, {"servers": 2, "failed": ["blog"]})
+        self.assertIn("blog", notify.call_args.args[0])
+
+
+class GitMirrorTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        patcher = mock.patch.object(git_mirror, "GIT_MIRROR_DIR", os.path.join(self.tmp, "mirrors"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def git(self, cwd, *args):
+        return subprocess.run(
+            ["git", "-c", "user.name=zea", "-c", "user.email=zea@example.com", *args],
+            cwd=cwd, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+
+    def commit(self, repo, name):
+        with open(os.path.join(repo, name), "w") as f:
+            f.write(name)
+        self.git(repo, "add", name)
+        self.git(repo, "commit", "-q", "-m", name)
+        return self.git(repo, "rev-parse", "HEAD")
+
+    def test_mirror_path(self):
+        first = git_mirror.mirror_path("https://github.com/acme/shop.git")
+
+        self.assertEqual(first.parent, git_mirror.Path(self.tmp, "mirrors"))
+        self.assertRegex(first.name, r"^shop-[0-9a-f]{10}\.git$")
+        self.assertNotEqual(first, git_mirror.mirror_path("https://github.com/other/shop.git"))
+        self.assertRegex(git_mirror.mirror_path("https://example.com/a/мой репо/").name, r"^repo-[0-9a-f]{10}\.git$")
+
+    def test_thin_bundle(self):
+        upstream = os.path.join(self.tmp, "upstream")
+        os.mkdir(upstream)
+        self.git(upstream, "init", "-q", "-b", "main")
+        base = self.commit(upstream, "a.txt")
+        server = os.path.join(self.tmp, "server")
+        self.git(self.tmp, "clone", "-q", upstream, server)
+        head = self.commit(upstream, "b.txt")
+
+        mirror = git_mirror.mirror_path(upstream)
+        with git_mirror._locked(mirror):
+            sha = git_mirror.update_mirror(upstream, "main")
+        self.assertEqual(sha, head)
+        self.assertEqual(git_mirror.known_commits(mirror, [base, "f" * 40]), [base])
+        self.assertEqual(git_mirror.known_commits(mirror, []), [])
+
+        bundle = os.path.join(self.tmp, "repo.bundle")
+        self.assertFalse(git_mirror.create_bundle(mirror, "main", sha, [head], bundle))
+        self.assertTrue(git_mirror.create_bundle(mirror, "main", sha, [base], bundle))
+        # Thin bundle: база — коммит, который уже есть на сервере
+        with open(bundle, "rb") as f:
+            header = f.read().split(b"\n\n", 1)[0].decode()
+        self.assertIn(f"\n-{base}", header)
+        self.assertIn(f"\n{head} refs/heads/main", header)
+
+        project = make_project(github_repo=upstream, github_branch="main")
+        with open(bundle, "rb") as stdin:
+            subprocess.run(
+                ["sh", "-e", "-c", git_mirror.bundle_script(project, sha, os.path.getsize(bundle))],
+                cwd=server, stdin=stdin, capture_output=True, check=True,
+            )
+        self.assertEqual(self.git(server, "rev-parse", "HEAD"), head)
+        self.assertFalse(os.path.exists(os.path.join(server, git_mirror.REMOTE_BUNDLE)))
+
+
+class EnvStoreTests(SimpleTestCase):
+    def test_roundtrip(self):
+        token = encrypt("A=1\r\nB='два'  \n\n")
+
+        self.assertNotIn("A=1", token)
+        self.assertEqual(decrypt(EnvVersion(ciphertext=token)), "A=1\nB='два'\n")
+
+    def test_key_rotation(self):
+        old, new = Fernet.generate_key().decode(), Fernet.generate_key().decode()
+        with override_settings(ENV_ENCRYPTION_KEYS=[old]):
+            token = encrypt("A=1")
+        with override_settings(ENV_ENCRYPTION_KEYS=[new, old]):
+            self.assertEqual(decrypt(EnvVersion(ciphertext=token)), "A=1\n")
+        with override_settings(ENV_ENCRYPTION_KEYS=[new]):
+            with self.assertRaises(EnvDecryptError):
+                decrypt(EnvVersion(project=make_project(), ciphertext=token))
+
+    def test_checksum_ignores_formatting(self):
+        self.assertEqual(checksum("A=1\r\nB=2"), checksum("A=1\nB=2\n\n"))
+        self.assertNotEqual(checksum("A=1"), checksum("A=2"))
+
+    def test_diff(self):
+        diff = diff_env("A=1\nB=2\n# C=3\n", "export A=1\nB=20\nD=4\n")
+
+        self.assertEqual(diff, {"added": ["D"], "removed": [], "changed": ["B"]})
+        self.assertEqual(diff_summary(diff_env("A=1\nB=2", "B=3\nC=4")), "+C ~B −A")
+
+    def test_write_command(self):
+        text = "A='it''s' $HOME `id`\nB=\"x\\ny\"\n"
+        with tempfile.TemporaryDirectory() as tmp:
+            run = lambda: subprocess.run(
+                ["sh", "-c", env_write_command(text)], cwd=tmp, capture_output=True, text=True, check=True,
+            ).stdout
+
+            self.assertEqual(run().strip(), ".env обновлён")
+            self.assertEqual(run().strip(), ".env не изменился")
+            with open(f"{tmp}/.env") as f:
+                self.assertEqual(f.read(), normalize(text))
+
+
+class PlacementTests(SimpleTestCase):
+    def server(self, **kwargs):
+        fields = {"name": "s", "cpu_cores": 4, "memory_mb": 8704, "reserved_cpus": Decimal(0), "reserved_memory_mb": 0}
+        fields.update(kwargs)
+        return Server(**fields)
+
+    def test_estimate_uses_defaults_without_limits(self):
+        self.assertEqual(estimate(make_project()), (Decimal("0.5"), 512))
+        self.assertEqual(estimate(make_project(cpu_limit=Decimal("1.5"), memory_limit_mb=256, compose_services=2)),
+                         (Decimal("3.0"), 512))
+
+    def test_spread_prefers_emptier_server(self):
+        empty = score_server(self.server(), Decimal(1), 1024, "spread")
+        busy = score_server(self.server(reserved_memory_mb=6144, project_count=6), Decimal(1), 1024, "spread")
+
+        self.assertTrue(empty.fits and busy.fits)
+        self.assertGreater(empty.score, busy.score)
+
+    def test_binpack_prefers_fuller_server(self):
+        empty = score_server(self.server(), Decimal(1), 1024, "binpack")
+        busy = score_server(self.server(reserved_memory_mb=6144), Decimal(1), 1024, "binpack")
+
+        self.assertGreater(busy.score, empty.score)
+
+    def test_does_not_fit(self):
+        self.assertFalse(score_server(self.server(reserved_memory_mb=7800), Decimal(1), 1024, "spread").fits)
+        self.assertFalse(score_server(self.server(reserved_cpus=Decimal(7.5)), Decimal(1), 128, "spread").fits)
+        self.assertFalse(score_server(self.server(disk_free_mb=100), Decimal(1), 128, "spread").fits)
+        self.assertFalse(score_server(self.server(memory_available_mb=100), Decimal(1), 128, "spread").fits)
+        self.assertFalse(score_server(self.server(accepts_projects=False), Decimal(1), 128, "spread").fits)
+
+    def test_unknown_capacity_ranks_last(self):
+        unknown = score_server(self.server(cpu_cores=None), Decimal(1), 1024, "spread")
+        full = score_server(self.server(reserved_memory_mb=7000), Decimal(1), 1024, "spread")
+
+        self.assertTrue(unknown.fits)
+        self.assertLess(unknown.score, full.score)
+
+    def test_parse_capacity(self):
+        output = "cores=8\nmemory=15953\navailable=12001\nload=0.42\ndisk_free=80123\nwarning: x\n"
+
+        self.assertEqual(parse_capacity(output), {
+            "cores": 8, "memory": 15953, "available": 12001, "load": 0.42, "disk_free": 80123,
+        })
+
+
+class MigrateTests(SimpleTestCase):
+    def test_parse_rsync_stats(self):
+        output = (
+            "Number of files: 1,204 (reg: 1,100, dir: 104)\n"
+            "Number of regular files transferred: 1,100\n"
+            "Total transferred file size: 52,428,800 bytes\n"
+            "--- том shop_media\n"
+            "Number of regular files transferred: 3\n"
+            "Total transferred file size: 2048 bytes\n"
+        )
+        self.assertEqual(parse_rsync_stats(output), (1103, 52430848))
+        self.assertEqual(parse_rsync_stats(""), (0, 0))
+
+    def test_check_paths(self):
+        source = Server(name="a", ip_address="10.0.0.1")
+        target = Server(name="b", ip_address="10.0.0.2")
+        same_host = Server(name="c", ip_address="10.0.0.1")
+
+        check_paths(source, "/srv/projects/shop", target, "/srv/projects/shop")
+        with self.assertRaises(MigrationError):
+            check_paths(source, "/srv/projects/shop", same_host, "/srv/projects/shop")
+        with self.assertRaises(MigrationError):
+            check_paths(source, "/shop", target, "/shop")
+
+    def test_forward_config(self):
+        target = Server(name="b", ip_address="10.0.0.2")
+        config = generate_forward_config(make_project(), target)
+
+        self.assertIn("proxy_pass http://10.0.0.2;", config)
+        self.assertIn("proxy_set_header Host $host;", config)
+        self.assertNotIn("listen 443", config)
+        self.assertEqual(generate_forward_config(make_project(domain=""), target), "")
+
+    def test_forward_config_tls(self):
+        config = generate_forward_config(make_project(tls=True), Server(name="b", ip_address="10.0.0.2"))
+
+        self.assertIn("proxy_pass http://10.0.0.2;", config)
+        self.assertIn("listen 443 ssl http2;", config)
+        self.assertIn("proxy_pass https://10.0.0.2;", config)
+        self.assertIn("proxy_ssl_name shop.example.com;", config)
+        self.assertIn(f"ssl_certificate {LETSENCRYPT_DIR}/live/shop/fullchain.pem;", config)
+
+
+class IdleTests(SimpleTestCase):
+    def test_parse_idle(self):
+        output = "ZEA_IDLE shop 1800\nZEA_IDLE blog 12\nstat: cannot stat\n"
+        self.assertEqual(parse_idle(output), {"shop": 1800, "blog": 12})
+
+    def test_wake_token(self):
+        self.assertEqual(wake_token("shop"), wake_token("shop"))
+        self.assertNotEqual(wake_token("shop"), wake_token("blog"))
+
+    def test_access_log(self):
+        config = generate_nginx_config(make_project())
+        self.assertIn(f"access_log {NGINX_LOG_DIR}/shop.access.log", config)
+        self.assertIn("proxy_pass http://zea_shop;", config)
+
+    def test_sleeping_config(self):
+        with mock.patch.object(idle, "WAKE_BASE_URL", "https://panel.example.com"):
+            config = generate_nginx_config(make_project(), sleeping=True)
+        url = f"https://panel.example.com/wake/shop/{wake_token('shop')}/"
+        self.assertIn(f"proxy_pass {url};", config)
+        self.assertNotIn("proxy_pass http://zea_shop;", config)
+        self.assertIn("location /static/", config)
+
+    def wake(self, cache_add):
+        project = make_project(id=7, sleeping_since=NOW)
+        request = RequestFactory().get("/wake/shop/", HTTP_ACCEPT="text/html")
+        with mock.patch.object(views.Project.objects, "filter") as filter_, \
+                mock.patch.object(views.cache, "add", cache_add), \
+                mock.patch.object(views, "enqueue_wake") as enqueue_wake:
+            filter_.return_value.only.return_value.first.return_value = project
+            response = views.wake_view(request, "shop", wake_token("shop"))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], str(idle.WAKE_RETRY_AFTER))
+        return enqueue_wake
+
+    def test_wake_lock(self):
+        self.wake(mock.Mock(return_value=True)).assert_called_once_with(7)
+        self.wake(mock.Mock(return_value=False)).assert_not_called()
+
+    def test_wake_without_redis(self):
+        with self.assertLogs(views.logger, "WARNING"):
+            enqueue_wake = self.wake(mock.Mock(side_effect=ConnectionError("redis down")))
+        enqueue_wake.assert_called_once_with(7)
+
+
+class TrafficTests(SimpleTestCase):
+    def collect(self, project, log_dir):
+        with mock.patch.object(nginx_config, "NGINX_LOG_DIR", log_dir):
+            command = traffic.collect_command([project])
+        output = subprocess.run(["sh", "-c", command], capture_output=True, text=True, check=True).stdout
+        buckets, positions = traffic.parse_traffic(output)
+        project.traffic_log_inode, project.traffic_log_offset = positions[project.slug]
+        return sum(counts["requests"] for counts in buckets.values()), buckets
+
+    def test_incremental_with_rotation(self):
+        project = make_project()
+        line = "1718000000.250 200 512 0.020\n"
+        with tempfile.TemporaryDirectory() as tmp:
+            log = f"{tmp}/shop.access.log"
+            with open(log, "w") as f:
+                f.write(line * 3 + "1718000001.0 502 0 0.010, 0.300\n" + "1718000002.0 304 0 -\n")
+            requests, buckets = self.collect(project, tmp)
+            counts = next(iter(buckets.values()))
+            self.assertEqual(requests, 5)
+            self.assertEqual((counts["status_2xx"], counts["status_3xx"], counts["status_5xx"]), (3, 1, 1))
+            self.assertEqual(sum(counts["latency"].values()), 4)
+
+            self.assertEqual(self.collect(project, tmp)[0], 0)
+
+            with open(log, "a") as f:
+                f.write(line * 2)
+            os.rename(log, log + ".1")
+            with open(log, "w") as f:
+                f.write(line)
+            self.assertEqual(self.collect(project, tmp)[0], 3)
+
+    def test_quantile(self):
+        latency = {"10": 90, "40": 10}
+        self.assertAlmostEqual(traffic.quantile(latency, 0.5), 2 * 1.1 ** 10 / 2.1)
+        self.assertAlmostEqual(traffic.quantile(latency, 0.99), 2 * 1.1 ** 40 / 2.1)
+        self.assertIsNone(traffic.quantile({}, 0.5))
+
+    def test_merge_counts(self):
+        total = traffic.empty_counts()
+        traffic.merge_counts(total, {**traffic.empty_counts(), "requests": 2, "latency": {"5": 2}})
+        traffic.merge_counts(total, {**traffic.empty_counts(), "requests": 1, "latency": {"5": 1, "7": 1}})
+        self.assertEqual(total["requests"], 3)
+        self.assertEqual(total["latency"], {"5": 3, "7": 1})
+
+
+class BackupTests(SimpleTestCase):
+    OUTPUT = (
+        "ZEA_BACKUP_BEGIN shop\n"
+        "ZEA_VOLUME shop_pgdata pgdata /var/lib/docker/volumes/shop_pgdata/_data\n"
+        "ZEA_SNAPSHOT files\n"
+        '{"message_type":"summary","data_added":1024,"total_bytes_processed":8192,"snapshot_id":"aa11"}\n'
+        "ZEA_SNAPSHOT db db postgres\n"
+        '{"message_type":"status","percent_done":0.5}\n'
+        '{"message_type":"summary","data_added":100,"total_bytes_processed":400,"snapshot_id":"bb22"}\n'
+        "ZEA_BACKUP_END shop 0\n"
+        "ZEA_BACKUP_BEGIN blog\n"
+        "Fatal: unable to open config file\n"
+        "ZEA_BACKUP_END blog 1\n"
+    )
+
+    def test_sections(self):
+        sections = {slug: int(code) for slug, _, code in backup.SECTION_RE.findall(self.OUTPUT)}
+        self.assertEqual(sections, {"shop": 0, "blog": 1})
+
+    def test_parse_backup(self):
+        body = backup.SECTION_RE.findall(self.OUTPUT)[0][1]
+        parsed = backup.parse_backup(body)
+        self.assertEqual(parsed["data_added"], 1124)
+        self.assertEqual(parsed["bytes_processed"], 8592)
+        self.assertEqual(parsed["volumes"][0]["key"], "pgdata")
+
+        copy = Backup(status="success", **parsed)
+        self.assertEqual(copy.snapshot()["id"], "aa11")
+        self.assertEqual(copy.databases, [{"kind": "db", "service": "db", "engine": "postgres", "id": "bb22"}])
+
+    def test_restore_requires_files_snapshot(self):
+        with self.assertRaises(backup.BackupError):
+            backup.restore_script(Backup(status="failed"), make_project())
+
+    def test_restore_task_rejects_bad_backup_before_start(self):
+        from . import tasks
+
+        project = make_project(id=3, status="active")
+        with mock.patch.object(Project.objects, "select_related") as projects, \
+                mock.patch.object(Backup.objects, "get", return_value=Backup(id=9, status="failed")), \
+                mock.patch.object(tasks.Deployment.objects, "filter") as deployments, \
+                mock.patch.object(tasks, "bump"), \
+                mock.patch.object(tasks, "notify_restore_failed") as notify, \
+                mock.patch.object(tasks, "run_ssh") as ssh, \
+                mock.patch.object(Project, "save") as save:
+            projects.return_value.get.return_value = project
+            tasks.restore_project_task.run(3, deployment_id=5, backup_id=9)
+        self.assertEqual(project.status, "active")
+        save.assert_not_called()
+        ssh.assert_not_called()
+        self.assertEqual(deployments.return_value.update.call_args.kwargs["status"], "failed")
+        notify.assert_called_once()
+
+    def test_secrets(self):
+        with mock.patch.object(backup, "BACKUP_PASSWORD", "pw"), \
+                mock.patch.dict(os.environ, {"BACKUP_ENV_AWS_ACCESS_KEY_ID": "key"}):
+            lines = backup.secrets().decode().splitlines()
+        self.assertIn("RESTIC_PASSWORD=pw", lines)
+        self.assertIn("AWS_ACCESS_KEY_ID=key", lines)
+
+
+class LeaderTests(SimpleTestCase):
+    def test_request_token(self):
+        # Воркер: заголовки сообщения — атрибуты request; eager — request.headers
+        worker = mock.Mock(spec=[])
+        setattr(worker, leader.TOKEN_HEADER, 7)
+        eager = mock.Mock(spec=[], headers={leader.TOKEN_HEADER: "8"})
+        self.assertEqual(leader._request_token(worker), 7)
+        self.assertEqual(leader._request_token(eager), 8)
+        self.assertIsNone(leader._request_token(mock.Mock(spec=[], headers=None)))
+
+    def test_fenced_without_token_runs(self):
+        job = leader.fenced(lambda x: x * 2)
+        with mock.patch.object(leader, "_get_redis") as redis:
+            self.assertEqual(job(21), 42)
+        redis.assert_not_called()
+
+    def test_redis_down_is_not_leader(self):
+        lease = leader.LeaderLease("beat")
+        lease.token = 3
+        with mock.patch.object(leader, "_get_redis", side_effect=ConnectionError("down")):
+            self.assertFalse(lease.hold())
+        self.assertIsNone(lease.token)
+
+
+class ProfilingTests(SimpleTestCase):
+    def test_not_sampled(self):
+        with mock.patch.object(profiling, "TASK_PROFILE_RATE", 0):
+            profiling.start("t0", "demo")
+        self.assertNotIn("t0", profiling._probes)
+        with mock.patch.object(profiling.TaskProfile.objects, "create") as create:
+            profiling.finish("t0", "demo", "SUCCESS")
+        create.assert_not_called()
+
+    def test_sampled_run_is_saved(self):
+        with mock.patch.object(profiling, "TASK_PROFILE_RATE", 1), \
+                mock.patch.object(profiling, "TASK_PROFILE_TRACEMALLOC_RATE", 1):
+            profiling.start("t1", "demo")
+        self.assertIn(profiling._probes["t1"].queries, profiling.connection.execute_wrappers)
+        junk = [bytearray(4096) for _ in range(256)]
+        with mock.patch.object(profiling.TaskProfile.objects, "create") as create:
+            profiling.finish("t1", "demo", "SUCCESS")
+        del junk
+        row = create.call_args.kwargs
+        self.assertEqual((row["task"], row["state"], row["queries"]), ("demo", "SUCCESS", 0))
+        self.assertGreater(row["rss_kb"], 0)
+        self.assertGreaterEqual(row["peak_kb"], 1024)
+        self.assertTrue(row["top_allocations"])
+        self.assertFalse(profiling.tracemalloc.is_tracing())
+        self.assertEqual(profiling.connection.execute_wrappers, [])
+
+    def test_save_error_does_not_raise(self):
+        with mock.patch.object(profiling, "TASK_PROFILE_RATE", 1):
+            profiling.start("t2", "demo")
+        with mock.patch.object(profiling.TaskProfile.objects, "create", side_effect=RuntimeError("db down")):
+            with self.assertLogs(profiling.logger, "WARNING"):
+                profiling.finish("t2", "demo", "FAILURE")
+        self.assertNotIn("t2", profiling._probes)
+
+    def test_query_counter(self):
+        counter = profiling._QueryCounter()
+        self.assertEqual(counter(lambda *args: "rows", "SELECT 1", None, False, {}), "rows")
+        with self.assertRaises(ValueError):
+            counter(mock.Mock(side_effect=ValueError), "SELECT 1", None, False, {})
+        self.assertEqual(counter.count, 2)
+
+
+class BillingTests(SimpleTestCase):
+    def setUp(self):
+        self.today = billing.timezone.localdate()
+        # Обработчики откладывают отправку до коммита; здесь коммит — сразу
+        patcher = mock.patch.object(billing.transaction, "on_commit", side_effect=lambda func, robust=False: func())
+        self.on_commit = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_planned_events_active(self):
+        paid_until = self.today + billing.timedelta(days=10)
+        events = billing.planned_events(make_project(status="active", paid_until=paid_until))
+        warning_day = paid_until - billing.timedelta(days=billing.WARNING_DAYS)
+        self.assertEqual(events["warning"], billing._local_datetime(warning_day, billing.WARNING_HOUR))
+        self.assertEqual(events["grace"], billing._local_datetime(paid_until + billing.timedelta(days=1)))
+        self.assertIsNone(events["suspend"])
+
+    def test_planned_events_short_period(self):
+        now = billing.timezone.now()
+        with mock.patch.object(billing.timezone, "now", return_value=now):
+            soon = billing.planned_events(make_project(status="active", paid_until=self.today + billing.timedelta(days=1)))
+            expired = billing.planned_events(make_project(status="active", paid_until=self.today - billing.timedelta(days=1)))
+        # До окончания меньше WARNING_DAYS — предупреждение сразу, после окончания — уже нет
+        self.assertEqual(soon["warning"], now)
+        self.assertIsNone(expired["warning"])
+        self.assertIsNotNone(expired["grace"])
+
+    def test_reconcile_keeps_overdue_warning(self):
+        project = make_project(status="active", paid_until=self.today + billing.timedelta(days=1))
+        fired = billing.timezone.now() - billing.timedelta(hours=5)
+        events = [billing.BillingEvent(kind="warning", due_at=fired, fired_at=fired)]
+        # Срок «сейчас» при каждой сверке новый — без этого предупреждение уходило бы ежедневно
+        self.assertEqual(self._reconcile(project, events), {"grace"})
+        self.assertEqual(self._reconcile(project, []), {"warning", "grace"})
+        self.assertEqual(self._reconcile(project, events, reset=True), {"warning", "grace"})
+
+    def test_planned_events_grace(self):
+        project = make_project(status="grace", paid_until=self.today, grace_until=self.today)
+        events = billing.planned_events(project)
+        self.assertEqual(events, {
+            "warning": None,
+            "grace": None,
+            "suspend": billing._local_datetime(self.today + billing.timedelta(days=1)),
+        })
+
+    def _reconcile(self, project, events, reset=False, suspend_pending=False):
+        with mock.patch.object(billing.BillingEvent.objects, "filter", return_value=events), \
+                mock.patch.object(billing.BillingEvent.objects, "update_or_create") as update, \
+                mock.patch.object(billing, "_suspend_pending", return_value=suspend_pending):
+            billing.schedule_billing_events(project, reset=reset)
+        return {call.kwargs["kind"] for call in update.call_args_list}
+
+    def test_reconcile_keeps_fired_events(self):
+        project = make_project(status="active", paid_until=self.today + billing.timedelta(days=10))
+        events = [
+            billing.BillingEvent(kind=kind, due_at=due_at, fired_at=billing.timezone.now())
+            for kind, due_at in billing.planned_events(project).items() if due_at
+        ]
+        self.assertEqual(self._reconcile(project, events), set())
+        self.assertEqual(self._reconcile(project, events, reset=True), {"warning", "grace"})
+
+    def test_reconcile_refires_failed_suspend(self):
+        yesterday = self.today - billing.timedelta(days=1)
+        project = make_project(status="grace", paid_until=yesterday, grace_until=yesterday)
+        due_at = billing.planned_events(project)["suspend"]
+        events = [billing.BillingEvent(kind="suspend", due_at=due_at, fired_at=due_at)]
+        self.assertEqual(self._reconcile(project, events), {"suspend"})
+        # Suspend ещё в очереди — ждём его, а не ставим второй
+        self.assertEqual(self._reconcile(project, events, suspend_pending=True), set())
+
+    def test_fire_warning(self):
+        project = make_project(status="active", paid_until=self.today + billing.timedelta(days=2))
+        with mock.patch("apps.projects.services.notifications.notify_billing_warning") as notify:
+            billing._fire_warning(project)
+            billing._fire_warning(make_project(status="suspended", paid_until=project.paid_until))
+        notify.assert_called_once_with(project, 2)
+
+    def test_fire_grace(self):
+        project = make_project(status="active", paid_until=self.today - billing.timedelta(days=1))
+        with mock.patch.object(Project, "save") as save, \
+                mock.patch("apps.projects.services.notifications.notify_status_change") as notify:
+            billing._fire_grace(project)
+        self.assertEqual(project.status, "grace")
+        self.assertEqual(project.grace_until, self.today + billing.timedelta(days=billing.GRACE_DAYS))
+        save.assert_called_once_with(update_fields=["status", "grace_until"])
+        notify.assert_called_once_with(project, "active", "grace")
+        self.assertTrue(self.on_commit.call_args.kwargs["robust"])
+
+    def test_fire_grace_paid(self):
+        project = make_project(status="active", paid_until=self.today)
+        with mock.patch.object(Project, "save") as save:
+            billing._fire_grace(project)
+        self.assertEqual(project.status, "active")
+        save.assert_not_called()
+
+    def test_fire_suspend(self):
+        from .tasks import PRIORITY_LOW
+
+        yesterday = self.today - billing.timedelta(days=1)
+        project = make_project(id=7, status="grace", grace_until=yesterday)
+        with mock.patch("apps.projects.tasks.enqueue_suspend") as enqueue:
+            with mock.patch.object(billing, "_suspend_pending", return_value=True):
+                billing._fire_suspend(project)
+            enqueue.assert_not_called()
+            with mock.patch.object(billing, "_suspend_pending", return_value=False):
+                billing._fire_suspend(project)
+                billing._fire_suspend(make_project(id=8, status="grace", grace_until=self.today))
+        enqueue.assert_called_once_with(7, priority=PRIORITY_LOW)
+
+
+class FleetTests(SimpleTestCase):
+    def result(self, label, seconds, output="", returncode=0):
+        target = fleet.FleetTarget(label=label, host=label, user="root", port=22)
+        return fleet.HostResult(target=target, returncode=returncode, seconds=seconds, output=output)
+
+    def test_servers_by_name_or_ip(self):
+        from .management.commands.fleet import Command
+
+        with mock.patch("apps.projects.management.commands.fleet.targets_for_servers") as targets:
+            Command()._targets({"projects": None, "servers": ["prod-1", "10.0.0.5", "::1"]})
+        where = targets.call_args.args[0].query.where.children[0]
+
+        # «prod-1» в inet-колонку не попадает: psycopg не смог бы его адаптировать
+        self.assertEqual({lookup.lhs.target.name: lookup.rhs for lookup in where.children},
+                         {"name": ["prod-1"], "ip_address": ["10.0.0.5", "::1"]})
+        self.assertEqual(fleet.servers_lookup(["prod-1"]), Q(name__in=["prod-1"]))
+
+    def test_targets(self):
+        project = make_project()
+        project.server.ssh_port = 2222
+
+        self.assertEqual(fleet.targets_for_servers([project.server]),
+                         [fleet.FleetTarget(label="test", host="10.0.0.1", user="root", port=2222)])
+        self.assertEqual(fleet.targets_for_projects([project])[0].cwd, "/srv/projects/shop")
+
+    def test_run_fleet(self):
+        def run_ssh(host, user, port, command, timeout, on_output, stdin):
+            if host == "ok":
+                on_output("up 3 days\n")
+                return f"{command}\n"
+            if host == "exit":
+                raise SSHCommandError("exit 2", returncode=2, output="No such file\n")
+            if host == "down":
+                raise SSHCommandError("exit 255", returncode=255)
+            if host == "slow":
+                raise SSHCommandError("таймаут", returncode=None)
+            raise OSError("ssh не найден")
+
+        targets = [fleet.FleetTarget(label=h, host=h, user="root", port=22, cwd="/srv/a b" if h == "ok" else "")
+                   for h in ("ok", "exit", "down", "slow", "broken")]
+        lines = []
+        with mock.patch.object(fleet, "run_ssh", side_effect=run_ssh):
+            results = fleet.run_fleet(targets, "uptime", workers=3, on_line=lambda *args: lines.append(args))
+
+        self.assertEqual([r.target.label for r in results], ["ok", "exit", "down", "slow", "broken"])
+        self.assertEqual([r.status for r in results], ["ok", "exit 2", "error", "timeout", "error"])
+        self.assertEqual(results[0].output, "cd '/srv/a b' && uptime\n")
+        self.assertEqual(results[1].output, "No such file\n")
+        self.assertEqual(results[4].error, "ssh: ssh не найден")
+        self.assertEqual(lines, [("ok", "up 3 days\n")])
+        self.assertEqual(fleet.summary(results)["failed"], 4)
+
+    def test_mark_outliers(self):
+        results = [self.result("a", 1.0), self.result("b", 1.2), self.result("c", 4.0), self.result("d", 9.0, returncode=1)]
+        fleet.mark_outliers(results)
+
+        self.assertEqual([r.outlier for r in results], [False, False, True, True])
+        # Меньше трёх успешных хостов — медиана ничего не значит
+        few = [self.result("a", 1.0), self.result("b", 10.0)]
+        fleet.mark_outliers(few)
+        self.assertFalse(any(r.outlier for r in few))
+
+    def test_group_outputs(self):
+        results = [
+            self.result("a", 1, "Docker version 27\n"),
+            self.result("b", 1, "Docker version 26"),
+            self.result("c", 1, "Docker version 27"),
+        ]
+
+        self.assertEqual(fleet.group_outputs(results), [
+            fleet.OutputGroup(output="Docker version 27", labels=["a", "c"]),
+            fleet.OutputGroup(output="Docker version 26", labels=["b"]),
+        ])
+
+
+class FleetCommandPermissionTests(SimpleTestCase):
+    def _actions(self, model, is_superuser):
+        request = RequestFactory().get("/admin/")
+        request.user = mock.Mock(is_active=True, is_staff=True, is_superuser=is_superuser)
+        request.user.has_perm.return_value = True
+        return django_admin.site._registry[model].get_actions(request)
+
+    def test_superuser_only(self):
+        for model in (Project, Server):
+            self.assertIn("run_fleet_command", self._actions(model, is_superuser=True))
+            self.assertNotIn("run_fleet_command", self._actions(model, is_superuser=False))
+            self.assertIn("delete_selected", self._actions(model, is_superuser=False))
+
+
+class SSHStandInTests(SimpleTestCase):
+    def test_loopback_only(self):
+        from .services.ssh_standin import SSHStandIn
+
+        with tempfile.TemporaryDirectory() as root:
+            for host in ("0.0.0.0", "10.0.0.1", "example.com"):
+                with self.assertRaises(ValueError):
+                    SSHStandIn(root, host=host)
+            standin = SSHStandIn(root, host="localhost")
+            self.assertEqual(standin.ssh_options[:2], ["-i", os.path.join(root, "client_key")])
+
+    def test_fake_ssh_matches_run_ssh(self):
+        import inspect
+
+        from .services.fake_ssh import FakeSSH
+        from .services.ssh_exec import run_ssh
+
+        fake = FakeSSH(latency=0, output_bytes=1)
+        # Бенчмарк подменяет run_ssh целиком: любой новый аргумент должен приниматься и здесь
+        self.assertEqual(list(inspect.signature(fake).parameters), list(inspect.signature(run_ssh).parameters))
+        self.assertEqual(fake("10.0.0.1", "root", 22, "rsync", forward_agent=True), "[root@10.0.0.1:22] ok\n")
+
+
+class PageCacheRedisDownTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(page_cache, "cache")
+        self.cache = patcher.start()
+        self.addCleanup(patcher.stop)
+        for method in ("get_many", "get", "add", "incr", "get_or_set"):
+            getattr(self.cache, method).side_effect = ConnectionError("redis down")
+
+    def test_bump_logs(self):
+        with self.assertLogs(page_cache.logger, "WARNING"):
+            page_cache.bump("projects", "servers")
+
+    def test_no_versions_no_etag(self):
+        with self.assertLogs(page_cache.logger, "WARNING"):
+            self.assertIsNone(page_cache.get_versions("projects"))
+            request = RequestFactory().get("/servers/")
+            request.user = mock.Mock(pk=1)
+            request._messages = []
+            self.assertIsNone(page_cache.page_etag("servers")(request))
+        self.assertEqual(page_cache.fragment_cache(None), page_cache.FRAGMENT_CACHE_OFF)
+
+    def test_cached_computes(self):
+        self.assertEqual(page_cache.cached("stats", None, lambda: 1), 1)
+        with self.assertLogs(page_cache.logger, "WARNING"):
+            self.assertEqual(page_cache.cached("stats", {"projects": 5}, lambda: 2), 2)
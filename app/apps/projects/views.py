@@ -1,28 +1,71 @@
+import asyncio
+import hmac
+import json
+import logging
+import os
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
 from django.contrib import messages
-from django.db.models import Sum, Count
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.core.paginator import Paginator
+from django.db import close_old_connections
+from django.db.models import Count, Q, Sum
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.cache import cache_control
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_POST
 
 from .models import Project, Server, Deployment
-from .tasks import deploy_project_task, suspend_project_task, resume_project_task
+from .services.idle import WAKE_LOCK_TTL, WAKE_RETRY_AFTER, wake_token
+from .services.live import broadcaster
+from .services.log_search import headlines, search_deployments
+from .services.metrics import render_metrics
+from .services.page_cache import cached, fragment_cache, get_versions, page_etag
+from .services.profiling import RANKINGS, TASK_PROFILE_RATE, task_ranking, worker_growth, worst_runs
+from .services.stats import annotate_queue
+from .services.traffic import traffic_summary
+from .services.webhooks import handle_push, verify_signature
+from .tasks import PRIORITY_HIGH, enqueue_deploy, enqueue_resume, enqueue_suspend, enqueue_wake
+
+logger = logging.getLogger(__name__)
+
+
+# Страницы со списками: ETag по версиям данных (304 без рендера), браузер
+# всегда переспрашивает сервер. Таблицы кешируются фрагментами в шаблонах.
+# На Dashboard есть ETA, поэтому его ETag дополнительно меняется раз в минуту.
+_revalidate = cache_control(private=True, no_cache=True)
 
 
 @login_required
+@_revalidate
+@condition(etag_func=page_etag("projects", "servers", "deployments", bucket=60))
 def dashboard_view(request):
+    versions = get_versions("projects", "servers")
+    # QuerySet ленивый: при попадании во фрагментный кеш запрос не выполняется
     projects = Project.objects.select_related("server").all()
-    recent_deployments = Deployment.objects.select_related("project").order_by("-started_at")[:10]
+    recent_deployments = annotate_queue(
+        Deployment.objects.select_related("project").order_by("-enqueued_at")[:10]
+    )
 
-    stats = {
-        "total": projects.count(),
-        "active": projects.filter(status="active").count(),
-        "grace": projects.filter(status="grace").count(),
-        "suspended": projects.filter(status="suspended").count(),
-    }
+    stats = cached("dashboard:stats", versions and {"projects": versions["projects"]}, lambda: Project.objects.aggregate(
+        total=Count("id"),
+        active=Count("id", filter=Q(status="active")),
+        grace=Count("id", filter=Q(status="grace")),
+        suspended=Count("id", filter=Q(status="suspended")),
+    ))
 
     return render(request, "dashboard.html", {
         "projects": projects,
         "recent_deployments": recent_deployments,
         "stats": stats,
+        "versions": versions,
+        "fragments": fragment_cache(versions),
     })
 
 
@@ -32,11 +75,15 @@ def project_detail_view(request, slug):
         Project.objects.select_related("server"),
         slug=slug,
     )
-    deployments = Deployment.objects.filter(project=project).order_by("-started_at")[:20]
+    deployments = annotate_queue(
+        Deployment.objects.filter(project=project).order_by("-enqueued_at")[:20]
+    )
 
     return render(request, "project_detail.html", {
         "project": project,
         "deployments": deployments,
+        "traffic": traffic_summary(project),
+        "last_backup": project.backups.first(),
     })
 
 
@@ -52,15 +99,19 @@ def project_action_view(request, slug, action):
         if project.status == "deploying":
             messages.warning(request, f"Проект {project.name} уже деплоится")
         else:
-            deploy_project_task.delay(project.id)
-            messages.success(request, f"🚀 Deploy для {project.name} запущен!")
+            dep = annotate_queue([enqueue_deploy(project.id, priority=PRIORITY_HIGH)])[0]
+            messages.success(
+                request,
+                f"🚀 Deploy для {project.name} запущен! "
+                f"Позиция в очереди: {dep.queue_position}, ETA ~{dep.eta_display}",
+            )
 
     elif action == "suspend":
-        suspend_project_task.delay(project.id)
+        enqueue_suspend(project.id, priority=PRIORITY_HIGH)
         messages.success(request, f"⛔ Suspend для {project.name} запущен!")
 
     elif action == "resume":
-        resume_project_task.delay(project.id)
+        enqueue_resume(project.id)
         messages.success(request, f"✅ Resume для {project.name} запущен!")
 
     else:
@@ -74,25 +125,233 @@ def project_action_view(request, slug, action):
 
 
 @login_required
+@_revalidate
+@condition(etag_func=page_etag("servers", "projects"))
 def servers_view(request):
-    servers = Server.objects.annotate(project_count=Count("projects")).all()
+    # project_count — агрегат на сервере (services/placement.py), без JOIN по проектам
+    servers = Server.objects.all()
+    versions = get_versions("servers", "projects")
 
     return render(request, "servers.html", {
         "servers": servers,
+        "versions": versions,
+        "fragments": fragment_cache(versions),
     })
 
 
 @login_required
+@_revalidate
+@condition(etag_func=page_etag("projects"))
 def billing_view(request):
-    projects = Project.objects.select_related("server").all()
+    projects = Project.objects.all()
+    versions = get_versions("projects")
+    # Статус оплаты зависит от текущей даты — она входит в ключи кеша
+    today = timezone.now().date()
 
-    total_revenue = projects.aggregate(total=Sum("price_per_month"))["total"] or 0
-    paid_count = sum(1 for p in projects if p.is_paid())
-    unpaid_count = sum(1 for p in projects if p.paid_until and not p.is_paid())
+    def summary():
+        return Project.objects.aggregate(
+            total_revenue=Sum("price_per_month"),
+            paid_count=Count("id", filter=Q(paid_until__gte=today)),
+            unpaid_count=Count("id", filter=Q(paid_until__lt=today)),
+        )
+
+    totals = cached("billing:summary", versions, summary, today)
 
     return render(request, "billing.html", {
         "projects": projects,
-        "total_revenue": total_revenue,
-        "paid_count": paid_count,
-        "unpaid_count": unpaid_count,
+        "total_revenue": totals["total_revenue"] or 0,
+        "paid_count": totals["paid_count"],
+        "unpaid_count": totals["unpaid_count"],
+        "versions": versions,
+        "fragments": fragment_cache(versions),
+        "today": today,
+    })
+
+
+SEARCH_PAGE_SIZE = 20
+
+
+@login_required
+def deployment_search_view(request):
+    """Полнотекстовый поиск по логам деплоев (GIN-индекс, см. services/log_search.py)."""
+    query = request.GET.get("q", "").strip()
+    slug = request.GET.get("project", "")
+    page = None
+    if query:
+        deployments = search_deployments(query)
+        if slug:
+            deployments = deployments.filter(project__slug=slug)
+        page = Paginator(deployments, SEARCH_PAGE_SIZE).get_page(request.GET.get("page"))
+        found = headlines(page.object_list, query)
+        for dep in page.object_list:
+            dep.headline = found.get(dep.id, "")
+
+    return render(request, "search.html", {
+        "query": query,
+        "slug": slug,
+        "page": page,
+        "projects": Project.objects.order_by("slug").values_list("slug", flat=True),
     })
+
+
+PROFILING_WINDOWS = (1, 24, 24 * 7)
+
+
+@login_required
+def profiling_view(request):
+    """Задачи Celery, худшие по памяти, CPU или запросам к БД (services/profiling.py)."""
+    try:
+        hours = int(request.GET.get("hours", 24))
+    except ValueError:
+        hours = 24
+    if hours not in PROFILING_WINDOWS:
+        hours = 24
+    sort = request.GET.get("sort", "rss")
+    if sort not in RANKINGS:
+        sort = "rss"
+
+    return render(request, "profiling.html", {
+        "ranking": task_ranking(hours, sort),
+        "worst_runs": worst_runs(hours),
+        "workers": worker_growth(hours),
+        "hours": hours,
+        "sort": sort,
+        "windows": PROFILING_WINDOWS,
+        "enabled": TASK_PROFILE_RATE > 0,
+    })
+
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+
+def metrics_view(request):
+    """
+    Метрики в формате Prometheus.
+    Если задан METRICS_TOKEN — доступ по заголовку Authorization: Bearer <token>,
+    иначе только для залогиненных пользователей.
+    """
+    if METRICS_TOKEN:
+        auth = request.META.get("HTTP_AUTHORIZATION", "")
+        if not hmac.compare_digest(auth, f"Bearer {METRICS_TOKEN}"):
+            return HttpResponse("Unauthorized", status=401)
+    elif not request.user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+
+    return HttpResponse(
+        render_metrics(),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+def _wake_lock(project_id: int) -> bool:
+    """
+    Одно пробуждение на WAKE_LOCK_TTL. Без Redis блокировку взять нельзя —
+    пробуждение всё равно ставится в очередь: лишняя задача wake дешевле,
+    чем проект, который не просыпается.
+    """
+    try:
+        return cache.add(f"zea:wake:{project_id}", 1, WAKE_LOCK_TTL)
+    except Exception as e:
+        logger.warning(f"Блокировка пробуждения проекта {project_id} недоступна: {e}")
+        return True
+
+
+@csrf_exempt
+def wake_view(request, slug, token):
+    """
+    Сюда nginx спящего проекта отправляет запросы к приложению (с исходным
+    путём после токена). Ставит пробуждение в очередь — одно на
+    WAKE_LOCK_TTL — и отвечает 503 с Retry-After: браузер повторит запрос,
+    когда проект уже запущен и nginx снова проксирует в приложение.
+    """
+    if not constant_time_compare(token, wake_token(slug)):
+        raise Http404
+    project = Project.objects.filter(slug=slug).only("id", "sleeping_since").first()
+    if project is None:
+        raise Http404
+    # sleeping_since пуст — проект уже проснулся, nginx ещё не перезагружен: только повтор
+    if project.sleeping_since and _wake_lock(project.id):
+        enqueue_wake(project.id)
+
+    if request.method in ("GET", "HEAD") and "text/html" in request.headers.get("Accept", ""):
+        response = render(request, "wake.html", {"retry_after": WAKE_RETRY_AFTER}, status=503)
+    else:
+        response = HttpResponse(
+            f"Проект запускается, повторите запрос через {WAKE_RETRY_AFTER} с\n",
+            status=503, content_type="text/plain; charset=utf-8",
+        )
+    response["Retry-After"] = str(WAKE_RETRY_AFTER)
+    response["Cache-Control"] = "no-store"
+    return response
+
+
+@csrf_exempt
+@require_POST
+def github_webhook_view(request):
+    """
+    Вебхук GitHub (push). Подпись X-Hub-Signature-256 проверяется
+    по GITHUB_WEBHOOK_SECRET; без секрета вебхук выключен.
+    """
+    if not verify_signature(request.body, request.headers.get("X-Hub-Signature-256", "")):
+        return HttpResponse("Invalid signature", status=403)
+
+    event = request.headers.get("X-GitHub-Event", "")
+    if event == "ping":
+        return JsonResponse({"ok": True, "event": "ping"})
+    if event != "push":
+        return JsonResponse({"ok": True, "event": event, "ignored": True})
+
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return HttpResponse("Invalid JSON", status=400)
+
+    return JsonResponse({"ok": True, "event": event, "projects": handle_push(payload)})
+
+
+# Раз в SSE_KEEPALIVE секунд шлём комментарий, чтобы прокси не рвали соединение
+SSE_KEEPALIVE = 15
+
+
+async def _sse_stream(project_id=None):
+    queue = broadcaster.subscribe(project_id)
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                payload = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: {payload['event']}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+    finally:
+        broadcaster.unsubscribe(queue)
+
+
+async def _sse_response(request, stream):
+    if not isinstance(request, ASGIRequest):
+        # Под WSGI поток держал бы воркер; 204 говорит EventSource не переподключаться
+        return HttpResponse(status=204)
+    # Соединение с БД (проверка сессии, поиск проекта) Django вернул бы в пул
+    # только по request_finished, то есть после закрытия бесконечного потока:
+    # несколько открытых вкладок выбрали бы весь пул. Поток БД не использует.
+    await sync_to_async(close_old_connections)()
+    response = StreamingHttpResponse(stream, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@login_required
+async def project_events_view(request, slug):
+    """SSE: статусы и живой лог деплоев проекта (работает только под ASGI)."""
+    project_id = await Project.objects.filter(slug=slug).values_list("id", flat=True).afirst()
+    if project_id is None:
+        raise Http404
+    return await _sse_response(request, _sse_stream(project_id))
+
+
+@login_required
+async def events_view(request):
+    """SSE: смены статусов всех проектов для Dashboard."""
+    return await _sse_response(request, _sse_stream())
@@ -1,9 +1,27 @@
 import os
 
 from celery import Celery
+from celery.signals import task_postrun, task_prerun
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
 
 app = Celery("zea_control")
 app.config_from_object("django.conf:settings", namespace="CELERY")
 app.autodiscover_tasks()
+
+
+# Профилирование задач (apps/projects/services/profiling.py): выборочные замеры
+# CPU, памяти и запросов к БД. Импорт внутри обработчиков — модели ещё не
+# загружены, когда импортируется этот модуль.
+@task_prerun.connect
+def _profile_start(task_id=None, task=None, **kwargs):
+    from apps.projects.services.profiling import start
+
+    start(task_id, task.name)
+
+
+@task_postrun.connect
+def _profile_finish(task_id=None, task=None, state=None, **kwargs):
+    from apps.projects.services.profiling import finish
+
+    finish(task_id, task.name, state)
@@ -12,6 +12,9 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 #     }
 # }
 
+# Тип процесса задаётся в docker-compose: web, worker, beat, bot
+ZEA_PROCESS_TYPE = os.getenv('ZEA_PROCESS_TYPE', 'web')
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -20,5 +23,24 @@ DATABASES = {
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
         'HOST': os.getenv('POSTGRES_HOST'),
         'PORT': os.getenv('POSTGRES_PORT', 5432),
+        # Перед переиспользованием соединения (из пула или постоянного) проверяем, что оно живо
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'connect_timeout': int(os.getenv('POSTGRES_CONNECT_TIMEOUT', 5)),
+        },
     }
 }
+
+if ZEA_PROCESS_TYPE == 'web':
+    # ASGI: соединения берутся из пула psycopg на процесс и возвращаются
+    # в конце запроса (постоянные соединения под ASGI не переиспользуются)
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 1)),
+        'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 4)),
+        'timeout': int(os.getenv('DB_POOL_TIMEOUT', 10)),
+        'max_idle': 300,
+    }
+else:
+    # Celery и бот живут долго и работают в своих потоках: держим соединение
+    # открытым между задачами/сообщениями
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('DB_CONN_MAX_AGE', 600))
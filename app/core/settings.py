@@ -4,6 +4,8 @@ from pathlib import Path
 import os
 
 from datetime import timedelta
+from celery.schedules import crontab
+from kombu import Queue
 
 load_dotenv()
 
@@ -90,10 +92,123 @@ CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", "redis://redis_zea:63
 CELERY_TIMEZONE = "Asia/Bishkek"
 CELERY_ENABLE_UTC = False
 
+# Очереди: тяжёлые сборки отдельно от быстрых lifecycle-операций,
+# чтобы resume/suspend не ждали 10-минутный build.
+CELERY_TASK_QUEUES = (
+    Queue("deploy"),
+    Queue("lifecycle"),
+    Queue("maintenance"),
+    Queue("backups"),
+    Queue("notifications"),
+)
+CELERY_TASK_DEFAULT_QUEUE = "maintenance"
+CELERY_TASK_ROUTES = {
+    "apps.projects.tasks.deploy_project_task": {"queue": "deploy"},
+    "apps.projects.tasks.migrate_project_task": {"queue": "deploy"},
+    "apps.projects.tasks.restore_project_task": {"queue": "deploy"},
+    "apps.projects.tasks.suspend_project_task": {"queue": "lifecycle"},
+    "apps.projects.tasks.resume_project_task": {"queue": "lifecycle"},
+    "apps.projects.tasks.apply_env_task": {"queue": "lifecycle"},
+    "apps.projects.tasks.sleep_project_task": {"queue": "lifecycle"},
+    "apps.projects.tasks.wake_project_task": {"queue": "lifecycle"},
+    "apps.projects.tasks.check_billing_task": {"queue": "maintenance"},
+    "apps.projects.tasks.process_billing_events_task": {"queue": "maintenance"},
+    "apps.projects.tasks.renew_certificates_task": {"queue": "maintenance"},
+    "apps.projects.tasks.collect_capacity_task": {"queue": "maintenance"},
+    "apps.projects.tasks.sleep_idle_projects_task": {"queue": "maintenance"},
+    "apps.projects.tasks.collect_traffic_task": {"queue": "maintenance"},
+    "apps.projects.tasks.prune_task_profiles_task": {"queue": "maintenance"},
+    "apps.projects.tasks.backup_projects_task": {"queue": "backups"},
+    "apps.projects.tasks.send_telegram_task": {"queue": "notifications"},
+}
+
+# Приоритеты внутри очереди (Redis: 0 — наивысший, 9 — наинизший)
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    "queue_order_strategy": "priority",
+    "priority_steps": list(range(10)),
+    "sep": ":",
+    "visibility_timeout": 2 * 60 * 60,
+}
+CELERY_TASK_DEFAULT_PRIORITY = 5
+
+# Воркер берёт по одной задаче, иначе приоритеты не работают
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_TASK_ACKS_LATE = True
+
+# Ключи шифрования env проектов (Fernet, через запятую): первый шифрует, остальные
+# только расшифровывают — для ротации. Пусто — ключ выводится из SECRET_KEY.
+# Новый ключ: python -c "from cryptography.fernet import Fernet; print(Fernet.generate_key().decode())"
+ENV_ENCRYPTION_KEYS = [key.strip() for key in os.getenv("ENV_ENCRYPTION_KEYS", "").split(",") if key.strip()]
+
+# Выборы лидера beat и бота (services/leader.py): копий может быть несколько, работает одна
+LEADER_REDIS_URL = os.getenv("LEADER_REDIS_URL", "redis://redis_zea:6379/4")
+CELERY_BEAT_SCHEDULER = "apps.projects.services.leader:LeaderScheduler"
+
+# Живые события деплоя (Redis pub/sub → SSE)
+LIVE_EVENTS_REDIS_URL = os.getenv("LIVE_EVENTS_REDIS_URL", "redis://redis_zea:6379/3")
+
+# Общий кеш для всех процессов (gunicorn-воркеры, Celery, бот)
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("CACHE_REDIS_URL", "redis://redis_zea:6379/2"),
+        "KEY_PREFIX": "zea",
+        "TIMEOUT": 60 * 60,
+        "OPTIONS": {
+            "socket_connect_timeout": 2,
+            "socket_timeout": 2,
+        },
+    },
+    # Заглушка для кеша фрагментов, когда Redis недоступен (services/page_cache.py)
+    "off": {
+        "BACKEND": "django.core.cache.backends.dummy.DummyCache",
+    },
+}
+
 CELERY_BEAT_SCHEDULE = {
+    # Переходы биллинга: события с точным сроком, поллер забирает наступившие
+    "process-billing-events": {
+        "task": "apps.projects.tasks.process_billing_events_task",
+        "schedule": timedelta(minutes=1),
+        "options": {"expires": 50},
+    },
+    # Страховочная сверка событий со всеми проектами, раз в сутки в 00:05
     "check-projects-billing-daily": {
         "task": "apps.projects.tasks.check_billing_task",
-        "schedule": timedelta(days=1),
+        "schedule": crontab(hour=0, minute=5),
+    },
+    # Ресурсы серверов для планировщика размещения
+    "collect-server-capacity": {
+        "task": "apps.projects.tasks.collect_capacity_task",
+        "schedule": timedelta(minutes=15),
+        "options": {"expires": 600},
+    },
+    # Засыпание проектов без запросов дольше их idle_timeout
+    "sleep-idle-projects": {
+        "task": "apps.projects.tasks.sleep_idle_projects_task",
+        "schedule": timedelta(minutes=5),
+        "options": {"expires": 240},
+    },
+    # Трафик проектов из access-логов nginx (только новые строки)
+    "collect-traffic": {
+        "task": "apps.projects.tasks.collect_traffic_task",
+        "schedule": timedelta(minutes=5),
+        "options": {"expires": 240},
+    },
+    # Инкрементальные резервные копии проектов (restic), ночью
+    "backup-projects-nightly": {
+        "task": "apps.projects.tasks.backup_projects_task",
+        "schedule": crontab(hour=2, minute=0),
+    },
+    # Продление сертификатов, истекающих в ближайшие 30 дней
+    "renew-certificates-daily": {
+        "task": "apps.projects.tasks.renew_certificates_task",
+        "schedule": crontab(hour=3, minute=30),
+    },
+    # Профили задач старше TASK_PROFILE_RETENTION_DAYS
+    "prune-task-profiles-daily": {
+        "task": "apps.projects.tasks.prune_task_profiles_task",
+        "schedule": crontab(hour=4, minute=15),
     },
 }
 